@@ -1,99 +1,143 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
+from flask import Flask
+from flask.cli import with_appcontext
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+import click
 import os
+import time
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'rabateks-dpp-secret-key-2024'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database/dpp.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-db = SQLAlchemy(app)
-
-# REMOVE ALL MODEL AND ROUTE IMPORTS FROM HERE
-# They will be imported inside functions to avoid circular imports
-
-@app.before_first_request
-def create_tables():
-    """Create database tables before first request"""
-    # Create database directory if it doesn't exist
-    db_dir = os.path.dirname(app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', ''))
-    if db_dir and not os.path.exists(db_dir):
-        os.makedirs(db_dir)
-    
-    # Import models here to avoid circular imports
+# Models and services import `db` from here; the app itself is built by
+# create_app() so importing this module stays cheap
+db = SQLAlchemy()
+
+
+def create_app(config_name=None):
+    """Application factory: configure the app, the database and the blueprints
+
+    No queries run here. Schema creation, migrations and seed data are an
+    explicit step (`flask db-upgrade`, or INIT_DB_ON_STARTUP for throwaway
+    databases) so new workers are ready as soon as the factory returns.
+    """
+    from config import config
+    from services.assets import init_assets
+    from services.database import engine_options, bind_options, configure_engine, ensure_sqlite_directory, init_write_queue
+    from services.change_feed import init_change_feed
+    from services.dimensions import init_dimensions
+    from services.instrumentation import init_instrumentation
+    from services.jobs import init_job_runner
+    from services.modules import init_modules
+    from services.render_cache import init_render_cache
+    from services.serialization import init_serialization
+
+    started = time.perf_counter()
+    app = Flask(__name__)
+    config_name = config_name or os.environ.get('FLASK_CONFIG', 'default')
+    app.config.from_object(config[config_name])
+    app.config['CONFIG_NAME'] = config_name
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    app.config['SQLALCHEMY_BINDS'] = bind_options(app.config)
+
+    db.init_app(app)
+    init_serialization(app)
+    init_dimensions(app)
+
+    # SQLite pragmas (WAL, busy_timeout, ...) and the optional single-writer queue
+    with app.app_context():
+        for engine in db.engines.values():
+            ensure_sqlite_directory(engine)
+            configure_engine(engine, app.config)
+    init_write_queue(app)
+    init_render_cache(app)
+    init_assets(app)
+    init_instrumentation(app)
+    init_job_runner(app)
+    init_modules(app)
+    init_change_feed(app)
+
+    register_blueprints(app)
+    register_commands(app)
+
+    if app.config.get('INIT_DB_ON_STARTUP'):
+        with app.app_context():
+            init_db()
+
+    app.extensions['dpp_startup_seconds'] = time.perf_counter() - started
+    return app
+
+
+def register_blueprints(app):
+    """Import and register the route blueprints"""
+    from routes.main import main_bp
+    from routes.garment import garment_bp
+    from routes.orders import orders_bp
+    from routes.jobs import jobs_bp
+
+    app.register_blueprint(main_bp)
+    app.register_blueprint(garment_bp, url_prefix='/garment')
+    app.register_blueprint(orders_bp, url_prefix='/orders')
+    app.register_blueprint(jobs_bp, url_prefix='/api/jobs')
+
+
+def init_db():
+    """Create missing tables, apply pending migrations and seed the DPP modules"""
     from models.garment import Garment
+    from models.dimensions import Country, Facility, Fabric
     from models.dashboard import DashboardStats, DPPModule
     from models.orders import Order
-    
-    # Create all tables
+    from models.jobs import Job
+    from models.events import ChangeEvent
+    from models.carbon import EmissionFactor
+    from models.rollups import OrderRollup, GarmentRollup
+    from models.status_history import OrderStatusChange, OrderStatusDuration
+    from models.search import SearchBacklog
+    from services.carbon import seed_factors
+    from services.migrations import upgrade
+    from services.modules import seed_modules
+
+    # Create all tables and bring older databases up to date
     db.create_all()
-    
+    upgrade()
+
     # Initialize sample data if tables are empty
-    if DPPModule.query.count() == 0:
-        sample_modules = [
-            DPPModule(name="Fibre DPP", description="Fiber traceability and sustainability", icon="fas fa-seedling", url="/fibre", color="success"),
-            DPPModule(name="Yarn DPP", description="Yarn production and quality tracking", icon="fas fa-thread", url="/yarn", color="info"),
-            DPPModule(name="Fabric DPP", description="Fabric manufacturing and properties", icon="fas fa-cut", url="/fabric", color="warning"),
-            DPPModule(name="Garment DPP", description="Complete garment lifecycle tracking", icon="fas fa-tshirt", url="/garment", color="primary"),
-            DPPModule(name="Chemical & Dyes", description="Chemical usage and safety tracking", icon="fas fa-flask", url="/chemicals", color="danger"),
-            DPPModule(name="Energy & Utilities", description="Energy consumption monitoring", icon="fas fa-bolt", url="/energy", color="warning"),
-            DPPModule(name="Finishing", description="Finishing processes and quality", icon="fas fa-magic", url="/finishing", color="info"),
-            DPPModule(name="IT DPP", description="IT infrastructure and digital tracking", icon="fas fa-laptop", url="/it", color="dark"),
-            DPPModule(name="Logistics", description="Supply chain and logistics management", icon="fas fa-truck", url="/logistics", color="success"),
-            DPPModule(name="Office DPP", description="Office operations and administration", icon="fas fa-building", url="/office", color="secondary"),
-            DPPModule(name="Office Supplies", description="Office supplies and waste management", icon="fas fa-paperclip", url="/supplies", color="info"),
-            DPPModule(name="Order Delivery", description="Order processing and delivery tracking", icon="fas fa-shipping-fast", url="/orders", color="primary"),
-            DPPModule(name="Packaging", description="Packaging materials and sustainability", icon="fas fa-box", url="/packaging", color="warning"),
-            DPPModule(name="Retail Distribution", description="Retail and distribution management", icon="fas fa-store", url="/retail", color="success"),
-            DPPModule(name="Transport DPP", description="Transportation and carbon footprint", icon="fas fa-car", url="/transport", color="danger")
-        ]
-        
-        for module in sample_modules:
-            db.session.add(module)
-        
-        db.session.commit()
+    if DPPModule.query.first() is None:
+        seed_modules()
         print("✅ Sample DPP modules initialized!")
+    if EmissionFactor.query.first() is None:
+        seed_factors()
+        print("✅ Default emission factors initialized!")
+
+
+@click.command('db-upgrade')
+@with_appcontext
+def db_upgrade_command():
+    """Create missing tables, apply pending schema migrations and seed data"""
+    init_db()
+    print("✅ Database schema is up to date!")
+
+
+def register_commands(app):
+    """Attach db-upgrade and the commands each service module lists in COMMANDS"""
+    from services import (assets, batch, benchmarks, bulk, carbon, jobs, passports, query_plans, rollups, search,
+                          serialization, startup, status_history, summary, transfer)
+
+    app.cli.add_command(db_upgrade_command)
+    for service in (summary, bulk, transfer, query_plans, startup, batch, jobs, carbon, rollups, serialization,
+                    benchmarks, search, assets, status_history, passports):
+        for command in service.COMMANDS:
+            app.cli.add_command(command)
 
-# API Routes
-@app.route('/api/stats')
-def api_stats():
-    """Get general statistics"""
-    try:
-        # Import models here to avoid circular imports
-        from models.garment import Garment
-        from models.orders import Order
-        
-        total_garments = Garment.query.count()
-        total_orders = Order.query.count()
-        
-        return jsonify({
-            'success': True,
-            'total_garments': total_garments,
-            'total_orders': total_orders,
-            'status': 'connected'
-        })
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e),
-            'status': 'error'
-        }), 500
 
 if __name__ == '__main__':
-    # Import and register blueprints here to avoid circular imports
-    from routes.main import main_bp
-    from routes.garment import garment_bp
-    from routes.orders import orders_bp
-    
-    # Register blueprints
-    app.register_blueprint(main_bp)
-    app.register_blueprint(garment_bp, url_prefix='/garment')
-    app.register_blueprint(orders_bp, url_prefix='/orders')
-    
+    # Build the app from the importable `app` module so models and routes
+    # share its `db` (this file runs as __main__, a separate module object)
+    from app import create_app, init_db
+
+    app = create_app()
+    with app.app_context():
+        init_db()
+
     print("🚀 Starting Rabateks DPP Flask Application...")
     print("📊 Dashboard: http://localhost:5000")
     print("👕 Garment DPP: http://localhost:5000/garment")
     print("📦 Orders: http://localhost:5000/orders")
     print("🎲 Random Creator: http://localhost:5000/orders/random-creator")
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    app.run(debug=True, host='0.0.0.0', port=5000)
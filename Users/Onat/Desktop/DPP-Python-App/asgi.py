@@ -0,0 +1,10 @@
+"""ASGI entry point, e.g. `uvicorn asgi:app --workers 4` (run `flask db-upgrade` first)
+
+Listing, detail and stats reads run as async handlers; see services/asgi.py.
+"""
+import os
+
+from app import create_app
+from services.asgi import AsyncAPI
+
+app = AsyncAPI(create_app(os.environ.get('FLASK_CONFIG', 'production')))
@@ -6,11 +6,73 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'rabateks-dpp-secret-key-2024-production'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///database/dpp.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Read by services/instrumentation.py for the per-request SQL metrics
     SQLALCHEMY_RECORD_QUERIES = True
     
+    # Run create_all/migrations/seeding inside create_app() instead of via
+    # `flask db-upgrade` (only sensible for throwaway databases)
+    INIT_DB_ON_STARTUP = False
+    
+    # Connection pool per worker process (size it to the worker's thread count)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_POOL_OVERFLOW = int(os.environ.get('DB_POOL_OVERFLOW', 5))
+    DB_POOL_TIMEOUT = 10
+    
+    # SQLite pragmas applied on every new connection (see services/database.py)
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -64000,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY'
+    }
+    
+    # Serialize API writes through one writer thread with group commit
+    SQLITE_WRITE_QUEUE = os.environ.get('SQLITE_WRITE_QUEUE', '').lower() in ('1', 'true', 'yes')
+    SQLITE_WRITE_QUEUE_BATCH = 100
+    SQLITE_WRITE_QUEUE_WAIT_MS = 2
+    
+    # ASGI mode (asgi.py, services/asgi.py): listing/detail/stats reads run on an async
+    # engine (aiosqlite) with this bounded pool; one handler per pooled connection
+    ASGI_DATABASE_URL = os.environ.get('ASGI_DATABASE_URL')
+    ASGI_POOL_SIZE = int(os.environ.get('ASGI_POOL_SIZE', 8))
+    ASGI_POOL_OVERFLOW = 0
+    ASGI_POOL_TIMEOUT = 5
+    # Requests waiting for a handler (or bridge thread) beyond this count or
+    # time get a 503 with Retry-After
+    ASGI_MAX_QUEUE = 512
+    ASGI_QUEUE_TIMEOUT = 10
+    # Threads running the other (sync Flask) endpoints; each SSE client holds one
+    ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', 32))
+    
     # Session configuration
     PERMANENT_SESSION_LIFETIME = timedelta(hours=24)
     
+    # Fingerprinted, precompressed static files and DPP pages (services/assets.py),
+    # built into instance/ASSET_BUILD_DIR by `flask build-assets` or on first use
+    ASSETS_ENABLED = True
+    ASSET_BUILD_DIR = 'assets'
+    ASSET_URL_PREFIX = '/assets'
+    # Re-check the sources for edits while serving (None: when DEBUG)
+    ASSET_RELOAD = None
+    # Standalone passport pages (GarmentDPP.html, ...) served at DPP_PAGES_URL_PREFIX;
+    # relative to the app folder, unset to not serve them
+    DPP_PAGES_DIR = os.environ.get('DPP_PAGES_DIR')
+    DPP_PAGES_URL_PREFIX = '/dpp'
+    DPP_PAGES_PATTERNS = ('*.html',)
+    DPP_PAGES_ASSET_DIRS = ('assets',)
+    
+    # gzip/brotli compression of large buffered responses, negotiated per request
+    COMPRESS_RESPONSES = True
+    COMPRESS_MIN_SIZE = 1024
+    COMPRESS_LEVEL = 3
+    COMPRESS_BROTLI_QUALITY = 4
+    COMPRESS_MIMETYPES = (
+        'application/json', 'application/vnd.dpp.columnar+json', 'application/x-ndjson',
+        'text/html', 'text/csv', 'text/plain'
+    )
+    
     # Upload configuration
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     UPLOAD_FOLDER = 'uploads'
@@ -20,6 +82,116 @@ class Config:
     DPP_COMPANY = 'Rabateks'
     DPP_CONTACT_EMAIL = 'dpp@rabateks.com'
     
+    # Seconds cached dashboard/API aggregates live before being recomputed
+    STATS_CACHE_TTL = int(os.environ.get('STATS_CACHE_TTL', 30))
+    
+    # Seconds between refreshes of the dashboard's DPP module metrics (services/modules.py);
+    # 0 computes them once, on first use
+    MODULE_REFRESH_SECONDS = int(os.environ.get('MODULE_REFRESH_SECONDS', 60))
+    
+    # Rendered page cache for the dashboard and listing pages (services/render_cache.py):
+    # 'lru' (per process), 'redis' (shared, uses RENDER_CACHE_URL), 'package.module:Class' or 'none'
+    RENDER_CACHE_BACKEND = os.environ.get('RENDER_CACHE_BACKEND', 'lru')
+    RENDER_CACHE_URL = os.environ.get('RENDER_CACHE_URL', 'redis://localhost:6379/0')
+    RENDER_CACHE_SIZE = 256
+    RENDER_CACHE_TTL = int(os.environ.get('RENDER_CACHE_TTL', 300))
+    
+    # Request metrics at METRICS_PATH plus slow-query / N+1 warnings (services/instrumentation.py)
+    INSTRUMENTATION_ENABLED = True
+    METRICS_PATH = '/metrics'
+    SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS', 100))
+    N_PLUS_ONE_THRESHOLD = 10
+    # Allow ?_profile=1 / X-Profile: 1 to dump a cProfile of the request to instance/PROFILE_DIR
+    PROFILE_REQUESTS = os.environ.get('PROFILE_REQUESTS', '').lower() in ('1', 'true', 'yes')
+    PROFILE_DIR = 'profiles'
+    
+    # Encode jsonify() responses with orjson when it is installed (services/serialization.py)
+    FAST_JSON = True
+    
+    # Upper bound for one /api/garments/batch or /api/orders/batch request
+    BATCH_MAX_OPERATIONS = 10000
+    
+    # Upper bound for a single /orders/api/orders/bulk-generate request
+    BULK_GENERATE_MAX_COUNT = 1000000
+    
+    # Compute garment carbon_footprint/sustainability_score from the emission
+    # factors on every write (services/carbon.py) instead of trusting the client
+    CARBON_COMPUTE_ON_WRITE = True
+    CARBON_RESCORE_CHUNK_SIZE = 50000
+    
+    # Background jobs (services/jobs.py) are queued in their own SQLite database
+    SQLALCHEMY_BINDS = {
+        'jobs': os.environ.get('JOBS_DATABASE_URL') or 'sqlite:///database/jobs.db',
+        'events': os.environ.get('EVENTS_DATABASE_URL') or 'sqlite:///database/events.db'
+    }
+    JOBS_ENABLED = True
+    # Run the job runner inside web workers; set to false when `flask run-jobs` runs separately
+    JOBS_RUN_IN_WEB = os.environ.get('JOBS_RUN_IN_WEB', 'true').lower() in ('1', 'true', 'yes')
+    # 'thread', 'process' (spawned processes, each with its own create_app())
+    # or 'inline' (run in the submitting request; for tests)
+    JOB_EXECUTOR = os.environ.get('JOB_EXECUTOR', 'thread')
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    # Max running jobs per kind across all runners; kinds not listed are only limited by JOB_WORKERS
+    JOB_CONCURRENCY = {
+        'orders.bulk_delete': 1,
+        'orders.generate': 1,
+        'stats.rebuild': 1,
+        'rollups.rebuild': 1,
+        'garments.rescore': 1,
+        'import': 1,
+        'orders.compact_status_history': 1,
+        'garments.render_passports': 1,
+        'search.catch_up': 1
+    }
+    JOB_MAX_ATTEMPTS = 3
+    # Seconds before the first retry; doubles with every further attempt
+    JOB_RETRY_BACKOFF = 5
+    JOB_POLL_INTERVAL = 1.0
+    JOB_HEARTBEAT_SECONDS = 10
+    # Running jobs without a heartbeat for this long are requeued
+    JOB_STALE_SECONDS = 60
+    JOB_RETENTION_DAYS = 7
+    # Jobs queued by the runners every N seconds (one per period across all runners)
+    JOB_SCHEDULE = {
+        'orders.compact_status_history': 6 * 3600,
+        # Bulk loads queue their own catch-up; this retries one that failed
+        'search.catch_up': 600
+    }
+    
+    # Order status transitions older than this are compacted to each order's
+    # latest status (services/status_history.py); duration aggregates are kept
+    STATUS_HISTORY_RETENTION_DAYS = int(os.environ.get('STATUS_HISTORY_RETENTION_DAYS', 90))
+    
+    # Garment/order change feed at /api/changes (SSE) and /api/changes/poll (services/change_feed.py),
+    # stored in the 'events' bind. SSE holds a connection per client: use threaded or async workers.
+    CHANGE_FEED_ENABLED = True
+    CHANGE_FEED_POLL_INTERVAL = 0.5
+    CHANGE_FEED_BUFFER = 1000
+    # Events kept for clients resuming with Last-Event-ID
+    CHANGE_FEED_RETENTION = 100000
+    # A table with more changed rows per commit is sent as a reset
+    CHANGE_FEED_MAX_IDS = 500
+    CHANGE_FEED_KEEPALIVE = 15
+    # Streams close after this long; EventSource reconnects with Last-Event-ID
+    CHANGE_FEED_STREAM_SECONDS = 300
+    CHANGE_FEED_RETRY_MS = 3000
+    CHANGE_FEED_LONG_POLL_SECONDS = 25
+    
+    # Garment passports (services/passports.py), cached under instance/PASSPORT_CACHE_DIR.
+    # PASSPORT_BASE_URL is the public root encoded in the QR codes
+    PASSPORT_CACHE_DIR = 'passports'
+    PASSPORT_BASE_URL = os.environ.get('PASSPORT_BASE_URL', 'http://localhost:5000')
+    PASSPORT_MAX_AGE = 300
+    # Processes for batch rendering (default: one per CPU)
+    PASSPORT_WORKERS = int(os.environ.get('PASSPORT_WORKERS', 0)) or None
+    
+    # Matches per search query that are ranked, counted and faceted (services/search.py)
+    SEARCH_WINDOW = 1000
+    
+    # `flask benchmark --baseline`: allowed relative p50/p99 slowdown and
+    # throughput drop, ignoring latency changes under min_ms (services/benchmarks.py)
+    BENCHMARK_THRESHOLDS = {'p50': 0.25, 'p99': 0.5, 'throughput': 0.2, 'min_ms': 1.0}
+    
 class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
@@ -34,6 +206,10 @@ class TestingConfig(Config):
     """Testing configuration"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_BINDS = {'jobs': 'sqlite:///:memory:', 'events': 'sqlite:///:memory:'}
+    JOB_EXECUTOR = 'inline'
+    MODULE_REFRESH_SECONDS = 0
+    INIT_DB_ON_STARTUP = True
     WTF_CSRF_ENABLED = False
 
 config = {
@@ -0,0 +1,32 @@
+from app import db
+from datetime import datetime
+
+class EmissionFactor(db.Model):
+    __tablename__ = 'emission_factors'
+    __table_args__ = (
+        db.UniqueConstraint('kind', 'key', name='uq_emission_factors_kind_key'),
+    )
+
+    # fabric: kg CO2e per kg of fabric; country/facility: multipliers on the
+    # per-unit footprint. key '*' is the fallback for unlisted values.
+    KINDS = ['fabric', 'country', 'facility']
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    key = db.Column(db.String(200), nullable=False)
+    factor = db.Column(db.Float, nullable=False)
+    source = db.Column(db.String(200))
+    updated_date = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<EmissionFactor {self.kind}:{self.key}={self.factor}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'key': self.key,
+            'factor': self.factor,
+            'source': self.source,
+            'updated_date': self.updated_date.isoformat() if self.updated_date else None
+        }
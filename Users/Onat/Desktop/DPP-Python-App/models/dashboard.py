@@ -1,6 +1,9 @@
 from app import db
 from datetime import datetime
 
+# The dashboard summary is a single row with a fixed primary key
+SUMMARY_ID = 1
+
 class DashboardStats(db.Model):
     __tablename__ = 'dashboard_stats'
     
@@ -9,6 +12,17 @@ class DashboardStats(db.Model):
     manufacturing_processes = db.Column(db.Integer, default=0)
     total_co2_monthly = db.Column(db.Float, default=0.0)
     monthly_operations = db.Column(db.Float, default=0.0)
+    
+    # Materialized counters, maintained incrementally by services/summary.py
+    total_garments = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    garment_quantity = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    total_carbon = db.Column(db.Float, default=0.0, nullable=False, server_default='0')
+    total_orders = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    order_quantity = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    pending_orders = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    processing_orders = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    completed_orders = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    cancelled_orders = db.Column(db.Integer, default=0, nullable=False, server_default='0')
     last_updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def to_dict(self):
@@ -17,8 +31,31 @@ class DashboardStats(db.Model):
             'manufacturing_processes': self.manufacturing_processes,
             'total_co2_monthly': self.total_co2_monthly,
             'monthly_operations': self.monthly_operations,
+            'total_garments': self.total_garments,
+            'garment_quantity': self.garment_quantity,
+            'total_carbon': round(self.total_carbon or 0, 2),
+            'total_orders': self.total_orders,
+            'order_quantity': self.order_quantity,
+            'pending_orders': self.pending_orders,
+            'processing_orders': self.processing_orders,
+            'completed_orders': self.completed_orders,
+            'cancelled_orders': self.cancelled_orders,
             'last_updated': self.last_updated.isoformat() if self.last_updated else None
         }
+    
+    @classmethod
+    def current(cls):
+        """Get the summary row; computed from the raw tables, unsaved, if missing
+
+        Reads never write: a missing row is recreated by a queued stats.rebuild
+        job (or `flask rebuild-stats`).
+        """
+        stats = db.session.get(cls, SUMMARY_ID)
+        if stats is None:
+            from services.summary import SEED_VALUES, compute_counters, schedule_rebuild
+            stats = cls(id=SUMMARY_ID, **SEED_VALUES, **compute_counters(db.session.connection()))
+            schedule_rebuild()
+        return stats
 
 class DPPModule(db.Model):
     __tablename__ = 'dpp_modules'
@@ -0,0 +1,64 @@
+from app import db
+
+class Country(db.Model):
+    """Interned country names referenced by orders and garments"""
+    __tablename__ = 'countries'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True)
+
+    def __repr__(self):
+        return f'<Country {self.id}: {self.name}>'
+
+class Facility(db.Model):
+    """Interned production facility names"""
+    __tablename__ = 'facilities'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False, unique=True)
+
+    def __repr__(self):
+        return f'<Facility {self.id}: {self.name}>'
+
+class Fabric(db.Model):
+    """Interned fabric type/name/construction combinations ('' stands for unset)"""
+    __tablename__ = 'fabrics'
+    __table_args__ = (
+        db.UniqueConstraint('fabric_type', 'fabric_name', 'fabric_construction', name='uq_fabrics_combination'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    fabric_type = db.Column(db.String(100), nullable=False, default='')
+    fabric_name = db.Column(db.String(100), nullable=False, default='')
+    fabric_construction = db.Column(db.String(100), nullable=False, default='')
+
+    def __repr__(self):
+        return f'<Fabric {self.id}: {self.fabric_type}/{self.fabric_name}/{self.fabric_construction}>'
+
+class DimensionField:
+    """A text attribute stored as a key into one of the dimension tables above
+
+    Reading decodes the key through the lookup cache in services/dimensions.py;
+    writing stores the key right away when the value is already known and
+    otherwise keeps the value until flush, when it is interned.
+    """
+
+    def __init__(self, dimension, part='name', nullable=True):
+        self.dimension = dimension
+        self.part = part
+        # Whether the old text column accepted NULL (imports require the others)
+        self.nullable = nullable
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        from services.dimensions import get_value
+        return get_value(obj, self)
+
+    def __set__(self, obj, value):
+        from services.dimensions import set_value
+        set_value(obj, self, value)
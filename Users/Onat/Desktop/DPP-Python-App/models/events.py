@@ -0,0 +1,17 @@
+from app import db
+from datetime import datetime
+
+class ChangeEvent(db.Model):
+    """One committed write to garments/orders, kept in its own SQLite database (the 'events' bind)"""
+    __tablename__ = 'change_events'
+    __bind_key__ = 'events'
+    # AUTOINCREMENT: sequence numbers are never reused after old events are purged
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    tables = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    created_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ChangeEvent {self.id} {self.tables}>'
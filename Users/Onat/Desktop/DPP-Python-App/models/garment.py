@@ -1,19 +1,25 @@
 from app import db
-from datetime import datetime
-from sqlalchemy import func
+from models.dimensions import DimensionField
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
 
 class Garment(db.Model):
     __tablename__ = 'garments'
+    __table_args__ = (
+        # Newest-first listings and (created_date, id) keyset pagination
+        db.Index('ix_garments_created_date_id', 'created_date', 'id'),
+        # Covers every column read by get_stats(), so it never touches the table
+        db.Index('ix_garments_stats', 'style_name', 'quantity', 'fabric_weight', 'carbon_footprint',
+                 'sustainability_score'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    country = db.Column(db.String(100), nullable=False)
-    production_facility = db.Column(db.String(200), nullable=False)
+    country_id = db.Column(db.Integer, db.ForeignKey('countries.id'), nullable=False)
+    facility_id = db.Column(db.Integer, db.ForeignKey('facilities.id'), nullable=False)
     po_number = db.Column(db.String(50), nullable=False, unique=True)
     style_name = db.Column(db.String(100), nullable=False)
     product_type = db.Column(db.String(100), nullable=False)
-    fabric_type = db.Column(db.String(100), nullable=False)
-    fabric_name = db.Column(db.String(100))
-    fabric_construction = db.Column(db.String(100))
+    fabric_id = db.Column(db.Integer, db.ForeignKey('fabrics.id'), nullable=False)
     fabric_weight = db.Column(db.Float)  # in grams
     quantity = db.Column(db.Integer, nullable=False)
     carbon_footprint = db.Column(db.Float, default=0.0)  # in kg CO2
@@ -21,6 +27,13 @@ class Garment(db.Model):
     created_date = db.Column(db.DateTime, default=datetime.utcnow)
     updated_date = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Stored as keys into the dimension tables (services/dimensions.py)
+    country = DimensionField('country', nullable=False)
+    production_facility = DimensionField('facility', nullable=False)
+    fabric_type = DimensionField('fabric', 'fabric_type', nullable=False)
+    fabric_name = DimensionField('fabric', 'fabric_name')
+    fabric_construction = DimensionField('fabric', 'fabric_construction')
+    
     def __repr__(self):
         return f'<Garment {self.style_name} - {self.po_number}>'
     
@@ -45,17 +58,60 @@ class Garment(db.Model):
     
     @classmethod
     def get_stats(cls):
-        """Get garment statistics"""
-        total_count = cls.query.count()
-        total_quantity = db.session.query(func.sum(cls.quantity)).scalar() or 0
-        unique_styles = db.session.query(func.count(func.distinct(cls.style_name))).scalar() or 0
-        avg_weight = db.session.query(func.avg(cls.fabric_weight)).scalar() or 0
-        total_carbon = db.session.query(func.sum(cls.carbon_footprint)).scalar() or 0
+        """Get garment statistics in a single aggregate query"""
+        return cls.stats_from_row(db.session.execute(cls.stats_query()).one())
+    
+    @classmethod
+    def stats_query(cls):
+        """The aggregate query behind get_stats() (also run by the async API)"""
+        return select(
+            func.count(cls.id),
+            func.sum(cls.quantity),
+            func.count(func.distinct(cls.style_name)),
+            func.avg(cls.fabric_weight),
+            func.sum(cls.carbon_footprint),
+            func.avg(cls.sustainability_score)
+        )
+    
+    @classmethod
+    def stats_from_row(cls, row):
+        total_count, total_quantity, unique_styles, avg_weight, total_carbon, avg_score = row
         
         return {
-            'total_count': total_count,
-            'total_quantity': total_quantity,
-            'unique_styles': unique_styles,
+            'total_count': total_count or 0,
+            'total_quantity': total_quantity or 0,
+            'unique_styles': unique_styles or 0,
             'avg_weight': round(avg_weight, 2) if avg_weight else 0,
-            'total_carbon': round(total_carbon, 2) if total_carbon else 0
-        }
\ No newline at end of file
+            'total_carbon': round(total_carbon, 2) if total_carbon else 0,
+            'avg_score': round(avg_score, 2) if avg_score else 0
+        }
+    
+    @classmethod
+    def random_columns(cls, count, rng, now=None, spread_days=0):
+        """Build `count` random garments column by column for bulk inserts"""
+        from models.orders import Order
+        
+        now = now or datetime.utcnow()
+        # Unique PO numbers from one 64-bit random block per row
+        id_hex = rng.getrandbits(64 * count).to_bytes(8 * count, 'big').hex().upper() if count else ''
+        
+        # Same value pools as the random orders
+        columns = {
+            'country': rng.choices(Order.RANDOM_COUNTRIES, k=count),
+            'production_facility': rng.choices(Order.RANDOM_FACILITIES, k=count),
+            'po_number': [f"PO-{id_hex[i:i + 16]}" for i in range(0, 16 * count, 16)],
+            'style_name': [f"Style-{n}" for n in rng.choices(range(1000, 10000), k=count)],
+            'product_type': rng.choices(Order.RANDOM_PRODUCT_TYPES, k=count),
+            'fabric_type': rng.choices(Order.RANDOM_FABRIC_TYPES, k=count),
+            'fabric_name': rng.choices(Order.RANDOM_FABRIC_NAMES, k=count),
+            'fabric_construction': rng.choices(Order.RANDOM_CONSTRUCTIONS, k=count),
+            'fabric_weight': rng.choices(Order.RANDOM_WEIGHTS, k=count),
+            'quantity': rng.choices(range(100, 5001), k=count)
+        }
+        if spread_days:
+            span = spread_days * 86400
+            columns['created_date'] = [now - timedelta(seconds=rng.random() * span) for _ in range(count)]
+        else:
+            columns['created_date'] = [now] * count
+        columns['updated_date'] = columns['created_date']
+        return columns
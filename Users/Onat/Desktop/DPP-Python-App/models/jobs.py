@@ -0,0 +1,68 @@
+from app import db
+from datetime import datetime
+import json
+
+class Job(db.Model):
+    """Background job row, kept in its own SQLite database (the 'jobs' bind)"""
+    __tablename__ = 'jobs'
+    __bind_key__ = 'jobs'
+    __table_args__ = (
+        # Dispatcher: next queued job by priority and age
+        db.Index('ix_jobs_status_priority', 'status', 'priority', 'created_date'),
+    )
+
+    STATUSES = ['queued', 'running', 'completed', 'failed', 'cancelled']
+    FINISHED_STATUSES = ['completed', 'failed', 'cancelled']
+
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    progress = db.Column(db.Text)
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=1)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    worker = db.Column(db.String(100))
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    heartbeat = db.Column(db.DateTime)
+    created_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_date = db.Column(db.DateTime)
+    finished_date = db.Column(db.DateTime)
+
+    @staticmethod
+    def row_to_dict(row):
+        """Serialize a jobs table row (ORM instance or Core row)"""
+        def loads(value):
+            return json.loads(value) if value else None
+
+        def iso(value):
+            return value.isoformat() if value else None
+
+        return {
+            'id': row.id,
+            'kind': row.kind,
+            'params': loads(row.params) or {},
+            'status': row.status,
+            'priority': row.priority,
+            'progress': loads(row.progress) or {},
+            'result': loads(row.result),
+            'error': row.error,
+            'attempts': row.attempts,
+            'max_attempts': row.max_attempts,
+            'cancel_requested': bool(row.cancel_requested),
+            'worker': row.worker,
+            'run_after': iso(row.run_after),
+            'heartbeat': iso(row.heartbeat),
+            'created_date': iso(row.created_date),
+            'started_date': iso(row.started_date),
+            'finished_date': iso(row.finished_date)
+        }
+
+    def to_dict(self):
+        return self.row_to_dict(self)
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
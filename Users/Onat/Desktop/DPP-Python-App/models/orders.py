@@ -1,27 +1,45 @@
 from app import db
-from datetime import datetime
+from models.dimensions import DimensionField
+from datetime import datetime, timedelta
+from sqlalchemy import func
 import uuid
 import random
 
 class Order(db.Model):
     __tablename__ = 'orders'
+    __table_args__ = (
+        # Newest-first listings and (created_date, id) keyset pagination
+        db.Index('ix_orders_created_date_id', 'created_date', 'id'),
+        # Status filtered listings, ordered by date
+        db.Index('ix_orders_status_created_date', 'status', 'created_date', 'id'),
+        # Per-status counts and quantity sums (get_stats, summary rebuild)
+        db.Index('ix_orders_status_quantity', 'status', 'quantity'),
+        db.Index('ix_orders_po_number', 'po_number'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.String(50), unique=True, nullable=False)
-    country = db.Column(db.String(100), nullable=False)
-    facility = db.Column(db.String(200), nullable=False)
+    country_id = db.Column(db.Integer, db.ForeignKey('countries.id'), nullable=False)
+    facility_id = db.Column(db.Integer, db.ForeignKey('facilities.id'), nullable=False)
     po_number = db.Column(db.String(50), nullable=False)
     style_name = db.Column(db.String(100), nullable=False)
     product_type = db.Column(db.String(100), nullable=False)
-    fabric_type = db.Column(db.String(100))
-    fabric_name = db.Column(db.String(100))
-    fabric_construction = db.Column(db.String(100))
+    fabric_id = db.Column(db.Integer, db.ForeignKey('fabrics.id'))
     fabric_weight = db.Column(db.Float)  # in grams
     quantity = db.Column(db.Integer, nullable=False)
     status = db.Column(db.String(20), default='pending')  # pending, processing, completed, cancelled
     created_date = db.Column(db.DateTime, default=datetime.utcnow)
     updated_date = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Stored as keys into the dimension tables (services/dimensions.py)
+    country = DimensionField('country', nullable=False)
+    facility = DimensionField('facility', nullable=False)
+    fabric_type = DimensionField('fabric', 'fabric_type')
+    fabric_name = DimensionField('fabric', 'fabric_name')
+    fabric_construction = DimensionField('fabric', 'fabric_construction')
+    
+    STATUSES = ['pending', 'processing', 'completed', 'cancelled']
+    
     def __init__(self, **kwargs):
         super(Order, self).__init__(**kwargs)
         if not self.order_id:
@@ -50,32 +68,76 @@ class Order(db.Model):
         }
     
     @classmethod
-    def create_random_order(cls):
-        """Create a random order for testing"""
-        countries = ['Turkey', 'Bangladesh', 'Vietnam', 'China', 'India', 'Pakistan']
-        facilities = [
-            'Rabateks Textile Manufacturing',
-            'Mango Apparel Facilities',
-            'Global Textile Solutions',
-            'Premium Garment Factory',
-            'Sustainable Fashion Hub',
-            'Modern Textile Complex'
-        ]
-        product_types = ['T-Shirt', 'Polo Shirt', 'Dress Shirt', 'Casual Shirt', 'Blouse', 'Tank Top']
-        fabric_types = ['Cotton', 'Polyester', 'Cotton Blend', 'Linen', 'Viscose', 'Modal']
-        fabric_names = ['Premium Cotton', 'Eco-Friendly Blend', 'Organic Cotton', 'Recycled Polyester', 'Bamboo Fiber']
-        constructions = ['Jersey', 'Poplin', 'Twill', 'Canvas', 'Interlock', 'Rib']
+    def get_stats(cls):
+        """Get order counters per status in a single grouped query"""
+        rows = db.session.query(cls.status, func.count(cls.id)).group_by(cls.status).all()
+        counts = dict(rows)
         
+        stats = {'total_orders': sum(counts.values())}
+        for status in cls.STATUSES:
+            stats[f'{status}_orders'] = counts.get(status, 0)
+        return stats
+    
+    # Value pools used by the random order generators
+    RANDOM_COUNTRIES = ['Turkey', 'Bangladesh', 'Vietnam', 'China', 'India', 'Pakistan']
+    RANDOM_FACILITIES = [
+        'Rabateks Textile Manufacturing',
+        'Mango Apparel Facilities',
+        'Global Textile Solutions',
+        'Premium Garment Factory',
+        'Sustainable Fashion Hub',
+        'Modern Textile Complex'
+    ]
+    RANDOM_PRODUCT_TYPES = ['T-Shirt', 'Polo Shirt', 'Dress Shirt', 'Casual Shirt', 'Blouse', 'Tank Top']
+    RANDOM_FABRIC_TYPES = ['Cotton', 'Polyester', 'Cotton Blend', 'Linen', 'Viscose', 'Modal']
+    RANDOM_FABRIC_NAMES = ['Premium Cotton', 'Eco-Friendly Blend', 'Organic Cotton', 'Recycled Polyester', 'Bamboo Fiber']
+    RANDOM_CONSTRUCTIONS = ['Jersey', 'Poplin', 'Twill', 'Canvas', 'Interlock', 'Rib']
+    RANDOM_STATUSES = ['pending', 'processing', 'completed']
+    # 120.0 to 300.0 g/m², in 0.1 steps
+    RANDOM_WEIGHTS = [weight / 10 for weight in range(1200, 3001)]
+    
+    @classmethod
+    def create_random_order(cls, rng=random):
+        """Create a random order for testing"""
         return cls(
-            country=random.choice(countries),
-            facility=random.choice(facilities),
-            po_number=f"PO-{random.randint(10000, 99999)}",
-            style_name=f"Style-{random.randint(1000, 9999)}",
-            product_type=random.choice(product_types),
-            fabric_type=random.choice(fabric_types),
-            fabric_name=random.choice(fabric_names),
-            fabric_construction=random.choice(constructions),
-            fabric_weight=round(random.uniform(120, 300), 1),
-            quantity=random.randint(100, 5000),
-            status=random.choice(['pending', 'processing', 'completed'])
-        )
\ No newline at end of file
+            country=rng.choice(cls.RANDOM_COUNTRIES),
+            facility=rng.choice(cls.RANDOM_FACILITIES),
+            po_number=f"PO-{rng.randint(10000, 99999)}",
+            style_name=f"Style-{rng.randint(1000, 9999)}",
+            product_type=rng.choice(cls.RANDOM_PRODUCT_TYPES),
+            fabric_type=rng.choice(cls.RANDOM_FABRIC_TYPES),
+            fabric_name=rng.choice(cls.RANDOM_FABRIC_NAMES),
+            fabric_construction=rng.choice(cls.RANDOM_CONSTRUCTIONS),
+            fabric_weight=round(rng.uniform(120, 300), 1),
+            quantity=rng.randint(100, 5000),
+            status=rng.choice(cls.RANDOM_STATUSES)
+        )
+    
+    @classmethod
+    def random_columns(cls, count, rng, now=None, spread_days=0):
+        """Build `count` random orders column by column for bulk inserts"""
+        now = now or datetime.utcnow()
+        # One 64-bit random block per row, generated in a single call
+        id_hex = rng.getrandbits(64 * count).to_bytes(8 * count, 'big').hex().upper() if count else ''
+        
+        columns = {
+            'order_id': [f"ORD-{id_hex[i:i + 16]}" for i in range(0, 16 * count, 16)],
+            'country': rng.choices(cls.RANDOM_COUNTRIES, k=count),
+            'facility': rng.choices(cls.RANDOM_FACILITIES, k=count),
+            'po_number': [f"PO-{n}" for n in rng.choices(range(10000, 100000), k=count)],
+            'style_name': [f"Style-{n}" for n in rng.choices(range(1000, 10000), k=count)],
+            'product_type': rng.choices(cls.RANDOM_PRODUCT_TYPES, k=count),
+            'fabric_type': rng.choices(cls.RANDOM_FABRIC_TYPES, k=count),
+            'fabric_name': rng.choices(cls.RANDOM_FABRIC_NAMES, k=count),
+            'fabric_construction': rng.choices(cls.RANDOM_CONSTRUCTIONS, k=count),
+            'fabric_weight': rng.choices(cls.RANDOM_WEIGHTS, k=count),
+            'quantity': rng.choices(range(100, 5001), k=count),
+            'status': rng.choices(cls.RANDOM_STATUSES, k=count)
+        }
+        if spread_days:
+            span = spread_days * 86400
+            columns['created_date'] = [now - timedelta(seconds=rng.random() * span) for _ in range(count)]
+        else:
+            columns['created_date'] = [now] * count
+        columns['updated_date'] = columns['created_date']
+        return columns
@@ -0,0 +1,40 @@
+from app import db
+
+# Time bucket sizes kept for every rollup, finest first
+GRAINS = ['hour', 'day', 'month']
+
+class OrderRollup(db.Model):
+    """Orders per created-date bucket x country x facility x product type x status"""
+    __tablename__ = 'order_rollups'
+    # Clustered on (grain, bucket, dimensions): upserts and time range scans
+    # read the table itself instead of going through a separate index
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    grain = db.Column(db.String(5), primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)
+    country = db.Column(db.String(100), primary_key=True)
+    facility = db.Column(db.String(200), primary_key=True)
+    product_type = db.Column(db.String(100), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<OrderRollup {self.grain} {self.bucket} {self.country}/{self.facility}/{self.status}: {self.orders}>'
+
+class GarmentRollup(db.Model):
+    """Garments and their carbon per created-date bucket x country x facility x product type"""
+    __tablename__ = 'garment_rollups'
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    grain = db.Column(db.String(5), primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)
+    country = db.Column(db.String(100), primary_key=True)
+    facility = db.Column(db.String(200), primary_key=True)
+    product_type = db.Column(db.String(100), primary_key=True)
+    garments = db.Column(db.Integer, nullable=False, default=0)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    carbon = db.Column(db.Float, nullable=False, default=0.0)  # kg CO2e
+
+    def __repr__(self):
+        return f'<GarmentRollup {self.grain} {self.bucket} {self.country}/{self.facility}: {self.garments}>'
@@ -0,0 +1,16 @@
+from app import db
+from datetime import datetime
+
+class SearchBacklog(db.Model):
+    """Id range of bulk-loaded rows not yet in a full-text index (services/search.py)"""
+    __tablename__ = 'search_backlog'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # SearchSpec kind: 'garments' or 'orders'
+    kind = db.Column(db.String(20), nullable=False)
+    first_id = db.Column(db.Integer, nullable=False)
+    last_id = db.Column(db.Integer, nullable=False)
+    created_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SearchBacklog {self.kind} {self.first_id}-{self.last_id}>'
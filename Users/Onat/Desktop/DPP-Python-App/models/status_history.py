@@ -0,0 +1,44 @@
+from app import db
+
+class OrderStatusChange(db.Model):
+    """One status transition of an order, appended in the writer's transaction
+
+    from_status is NULL for the first row of an order, to_status is NULL once
+    the order was deleted. Rows are never updated; compaction only drops rows
+    superseded by a later one (services/status_history.py).
+    """
+    __tablename__ = 'order_status_changes'
+    __table_args__ = (
+        # Latest row per order, and an order's history in order
+        db.Index('ix_order_status_changes_order_id_id', 'order_id', 'id'),
+        db.Index('ix_order_status_changes_changed_at', 'changed_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    # No foreign keys: the history outlives deleted orders
+    order_id = db.Column(db.Integer, nullable=False)
+    facility_id = db.Column(db.Integer)
+    from_status = db.Column(db.String(20))
+    to_status = db.Column(db.String(20))
+    changed_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<OrderStatusChange {self.order_id}: {self.from_status} -> {self.to_status}>'
+
+class OrderStatusDuration(db.Model):
+    """Orders entering and leaving a status per day x facility x status, with the time spent in it"""
+    __tablename__ = 'order_status_durations'
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    day = db.Column(db.DateTime, primary_key=True)
+    facility_id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    # Orders that entered the status that day
+    entered = db.Column(db.Integer, nullable=False, default=0)
+    # Stays that ended that day by moving to another status, and their lengths
+    exited = db.Column(db.Integer, nullable=False, default=0)
+    total_seconds = db.Column(db.Float, nullable=False, default=0.0)
+    max_seconds = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<OrderStatusDuration {self.day} {self.facility_id}/{self.status}: {self.exited}>'
@@ -1,22 +1,52 @@
-from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for
+from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, abort, current_app
 from app import db
+from models.carbon import EmissionFactor
 from models.garment import Garment
+from services.listing import listing_response
+from services import carbon, stats as stats_engine
+from services.database import run_write
+from services.serialization import json_flag
+from services.render_cache import cached_page
 from datetime import datetime
 
 garment_bp = Blueprint('garment', __name__)
 
 @garment_bp.route('/')
+@cached_page('garments')
 def index():
     """Garment DPP main page"""
     garments = Garment.query.order_by(Garment.created_date.desc()).all()
-    stats = Garment.get_stats()
+    stats = stats_engine.garment_stats()
     return render_template('garment.html', garments=garments, stats=stats)
 
 @garment_bp.route('/api/garments')
 def api_garments():
-    """API endpoint for all garments"""
-    garments = Garment.query.all()
-    return jsonify([garment.to_dict() for garment in garments])
+    """API endpoint for all garments (supports cursor, limit, fields and format=ndjson)"""
+    return listing_response(Garment)
+
+@garment_bp.route('/api/garments/import', methods=['POST'])
+def api_import_garments():
+    """API endpoint to bulk upsert garments from CSV, NDJSON or XLSX (keyed on po_number)"""
+    from services.transfer import import_response
+    return import_response('garments')
+
+@garment_bp.route('/api/garments/export')
+def api_export_garments():
+    """API endpoint to export all garments as CSV, NDJSON or XLSX"""
+    from services.transfer import export_response
+    return export_response('garments')
+
+@garment_bp.route('/api/garments/batch', methods=['POST'])
+def api_batch_garments():
+    """API endpoint to create/update/delete many garments in one transaction"""
+    from services.batch import batch_response
+    return batch_response('garments')
+
+@garment_bp.route('/api/garments/search')
+def api_search_garments():
+    """API endpoint for ranked full-text garment search with country/product_type facets"""
+    from services.search import search_response
+    return search_response('garments')
 
 @garment_bp.route('/api/garments/<int:garment_id>')
 def api_garment_detail(garment_id):
@@ -24,6 +54,35 @@ def api_garment_detail(garment_id):
     garment = Garment.query.get_or_404(garment_id)
     return jsonify(garment.to_dict())
 
+@garment_bp.route('/<int:garment_id>/passport')
+def passport(garment_id):
+    """Public Digital Product Passport page of a garment, served from the passport cache"""
+    from services.passports import passport_response
+    return passport_response(garment_id, 'html')
+
+@garment_bp.route('/api/garments/<int:garment_id>/passport')
+def api_garment_passport(garment_id):
+    """API endpoint for a garment's passport as JSON-LD (format=qr for its QR payload, qr.svg for the code)"""
+    from services.passports import DOCUMENTS, passport_response
+    document = request.args.get('format', 'jsonld')
+    if document not in DOCUMENTS:
+        return jsonify({
+            'success': False,
+            'message': f"format must be one of {', '.join(DOCUMENTS)}"
+        }), 400
+    return passport_response(garment_id, document)
+
+@garment_bp.route('/api/garments/passports/render', methods=['POST'])
+def api_render_passports():
+    """API endpoint to pre-render the passports that aren't cached yet, in the background"""
+    from services.jobs import submit_job, job_accepted
+    
+    data = request.get_json(silent=True) or {}
+    job_id = submit_job('garments.render_passports', {
+        'force': bool(data.get('force', False))
+    })
+    return job_accepted(job_id, 'Rendering passports')
+
 @garment_bp.route('/api/garments', methods=['POST'])
 def api_create_garment():
     """API endpoint to create new garment"""
@@ -45,8 +104,7 @@ def api_create_garment():
             sustainability_score=int(data.get('sustainability_score', 50))
         )
         
-        db.session.add(garment)
-        db.session.commit()
+        run_write(lambda session: session.add(garment))
         
         return jsonify({
             'success': True,
@@ -65,26 +123,30 @@ def api_create_garment():
 def api_update_garment(garment_id):
     """API endpoint to update garment"""
     try:
-        garment = Garment.query.get_or_404(garment_id)
         data = request.get_json()
         
-        # Update fields
-        for field in ['country', 'production_facility', 'po_number', 'style_name', 
-                     'product_type', 'fabric_type', 'fabric_name', 'fabric_construction']:
-            if field in data:
-                setattr(garment, field, data[field])
+        def update(session):
+            garment = session.get(Garment, garment_id) or abort(404)
+            
+            # Update fields
+            for field in ['country', 'production_facility', 'po_number', 'style_name', 
+                         'product_type', 'fabric_type', 'fabric_name', 'fabric_construction']:
+                if field in data:
+                    setattr(garment, field, data[field])
+            
+            if 'fabric_weight' in data:
+                garment.fabric_weight = float(data['fabric_weight'])
+            if 'quantity' in data:
+                garment.quantity = int(data['quantity'])
+            if 'carbon_footprint' in data:
+                garment.carbon_footprint = float(data['carbon_footprint'])
+            if 'sustainability_score' in data:
+                garment.sustainability_score = int(data['sustainability_score'])
+            
+            garment.updated_date = datetime.utcnow()
+            return garment
         
-        if 'fabric_weight' in data:
-            garment.fabric_weight = float(data['fabric_weight'])
-        if 'quantity' in data:
-            garment.quantity = int(data['quantity'])
-        if 'carbon_footprint' in data:
-            garment.carbon_footprint = float(data['carbon_footprint'])
-        if 'sustainability_score' in data:
-            garment.sustainability_score = int(data['sustainability_score'])
-        
-        garment.updated_date = datetime.utcnow()
-        db.session.commit()
+        garment = run_write(update)
         
         return jsonify({
             'success': True,
@@ -103,9 +165,11 @@ def api_update_garment(garment_id):
 def api_delete_garment(garment_id):
     """API endpoint to delete garment"""
     try:
-        garment = Garment.query.get_or_404(garment_id)
-        db.session.delete(garment)
-        db.session.commit()
+        def delete(session):
+            garment = session.get(Garment, garment_id) or abort(404)
+            session.delete(garment)
+        
+        run_write(delete)
         
         return jsonify({
             'success': True,
@@ -122,5 +186,63 @@ def api_delete_garment(garment_id):
 @garment_bp.route('/api/stats')
 def api_garment_stats():
     """API endpoint for garment statistics"""
-    stats = Garment.get_stats()
-    return jsonify(stats)
\ No newline at end of file
+    stats = stats_engine.garment_stats()
+    return jsonify(stats)
+@garment_bp.route('/api/emission-factors')
+def api_emission_factors():
+    """API endpoint for the emission factors used to score garments"""
+    factors = EmissionFactor.query.order_by(EmissionFactor.kind, EmissionFactor.key).all()
+    return jsonify({
+        'success': True,
+        'factors': [factor.to_dict() for factor in factors],
+        'manufacturing_kg_per_unit': carbon.MANUFACTURING_KG_PER_UNIT,
+        'default_weight_g': carbon.DEFAULT_WEIGHT_G,
+        'score_reference_kg': carbon.SCORE_REFERENCE_KG
+    })
+
+@garment_bp.route('/api/emission-factors', methods=['PUT'])
+def api_update_emission_factors():
+    """API endpoint to change factors ({"factors": [{kind, key, factor}], "rescore": true})
+
+    By default every garment is then rescored by a background job. Other
+    worker processes see the new factors on their next write (see
+    carbon.get_factors()).
+    """
+    try:
+        from services.jobs import submit_job, job_accepted
+        
+        data = request.get_json() or {}
+        items = data.get('factors')
+        if not isinstance(items, list) or not items:
+            raise ValueError('factors must be a non-empty list')
+        rescore = json_flag(data, 'rescore', True)
+        
+        run_write(lambda session: carbon.set_factors(session, items))
+        carbon.invalidate_factors()
+        
+        if not rescore:
+            return jsonify({
+                'success': True,
+                'message': f'{len(items)} emission factors updated'
+            })
+        job_id = submit_job('garments.rescore', {
+            'chunk_size': current_app.config.get('CARBON_RESCORE_CHUNK_SIZE', carbon.DEFAULT_CHUNK_SIZE)
+        })
+        return job_accepted(job_id, f'{len(items)} emission factors updated, rescoring garments')
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'Error updating emission factors: {str(e)}'
+        }), 400
+
+@garment_bp.route('/api/garments/rescore', methods=['POST'])
+def api_rescore_garments():
+    """API endpoint to recompute every garment's footprint and score in the background"""
+    from services.jobs import submit_job, job_accepted
+    
+    job_id = submit_job('garments.rescore', {
+        'chunk_size': current_app.config.get('CARBON_RESCORE_CHUNK_SIZE', carbon.DEFAULT_CHUNK_SIZE)
+    })
+    return job_accepted(job_id, 'Rescoring garments')
@@ -0,0 +1,76 @@
+from flask import Blueprint, request, jsonify, send_file
+from models.jobs import Job
+from services.jobs import submit_job, get_job, list_jobs, cancel_job, job_kinds, job_file_path, job_accepted
+from services.transfer import MIMETYPES
+import os
+
+jobs_bp = Blueprint('jobs', __name__)
+
+@jobs_bp.route('/')
+def api_jobs():
+    """API endpoint for recent jobs (filter with status and kind)"""
+    status = request.args.get('status')
+    if status and status not in Job.STATUSES:
+        return jsonify({
+            'success': False,
+            'message': f"status must be one of {', '.join(Job.STATUSES)}"
+        }), 400
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    return jsonify({
+        'success': True,
+        'jobs': list_jobs(status=status, kind=request.args.get('kind'), limit=limit),
+        'kinds': job_kinds()
+    })
+
+@jobs_bp.route('/', methods=['POST'])
+def api_submit_job():
+    """API endpoint to queue a job: {"kind": ..., "params": {...}, "priority": 0, "max_attempts": 3}"""
+    try:
+        data = request.get_json() or {}
+        if data.get('kind') in ('import', 'export'):
+            raise ValueError('use the import/export endpoints with background=1 for file jobs')
+        job_id = submit_job(
+            data.get('kind'),
+            data.get('params') or {},
+            priority=int(data.get('priority', 0)),
+            max_attempts=data.get('max_attempts')
+        )
+        return job_accepted(job_id, f"Job {data['kind']} queued")
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error submitting job: {str(e)}'
+        }), 400
+
+@jobs_bp.route('/<job_id>')
+def api_job_status(job_id):
+    """API endpoint for the status, progress and result of a job"""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Unknown job'}), 404
+    return jsonify({'success': True, 'job': job})
+
+@jobs_bp.route('/<job_id>', methods=['DELETE'])
+def api_cancel_job(job_id):
+    """API endpoint to cancel a queued job or stop a running one at its next checkpoint"""
+    job = cancel_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Unknown job'}), 404
+    return jsonify({'success': True, 'message': 'Cancellation requested', 'job': job})
+
+@jobs_bp.route('/<job_id>/download')
+def api_job_download(job_id):
+    """API endpoint to download the file written by a completed export job"""
+    job = get_job(job_id)
+    if job is None or job['kind'] != 'export':
+        return jsonify({'success': False, 'message': 'Unknown export job'}), 404
+    if job['status'] != 'completed':
+        return jsonify({'success': False, 'message': f"Export is {job['status']}"}), 409
+
+    fmt = job['params']['fmt']
+    path = job_file_path(job_id, fmt)
+    if not os.path.exists(path):
+        return jsonify({'success': False, 'message': 'Export file has expired'}), 410
+    return send_file(path, mimetype=MIMETYPES[fmt], as_attachment=True,
+                     download_name=f"{job['params']['kind']}.{fmt}")
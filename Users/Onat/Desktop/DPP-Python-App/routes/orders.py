@@ -1,25 +1,21 @@
-from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for
+from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, current_app, abort
 from app import db
 from models.orders import Order
+from services.listing import listing_response
+from services import stats as stats_engine, status_history
+from services.database import run_write
+from services.render_cache import cached_page
 from datetime import datetime
 import random
 
 orders_bp = Blueprint('orders', __name__)
 
 @orders_bp.route('/')
+@cached_page('orders')
 def index():
     """Orders main page"""
     orders = Order.query.order_by(Order.created_date.desc()).all()
-    total_orders = Order.query.count()
-    pending_orders = Order.query.filter_by(status='pending').count()
-    completed_orders = Order.query.filter_by(status='completed').count()
-    
-    stats = {
-        'total_orders': total_orders,
-        'pending_orders': pending_orders,
-        'completed_orders': completed_orders,
-        'processing_orders': Order.query.filter_by(status='processing').count()
-    }
+    stats = stats_engine.order_stats()
     
     return render_template('orders.html', orders=orders, stats=stats)
 
@@ -30,9 +26,35 @@ def random_creator():
 
 @orders_bp.route('/api/orders')
 def api_orders():
-    """API endpoint for all orders"""
-    orders = Order.query.order_by(Order.created_date.desc()).all()
-    return jsonify([order.to_dict() for order in orders])
+    """API endpoint for all orders (supports cursor, limit, fields, status and format=ndjson)"""
+    filters = {}
+    if request.args.get('status'):
+        filters['status'] = request.args['status']
+    return listing_response(Order, filters)
+
+@orders_bp.route('/api/orders/import', methods=['POST'])
+def api_import_orders():
+    """API endpoint to bulk upsert orders from CSV, NDJSON or XLSX (keyed on order_id)"""
+    from services.transfer import import_response
+    return import_response('orders')
+
+@orders_bp.route('/api/orders/export')
+def api_export_orders():
+    """API endpoint to export all orders as CSV, NDJSON or XLSX"""
+    from services.transfer import export_response
+    return export_response('orders')
+
+@orders_bp.route('/api/orders/batch', methods=['POST'])
+def api_batch_orders():
+    """API endpoint to create/update/delete many orders in one transaction"""
+    from services.batch import batch_response
+    return batch_response('orders')
+
+@orders_bp.route('/api/orders/search')
+def api_search_orders():
+    """API endpoint for ranked full-text order search with country/status/product_type facets"""
+    from services.search import search_response
+    return search_response('orders')
 
 @orders_bp.route('/api/orders/<int:order_id>')
 def api_order_detail(order_id):
@@ -40,6 +62,14 @@ def api_order_detail(order_id):
     order = Order.query.get_or_404(order_id)
     return jsonify(order.to_dict())
 
+@orders_bp.route('/api/orders/<int:order_id>/history')
+def api_order_history(order_id):
+    """API endpoint for an order's status transitions (kept after the order is deleted)"""
+    changes = status_history.order_history(order_id)
+    if not changes:
+        abort(404)
+    return jsonify({'success': True, 'order_id': order_id, 'changes': changes})
+
 @orders_bp.route('/api/orders', methods=['POST'])
 def api_create_order():
     """API endpoint to create new order"""
@@ -60,8 +90,7 @@ def api_create_order():
             status=data.get('status', 'pending')
         )
         
-        db.session.add(order)
-        db.session.commit()
+        run_write(lambda session: session.add(order))
         
         return jsonify({
             'success': True,
@@ -84,11 +113,9 @@ def api_create_random_order():
         created_orders = []
         
         for _ in range(min(count, 50)):  # Limit to 50 orders at once
-            order = Order.create_random_order()
-            db.session.add(order)
-            created_orders.append(order)
+            created_orders.append(Order.create_random_order())
         
-        db.session.commit()
+        run_write(lambda session: session.add_all(created_orders))
         
         return jsonify({
             'success': True,
@@ -103,26 +130,74 @@ def api_create_random_order():
             'message': f'Error creating random orders: {str(e)}'
         }), 400
 
+@orders_bp.route('/api/orders/bulk-generate', methods=['POST'])
+def api_bulk_generate_orders():
+    """API endpoint to bulk insert random orders (count, seed, chunk_size, spread_days, defer_indexes)
+
+    With "background": true the load runs as a job and a 202 with its status_url is returned.
+    The new orders are found by search once the queued search.catch_up job has
+    indexed them (search_pending in the result counts them).
+    """
+    try:
+        from services.bulk import generate_orders, DEFAULT_CHUNK_SIZE
+        from services.jobs import submit_job, job_accepted
+        from services.serialization import json_flag
+        
+        data = request.get_json() or {}
+        count = int(data.get('count', 1000))
+        max_count = current_app.config.get('BULK_GENERATE_MAX_COUNT', 1000000)
+        if count < 1 or count > max_count:
+            raise ValueError(f'count must be between 1 and {max_count}')
+        
+        seed = data.get('seed')
+        options = {
+            'seed': int(seed) if seed is not None else None,
+            'chunk_size': int(data.get('chunk_size', DEFAULT_CHUNK_SIZE)),
+            'spread_days': int(data.get('spread_days', 0)),
+            'defer_indexes': json_flag(data, 'defer_indexes')
+        }
+        if json_flag(data, 'background', False):
+            job_id = submit_job('orders.generate', {'count': count, **options})
+            return job_accepted(job_id, f'Generation of {count} orders queued')
+        
+        result = generate_orders(count, **options)
+        
+        return jsonify({
+            'success': True,
+            'message': f"{result['created']} random orders created successfully",
+            **result
+        }), 201
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error generating orders: {str(e)}'
+        }), 400
+
 @orders_bp.route('/api/orders/<int:order_id>', methods=['PUT'])
 def api_update_order(order_id):
     """API endpoint to update order"""
     try:
-        order = Order.query.get_or_404(order_id)
         data = request.get_json()
         
-        # Update fields
-        for field in ['country', 'facility', 'po_number', 'style_name', 
-                     'product_type', 'fabric_type', 'fabric_name', 'fabric_construction', 'status']:
-            if field in data:
-                setattr(order, field, data[field])
+        def update(session):
+            order = session.get(Order, order_id) or abort(404)
+            
+            # Update fields
+            for field in ['country', 'facility', 'po_number', 'style_name', 
+                         'product_type', 'fabric_type', 'fabric_name', 'fabric_construction', 'status']:
+                if field in data:
+                    setattr(order, field, data[field])
+            
+            if 'fabric_weight' in data:
+                order.fabric_weight = float(data['fabric_weight'])
+            if 'quantity' in data:
+                order.quantity = int(data['quantity'])
+            
+            order.updated_date = datetime.utcnow()
+            return order
         
-        if 'fabric_weight' in data:
-            order.fabric_weight = float(data['fabric_weight'])
-        if 'quantity' in data:
-            order.quantity = int(data['quantity'])
-        
-        order.updated_date = datetime.utcnow()
-        db.session.commit()
+        order = run_write(update)
         
         return jsonify({
             'success': True,
@@ -141,9 +216,11 @@ def api_update_order(order_id):
 def api_delete_order(order_id):
     """API endpoint to delete order"""
     try:
-        order = Order.query.get_or_404(order_id)
-        db.session.delete(order)
-        db.session.commit()
+        def delete(session):
+            order = session.get(Order, order_id) or abort(404)
+            session.delete(order)
+        
+        run_write(delete)
         
         return jsonify({
             'success': True,
@@ -159,20 +236,35 @@ def api_delete_order(order_id):
 
 @orders_bp.route('/api/orders/bulk-delete', methods=['POST'])
 def api_bulk_delete_orders():
-    """API endpoint to delete all orders"""
+    """API endpoint to delete all orders, or those matching status/facility/created_before/created_after
+
+    Runs as a chunked background job; poll the returned status_url for progress
+    and DELETE it to cancel.
+    """
     try:
-        deleted_count = Order.query.count()
-        Order.query.delete()
-        db.session.commit()
+        from services.jobs import submit_job, job_accepted
+        from services.purge import parse_filters, DEFAULT_CHUNK_SIZE, RECLAIM_MODES
         
-        return jsonify({
-            'success': True,
-            'message': f'{deleted_count} orders deleted successfully'
+        data = request.get_json(silent=True) or {}
+        filters = parse_filters(data)
+        chunk_size = int(data.get('chunk_size', DEFAULT_CHUNK_SIZE))
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be positive')
+        reclaim = data.get('reclaim')
+        if reclaim and reclaim not in RECLAIM_MODES:
+            raise ValueError(f"reclaim must be one of {', '.join(RECLAIM_MODES)}")
+        
+        job_id = submit_job('orders.bulk_delete', {
+            'chunk_size': chunk_size,
+            'reclaim': reclaim,
+            'pause_ms': int(data.get('pause_ms', 0)),
+            **filters
         })
         
+        return job_accepted(job_id, 'Bulk delete started')
+        
     except Exception as e:
-        db.session.rollback()
         return jsonify({
             'success': False,
             'message': f'Error deleting orders: {str(e)}'
-        }), 400
\ No newline at end of file
+        }), 400
@@ -0,0 +1,3 @@
+# Services package initialization
+# Shared query, caching and background helpers used by the blueprints
+# Import modules directly where needed to avoid circular imports
@@ -0,0 +1,499 @@
+"""ASGI serving mode with async handlers for the read-heavy API endpoints
+
+``asgi.py`` wraps the Flask app in ``AsyncAPI`` for an ASGI server
+(``uvicorn asgi:app``). GET requests to the garment/order listings, the
+garment/order detail endpoints, ``/api/stats`` and ``/garment/api/stats``
+run as coroutines on an async SQLAlchemy engine (``sqlite+aiosqlite`` for
+the configured SQLite database): a client waiting on the database holds a
+pool connection, not a thread. Their responses are byte-for-byte the ones
+the Flask views return (the same query builders, row encoders, error
+handlers and after_request hooks run), including streamed listings.
+
+Everything else (writes, imports, search, pages, the change feed) is passed
+to the Flask app through a WSGI bridge on ASGI_WSGI_THREADS threads. Each
+SSE client holds one of those threads for as long as it is connected.
+
+Backpressure: at most ASGI_POOL_SIZE + ASGI_POOL_OVERFLOW async handlers
+run at once, each holding one pooled connection (a streamed listing holds
+it until the last row is sent). Up to ASGI_MAX_QUEUE more wait for a slot,
+for at most ASGI_QUEUE_TIMEOUT seconds; beyond either limit the request is
+answered right away with 503 and ``Retry-After`` instead of piling up. The
+WSGI bridge queues at most ASGI_MAX_QUEUE requests per thread pool the
+same way.
+"""
+import asyncio
+import contextvars
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, jsonify, request
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from werkzeug.exceptions import HTTPException, NotFound
+
+from app import db
+from models.dashboard import DashboardStats, SUMMARY_ID
+from models.garment import Garment
+from models.orders import Order
+from services import assets, dimensions, serialization, stats as stats_engine
+from services.database import configure_engine
+from services.listing import (STREAM_CHUNK_SIZE, build_query, encoder_for, page_query, parse_listing_request,
+                              selected_columns, split_page)
+from services.serialization import FORMATS, StreamWriter
+
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+RETRY_AFTER_SECONDS = 1
+
+
+class Busy(Exception):
+    """No handler slot or pool connection became free in time"""
+
+
+class AsyncStream:
+    """A streamed response body produced by an async generator"""
+
+    def __init__(self, body, mimetype):
+        self.body = body
+        self.mimetype = mimetype
+
+
+def async_database_url(url):
+    """The async driver URL for a configured database URL"""
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise RuntimeError(f'ASGI mode has no async driver for {url.get_backend_name()} databases')
+    return url.set(drivername=driver)
+
+
+def create_engine(config, url):
+    """Async engine with the bounded pool from the ASGI_POOL_* settings"""
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+    options = {
+        # aiosqlite defaults to NullPool (a new connection per checkout)
+        'poolclass': AsyncAdaptedQueuePool,
+        'pool_size': config.get('ASGI_POOL_SIZE', 8),
+        'max_overflow': config.get('ASGI_POOL_OVERFLOW', 0),
+        'pool_timeout': config.get('ASGI_POOL_TIMEOUT', 5)
+    }
+    if url.get_backend_name() == 'sqlite':
+        options['connect_args'] = {'timeout': config.get('SQLITE_PRAGMAS', {}).get('busy_timeout', 5000) / 1000}
+    try:
+        engine = create_async_engine(url, **options)
+    except ImportError as e:
+        raise RuntimeError(f'ASGI mode needs the async driver for {url.drivername} (pip install aiosqlite)') from e
+    configure_engine(engine.sync_engine, config)
+    return engine
+
+
+# Async handlers (run inside the request context, return a view result)
+
+def _order_filters():
+    # As in routes/orders.py
+    return {'status': request.args['status']} if request.args.get('status') else None
+
+
+async def _stream_rows(connection, writer, stmt):
+    try:
+        head = writer.head()
+        if head:
+            yield head
+        result = await connection.stream(stmt.execution_options(yield_per=STREAM_CHUNK_SIZE))
+        async for rows in result.partitions():
+            piece = writer.chunk(rows)
+            if piece:
+                yield piece
+        tail = writer.tail()
+        if tail:
+            yield tail
+    finally:
+        await connection.close()
+
+
+async def listing(api, model, filters=None):
+    """services/listing.py listing_response() on the async engine"""
+    try:
+        fields, fmt, cursor, limit = parse_listing_request(model)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    filters = filters() if callable(filters) else filters
+    encoder = encoder_for(model, fields)
+
+    if limit is not None:
+        async with api.connection() as connection:
+            result = await connection.execute(page_query(model, fields, cursor, limit, filters))
+            rows, meta = split_page(result.all(), limit)
+        return current_app.response_class(serialization.page_body(fmt, encoder, rows, **meta), mimetype=FORMATS[fmt])
+
+    # The connection stays checked out until the last chunk is sent
+    connection = await api.checkout()
+    stmt = build_query(model, fields, cursor, filters)
+    return AsyncStream(_stream_rows(connection, StreamWriter(fmt, encoder), stmt), FORMATS[fmt])
+
+
+async def detail(api, model, row_id):
+    """to_dict() of one row, read with the listing query"""
+    fields = dimensions.public_fields(model)
+    stmt = dimensions.select_fields(model, selected_columns(fields)).where(model.id == row_id)
+    async with api.connection() as connection:
+        row = (await connection.execute(stmt)).first()
+    if row is None:
+        raise NotFound()
+    return jsonify(encoder_for(model, fields).json_ready([row])[0])
+
+
+async def dashboard_stats(api):
+    """routes/main.py api_stats() from one read of the summary row"""
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    try:
+        async with api.connection() as connection:
+            async with AsyncSession(bind=connection) as session:
+                stats = await session.get(DashboardStats, SUMMARY_ID)
+                if stats is None:
+                    # Building the missing row is a write: leave it to the Flask view
+                    return None
+                return jsonify({
+                    'success': True,
+                    'stats': stats.to_dict(),
+                    **stats_engine.totals(stats),
+                    'status': 'connected'
+                })
+    except Busy:
+        raise
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'status': 'error'
+        }), 500
+
+
+async def garment_stats(api):
+    """services/stats.py garment_stats(), sharing its cache"""
+    value = stats_engine.cache.peek('garments')
+    if value is None:
+        async with api.connection() as connection:
+            value = Garment.stats_from_row((await connection.execute(Garment.stats_query())).one())
+        stats_engine.cache.put('garments', value, stats_engine.cache_ttl())
+    return jsonify(value)
+
+
+# Flask endpoint -> (handler, fixed arguments, view argument names)
+HANDLERS = {
+    'garment.api_garments': (listing, {'model': Garment}, {}),
+    'orders.api_orders': (listing, {'model': Order, 'filters': _order_filters}, {}),
+    'garment.api_garment_detail': (detail, {'model': Garment}, {'garment_id': 'row_id'}),
+    'orders.api_order_detail': (detail, {'model': Order}, {'order_id': 'row_id'}),
+    'main.api_stats': (dashboard_stats, {}, {}),
+    'garment.api_garment_stats': (garment_stats, {}, {})
+}
+
+
+# ASGI <-> WSGI
+
+def wsgi_environ(scope, body=b''):
+    """WSGI environ for an ASGI HTTP scope"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    for raw_name, raw_value in scope.get('headers', ()):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        environ[name] = f'{environ[name]},{value}' if name in environ else value
+    return environ
+
+
+def _asgi_headers(headers):
+    return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+
+async def _read_body(receive, limit=None):
+    """The request body, or None when it is larger than `limit`"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return b''
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if limit is not None and size > limit:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def _send_simple(send, status, body, headers=()):
+    await send({'type': 'http.response.start', 'status': status, 'headers': _asgi_headers([
+        ('Content-Type', 'application/json'), ('Content-Length', str(len(body))), *headers
+    ])})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class _Gate:
+    """`slots` concurrent holders, at most `queue` waiters for `timeout` seconds"""
+
+    def __init__(self, slots, queue, timeout):
+        self.slots = slots
+        self.queue = queue
+        self.timeout = timeout
+        self._semaphore = None
+        self.waiting = 0
+
+    async def acquire(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.slots)
+        if self._semaphore.locked() and self.waiting >= self.queue:
+            raise Busy()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise Busy() from None
+        finally:
+            self.waiting -= 1
+
+    def release(self):
+        self._semaphore.release()
+
+
+class AsyncAPI:
+    """ASGI application: async read endpoints, the rest through the Flask app"""
+
+    def __init__(self, app):
+        self.app = app
+        config = app.config
+        self.max_content_length = config.get('MAX_CONTENT_LENGTH')
+        queue = config.get('ASGI_MAX_QUEUE', 512)
+        timeout = config.get('ASGI_QUEUE_TIMEOUT', 10)
+        self.handler_gate = _Gate(config.get('ASGI_POOL_SIZE', 8) + config.get('ASGI_POOL_OVERFLOW', 0), queue, timeout)
+        threads = config.get('ASGI_WSGI_THREADS', 32)
+        self.wsgi_gate = _Gate(threads, queue, timeout)
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='dpp-asgi-wsgi')
+        self._engine = None
+
+    # Database
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            with self.app.app_context():
+                url = self.app.config.get('ASGI_DATABASE_URL') or async_database_url(db.engine.url)
+                self._engine = create_engine(self.app.config, make_url(url))
+        return self._engine
+
+    async def checkout(self):
+        """A started AsyncConnection; a pool timeout becomes Busy"""
+        connection = self.engine.connect()
+        try:
+            await connection.start()
+        except PoolTimeout:
+            raise Busy() from None
+        return connection
+
+    def connection(self):
+        return _Connection(self)
+
+    async def close(self):
+        if self._engine is not None:
+            await self._engine.dispose()
+        self.executor.shutdown(wait=False)
+
+    # ASGI
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise RuntimeError(f"Unsupported ASGI scope type {scope['type']}")
+
+        environ = wsgi_environ(scope)
+        target = self._match(environ) if scope['method'] == 'GET' else None
+        if target is not None:
+            try:
+                await self.handler_gate.acquire()
+            except Busy:
+                return await self._busy(send)
+            try:
+                if await self._call_handler(environ, send, *target):
+                    return
+            finally:
+                self.handler_gate.release()
+
+        body = await _read_body(receive, self.max_content_length)
+        if body is None:
+            return await _send_simple(send, 413, b'{"success":false,"message":"Request body too large"}')
+        # The body is read in full (and de-chunked by the server)
+        environ['wsgi.input'] = io.BytesIO(body)
+        environ['CONTENT_LENGTH'] = str(len(body))
+        environ.pop('HTTP_TRANSFER_ENCODING', None)
+        try:
+            await self.wsgi_gate.acquire()
+        except Busy:
+            return await self._busy(send)
+        try:
+            await self._call_wsgi(environ, send)
+        finally:
+            self.wsgi_gate.release()
+
+    def _match(self, environ):
+        adapter = self.app.url_map.bind_to_environ(environ)
+        try:
+            rule, view_args = adapter.match(return_rule=True)
+        except HTTPException:
+            return None
+        entry = HANDLERS.get(rule.endpoint)
+        if entry is None:
+            return None
+        handler, fixed, renamed = entry
+        return handler, {**fixed, **{renamed[name]: value for name, value in view_args.items()}}
+
+    async def _busy(self, send):
+        await _send_simple(send, 503, b'{"success":false,"message":"Server busy, retry shortly"}',
+                           [('Retry-After', str(RETRY_AFTER_SECONDS))])
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _call_handler(self, environ, send, handler, arguments):
+        """Run an async handler like Flask runs a view; False to fall back to WSGI"""
+        app = self.app
+        ctx = app.request_context(environ)
+        ctx.push()
+        try:
+            stream = None
+            try:
+                try:
+                    rv = app.preprocess_request()
+                    if rv is None:
+                        rv = await handler(self, **arguments)
+                        if rv is None:
+                            return False
+                except Busy:
+                    rv = None
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                if rv is None:
+                    await self._busy(send)
+                    return True
+                if isinstance(rv, AsyncStream):
+                    stream = rv
+                    response = app.finalize_request(app.response_class(mimetype=stream.mimetype))
+                else:
+                    response = app.finalize_request(rv)
+            except Exception as e:
+                response = app.handle_exception(e)
+
+            if stream is None:
+                await send({'type': 'http.response.start', 'status': response.status_code,
+                            'headers': _asgi_headers(response.headers.to_wsgi_list())})
+                await send({'type': 'http.response.body', 'body': response.get_data()})
+            else:
+                await self._send_stream(send, response, stream)
+            return True
+        finally:
+            ctx.pop()
+
+    async def _send_stream(self, send, response, stream):
+        config = self.app.config
+        compress = None
+        if config.get('COMPRESS_RESPONSES', True) and stream.mimetype in config.get('COMPRESS_MIMETYPES', ()):
+            response.vary.add('Accept-Encoding')
+            encoding = assets.response_encoding()
+            if encoding is not None:
+                response.headers['Content-Encoding'] = encoding
+                compress, finish = assets.stream_compressor(
+                    encoding, config.get('COMPRESS_LEVEL', 3), config.get('COMPRESS_BROTLI_QUALITY', 4)
+                )
+        response.headers.pop('Content-Length', None)
+        await send({'type': 'http.response.start', 'status': response.status_code,
+                    'headers': _asgi_headers(response.headers.to_wsgi_list())})
+        body = stream.body
+        try:
+            async for piece in body:
+                await send({'type': 'http.response.body', 'body': compress(piece) if compress else piece,
+                            'more_body': True})
+            await send({'type': 'http.response.body', 'body': finish() if compress else b''})
+        finally:
+            await body.aclose()
+
+    async def _call_wsgi(self, environ, send):
+        """Run the Flask app in the bridge threads, streaming its body out"""
+        loop = asyncio.get_running_loop()
+        # One context for every step so request contexts pushed by the app
+        # (stream_with_context) are popped where they were pushed
+        context = contextvars.copy_context()
+
+        def call(func, *args):
+            return loop.run_in_executor(self.executor, context.run, func, *args)
+
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info is not None and started:
+                raise exc_info[1].with_traceback(exc_info[2])
+            started[:] = [int(status.split(' ', 1)[0]), headers]
+
+        iterable = await call(self.app, environ, start_response)
+        try:
+            iterator = iter(iterable)
+            chunk = await call(next, iterator, None)
+            status, headers = started
+            await send({'type': 'http.response.start', 'status': status, 'headers': _asgi_headers(headers)})
+            while chunk is not None:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await call(next, iterator, None)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(iterable, 'close'):
+                await call(iterable.close)
+
+
+class _Connection:
+    """`async with api.connection()`: a pooled connection, Busy on pool timeout"""
+
+    def __init__(self, api):
+        self.api = api
+        self.connection = None
+
+    async def __aenter__(self):
+        self.connection = await self.api.checkout()
+        return self.connection
+
+    async def __aexit__(self, *exc_info):
+        await self.connection.close()
@@ -0,0 +1,461 @@
+"""Fingerprinted, precompressed static files and DPP passport pages
+
+Two sources are served through the pipeline:
+
+* ``static``: everything in the app's static folder, at ASSET_URL_PREFIX;
+* ``dpp``: the standalone passport pages (GarmentDPP.html, RabateksDPP.html,
+  ...) in DPP_PAGES_DIR matching DPP_PAGES_PATTERNS, plus the files under
+  its DPP_PAGES_ASSET_DIRS, at DPP_PAGES_URL_PREFIX. Unset disables them.
+
+Building copies every file into ASSET_BUILD_DIR (under the instance folder)
+under a content-hash name (``css/style.3f2a9c01d4e7.css``) next to gzip and,
+when the optional ``brotli`` package is installed, brotli variants. Variants
+that don't save at least 5% are not kept. Relative ``src``/``href``/``url()``
+references in HTML and CSS files are rewritten to the fingerprinted names of
+the files they point at, so a passport page pulls its logo and scripts from
+URLs that never change. ``manifest.json`` records what was built from which
+source mtime and size; unchanged files are skipped on the next build.
+
+Run ``flask build-assets`` at deploy time. Otherwise the first request that
+needs an asset builds whatever is missing or stale (create_app() itself
+touches no files). With ASSET_RELOAD (default: DEBUG) sources are re-checked
+at most once a second, so edits show up without a rebuild.
+
+Fingerprinted URLs are served with ``Cache-Control: public, max-age=1y,
+immutable``. The logical URLs (``/dpp/GarmentDPP.html`` or a template that
+doesn't use ``asset_url``) are served with ``no-cache`` and an ETag, so
+revisits cost a 304. The stored variant matching Accept-Encoding is sent
+as is, with no compression work per request. ``asset_url()`` is the
+template helper: it takes the arguments of ``url_for('static', filename=...)``
+and returns the fingerprinted URL.
+
+``compress_response`` compresses dynamic responses (JSON listings, search
+results, rendered pages) with the best encoding the client accepts: buffered
+bodies of at least COMPRESS_MIN_SIZE bytes in one go, streamed listings and
+exports chunk by chunk. Only COMPRESS_MIMETYPES are touched, so the SSE
+change feed and files (``send_file``) pass through as they are.
+"""
+import fnmatch
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import threading
+import time
+import zlib
+
+import click
+from flask import abort, current_app, has_app_context, request, send_file, url_for
+from flask.cli import with_appcontext
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip variants are built and negotiated
+    brotli = None
+
+HASH_LENGTH = 12
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+MANIFEST_VERSION = 1
+# A variant must be at most this fraction of the original to be kept
+MIN_SAVING = 0.95
+RELOAD_INTERVAL = 1.0
+# Encodings in order of preference, with their file suffix
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'application/xml')
+# Files whose references are rewritten, in build order (after everything else)
+REWRITTEN = ('.css', '.html', '.htm')
+ENDPOINTS = {'static': 'assets', 'dpp': 'dpp_pages'}
+
+_REFERENCE = re.compile(r'''(?P<prefix>\b(?:src|href)\s*=\s*["']|url\(\s*["']?)(?P<ref>[^"'()\s?#]+)''', re.I)
+
+
+def _compressible(mimetype):
+    return mimetype is not None and mimetype.startswith(COMPRESSIBLE)
+
+
+def _fingerprinted(path, digest):
+    stem, ext = posixpath.splitext(path)
+    return f'{stem}.{digest}{ext}'
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporary, 'wb') as target:
+        target.write(data)
+    os.replace(temporary, path)
+
+
+def _gzip(data, level=9):
+    # mtime=0 keeps the output (and its ETag) identical across builds
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _brotli(data, quality=11):
+    return brotli.compress(data, mode=brotli.MODE_TEXT, quality=quality)
+
+
+def _build_order(path):
+    extension = posixpath.splitext(path)[1].lower()
+    return (REWRITTEN.index(extension) + 1 if extension in REWRITTEN else 0, path)
+
+
+class AssetSource:
+    """A directory whose files are served through the pipeline"""
+
+    def __init__(self, name, root, patterns=None, directories=None):
+        self.name = name
+        self.root = os.path.abspath(root)
+        # Top level files matching `patterns` plus everything under
+        # `directories`; None means the whole tree
+        self.patterns = patterns
+        self.directories = directories
+
+    def _walk(self, directory):
+        for base, dirs, files in os.walk(os.path.join(self.root, directory)):
+            dirs[:] = sorted(name for name in dirs if not name.startswith('.'))
+            for name in sorted(files):
+                if not name.startswith('.'):
+                    yield os.path.relpath(os.path.join(base, name), self.root).replace(os.sep, '/')
+
+    def files(self):
+        """Paths (relative, '/' separated) of the files to serve"""
+        if not os.path.isdir(self.root):
+            return []
+        if self.patterns is None:
+            return list(self._walk(''))
+        paths = [
+            name for name in sorted(os.listdir(self.root))
+            if os.path.isfile(os.path.join(self.root, name))
+            and any(fnmatch.fnmatch(name, pattern) for pattern in self.patterns)
+        ]
+        for directory in self.directories or ():
+            paths.extend(self._walk(directory))
+        return paths
+
+
+class AssetPipeline:
+    """Builds the fingerprinted/compressed copies and resolves request paths"""
+
+    def __init__(self, build_dir, sources, reload=False):
+        self.build_dir = build_dir
+        self.sources = {source.name: source for source in sources}
+        self.reload = reload
+        self._lock = threading.Lock()
+        self._manifest = None
+        # source -> fingerprinted path -> logical path
+        self._files = {}
+        self._checked = 0.0
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.build_dir, 'manifest.json')
+
+    def _load(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as stream:
+                manifest = json.load(stream)
+        except (OSError, ValueError):
+            manifest = {}
+        if manifest.get('version') != MANIFEST_VERSION or manifest.get('brotli') != (brotli is not None):
+            manifest = {'version': MANIFEST_VERSION, 'brotli': brotli is not None, 'sources': {}}
+        return manifest
+
+    def output_path(self, source, entry, encoding=None):
+        suffix = dict(ENCODINGS)[encoding] if encoding else ''
+        return os.path.join(self.build_dir, source, entry['file'] + suffix)
+
+    def _outputs_exist(self, source, entry):
+        return all(os.path.exists(self.output_path(source, entry, encoding))
+                   for encoding in (None, *entry['encodings']))
+
+    def _rewrite(self, source, path, data, entries):
+        """Point relative references in an HTML/CSS file at fingerprinted files"""
+        text = data.decode('utf-8', errors='surrogateescape')
+        directory = posixpath.dirname(path)
+        used = {}
+
+        def replace(match):
+            ref = match.group('ref')
+            if ref.startswith(('/', '//')) or ':' in ref:
+                return match.group(0)
+            target = posixpath.normpath(posixpath.join(directory, ref))
+            entry = entries.get(target)
+            # Links between pages keep their logical names (pages link each other)
+            if entry is None or entry['mimetype'] == 'text/html':
+                return match.group(0)
+            used[target] = entry['hash']
+            return match.group('prefix') + posixpath.relpath(entry['file'], directory or '.')
+
+        text = _REFERENCE.sub(replace, text)
+        return text.encode('utf-8', errors='surrogateescape'), used
+
+    def _build_file(self, source, path, stat, data, entries):
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        dependencies = {}
+        if posixpath.splitext(path)[1].lower() in REWRITTEN:
+            data, dependencies = self._rewrite(source, path, data, entries)
+        digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+        entry = {
+            'file': _fingerprinted(path, digest),
+            'hash': digest,
+            'mimetype': mimetype,
+            'size': len(data),
+            'source_size': stat.st_size,
+            'source_mtime_ns': stat.st_mtime_ns,
+            'dependencies': dependencies,
+            'encodings': {}
+        }
+        _write_atomic(self.output_path(source, entry), data)
+        if _compressible(mimetype):
+            variants = [('gzip', _gzip)]
+            if brotli is not None:
+                variants.insert(0, ('br', _brotli))
+            for encoding, compress in variants:
+                compressed = compress(data)
+                if len(compressed) <= len(data) * MIN_SAVING:
+                    _write_atomic(self.output_path(source, entry, encoding), compressed)
+                    entry['encodings'][encoding] = len(compressed)
+        return entry
+
+    def _stale(self, source, entry, stat, entries):
+        if entry is None or not self._outputs_exist(source, entry):
+            return True
+        if (entry['source_size'], entry['source_mtime_ns']) != (stat.st_size, stat.st_mtime_ns):
+            return True
+        return any(entries.get(path, {}).get('hash') != digest for path, digest in entry['dependencies'].items())
+
+    def build(self, force=False):
+        """Build missing or stale files of every source; returns per-source counts"""
+        with self._lock:
+            manifest = self._manifest if self._manifest is not None else self._load()
+            report = {}
+            changed = self._manifest is None and not os.path.exists(self.manifest_path)
+            for name, source in self.sources.items():
+                previous = manifest['sources'].get(name, {})
+                entries = {}
+                built = 0
+                # Files that pages and stylesheets reference are built (and hashed) first
+                for path in sorted(source.files(), key=_build_order):
+                    try:
+                        stat = os.stat(os.path.join(source.root, path))
+                    except OSError:
+                        continue
+                    entry = previous.get(path)
+                    if force or self._stale(name, entry, stat, entries):
+                        with open(os.path.join(source.root, path), 'rb') as stream:
+                            entry = self._build_file(name, path, stat, stream.read(), entries)
+                        built += 1
+                    entries[path] = entry
+                changed = changed or built or entries.keys() != previous.keys()
+                manifest['sources'][name] = entries
+                report[name] = {
+                    'files': len(entries),
+                    'built': built,
+                    'bytes': sum(entry['size'] for entry in entries.values()),
+                    **{
+                        f'{encoding}_bytes': sum(entry['encodings'].get(encoding, entry['size'])
+                                                 for entry in entries.values())
+                        for encoding, _ in ENCODINGS if encoding != 'br' or brotli is not None
+                    }
+                }
+            if changed:
+                _write_atomic(self.manifest_path, json.dumps(manifest, indent=1, sort_keys=True).encode())
+            self._manifest = manifest
+            self._files = {
+                name: {entry['file']: path for path, entry in entries.items()}
+                for name, entries in manifest['sources'].items()
+            }
+            self._checked = time.monotonic()
+            return report
+
+    def _ensure_built(self):
+        if self._manifest is None or (self.reload and time.monotonic() - self._checked >= RELOAD_INTERVAL):
+            self.build()
+
+    def lookup(self, source, path):
+        """Manifest entry of logical `path`, or None"""
+        self._ensure_built()
+        return self._manifest['sources'].get(source, {}).get(path)
+
+    def resolve(self, source, path):
+        """(entry, fingerprinted) for a request path, or None"""
+        self._ensure_built()
+        entries = self._manifest['sources'].get(source, {})
+        logical = self._files.get(source, {}).get(path)
+        if logical is not None:
+            return entries[logical], True
+        if path in entries:
+            return entries[path], False
+        return None
+
+
+def _negotiate(available):
+    """The preferred stored encoding the client accepts, or None for identity"""
+    accepted = request.accept_encodings
+    for encoding, _ in ENCODINGS:
+        if encoding in available and accepted[encoding] > 0:
+            return encoding
+    return None
+
+
+def get_pipeline():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('dpp_assets')
+
+
+def serve(source, filename):
+    """Send a stored variant of an asset (by logical or fingerprinted path)"""
+    pipeline = get_pipeline()
+    found = pipeline.resolve(source, filename) if pipeline is not None else None
+    if found is None:
+        abort(404)
+    entry, fingerprinted = found
+    encoding = _negotiate(entry['encodings'])
+    response = send_file(
+        pipeline.output_path(source, entry, encoding), mimetype=entry['mimetype'],
+        etag=f"{entry['hash']}-{encoding or 'identity'}", conditional=True,
+        max_age=IMMUTABLE_MAX_AGE if fingerprinted else None
+    )
+    if fingerprinted:
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if entry['encodings']:
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+def asset_url(filename, source='static', **values):
+    """url_for('static', filename=...) returning the fingerprinted URL"""
+    pipeline = get_pipeline()
+    entry = pipeline.lookup(source, filename) if pipeline is not None else None
+    if entry is not None:
+        return url_for(ENDPOINTS[source], filename=entry['file'], **values)
+    if source == 'static':
+        return url_for('static', filename=filename, **values)
+    return url_for(ENDPOINTS[source], filename=filename, **values)
+
+
+# Dynamic response compression
+
+def response_encoding():
+    """Encoding for a dynamic response to the current request, or None"""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br'] > 0:
+        return 'br'
+    if accepted['gzip'] > 0:
+        return 'gzip'
+    return None
+
+
+def stream_compressor(encoding, level=3, quality=4):
+    """(compress, finish) for a streamed body; compress(chunk) flushes the chunk"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=quality)
+        return (lambda chunk: compressor.process(chunk) + compressor.flush()), compressor.finish
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return (lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)), compressor.flush
+
+
+def _compress_stream(chunks, body, encoding, level, quality):
+    """Compress a streamed body chunk by chunk"""
+    compress, finish = stream_compressor(encoding, level, quality)
+    try:
+        for chunk in chunks:
+            if chunk:
+                # Each chunk is a block of rows: send it on rather than wait for more
+                yield compress(chunk)
+        yield finish()
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+
+
+def compress_response(response):
+    """Compress a large or streamed response with the client's preferred encoding"""
+    config = current_app.config
+    if (response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers or response.cache_control.no_transform
+            or response.mimetype not in config.get('COMPRESS_MIMETYPES', ())):
+        return response
+    level = config.get('COMPRESS_LEVEL', 3)
+    quality = config.get('COMPRESS_BROTLI_QUALITY', 4)
+
+    if response.is_streamed:
+        response.vary.add('Accept-Encoding')
+        encoding = response_encoding()
+        if encoding is None:
+            return response
+        body = response.response
+        response.response = _compress_stream(response.iter_encoded(), body, encoding, level, quality)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config.get('COMPRESS_MIN_SIZE', 1024):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = response_encoding()
+        if encoding is None:
+            return response
+        compressed = _brotli(data, quality) if encoding == 'br' else _gzip(data, level)
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    # The representation differs from the identity one: its validator is only weak
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_assets(app):
+    """Register the asset routes, the template helper and response compression"""
+    if app.config.get('ASSETS_ENABLED', True):
+        sources = [AssetSource('static', app.static_folder)]
+        pages = app.config.get('DPP_PAGES_DIR')
+        if pages:
+            sources.append(AssetSource('dpp', os.path.join(app.root_path, pages),
+                                       patterns=app.config.get('DPP_PAGES_PATTERNS', ('*.html',)),
+                                       directories=app.config.get('DPP_PAGES_ASSET_DIRS', ())))
+        reload = app.config.get('ASSET_RELOAD')
+        pipeline = AssetPipeline(
+            os.path.join(app.instance_path, app.config.get('ASSET_BUILD_DIR', 'assets')), sources,
+            reload=app.debug if reload is None else reload
+        )
+        app.extensions['dpp_assets'] = pipeline
+        app.add_url_rule(f"{app.config.get('ASSET_URL_PREFIX', '/assets')}/<path:filename>", ENDPOINTS['static'],
+                         serve, defaults={'source': 'static'})
+        if pages:
+            prefix = app.config.get('DPP_PAGES_URL_PREFIX', '/dpp')
+            app.add_url_rule(f'{prefix}/', ENDPOINTS['dpp'], serve, defaults={'source': 'dpp', 'filename': 'index.html'})
+            app.add_url_rule(f'{prefix}/<path:filename>', ENDPOINTS['dpp'], serve, defaults={'source': 'dpp'})
+    app.add_template_global(asset_url)
+    if app.config.get('COMPRESS_RESPONSES', True):
+        app.after_request(compress_response)
+
+
+@click.command('build-assets')
+@click.option('--force', is_flag=True, help='Rebuild every file, not only missing or changed ones')
+@with_appcontext
+def build_assets_command(force):
+    """Fingerprint and precompress the static files and DPP passport pages"""
+    pipeline = get_pipeline()
+    if pipeline is None:
+        raise click.ClickException('ASSETS_ENABLED is off')
+    started = time.perf_counter()
+    report = pipeline.build(force=force)
+    for name, item in report.items():
+        sizes = ', '.join(f"{key.split('_')[0]} {value}" for key, value in item.items() if key.endswith('_bytes'))
+        print(f"   {name}: {item['files']} files ({item['built']} built), {item['bytes']} bytes ({sizes})")
+    print(f"✅ Assets built in {round(time.perf_counter() - started, 2)}s into {pipeline.build_dir}")
+
+
+COMMANDS = (build_assets_command,)
@@ -0,0 +1,420 @@
+"""Batch create/update/delete for garments and orders in one transaction
+
+A batch is a list of operations::
+
+    {"op": "create", "data": {...}}
+    {"op": "update", "id": 12, "data": {"status": "completed"}}
+    {"op": "delete", "id": 13}
+
+All operations are applied with set-based statements:
+
+* creates: one multi-row INSERT;
+* updates: one ``UPDATE ... WHERE id IN (...)`` per distinct ``data``, or an
+  executemany ``UPDATE ... WHERE id = ?`` for updates with unique values;
+* deletes: one ``DELETE ... WHERE id IN (...)``.
+
+The rows touched by updates and deletes are read once, both to report
+unknown ids and to compute exact DashboardStats deltas. In atomic mode (the
+default) any invalid operation rejects the whole batch. Otherwise the valid
+operations are applied and the failures are reported.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, delete, insert, select, update
+
+from app import db
+from models.garment import Garment
+from models.orders import Order
+from services import carbon, change_feed, dimensions, rollups, stats as stats_engine, status_history
+from services.database import run_write
+from services.summary import apply_delta
+from services.transfer import SPECS, build_converters, coerce_row, column_defaults, known_fields
+
+OPERATIONS = ('create', 'update', 'delete')
+DEFAULT_MAX_OPERATIONS = 10000
+# Ids per IN (...) list, well below SQLite's bound parameter limit
+IN_CHUNK_SIZE = 500
+
+
+def _chunks(items, size=IN_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class BatchItem:
+    """One operation of a batch and its outcome"""
+
+    def __init__(self, index, op, id=None, values=None, errors=None):
+        self.index = index
+        self.op = op
+        self.id = id
+        self.values = values or {}
+        self.errors = errors or []
+        self.status = 'invalid' if self.errors else None
+
+    def fail(self, status, error):
+        self.status = status
+        self.errors.append(error)
+
+    def to_dict(self):
+        result = {'index': self.index, 'op': self.op, 'id': self.id, 'status': self.status}
+        if self.errors:
+            result['errors'] = self.errors
+        return result
+
+
+def _coerce_update(spec, converters, data):
+    values = {}
+    errors = []
+    for name, raw in known_fields(spec, converters, data, errors):
+        try:
+            values[name] = converters[name](raw) if raw is not None else None
+        except (TypeError, ValueError):
+            errors.append(f'{name}: invalid value {raw!r}')
+    if spec.model is Order and 'status' in values and values['status'] not in Order.STATUSES:
+        errors.append(f"status: must be one of {', '.join(Order.STATUSES)}")
+    for name in spec.required:
+        if name in values and values[name] is None:
+            errors.append(f'{name}: required')
+    if not values and not errors:
+        errors.append('data: nothing to update')
+    return values, errors
+
+
+def parse_operations(kind, operations):
+    """Validate raw operations into BatchItems (without touching the database)"""
+    spec = SPECS[kind]
+    converters = build_converters(spec)
+    defaults = column_defaults(spec)
+
+    items = []
+    seen_ids = set()
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+            items.append(BatchItem(index, None, errors=[f"op: must be one of {', '.join(OPERATIONS)}"]))
+            continue
+
+        op = operation['op']
+        data = operation.get('data') or {}
+        if not isinstance(data, dict):
+            items.append(BatchItem(index, op, operation.get('id'), errors=['data: must be an object']))
+            continue
+
+        if op == 'create':
+            values, supplied, errors = coerce_row(spec, converters, defaults, data)
+            items.append(BatchItem(index, op, values=values, errors=errors))
+            continue
+
+        try:
+            row_id = int(operation.get('id'))
+        except (TypeError, ValueError):
+            items.append(BatchItem(index, op, operation.get('id'), errors=['id: must be an integer']))
+            continue
+        if row_id in seen_ids:
+            items.append(BatchItem(index, op, row_id, errors=['id: appears more than once in the batch']))
+            continue
+        seen_ids.add(row_id)
+
+        if op == 'update':
+            values, errors = _coerce_update(spec, converters, data)
+            items.append(BatchItem(index, op, row_id, values=values, errors=errors))
+        else:
+            items.append(BatchItem(index, op, row_id))
+    return items
+
+
+def _load_existing(connection, spec, ids):
+    """{id: {summary or dimension key column: value}} for the ids that exist"""
+    table = spec.table
+    names = list(spec.summary_columns) + sorted(dimensions.key_columns(spec.model))
+    columns = [table.c[name] for name in names]
+    existing = {}
+    for chunk in _chunks(ids):
+        for row in connection.execute(select(table.c.id, *columns).where(table.c.id.in_(chunk))):
+            existing[row[0]] = dict(zip(names, row[1:]))
+    return existing
+
+
+def _summary_deltas(spec, creates, updates, deletes, existing):
+    deltas = Counter()
+    for item in creates:
+        deltas.update(spec.contribution(item.values))
+    for item in updates:
+        old = existing[item.id]
+        new = {name: item.values.get(name, old[name]) for name in spec.summary_columns}
+        deltas.update(spec.contribution(new))
+        deltas.subtract(spec.contribution(old))
+    for item in deletes:
+        deltas.subtract(spec.contribution(existing[item.id]))
+    return dict(deltas)
+
+
+def _execute_creates(connection, spec, items, now):
+    table = spec.table
+    rows = [{**item.values, 'created_date': now, 'updated_date': now} for item in items]
+    dimensions.encode_rows(connection, spec.model, rows)
+    # Every row needs the same keys for one multi-row INSERT
+    names = set().union(*rows)
+    rows = [{name: row.get(name) for name in names} for row in rows]
+    result = connection.execute(
+        insert(table).returning(table.c.id, sort_by_parameter_order=True), rows
+    )
+    for item, row_id in zip(items, result.scalars()):
+        item.id = row_id
+
+
+def _execute_updates(connection, spec, items, existing, now):
+    table = spec.table
+    rows = [dict(item.values) for item in items]
+    # Partial fabric updates keep the row's other fabric parts
+    dimensions.encode_rows(connection, spec.model, rows, [existing[item.id] for item in items])
+    groups = defaultdict(list)
+    for item, values in zip(items, rows):
+        groups[tuple(sorted(values.items()))].append(item.id)
+
+    singles = defaultdict(list)
+    for values, ids in groups.items():
+        if len(ids) == 1:
+            singles[tuple(name for name, value in values)].append({'_id': ids[0], **dict(values)})
+            continue
+        for chunk in _chunks(ids):
+            connection.execute(
+                update(table).where(table.c.id.in_(chunk)).values(**dict(values), updated_date=now)
+            )
+
+    for names, rows in singles.items():
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam('_id'))
+            .values({**{name: bindparam(name) for name in names}, 'updated_date': now})
+        )
+        connection.execute(statement, rows)
+
+
+def _execute_deletes(connection, table, items):
+    ids = [item.id for item in items]
+    for chunk in _chunks(ids):
+        connection.execute(delete(table).where(table.c.id.in_(chunk)))
+
+
+def apply_batch(session, kind, items, atomic=True):
+    """Apply validated BatchItems inside the session's transaction"""
+    spec = SPECS[kind]
+    connection = session.connection()
+
+    ids = [item.id for item in items if item.op in ('update', 'delete') and not item.errors]
+    existing = _load_existing(connection, spec, ids)
+    for item in items:
+        if item.op in ('update', 'delete') and not item.errors and item.id not in existing:
+            item.fail('not_found', f'id: no {kind[:-1]} with id {item.id}')
+
+    if atomic and any(item.errors for item in items):
+        for item in items:
+            if item.status is None:
+                item.status = 'skipped'
+        return items
+
+    valid = [item for item in items if item.status is None]
+    creates = [item for item in valid if item.op == 'create']
+    updates = [item for item in valid if item.op == 'update']
+    deletes = [item for item in valid if item.op == 'delete']
+
+    deltas = _summary_deltas(spec, creates, updates, deletes, existing)
+    # Count the rows about to change out of the rollups, and back in below
+    for chunk in _chunks([item.id for item in updates + deletes]):
+        rollups.apply(connection, spec.model, [spec.table.c.id.in_(chunk)], sign=-1)
+    now = datetime.utcnow()
+    if creates:
+        _execute_creates(connection, spec, creates, now)
+    if updates:
+        _execute_updates(connection, spec, updates, existing, now)
+    if deletes:
+        if spec.model is Order:
+            for chunk in _chunks([item.id for item in deletes]):
+                status_history.record_deleted(connection, [spec.table.c.id.in_(chunk)], now)
+        _execute_deletes(connection, spec.table, deletes)
+    apply_delta(connection, deltas)
+    if valid:
+        stats_engine.mark_dirty(session, spec.model)
+    if spec.model is Garment and (creates or updates):
+        ids = [item.id for item in creates + updates]
+        for chunk in _chunks(ids):
+            carbon.rescore_written(session, spec.table.c.id.in_(chunk))
+    for chunk in _chunks([item.id for item in creates + updates]):
+        rollups.apply(connection, spec.model, [spec.table.c.id.in_(chunk)])
+        if spec.model is Order:
+            status_history.record(connection, [spec.table.c.id.in_(chunk)], now)
+
+    if valid:
+        change_feed.record(
+            session, kind,
+            created=[item.id for item in creates],
+            updated={item.id: {**item.values, 'updated_date': now} for item in updates},
+            deleted=[item.id for item in deletes]
+        )
+
+    for item in valid:
+        item.status = {'create': 'created', 'update': 'updated', 'delete': 'deleted'}[item.op]
+    return items
+
+
+def run_batch(kind, operations, atomic=True):
+    """Validate and apply a batch as one write; returns a report"""
+    items = parse_operations(kind, operations)
+    started = time.perf_counter()
+    run_write(lambda session: apply_batch(session, kind, items, atomic=atomic))
+    statuses = Counter(item.status for item in items)
+    failed = sum(1 for item in items if item.errors)
+    return {
+        'applied': sum(statuses[status] for status in ('created', 'updated', 'deleted')),
+        'failed': failed,
+        'created': statuses['created'],
+        'updated': statuses['updated'],
+        'deleted': statuses['deleted'],
+        'seconds': round(time.perf_counter() - started, 4),
+        'results': [item.to_dict() for item in items]
+    }
+
+
+def batch_response(kind):
+    """Handle a POST of {"operations": [...], "atomic": true}"""
+    from flask import request, jsonify
+
+    try:
+        data = request.get_json() or {}
+        operations = data.get('operations')
+        if not isinstance(operations, list) or not operations:
+            raise ValueError('operations must be a non-empty list')
+        max_operations = current_app.config.get('BATCH_MAX_OPERATIONS', DEFAULT_MAX_OPERATIONS)
+        if len(operations) > max_operations:
+            raise ValueError(f'at most {max_operations} operations per batch')
+        atomic = bool(data.get('atomic', True))
+        report = run_batch(kind, operations, atomic=atomic)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'Error applying {kind} batch: {str(e)}'
+        }), 400
+
+    if report['failed'] and atomic:
+        return jsonify({
+            'success': False,
+            'message': f"Batch rejected: {report['failed']} of {len(operations)} operations are invalid",
+            **report
+        }), 400
+
+    return jsonify({
+        'success': report['failed'] == 0,
+        'message': f"{report['applied']} operations applied to {kind}, {report['failed']} failed",
+        **report
+    })
+
+
+_BENCHMARK_RUNNER = '''
+import json, sys
+from services.batch import run_benchmark
+print(json.dumps(run_benchmark(**json.loads(sys.argv[1]))))
+'''
+
+
+def benchmark(kind='orders', count=500, config_name='production', cwd=None):
+    """Time one-by-one API updates/deletes against the batch endpoint
+
+    Runs run_benchmark() in a fresh interpreter on throwaway databases in a
+    temporary directory (config.py reads the database URLs from the
+    environment at import time, see services/benchmarks.py), so the
+    configured database is never written to.
+    """
+    from services.benchmarks import database_paths
+
+    cwd = cwd or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ)
+        env.update({name: f'sqlite:///{path}' for name, path in database_paths(directory, count).items()})
+        env['JOBS_RUN_IN_WEB'] = 'false'
+        result = subprocess.run(
+            [sys.executable, '-c', _BENCHMARK_RUNNER,
+             json.dumps({'kind': kind, 'count': count, 'config_name': config_name})],
+            cwd=cwd, env=env, capture_output=True, text=True
+        )
+    if result.returncode != 0:
+        raise RuntimeError(f'Batch benchmark failed:\n{result.stderr.strip()[-2000:]}')
+    # Seeding messages may print first; the results are the last line
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run_benchmark(kind='orders', count=500, config_name='production'):
+    """benchmark() in the child process, on the databases in its environment
+
+    Creates 2 x `count` rows through the batch endpoint, then updates and
+    deletes half of them one request at a time and the other half with one
+    batch request each. Returns seconds and rows/s per path.
+    """
+    from app import create_app, init_db
+
+    app = create_app(config_name)
+    with app.app_context():
+        init_db()
+    prefix = {'garments': '/garment/api/garments', 'orders': '/orders/api/orders'}[kind]
+    client = app.test_client()
+    sample = {
+        'garments': {'country': 'Turkey', 'production_facility': 'Bench', 'po_number': 'BENCH',
+                     'style_name': 'Bench', 'product_type': 'T-Shirt', 'fabric_type': 'Cotton'},
+        'orders': {'country': 'Turkey', 'facility': 'Bench', 'po_number': 'BENCH', 'style_name': 'Bench',
+                   'product_type': 'T-Shirt', 'fabric_type': 'Cotton', 'quantity': 1}
+    }[kind]
+
+    def create_rows(tag):
+        operations = [
+            {'op': 'create', 'data': {**sample, 'po_number': f'BENCH-{tag}-{index}'}}
+            for index in range(count)
+        ]
+        report = client.post(f'{prefix}/batch', json={'operations': operations}).get_json()
+        return [result['id'] for result in report['results']]
+
+    change = {'status': 'completed'} if kind == 'orders' else {'quantity': 2}
+
+    def timed(func):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        return {'seconds': round(elapsed, 4), 'rows_per_second': round(count / elapsed) if elapsed else count}
+
+    single_ids = create_rows('single')
+    batch_ids = create_rows('batch')
+    return {
+        'count': count,
+        'single_update': timed(lambda: [client.put(f'{prefix}/{row_id}', json=change) for row_id in single_ids]),
+        'batch_update': timed(lambda: client.post(f'{prefix}/batch', json={'operations': [
+            {'op': 'update', 'id': row_id, 'data': change} for row_id in batch_ids
+        ]})),
+        'single_delete': timed(lambda: [client.delete(f'{prefix}/{row_id}') for row_id in single_ids]),
+        'batch_delete': timed(lambda: client.post(f'{prefix}/batch', json={'operations': [
+            {'op': 'delete', 'id': row_id} for row_id in batch_ids
+        ]}))
+    }
+
+
+@click.command('benchmark-batch')
+@click.argument('kind', type=click.Choice(['garments', 'orders']), default='orders')
+@click.option('--count', default=500, show_default=True, help='Rows per path (2 x count rows, in a temporary database)')
+@with_appcontext
+def benchmark_batch_command(kind, count):
+    """Compare one-by-one API updates/deletes with the batch endpoint"""
+    result = benchmark(kind, count, current_app.config['CONFIG_NAME'])
+    for name in ('single_update', 'batch_update', 'single_delete', 'batch_delete'):
+        print(f"   {name}: {result[name]['seconds']}s ({result[name]['rows_per_second']} rows/s)")
+
+
+COMMANDS = (benchmark_batch_command,)
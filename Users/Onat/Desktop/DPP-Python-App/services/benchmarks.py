@@ -0,0 +1,790 @@
+"""Endpoint benchmark and load-test suite
+
+Each dataset size gets its own SQLite databases under
+``instance/benchmarks`` (dpp-<size>.db plus its jobs/events binds), seeded
+once with ``size`` random orders and ``size`` random garments through
+services/bulk.py. Every size runs in a fresh interpreter, like the cold start
+probes in services/startup.py, because config.py reads the database URLs from
+the environment at import time.
+
+For every scenario (dashboard, stats, listings, detail, create, random,
+analytics, HTML pages) the child process measures:
+
+* ``in_process``: sequential requests through the Flask test client, so the
+  numbers are the app's own cost without any network or server overhead,
+* ``server``: the same requests from ``concurrency`` client threads against a
+  threaded werkzeug server on 127.0.0.1, one keep-alive connection each.
+
+Each scenario reports count, errors, mean/p50/p90/p99/max latency (ms) and
+requests per second. Failed requests (status >= 400 or a connection error) are
+counted in errors only: latency and throughput cover the successful ones. Rows created by the write scenarios are deleted again
+through the batch engine, so a database can be reused between runs.
+
+``measure_capacity()`` (`flask benchmark-asgi`) compares the read endpoints
+served by the threaded WSGI server with the ASGI mode (services/asgi.py) at
+growing numbers of open connections.
+
+Results are plain JSON tagged with the git commit. ``compare()`` checks a run
+against a baseline file with the relative thresholds in BENCHMARK_THRESHOLDS
+(`flask benchmark --baseline old.json` exits 1 on a regression).
+"""
+import http.client
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+DEFAULT_SIZES = (1000, 100000, 1000000)
+DEFAULT_THRESHOLDS = {
+    # Allowed relative slowdown of the latency percentiles
+    'p50': 0.25,
+    'p99': 0.5,
+    # Allowed relative drop in requests per second
+    'throughput': 0.2,
+    # Latency differences below this many ms are never a regression
+    'min_ms': 1.0
+}
+# Ids per cleanup batch, within BATCH_MAX_OPERATIONS
+CLEANUP_CHUNK = 5000
+
+_RUNNER = '''
+import json, sys
+from services.benchmarks import run_size
+print(json.dumps(run_size(**json.loads(sys.argv[1]))))
+'''
+
+
+# Scenarios
+
+class Scenario:
+    """One request shape: `path` and `body` may be callables of the run context"""
+
+    def __init__(self, name, path, method='GET', body=None, created=None):
+        self.name = name
+        self.path = path
+        self.method = method
+        self.body = body
+        # (kind, function returning the ids a response created)
+        self.created = created
+
+    def build(self, context):
+        path = self.path(context) if callable(self.path) else self.path
+        body = self.body(context) if callable(self.body) else self.body
+        return path, body
+
+
+def _new_garment(context):
+    return {
+        'country': 'Turkey',
+        'production_facility': 'Rabateks Tekstil Ltd.',
+        'po_number': context.unique('PO-BENCH'),
+        'style_name': 'Style-Bench',
+        'product_type': 'T-Shirt',
+        'fabric_type': 'Cotton',
+        'fabric_name': 'Premium Cotton',
+        'fabric_construction': 'Jersey',
+        'fabric_weight': 180,
+        'quantity': 500
+    }
+
+
+def _new_order(context):
+    return {
+        'country': 'Turkey',
+        'facility': 'Rabateks Tekstil Ltd.',
+        'po_number': context.unique('PO-BENCH'),
+        'style_name': 'Style-Bench',
+        'product_type': 'T-Shirt',
+        'fabric_type': 'Cotton',
+        'fabric_name': 'Premium Cotton',
+        'fabric_construction': 'Jersey',
+        'fabric_weight': 180,
+        'quantity': 500,
+        'status': 'pending'
+    }
+
+
+SCENARIOS = [
+    Scenario('dashboard', '/'),
+    Scenario('stats', '/api/stats'),
+    Scenario('garment_stats', '/garment/api/stats'),
+    Scenario('garment_page', '/garment/'),
+    Scenario('order_page', '/orders/'),
+    Scenario('garment_listing', '/garment/api/garments?limit=100'),
+    Scenario('order_listing', '/orders/api/orders?limit=100'),
+    Scenario('garment_detail', lambda context: f"/garment/api/garments/{context.random_id('garments')}"),
+    Scenario('order_detail', lambda context: f"/orders/api/orders/{context.random_id('orders')}"),
+    Scenario('order_analytics', '/api/analytics/orders?grain=month&by=status'),
+    Scenario('garment_create', '/garment/api/garments', 'POST', _new_garment,
+             created=('garments', lambda data: [data['garment']['id']])),
+    Scenario('order_create', '/orders/api/orders', 'POST', _new_order,
+             created=('orders', lambda data: [data['order']['id']])),
+    Scenario('order_random', '/orders/api/orders/random', 'POST', {'count': 1},
+             created=('orders', lambda data: [order['id'] for order in data['orders']]))
+]
+SCENARIO_NAMES = [scenario.name for scenario in SCENARIOS]
+
+
+class RunContext:
+    """Seeded id picks and unique values shared by a size's requests"""
+
+    def __init__(self, seed, id_ranges):
+        self.rng = random.Random(seed)
+        self.id_ranges = id_ranges
+        self.token = uuid.uuid4().hex[:8].upper()
+        self.counter = itertools.count(1)
+        self.created = {'garments': [], 'orders': []}
+        self._lock = threading.Lock()
+
+    def random_id(self, kind):
+        low, high = self.id_ranges[kind]
+        with self._lock:
+            return self.rng.randint(low, high)
+
+    def unique(self, prefix):
+        return f'{prefix}-{self.token}-{next(self.counter)}'
+
+    def collect(self, scenario, status, body):
+        if scenario.created is None or status >= 400:
+            return
+        kind, ids = scenario.created
+        try:
+            new_ids = ids(json.loads(body))
+        except (ValueError, KeyError, TypeError):
+            return
+        with self._lock:
+            self.created[kind].extend(new_ids)
+
+
+# Statistics
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an ascending list"""
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(latencies, errors, elapsed):
+    """Latency percentiles (ms) and throughput of one scenario's successful requests"""
+    ordered = sorted(latencies)
+    count = len(ordered)
+
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        'count': count,
+        'errors': errors,
+        'mean_ms': ms(sum(ordered) / count) if count else None,
+        'p50_ms': ms(percentile(ordered, 50)),
+        'p90_ms': ms(percentile(ordered, 90)),
+        'p99_ms': ms(percentile(ordered, 99)),
+        'max_ms': ms(ordered[-1]) if count else None,
+        'rps': round(count / elapsed, 1) if elapsed else None
+    }
+
+
+# Measurement
+
+def measure_in_process(app, scenarios, context, requests, warmup):
+    """Sequential requests through the test client"""
+    client = app.test_client()
+    results = {}
+    for scenario in scenarios:
+        latencies = []
+        errors = 0
+        started = time.perf_counter()
+        for index in range(warmup + requests):
+            path, body = scenario.build(context)
+            request_started = time.perf_counter()
+            response = client.open(path, method=scenario.method, json=body)
+            data = response.get_data()
+            latency = time.perf_counter() - request_started
+            context.collect(scenario, response.status_code, data)
+            if index < warmup:
+                started = time.perf_counter()
+                continue
+            if response.status_code >= 400:
+                errors += 1
+            else:
+                latencies.append(latency)
+        results[scenario.name] = summarize(latencies, errors, time.perf_counter() - started)
+    return results
+
+
+def _client_worker(port, scenario, context, count, latencies, failures):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        for _ in range(count):
+            path, body = scenario.build(context)
+            payload = json.dumps(body).encode('utf-8') if body is not None else None
+            headers = {'Content-Type': 'application/json'} if payload is not None else {}
+            request_started = time.perf_counter()
+            try:
+                connection.request(scenario.method, path, body=payload, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (OSError, http.client.HTTPException):
+                failures.append(1)
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                continue
+            latency = time.perf_counter() - request_started
+            context.collect(scenario, response.status, data)
+            if response.status >= 400:
+                failures.append(1)
+            else:
+                latencies.append(latency)
+            if response.getheader('Connection', '').lower() == 'close':
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    finally:
+        connection.close()
+
+
+def _run_clients(port, scenario, context, requests, concurrency):
+    latencies = []
+    failures = []
+    shares = [requests // concurrency + (1 if index < requests % concurrency else 0) for index in range(concurrency)]
+    threads = [
+        threading.Thread(target=_client_worker, args=(port, scenario, context, share, latencies, failures))
+        for share in shares if share
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, len(failures), time.perf_counter() - started
+
+
+def measure_server(app, scenarios, context, requests, warmup, concurrency):
+    """Concurrent clients against a threaded local WSGI server"""
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    concurrency = max(1, int(concurrency))
+    results = {}
+    try:
+        for scenario in scenarios:
+            if warmup:
+                _run_clients(server.port, scenario, context, warmup, concurrency)
+            latencies, errors, elapsed = _run_clients(server.port, scenario, context, requests, concurrency)
+            results[scenario.name] = summarize(latencies, errors, elapsed)
+            results[scenario.name]['concurrency'] = concurrency
+    finally:
+        server.shutdown()
+        thread.join()
+    return results
+
+
+# One dataset size (runs in the child process)
+
+def _row_counts():
+    from sqlalchemy import func, select
+
+    from app import db
+    from models.garment import Garment
+    from models.orders import Order
+
+    counts = {}
+    ranges = {}
+    for kind, model in (('garments', Garment), ('orders', Order)):
+        row = db.session.execute(select(func.count(), func.min(model.id), func.max(model.id))).one()
+        counts[kind] = row[0]
+        ranges[kind] = (row[1] or 0, row[2] or 0)
+    db.session.rollback()
+    return counts, ranges
+
+
+def _seed(size, seed):
+    from sqlalchemy import text
+
+    from app import db
+    from services.bulk import generate_garments, generate_orders
+    from services.database import begin_immediate
+    from services.search import catch_up
+
+    started = time.perf_counter()
+    generate_orders(size, seed=seed, spread_days=365, queue_search=False)
+    generate_garments(size, seed=seed, spread_days=365, queue_search=False)
+    with begin_immediate():
+        catch_up()
+    db.session.execute(text('ANALYZE'))
+    db.session.commit()
+    return round(time.perf_counter() - started, 3)
+
+
+def _cleanup(context):
+    from services.batch import run_batch
+
+    deleted = 0
+    for kind, ids in context.created.items():
+        ids = list(dict.fromkeys(ids))
+        for start in range(0, len(ids), CLEANUP_CHUNK):
+            operations = [{'op': 'delete', 'id': row_id} for row_id in ids[start:start + CLEANUP_CHUNK]]
+            deleted += run_batch(kind, operations, atomic=False)['deleted']
+        context.created[kind] = []
+    return deleted
+
+
+def run_size(size, seed=1, requests=200, warmup=20, concurrency=8, server=True, scenarios=None,
+             config_name='production'):
+    """Seed (when empty) and benchmark the databases configured in the environment"""
+    from app import create_app, init_db
+
+    app = create_app(config_name)
+    selected = [scenario for scenario in SCENARIOS if not scenarios or scenario.name in scenarios]
+
+    with app.app_context():
+        init_db()
+        counts, ranges = _row_counts()
+        seed_seconds = None
+        if not counts['orders'] and not counts['garments']:
+            seed_seconds = _seed(size, seed)
+            counts, ranges = _row_counts()
+
+    # Outside the app context: every request gets its own context and session
+    context = RunContext(seed, ranges)
+    modes = {'in_process': measure_in_process(app, selected, context, requests, warmup)}
+    if server:
+        modes['server'] = measure_server(app, selected, context, requests, warmup, concurrency)
+
+    with app.app_context():
+        cleaned = _cleanup(context)
+
+    return {
+        'size': size,
+        'rows': counts,
+        'seed_seconds': seed_seconds,
+        'cleaned_rows': cleaned,
+        'modes': modes
+    }
+
+
+# Suite (parent process)
+
+def database_paths(directory, size):
+    """Main, jobs and events database files for one size"""
+    return {
+        'DATABASE_URL': os.path.join(directory, f'dpp-{size}.db'),
+        'JOBS_DATABASE_URL': os.path.join(directory, f'jobs-{size}.db'),
+        'EVENTS_DATABASE_URL': os.path.join(directory, f'events-{size}.db')
+    }
+
+
+def _remove_database(path):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def run_child(size, directory, options, reseed=False, cwd=None):
+    """Run run_size() for one size in a fresh interpreter"""
+    cwd = cwd or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    paths = database_paths(directory, size)
+    if reseed:
+        for path in paths.values():
+            _remove_database(path)
+
+    env = dict(os.environ)
+    env.update({name: f'sqlite:///{os.path.abspath(path)}' for name, path in paths.items()})
+    env['JOBS_RUN_IN_WEB'] = 'false'
+    result = subprocess.run(
+        [sys.executable, '-c', _RUNNER, json.dumps({'size': size, **options})],
+        cwd=cwd, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f'Benchmark for size {size} failed:\n{result.stderr.strip()[-2000:]}')
+    # Seeding messages may print first; the results are the last line
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def current_commit(cwd=None):
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=cwd,
+                                capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def run_suite(directory, sizes=DEFAULT_SIZES, requests=200, warmup=20, concurrency=8, server=True,
+              seed=1, reseed=False, scenarios=None, progress=None):
+    """Benchmark every size and return the results document"""
+    os.makedirs(directory, exist_ok=True)
+    options = {
+        'seed': seed,
+        'requests': requests,
+        'warmup': warmup,
+        'concurrency': concurrency,
+        'server': server,
+        'scenarios': list(scenarios) if scenarios else None
+    }
+    results = {}
+    for size in sizes:
+        if progress:
+            progress(size)
+        results[str(size)] = run_child(size, directory, options, reseed=reseed)
+    return {
+        'commit': current_commit(directory),
+        'created': datetime.utcnow().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': options,
+        'sizes': results
+    }
+
+
+def write_results(results, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as target:
+        json.dump(results, target, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as source:
+        return json.load(source)
+
+
+# Comparison
+
+def compare(baseline, current, thresholds=None):
+    """Regressions of `current` against `baseline` (both results documents)
+
+    A latency percentile regresses when it grew by more than its relative
+    threshold and by at least min_ms; throughput regresses when requests per
+    second dropped by more than the throughput threshold. Any increase in
+    errors is a regression. Scenarios missing from either run are skipped.
+    """
+    thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    regressions = []
+    for size, current_size in current.get('sizes', {}).items():
+        baseline_size = baseline.get('sizes', {}).get(size)
+        if not baseline_size:
+            continue
+        for mode, scenarios in current_size['modes'].items():
+            baseline_mode = baseline_size['modes'].get(mode, {})
+            for name, stats in scenarios.items():
+                old = baseline_mode.get(name)
+                if not old:
+                    continue
+                before, after = old.get('errors') or 0, stats.get('errors') or 0
+                if after > before:
+                    regressions.append(_regression(size, mode, name, 'errors', before, after))
+                for metric in ('p50', 'p99'):
+                    before, after = old.get(f'{metric}_ms'), stats.get(f'{metric}_ms')
+                    if before is None or after is None:
+                        continue
+                    if after > before * (1 + thresholds[metric]) and after - before >= thresholds['min_ms']:
+                        regressions.append(_regression(size, mode, name, f'{metric}_ms', before, after))
+                before, after = old.get('rps'), stats.get('rps')
+                if before and after is not None and after < before * (1 - thresholds['throughput']):
+                    regressions.append(_regression(size, mode, name, 'rps', before, after))
+    return regressions
+
+
+def _regression(size, mode, scenario, metric, before, after):
+    return {
+        'size': size,
+        'mode': mode,
+        'scenario': scenario,
+        'metric': metric,
+        'baseline': before,
+        'current': after,
+        'change': round((after - before) / before, 3) if before else None
+    }
+
+
+# Connection capacity: threaded WSGI vs ASGI
+
+# Read endpoints that services/asgi.py serves with async handlers
+CAPACITY_SCENARIOS = ('stats', 'garment_stats', 'order_listing', 'garment_listing', 'order_detail', 'garment_detail')
+CAPACITY_MODES = ('wsgi', 'asgi')
+# Listen backlog of both servers, so neither refuses connections the other queues
+BACKLOG = 2048
+SERVER_START_TIMEOUT = 30
+
+_SERVER = '''
+import json, sys
+from services.benchmarks import serve
+serve(**json.loads(sys.argv[1]))
+'''
+
+
+def serve(mode, port, config_name='production'):
+    """Serve the app on 127.0.0.1:port until killed (runs in a child process)
+
+    ``wsgi`` is the threaded werkzeug server (a thread per connection, the
+    `app.run()` path); ``asgi`` is uvicorn running services/asgi.py.
+    """
+    from app import create_app
+
+    app = create_app(config_name)
+    if mode == 'asgi':
+        import uvicorn
+        from services.asgi import AsyncAPI
+        uvicorn.run(AsyncAPI(app), host='127.0.0.1', port=port, log_level='warning', backlog=BACKLOG)
+        return
+
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    server.socket.listen(BACKLOG)
+    server.serve_forever()
+
+
+def _free_port():
+    import socket
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def _start_server(mode, config_name, cwd=None):
+    import socket
+
+    cwd = cwd or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    port = _free_port()
+    env = dict(os.environ, JOBS_RUN_IN_WEB='false')
+    # A file rather than a pipe: nothing drains the server's log while it runs
+    log = tempfile.TemporaryFile()
+    process = subprocess.Popen(
+        [sys.executable, '-c', _SERVER, json.dumps({'mode': mode, 'port': port, 'config_name': config_name})],
+        cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=log
+    )
+    with log:
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                log.seek(0)
+                raise RuntimeError(f'{mode} server exited:\n{log.read().decode(errors="replace")[-2000:]}')
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return process, port
+            except OSError:
+                time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'{mode} server did not start within {SERVER_START_TIMEOUT}s')
+
+
+async def _read_response(reader):
+    """(status, keep_alive) of one HTTP/1.1 response, reading its whole body"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    status = int(status_line.split(b' ', 2)[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';', 1)[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def _capacity_client(port, scenario, context, deadline, timeout, stats):
+    import asyncio
+
+    reader = writer = None
+    try:
+        while time.perf_counter() < deadline:
+            if writer is None:
+                try:
+                    reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+                except (OSError, asyncio.TimeoutError):
+                    stats['connect_errors'] += 1
+                    await asyncio.sleep(0.05)
+                    continue
+            path, _ = scenario.build(context)
+            started = time.perf_counter()
+            try:
+                writer.write(f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nAccept-Encoding: identity\r\n\r\n'.encode())
+                status, keep_alive = await asyncio.wait_for(_read_response(reader), timeout)
+            except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                stats['errors'] += 1
+                writer.close()
+                writer = None
+                continue
+            if status == 503:
+                stats['rejected'] += 1
+            elif status >= 400:
+                stats['errors'] += 1
+            else:
+                stats['latencies'].append(time.perf_counter() - started)
+            if not keep_alive:
+                writer.close()
+                writer = None
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def _capacity_run(port, scenario, context, connections, duration, timeout):
+    import asyncio
+
+    stats = {'latencies': [], 'errors': 0, 'rejected': 0, 'connect_errors': 0}
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        _capacity_client(port, scenario, context, deadline, timeout, stats) for _ in range(connections)
+    ])
+    return stats, time.perf_counter() - started
+
+
+def measure_capacity(app, levels=(10, 100, 500, 1000), duration=10.0, scenarios=None, seed=1, timeout=30.0,
+                     progress=None):
+    """Throughput and latency of the read endpoints per open-connection count
+
+    Both servers run in their own process against the app's database; the
+    load comes from this process, from `connections` concurrent keep-alive
+    connections (asyncio, so thousands fit in one thread) that each send
+    requests back to back for `duration` seconds. Per mode, level and
+    scenario the results add the 503s sent by the ASGI backpressure
+    (``rejected``), failed connects and timed out or failed requests.
+    """
+    import asyncio
+
+    selected = [scenario for scenario in SCENARIOS
+                if scenario.name in CAPACITY_SCENARIOS and (not scenarios or scenario.name in scenarios)]
+    with app.app_context():
+        counts, ranges = _row_counts()
+    context = RunContext(seed, ranges)
+    config_name = app.config.get('CONFIG_NAME', 'production')
+
+    modes = {}
+    for mode in CAPACITY_MODES:
+        process, port = _start_server(mode, config_name)
+        try:
+            levels_result = {}
+            for connections in levels:
+                if progress:
+                    progress(mode, connections)
+                results = {}
+                for scenario in selected:
+                    # Warm the server's caches and pools before measuring
+                    asyncio.run(_capacity_run(port, scenario, context, min(connections, 10), 0.5, timeout))
+                    stats, elapsed = asyncio.run(_capacity_run(port, scenario, context, connections, duration, timeout))
+                    results[scenario.name] = {
+                        **summarize(stats['latencies'], stats['errors'], elapsed),
+                        'rejected': stats['rejected'],
+                        'connect_errors': stats['connect_errors']
+                    }
+                levels_result[str(connections)] = results
+            modes[mode] = levels_result
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+    return {
+        'commit': current_commit(),
+        'created': datetime.utcnow().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'rows': counts,
+        'settings': {'levels': list(levels), 'duration': duration, 'timeout': timeout, 'seed': seed},
+        'modes': modes
+    }
+
+
+@click.command('benchmark')
+@click.option('--sizes', default='1000,100000,1000000', show_default=True, help='Seeded orders and garments per dataset (comma separated)')
+@click.option('--requests', 'request_count', default=200, show_default=True, help='Measured requests per endpoint and mode')
+@click.option('--warmup', default=20, show_default=True, help='Unmeasured requests before each endpoint')
+@click.option('--concurrency', default=8, show_default=True, help='Client threads against the local server')
+@click.option('--server/--no-server', default=True, help='Also load-test through a threaded local WSGI server')
+@click.option('--scenario', 'scenarios', multiple=True, help='Only run these endpoints (default: all)')
+@click.option('--seed', default=1, show_default=True, help='RNG seed for the datasets and id picks')
+@click.option('--reseed', is_flag=True, help='Delete and regenerate the benchmark databases')
+@click.option('--output', type=click.Path(dir_okay=False), help='Results file (default instance/benchmarks/results-<time>.json)')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False), help='Earlier results file to check for regressions')
+@with_appcontext
+def benchmark_command(sizes, request_count, warmup, concurrency, server, scenarios, seed, reseed, output, baseline):
+    """Throughput and p50/p99 latency of every endpoint at several dataset sizes"""
+    unknown = [name for name in scenarios if name not in SCENARIO_NAMES]
+    if unknown:
+        raise click.BadParameter(f"choose from {', '.join(SCENARIO_NAMES)}", param_hint='--scenario')
+    directory = os.path.join(current_app.instance_path, 'benchmarks')
+    results = run_suite(
+        directory, sizes=[int(size) for size in sizes.split(',') if size.strip()],
+        requests=request_count, warmup=warmup, concurrency=concurrency, server=server,
+        seed=seed, reseed=reseed, scenarios=scenarios,
+        progress=lambda size: print(f"   benchmarking {size} rows...")
+    )
+    output = output or os.path.join(directory, f"results-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    write_results(results, output)
+    for size, result in results['sizes'].items():
+        for mode, stats in result['modes'].items():
+            print(f"   [{size} rows, {mode}]")
+            for name, item in stats.items():
+                print(f"   {name}: p50 {item['p50_ms']} ms, p99 {item['p99_ms']} ms, "
+                      f"{item['rps']} req/s, {item['errors']} errors")
+    print(f"✅ Benchmark results written to {output}")
+    if baseline:
+        regressions = compare(load_results(baseline), results, current_app.config.get('BENCHMARK_THRESHOLDS'))
+        for item in regressions:
+            print(f"   ❌ {item['size']} rows {item['mode']} {item['scenario']} {item['metric']}: "
+                  f"{item['baseline']} -> {item['current']}")
+        if regressions:
+            raise SystemExit(1)
+        print("✅ No regressions against the baseline")
+
+
+@click.command('benchmark-asgi')
+@click.option('--connections', default='10,100,500,1000', show_default=True, help='Concurrent keep-alive connections per run (comma separated)')
+@click.option('--duration', default=10.0, show_default=True, help='Seconds per endpoint and connection count')
+@click.option('--scenario', 'scenarios', multiple=True, help='Only run these endpoints (default: all read endpoints)')
+@click.option('--seed', default=1, show_default=True, help='RNG seed for the id picks')
+@click.option('--output', type=click.Path(dir_okay=False), help='Results file (default instance/benchmarks/capacity-<time>.json)')
+@with_appcontext
+def benchmark_asgi_command(connections, duration, scenarios, seed, output):
+    """Compare the threaded WSGI server with the ASGI mode under many open connections"""
+    unknown = [name for name in scenarios if name not in CAPACITY_SCENARIOS]
+    if unknown:
+        raise click.BadParameter(f"choose from {', '.join(CAPACITY_SCENARIOS)}", param_hint='--scenario')
+    results = measure_capacity(
+        current_app._get_current_object(),
+        levels=[int(level) for level in connections.split(',') if level.strip()],
+        duration=duration, scenarios=scenarios, seed=seed,
+        progress=lambda mode, level: print(f"   {mode}: {level} connections...")
+    )
+    output = output or os.path.join(current_app.instance_path, 'benchmarks',
+                                    f"capacity-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    write_results(results, output)
+    for mode, levels in results['modes'].items():
+        for level, stats in levels.items():
+            print(f"   [{mode}, {level} connections]")
+            for name, item in stats.items():
+                print(f"   {name}: p50 {item['p50_ms']} ms, p99 {item['p99_ms']} ms, {item['rps']} req/s, "
+                      f"{item['errors']} errors, {item['rejected']} rejected")
+    print(f"✅ Capacity results written to {output}")
+
+
+COMMANDS = (benchmark_command, benchmark_asgi_command)
@@ -0,0 +1,282 @@
+"""High-volume random order and garment generation
+
+Rows are built column by column with a seedable RNG and written with one
+``executemany`` per chunk, all inside one transaction. The DashboardStats
+summary and the stats cache are updated once per chunk instead of per row.
+Garments are scored with the vectorized carbon engine per chunk, since the
+ORM hooks don't run for these inserts. Country, facility and fabric values
+are interned once per chunk (services/dimensions.py).
+
+On SQLite, loads at least as large as the existing table drop the secondary
+indexes for the duration of the insert and rebuild them before committing;
+sorting once is cheaper than maintaining every index row by row. The
+full-text index triggers are dropped for every load and the new id range is
+queued for the ``search.catch_up`` job (services/search.py): the rows are
+searchable once it has run. Rollup and order status duration deltas are
+counted from the chunks' columns rather than read back from the table.
+"""
+import random
+import time
+from collections import Counter
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, insert, select
+
+from app import db
+from models.dashboard import DashboardStats, SUMMARY_ID
+from models.garment import Garment
+from models.orders import Order
+from models.status_history import OrderStatusChange
+from services import carbon, change_feed, dimensions, rollups, search, stats as stats_engine, status_history
+from services.database import begin_immediate
+from services.summary import apply_delta, order_status_column
+
+DEFAULT_CHUNK_SIZE = 10000
+
+
+def order_deltas(columns):
+    """Summary counter deltas for a chunk of inserted order columns"""
+    deltas = {
+        'total_orders': len(columns['status']),
+        'order_quantity': sum(columns['quantity'])
+    }
+    for status, count in Counter(columns['status']).items():
+        column = order_status_column(status)
+        if column:
+            deltas[column] = count
+    return deltas
+
+
+def garment_deltas(columns):
+    """Summary counter deltas for a chunk of inserted garment columns"""
+    return {
+        'total_garments': len(columns['quantity']),
+        'garment_quantity': sum(columns['quantity']),
+        'total_carbon': sum(columns['carbon_footprint'])
+    }
+
+
+def _sqlite_datetime(values):
+    """Format datetimes the way SQLAlchemy stores them in SQLite"""
+    cache = {}
+    formatted = []
+    for value in values:
+        text = cache.get(value)
+        if text is None:
+            text = cache[value] = value.isoformat(sep=' ', timespec='microseconds')
+        formatted.append(text)
+    return formatted
+
+
+def insert_columns(connection, table, columns):
+    """executemany one chunk of column lists into `table`
+
+    On SQLite the rows go straight to the DB-API cursor as tuples, skipping
+    SQLAlchemy's per-row parameter processing; other databases use a Core
+    ``insert()``.
+    """
+    names = list(columns)
+    if connection.dialect.name != 'sqlite':
+        rows = [dict(zip(names, values)) for values in zip(*columns.values())]
+        connection.execute(insert(table), rows)
+        return
+
+    values = [
+        _sqlite_datetime(column) if column and isinstance(column[0], datetime) else column
+        for column in columns.values()
+    ]
+    sql = f"INSERT INTO {table.name} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})"
+    connection.exec_driver_sql(sql, list(zip(*values)))
+
+
+# Summary counter holding each table's row count
+SUMMARY_TOTALS = {
+    'orders': DashboardStats.total_orders,
+    'garments': DashboardStats.total_garments
+}
+
+
+def existing_rows(connection, table):
+    """Current row count, read from the summary row when it has one"""
+    column = SUMMARY_TOTALS.get(table.name)
+    if column is not None:
+        total = connection.execute(select(column).where(DashboardStats.id == SUMMARY_ID)).scalar()
+        if total is not None:
+            return total
+    return connection.execute(select(func.count()).select_from(table)).scalar()
+
+
+# Tables every generated row of a model also adds a row to
+WRITTEN_ALONG = {Order: (OrderStatusChange,)}
+
+
+def secondary_indexes(table):
+    """Non-unique indexes that can be rebuilt after a load"""
+    return [index for index in table.indexes if not index.unique]
+
+
+def _load(model, count, build_chunk, chunk_size, defer_indexes, job):
+    """Insert `count` rows of `model` from build_chunk(size, connection)
+
+    Returns (inserted, deferred indexes flag, rows queued for search). The
+    caller commits.
+    """
+    table = model.__table__
+    inserted = 0
+
+    with begin_immediate():
+        connection = db.session.connection()
+    if connection.dialect.name != 'sqlite':
+        defer_indexes = False
+    elif defer_indexes is None:
+        defer_indexes = count >= existing_rows(connection, table)
+    deferred = []
+    if defer_indexes:
+        for loaded in (model, *WRITTEN_ALONG.get(model, ())):
+            deferred += secondary_indexes(loaded.__table__)
+    for index in deferred:
+        index.drop(connection, checkfirst=True)
+    # The loaded rows are indexed for search by a catch-up job instead of per row
+    deferred_search = search.deferred_index(connection, model)
+    first_id = connection.execute(select(func.coalesce(func.max(table.c.id), 0))).scalar() + 1
+    # Rollups and status durations are counted from the chunks' columns
+    rollup_deltas = rollups.RollupDeltas(model)
+    duration_deltas = status_history.DurationDeltas() if model is Order else None
+
+    while inserted < count:
+        size = min(chunk_size, count - inserted)
+        columns, deltas = build_chunk(size, connection)
+        columns = dimensions.encode_columns(connection, model, columns)
+        insert_columns(connection, table, columns)
+        apply_delta(connection, deltas)
+        rollup_deltas.add(columns)
+        if duration_deltas is not None:
+            status_history.enter_columns(duration_deltas, columns)
+        inserted += size
+        if job is not None:
+            job.update(total=count, created=inserted)
+            job.check_cancelled()
+
+    if duration_deltas is not None:
+        status_history.record_created(connection, [table.c.id >= first_id], deltas=duration_deltas)
+    for index in deferred:
+        index.create(connection)
+    search_pending = search.restore_index(connection, deferred_search, first_id)
+    rollup_deltas.apply(connection)
+
+    stats_engine.mark_dirty(db.session, model)
+    change_feed.record(db.session, table.name, reset=True)
+    return inserted, bool(defer_indexes), search_pending
+
+
+def _generate(model, count, build_chunk, seed, chunk_size, defer_indexes, queue_search, job):
+    chunk_size = max(1, int(chunk_size))
+    started = time.perf_counter()
+
+    try:
+        inserted, deferred, search_pending = _load(model, count, build_chunk, chunk_size, defer_indexes, job)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    elapsed = time.perf_counter() - started
+    if search_pending and queue_search:
+        from services.jobs import submit_job
+        submit_job('search.catch_up')
+    return {
+        'created': inserted,
+        'seed': seed,
+        'chunk_size': chunk_size,
+        'deferred_indexes': deferred,
+        'search_pending': search_pending,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(inserted / elapsed) if elapsed else inserted
+    }
+
+
+def generate_orders(count, seed=None, chunk_size=DEFAULT_CHUNK_SIZE, spread_days=0, defer_indexes=None,
+                    queue_search=True, job=None):
+    """Insert `count` random orders in chunks inside a single transaction
+
+    The same seed always produces the same dataset (including order ids, so
+    a seed can only be loaded once into a given database). defer_indexes=None
+    defers index maintenance when `count` is at least the existing row count.
+    The rows are indexed for search by a queued ``search.catch_up`` job;
+    with queue_search=False the caller runs search.catch_up() itself. As a
+    background job it reports progress per chunk; cancelling rolls the whole
+    load back.
+    """
+    rng = random.Random(seed)
+
+    def build_chunk(size, connection):
+        columns = Order.random_columns(size, rng, spread_days=spread_days)
+        return columns, order_deltas(columns)
+
+    return _generate(Order, count, build_chunk, seed, chunk_size, defer_indexes, queue_search, job)
+
+
+def generate_garments(count, seed=None, chunk_size=DEFAULT_CHUNK_SIZE, spread_days=0, defer_indexes=None,
+                      queue_search=True, job=None):
+    """Insert `count` random, scored garments in chunks inside a single transaction
+
+    Same behaviour as generate_orders(); PO numbers are unique per seed.
+    """
+    rng = random.Random(seed)
+    factors = None
+
+    def build_chunk(size, connection):
+        nonlocal factors
+        if factors is None:
+            factors = carbon.load_factors(connection)
+        columns = Garment.random_columns(size, rng, spread_days=spread_days)
+        footprint, score = carbon.compute_scores(columns, factors)
+        columns['carbon_footprint'] = [float(value) for value in footprint]
+        columns['sustainability_score'] = [int(value) for value in score]
+        return columns, garment_deltas(columns)
+
+    return _generate(Garment, count, build_chunk, seed, chunk_size, defer_indexes, queue_search, job)
+
+
+def _catch_up_search():
+    started = time.perf_counter()
+    with begin_immediate():
+        counts = search.catch_up()
+    db.session.commit()
+    if counts:
+        print(f"✅ {sum(counts.values())} rows added to the search index in {round(time.perf_counter() - started, 2)}s")
+
+
+@click.command('generate-orders')
+@click.option('--count', default=100000, show_default=True, help='Number of orders to insert')
+@click.option('--seed', type=int, default=None, help='RNG seed for a reproducible dataset')
+@click.option('--chunk-size', default=10000, show_default=True, help='Rows per executemany batch')
+@click.option('--spread-days', default=0, show_default=True, help='Spread created dates over this many past days')
+@click.option('--defer-indexes/--keep-indexes', default=None, help='Rebuild secondary indexes after the load (default: when count >= existing rows)')
+@with_appcontext
+def generate_orders_command(count, seed, chunk_size, spread_days, defer_indexes):
+    """Bulk insert random orders for load testing and staging data"""
+    result = generate_orders(count, seed=seed, chunk_size=chunk_size, spread_days=spread_days,
+                             defer_indexes=defer_indexes, queue_search=False)
+    print(f"✅ {result['created']} orders created in {result['seconds']}s ({result['rows_per_second']} rows/s)")
+    _catch_up_search()
+
+
+@click.command('generate-garments')
+@click.option('--count', default=100000, show_default=True, help='Number of garments to insert')
+@click.option('--seed', type=int, default=None, help='RNG seed for a reproducible dataset')
+@click.option('--chunk-size', default=10000, show_default=True, help='Rows per executemany batch')
+@click.option('--spread-days', default=0, show_default=True, help='Spread created dates over this many past days')
+@click.option('--defer-indexes/--keep-indexes', default=None, help='Rebuild secondary indexes after the load (default: when count >= existing rows)')
+@with_appcontext
+def generate_garments_command(count, seed, chunk_size, spread_days, defer_indexes):
+    """Bulk insert random, scored garments for load testing and staging data"""
+    result = generate_garments(count, seed=seed, chunk_size=chunk_size, spread_days=spread_days,
+                               defer_indexes=defer_indexes, queue_search=False)
+    print(f"✅ {result['created']} garments created in {result['seconds']}s ({result['rows_per_second']} rows/s)")
+    _catch_up_search()
+
+
+COMMANDS = (generate_orders_command, generate_garments_command)
@@ -0,0 +1,416 @@
+"""Carbon footprint and sustainability score engine for garments
+
+A garment's footprint per unit is::
+
+    (fabric_weight kg x fabric factor + MANUFACTURING_KG_PER_UNIT)
+        x country factor x facility factor
+
+and ``carbon_footprint`` is that times ``quantity`` (kg CO2e). The
+sustainability score maps the per-unit footprint onto 0-100:
+``100 * R / (R + unit)`` with R = SCORE_REFERENCE_KG, so a garment at the
+reference footprint scores 50 and lower footprints score higher.
+
+Factors live in the ``emission_factors`` table (key '*' is the fallback for
+unlisted values, DEFAULT_FACTORS seed it). Garments are scored:
+
+* on every ORM insert/update (mapper hooks below),
+* after batch and import writes, for the rows they wrote
+  (``rescore_written``, in the writer's transaction),
+* for the whole catalogue when factors change (``rescore_all``, in chunks,
+  usually as the 'garments.rescore' background job).
+
+Rescoring reads the input columns in id-ordered chunks, computes each chunk
+with NumPy array arithmetic (or a plain Python loop when NumPy is not
+installed), writes back only the rows whose values changed with one
+executemany, and adjusts the DashboardStats carbon total by the difference.
+"""
+import threading
+import time
+
+import click
+from flask import current_app, has_app_context
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, event, func, select, update
+
+from app import db
+from models.carbon import EmissionFactor
+from models.garment import Garment
+from services import change_feed, dimensions, rollups, stats as stats_engine
+from services.database import begin_immediate
+from services.summary import apply_delta
+
+try:
+    import numpy as np
+except ImportError:  # optional: rescoring falls back to pure Python
+    np = None
+
+MANUFACTURING_KG_PER_UNIT = 1.0
+# Used when a garment has no (or a non-positive) fabric_weight
+DEFAULT_WEIGHT_G = 200.0
+SCORE_REFERENCE_KG = 5.0
+DEFAULT_CHUNK_SIZE = 50000
+
+DEFAULT_FACTORS = {
+    'fabric': {
+        '*': 7.0,
+        'cotton': 5.9,
+        'organic cotton': 3.8,
+        'cotton blend': 6.8,
+        'polyester': 9.5,
+        'recycled polyester': 5.5,
+        'nylon': 12.0,
+        'wool': 13.9,
+        'linen': 4.5,
+        'viscose': 6.3,
+        'modal': 5.8,
+        'elastane': 14.0,
+        'denim': 6.5
+    },
+    'country': {
+        '*': 1.0,
+        'turkey': 1.0,
+        'bangladesh': 1.15,
+        'vietnam': 1.1,
+        'china': 1.25,
+        'india': 1.3,
+        'pakistan': 1.2,
+        'portugal': 0.7,
+        'italy': 0.75
+    },
+    'facility': {
+        '*': 1.0
+    }
+}
+
+INPUT_COLUMNS = ('fabric_type', 'fabric_weight', 'quantity', 'country', 'production_facility')
+OUTPUT_COLUMNS = ('carbon_footprint', 'sustainability_score')
+# Inputs stored as dimension keys: read the keys, decode them per chunk
+KEYED_INPUTS = {'fabric_type': 'fabric_id', 'country': 'country_id', 'production_facility': 'facility_id'}
+
+
+def normalize_key(value):
+    return ' '.join(str(value or '').lower().split())
+
+
+class FactorTable:
+    """Factor lookups by kind, falling back to the kind's '*' entry"""
+
+    def __init__(self, factors):
+        self.factors = {
+            kind: {normalize_key(key) if key != '*' else '*': value for key, value in table.items()}
+            for kind, table in factors.items()
+        }
+        for kind in EmissionFactor.KINDS:
+            self.factors.setdefault(kind, {}).setdefault('*', DEFAULT_FACTORS[kind]['*'])
+
+    def lookup(self, kind, value):
+        table = self.factors[kind]
+        return table.get(normalize_key(value), table['*'])
+
+    def unit_footprint(self, fabric_type, fabric_weight, country, facility):
+        weight = fabric_weight if fabric_weight and fabric_weight > 0 else DEFAULT_WEIGHT_G
+        return (
+            (weight / 1000 * self.lookup('fabric', fabric_type) + MANUFACTURING_KG_PER_UNIT)
+            * self.lookup('country', country)
+            * self.lookup('facility', facility)
+        )
+
+    def score(self, fabric_type, fabric_weight, quantity, country, facility):
+        """(carbon_footprint, sustainability_score) for one garment"""
+        unit = self.unit_footprint(fabric_type, fabric_weight, country, facility)
+        return round(unit * (quantity or 0), 3), int(round(100 * SCORE_REFERENCE_KG / (SCORE_REFERENCE_KG + unit)))
+
+    def factor_column(self, kind, values):
+        """Factor per value, looking each distinct value up once"""
+        table = self.factors[kind]
+        seen = {value: table.get(normalize_key(value), table['*']) for value in set(values)}
+        return list(map(seen.__getitem__, values))
+
+
+# Factor table loading
+
+def load_factors(connection=None):
+    """FactorTable from emission_factors (DEFAULT_FACTORS while it is empty)"""
+    connection = connection or db.session.connection()
+    table = EmissionFactor.__table__
+    rows = connection.execute(select(table.c.kind, table.c.key, table.c.factor)).all()
+    if not rows:
+        return FactorTable(DEFAULT_FACTORS)
+    factors = {}
+    for kind, key, factor in rows:
+        factors.setdefault(kind, {})[key] = factor
+    return FactorTable(factors)
+
+
+def factors_version(connection):
+    """Version of the emission_factors rows: (row count, newest updated_date)
+
+    Inserts and updates stamp updated_date and deletes change the count, so
+    every write through set_factors()/seed_factors() gives a new version.
+    """
+    table = EmissionFactor.__table__
+    return tuple(connection.execute(select(func.count(), func.max(table.c.updated_date))).one())
+
+
+_cache_lock = threading.Lock()
+_cache = {'factors': None, 'version': None}
+
+
+def get_factors(connection=None):
+    """Cached FactorTable, reloaded when factors_version() changes
+
+    The version is read on every call, so factors changed by another worker
+    process are used from its commit on.
+    """
+    connection = connection or db.session.connection()
+    version = factors_version(connection)
+    with _cache_lock:
+        if _cache['factors'] is not None and _cache['version'] == version:
+            return _cache['factors']
+    factors = load_factors(connection)
+    with _cache_lock:
+        _cache['factors'] = factors
+        _cache['version'] = version
+    return factors
+
+
+def invalidate_factors():
+    with _cache_lock:
+        _cache['factors'] = None
+
+
+def seed_factors():
+    """Insert DEFAULT_FACTORS into an empty emission_factors table"""
+    for kind, table in DEFAULT_FACTORS.items():
+        for key, factor in table.items():
+            db.session.add(EmissionFactor(kind=kind, key=key, factor=factor, source='default'))
+    db.session.commit()
+    invalidate_factors()
+
+
+def set_factors(session, items):
+    """Upsert [{"kind", "key", "factor", "source"}] (factor None deletes the key)"""
+    for item in items:
+        kind = item.get('kind')
+        if kind not in EmissionFactor.KINDS:
+            raise ValueError(f"kind must be one of {', '.join(EmissionFactor.KINDS)}")
+        key = '*' if item.get('key') == '*' else normalize_key(item.get('key'))
+        if not key:
+            raise ValueError('key is required')
+        existing = session.execute(
+            select(EmissionFactor).where(EmissionFactor.kind == kind, EmissionFactor.key == key)
+        ).scalar_one_or_none()
+        if item.get('factor') is None:
+            if key == '*':
+                raise ValueError("the '*' fallback can't be deleted")
+            if existing is not None:
+                session.delete(existing)
+            continue
+        factor = float(item['factor'])
+        if factor < 0:
+            raise ValueError('factor must not be negative')
+        if existing is None:
+            existing = EmissionFactor(kind=kind, key=key)
+            session.add(existing)
+        existing.factor = factor
+        existing.source = item.get('source', existing.source)
+
+
+# Scoring on write
+
+def _compute_on_write():
+    return not has_app_context() or current_app.config.get('CARBON_COMPUTE_ON_WRITE', True)
+
+
+def _score_garment(mapper, connection, target):
+    if not _compute_on_write():
+        return
+    target.carbon_footprint, target.sustainability_score = get_factors(connection).score(
+        target.fabric_type, target.fabric_weight, target.quantity, target.country, target.production_facility
+    )
+
+
+event.listen(Garment, 'before_insert', _score_garment)
+event.listen(Garment, 'before_update', _score_garment)
+
+
+# Vectorized rescoring
+
+def compute_scores(columns, factors):
+    """Carbon footprints and scores for columns of INPUT_COLUMNS values"""
+    fabric = factors.factor_column('fabric', columns['fabric_type'])
+    country = factors.factor_column('country', columns['country'])
+    facility = factors.factor_column('facility', columns['production_facility'])
+
+    if np is not None:
+        weight = np.array(columns['fabric_weight'], dtype=float)
+        weight = np.where(np.isnan(weight) | (weight <= 0), DEFAULT_WEIGHT_G, weight)
+        quantity = np.nan_to_num(np.array(columns['quantity'], dtype=float))
+        unit = (weight / 1000 * np.array(fabric) + MANUFACTURING_KG_PER_UNIT) * np.array(country) * np.array(facility)
+        carbon = np.round(unit * quantity, 3)
+        score = np.rint(100 * SCORE_REFERENCE_KG / (SCORE_REFERENCE_KG + unit)).astype(np.int64)
+        return carbon, score
+
+    carbon = []
+    score = []
+    for weight, quantity, fabric_factor, country_factor, facility_factor in zip(
+        columns['fabric_weight'], columns['quantity'], fabric, country, facility
+    ):
+        weight = weight if weight and weight > 0 else DEFAULT_WEIGHT_G
+        unit = (weight / 1000 * fabric_factor + MANUFACTURING_KG_PER_UNIT) * country_factor * facility_factor
+        carbon.append(round(unit * (quantity or 0), 3))
+        score.append(int(round(100 * SCORE_REFERENCE_KG / (SCORE_REFERENCE_KG + unit))))
+    return carbon, score
+
+
+def _changed_rows(ids, carbon, score, old_carbon, old_score):
+    """(carbon, score, id) rows that differ from the stored values, and the carbon delta"""
+    if np is not None:
+        old_carbon = np.array(old_carbon, dtype=float)
+        old_score = np.array(old_score, dtype=float)
+        changed = np.isnan(old_carbon) | (np.abs(carbon - np.nan_to_num(old_carbon)) > 1e-9) | (score != old_score)
+        delta = float(carbon.sum() - np.nan_to_num(old_carbon).sum())
+        if not changed.any():
+            return [], delta
+        rows = list(zip(carbon[changed].tolist(), score[changed].tolist(), np.array(ids)[changed].tolist()))
+        return rows, delta
+
+    rows = []
+    delta = 0.0
+    for row_id, new_carbon, new_score, stored_carbon, stored_score in zip(ids, carbon, score, old_carbon, old_score):
+        delta += new_carbon - (stored_carbon or 0.0)
+        if stored_carbon is None or abs(new_carbon - stored_carbon) > 1e-9 or new_score != stored_score:
+            rows.append((new_carbon, new_score, row_id))
+    return rows, delta
+
+
+def _write_scores(connection, rows):
+    if connection.dialect.name == 'sqlite':
+        # Straight to the DB-API cursor, like services/bulk.py's inserts
+        connection.exec_driver_sql(
+            'UPDATE garments SET carbon_footprint = ?, sustainability_score = ? WHERE id = ?', rows
+        )
+        return
+    table = Garment.__table__
+    connection.execute(
+        update(table).where(table.c.id == bindparam('_id')).values(
+            carbon_footprint=bindparam('_carbon'), sustainability_score=bindparam('_score')
+        ),
+        [{'_carbon': carbon, '_score': score, '_id': row_id} for carbon, score, row_id in rows]
+    )
+
+
+def rescore_rows(connection, factors, clauses, after_id=0, limit=None, track_rollups=False):
+    """Rescore garments matching `clauses` with id > after_id (up to `limit`)
+
+    Runs inside the caller's transaction. Returns (last id, rows read, rows
+    changed) and leaves the DashboardStats carbon total adjusted. Writers that
+    already count their rows out of and back into the rollups leave
+    track_rollups off.
+    """
+    table = Garment.__table__
+    stored = tuple(KEYED_INPUTS.get(name, name) for name in INPUT_COLUMNS)
+    query = (
+        select(table.c.id, *(table.c[name] for name in stored + OUTPUT_COLUMNS))
+        .where(table.c.id > after_id, *clauses)
+        .order_by(table.c.id)
+    )
+    if limit:
+        query = query.limit(limit)
+    if connection.dialect.name == 'sqlite':
+        # Plain DB-API tuples: building Row objects costs as much as the fetch
+        compiled = query.compile(connection, compile_kwargs={'render_postcompile': True})
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+        rows = connection.exec_driver_sql(str(compiled), params).cursor.fetchall()
+    else:
+        rows = connection.execute(query).all()
+    if not rows:
+        return None, 0, []
+
+    values = list(zip(*rows))
+    columns = dict(zip(('id',) + INPUT_COLUMNS + OUTPUT_COLUMNS, values))
+    for name in KEYED_INPUTS:
+        columns[name] = dimensions.decode_column(Garment, name, columns[name], connection)
+    carbon, score = compute_scores(columns, factors)
+    changed, delta = _changed_rows(columns['id'], carbon, score, columns['carbon_footprint'],
+                                   columns['sustainability_score'])
+    if changed:
+        window = [table.c.id > after_id, table.c.id <= rows[-1][0], *clauses]
+        if track_rollups:
+            rollups.apply(connection, Garment, window, sign=-1)
+        _write_scores(connection, changed)
+        if track_rollups:
+            rollups.apply(connection, Garment, window)
+        apply_delta(connection, {'total_carbon': delta})
+    return rows[-1][0], len(rows), changed
+
+
+def rescore_written(session, clause):
+    """Rescore the garments a batch/import just wrote, in its transaction"""
+    if not _compute_on_write():
+        return
+    connection = session.connection()
+    last_id, read, changed = rescore_rows(connection, get_factors(connection), [clause])
+    if changed:
+        change_feed.record(session, 'garments', updated={
+            row_id: {'carbon_footprint': carbon, 'sustainability_score': score}
+            for carbon, score, row_id in changed
+        })
+
+
+def rescore_all(chunk_size=DEFAULT_CHUNK_SIZE, job=None):
+    """Recompute every garment in id-ordered chunks, one transaction per chunk"""
+    chunk_size = max(1, int(chunk_size))
+    started = time.perf_counter()
+    factors = load_factors()
+    db.session.commit()
+
+    total = db.session.execute(select(func.count(Garment.id))).scalar()
+    db.session.commit()
+    progress = {'total': total, 'processed': 0, 'changed': 0}
+    if job is not None:
+        job.update(**progress)
+
+    last_id = 0
+    while not (job is not None and job.cancel_requested):
+        try:
+            with begin_immediate():
+                connection = db.session.connection()
+            last_id, read, changed = rescore_rows(connection, factors, [], after_id=last_id, limit=chunk_size,
+                                                 track_rollups=True)
+            if last_id is None:
+                db.session.commit()
+                break
+            if changed:
+                stats_engine.mark_dirty(db.session, Garment)
+                change_feed.record(db.session, 'garments', reset=True)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        progress['processed'] += read
+        progress['changed'] += len(changed)
+        if job is not None:
+            job.update(**progress)
+
+    invalidate_factors()
+    elapsed = time.perf_counter() - started
+    return dict(
+        progress,
+        engine='numpy' if np is not None else 'python',
+        seconds=round(elapsed, 3),
+        rows_per_second=round(progress['processed'] / elapsed) if elapsed else progress['processed']
+    )
+
+
+@click.command('rescore-garments')
+@click.option('--chunk-size', default=None, type=int, help='Rows per transaction (default CARBON_RESCORE_CHUNK_SIZE)')
+@with_appcontext
+def rescore_garments_command(chunk_size):
+    """Recompute carbon footprint and sustainability score for every garment"""
+    result = rescore_all(chunk_size or current_app.config.get('CARBON_RESCORE_CHUNK_SIZE', 50000))
+    print(f"✅ {result['processed']} garments rescored ({result['changed']} changed) in {result['seconds']}s "
+          f"({result['rows_per_second']} rows/s, {result['engine']} engine)")
+
+
+COMMANDS = (rescore_garments_command,)
@@ -0,0 +1,452 @@
+"""Change feed for garments and orders (server-sent events and long-poll)
+
+Session hooks collect what every flush wrote to the feed tables: created and
+deleted ids, and the changed fields of updated rows with their new values.
+Core writers that bypass the ORM (batch, purge, bulk generate, import) call
+``record()`` themselves. After the commit the changes become one event in the
+``change_events`` table of the 'events' bind (database/events.db), together
+with the current DashboardStats counters. Its autoincrement id is the event
+sequence number, shared by every worker process.
+
+An event looks like::
+
+    {"seq": 42, "time": "...",
+     "changes": {"orders": {"created": [7], "updated": {"5": {"status": "completed"}},
+                            "deleted": [3]}},
+     "stats": {"total_orders": 120, "pending_orders": 40, ...}}
+
+A table with more than CHANGE_FEED_MAX_IDS changed rows in one commit (or a
+write whose rows are not known) is sent as ``{"reset": true}``: refetch it.
+
+Readers share a per-process ``ChangeFeed``: it keeps the latest events in
+memory and at most one waiting request per process queries the events table
+per poll interval, however many clients are connected. Commits made in this
+process wake the waiting requests immediately.
+
+Clients resume with ``Last-Event-ID`` (sent automatically by EventSource on
+reconnect) or ``?after=<seq>``. If the events after that id were already
+purged the client gets a ``reset`` event and should refetch everything.
+"""
+import json
+import threading
+import time
+from collections import deque
+from datetime import date, datetime
+
+from flask import current_app, has_app_context
+from sqlalchemy import delete, event, func, insert, inspect, select
+from sqlalchemy.orm import Session
+
+from app import db
+from models.dashboard import DashboardStats, SUMMARY_ID
+from models.events import ChangeEvent
+from models.garment import Garment
+from models.orders import Order
+from services import dimensions
+from services.database import commit_state, discard_commit_state, pop_commit_state
+
+# Models whose writes are published, by table name
+FEED_MODELS = {
+    Garment: 'garments',
+    Order: 'orders'
+}
+FEED_TABLES = tuple(FEED_MODELS.values())
+
+# DashboardStats counters sent with every event
+STATS_FIELDS = (
+    'total_garments', 'garment_quantity', 'total_carbon', 'total_orders', 'order_quantity',
+    'pending_orders', 'processing_orders', 'completed_orders', 'cancelled_orders'
+)
+
+DEFAULT_MAX_IDS = 500
+# Events returned per read
+READ_LIMIT = 500
+
+
+def _jsonable(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+# Collecting changes
+
+class TableChanges:
+    """Ids and changed fields written to one table in one transaction"""
+
+    def __init__(self):
+        self.created = set()
+        self.updated = {}
+        self.deleted = set()
+        self.reset = False
+
+    def update(self, row_id, values):
+        self.updated.setdefault(row_id, {}).update(
+            {name: _jsonable(value) for name, value in values.items()}
+        )
+
+    def merge(self, other):
+        self.created.update(other.created)
+        for row_id, values in other.updated.items():
+            self.updated.setdefault(row_id, {}).update(values)
+        self.deleted.update(other.deleted)
+        self.reset = self.reset or other.reset
+
+    def to_dict(self, max_ids):
+        if self.reset or len(self.created) + len(self.updated) + len(self.deleted) > max_ids:
+            return {'reset': True}
+        # A row created or deleted in this transaction is only reported as such
+        updated = {
+            str(row_id): values for row_id, values in self.updated.items()
+            if row_id not in self.created and row_id not in self.deleted
+        }
+        result = {}
+        if self.created:
+            result['created'] = sorted(self.created - self.deleted)
+        if updated:
+            result['updated'] = updated
+        if self.deleted:
+            result['deleted'] = sorted(self.deleted)
+        return result
+
+
+def _pending(session, table):
+    return commit_state(session, 'feed_changes', dict).setdefault(table, TableChanges())
+
+
+def record(session, table, created=(), updated=None, deleted=(), reset=False):
+    """Add Core-level writes to the session's pending feed event
+
+    `updated` maps row ids to the values that were written.
+    """
+    changes = _pending(session, table)
+    changes.created.update(created)
+    for row_id, values in (updated or {}).items():
+        changes.update(row_id, values)
+    changes.deleted.update(deleted)
+    changes.reset = changes.reset or reset
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_flushed(session, flush_context):
+    for obj in session.new:
+        table = FEED_MODELS.get(type(obj))
+        if table:
+            _pending(session, table).created.add(obj.id)
+    for obj in session.dirty:
+        table = FEED_MODELS.get(type(obj))
+        if not table:
+            continue
+        state = inspect(obj)
+        values = {
+            attr.key: attr.value
+            for attr in state.attrs
+            if attr.history.has_changes() and attr.key in state.mapper.columns
+        }
+        if values:
+            # Key columns are reported as the country/facility/fabric values
+            _pending(session, table).update(obj.id, dimensions.public_changes(obj, values))
+    for obj in session.deleted:
+        table = FEED_MODELS.get(type(obj))
+        if table:
+            _pending(session, table).deleted.add(obj.id)
+
+
+def _collect_bulk(context):
+    table = FEED_MODELS.get(context.mapper.class_) if context.mapper is not None else None
+    if table:
+        _pending(context.session, table).reset = True
+
+
+event.listen(Session, 'after_bulk_update', _collect_bulk)
+event.listen(Session, 'after_bulk_delete', _collect_bulk)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_on_rollback(session, previous_transaction):
+    discard_commit_state(session, 'feed_changes', previous_transaction)
+    if not previous_transaction.nested:
+        session.info.pop('feed_stats', None)
+
+
+@event.listens_for(Session, 'before_commit')
+def _read_stats(session):
+    # Read the counters inside the committing transaction: after the commit
+    # this thread would need a second pooled connection to read them. Flush
+    # first (commit would anyway) so the counters include pending objects.
+    if session.in_nested_transaction():
+        return
+    session.flush()
+    if session.info.get('feed_changes'):
+        session.info['feed_stats'] = current_stats(session.connection())
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_on_commit(session):
+    parts = pop_commit_state(session, 'feed_changes')
+    if not parts:
+        return
+    stats = session.info.pop('feed_stats', None)
+    pending = {}
+    for part in parts:
+        for table, item in part.items():
+            pending.setdefault(table, TableChanges()).merge(item)
+    if not pending or not has_app_context() or not current_app.config.get('CHANGE_FEED_ENABLED', True):
+        return
+    max_ids = current_app.config.get('CHANGE_FEED_MAX_IDS', DEFAULT_MAX_IDS)
+    changes = {table: item.to_dict(max_ids) for table, item in sorted(pending.items())}
+    changes = {table: item for table, item in changes.items() if item}
+    if not changes:
+        return
+    try:
+        publish(changes, stats)
+    except Exception as e:
+        # The data is committed; a lost event only delays clients until their next reset
+        current_app.logger.warning('Could not publish change event: %s', e)
+
+
+def current_stats(connection):
+    """The DashboardStats counters sent with events"""
+    columns = [DashboardStats.__table__.c[name] for name in STATS_FIELDS]
+    row = connection.execute(select(*columns).where(DashboardStats.id == SUMMARY_ID)).first()
+    if row is None:
+        return None
+    stats = dict(zip(STATS_FIELDS, row))
+    stats['total_carbon'] = round(stats['total_carbon'] or 0, 2)
+    return stats
+
+
+def publish(changes, stats=None):
+    """Store one event for `changes` ({table: diff}) and wake local readers"""
+    now = datetime.utcnow()
+    data = {'time': now.isoformat(), 'changes': changes, 'stats': stats}
+    table = ChangeEvent.__table__
+    with db.engines['events'].begin() as connection:
+        seq = connection.execute(
+            insert(table).values(tables=','.join(changes), payload=json.dumps(data), created_date=now)
+        ).inserted_primary_key[0]
+        retention = current_app.config.get('CHANGE_FEED_RETENTION', 100000)
+        if seq % 1000 == 0:
+            connection.execute(delete(table).where(table.c.id <= seq - retention))
+
+    feed = current_app.extensions.get('dpp_change_feed')
+    if feed is not None:
+        feed.notify()
+    return seq
+
+
+# Reading
+
+class ChangeFeed:
+    """Per-process reader of the events table shared by all feed requests"""
+
+    def __init__(self, engine, poll_interval=1.0, buffer_size=1000):
+        self.engine = engine
+        self.poll_interval = poll_interval
+        self._events = deque(maxlen=buffer_size)
+        self._last = None
+        self._refreshed = 0.0
+        self._dirty = False
+        self._condition = threading.Condition()
+        self._refresh_lock = threading.Lock()
+
+    def _rows(self, connection, after, limit=READ_LIMIT):
+        table = ChangeEvent.__table__
+        return [
+            (row.id, frozenset(row.tables.split(',')), row.payload)
+            for row in connection.execute(
+                select(table.c.id, table.c.tables, table.c.payload)
+                .where(table.c.id > after).order_by(table.c.id).limit(limit)
+            )
+        ]
+
+    def _refresh(self, force=False):
+        """Load new events; only one thread per process queries at a time"""
+        if not force and not self._dirty and time.monotonic() - self._refreshed < self.poll_interval:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self._dirty = False
+            with self.engine.connect() as connection:
+                if self._last is None:
+                    self._last = connection.execute(select(func.max(ChangeEvent.__table__.c.id))).scalar() or 0
+                rows = self._rows(connection, self._last)
+            self._refreshed = time.monotonic()
+            if rows:
+                with self._condition:
+                    self._events.extend(rows)
+                    self._last = rows[-1][0]
+                    self._condition.notify_all()
+        finally:
+            self._refresh_lock.release()
+
+    def notify(self):
+        """A commit in this process published an event"""
+        with self._condition:
+            self._dirty = True
+            self._condition.notify_all()
+
+    def latest(self):
+        """Sequence number of the newest event"""
+        self._refresh(force=self._last is None)
+        return self._last or 0
+
+    def read(self, after, tables=None):
+        """Events after `after` touching `tables`: (events, reset, position)
+
+        position is the newest sequence number examined, so filtered-out
+        events are not read again. reset is True when events after `after`
+        were already purged (or `after` is from another events database).
+        """
+        self._refresh(force=self._last is None)
+        with self._condition:
+            if after > self._last:
+                return [], True, after
+            buffered = bool(self._events) and after >= self._events[0][0] - 1
+            if buffered or after == self._last:
+                rows = [row for row in self._events if row[0] > after][:READ_LIMIT]
+            else:
+                rows = None
+        if rows is None:
+            # Older than the buffer: read straight from the table
+            with self.engine.connect() as connection:
+                rows = self._rows(connection, after)
+                oldest = connection.execute(select(func.min(ChangeEvent.__table__.c.id))).scalar()
+            if oldest is None or oldest > after + 1:
+                return [], True, after
+        position = rows[-1][0] if rows else after
+        if tables:
+            rows = [row for row in rows if row[1] & tables]
+        return [(seq, payload) for seq, _, payload in rows], False, position
+
+    def wait(self, after, tables=None, timeout=25.0):
+        """Block until there are events after `after` (or `timeout` passes)"""
+        deadline = time.monotonic() + timeout
+        while True:
+            events, reset, after = self.read(after, tables)
+            remaining = deadline - time.monotonic()
+            if events or reset or remaining <= 0:
+                return events, reset, after
+            with self._condition:
+                if not self._dirty:
+                    self._condition.wait(min(self.poll_interval, remaining))
+
+
+def init_change_feed(app):
+    """Attach the app's ChangeFeed reader"""
+    if not app.config.get('CHANGE_FEED_ENABLED', True):
+        return None
+    with app.app_context():
+        engine = db.engines['events']
+    feed = ChangeFeed(
+        engine,
+        poll_interval=app.config.get('CHANGE_FEED_POLL_INTERVAL', 1.0),
+        buffer_size=app.config.get('CHANGE_FEED_BUFFER', 1000)
+    )
+    app.extensions['dpp_change_feed'] = feed
+    return feed
+
+
+def get_feed():
+    return current_app.extensions.get('dpp_change_feed')
+
+
+# HTTP helpers used by the main blueprint
+
+def _requested_tables():
+    from flask import request
+    names = [name.strip() for name in request.args.get('tables', '').split(',') if name.strip()]
+    unknown = [name for name in names if name not in FEED_TABLES]
+    if unknown:
+        raise ValueError(f"tables must be among {', '.join(FEED_TABLES)}")
+    return frozenset(names) or None
+
+
+def _requested_after():
+    from flask import request
+    value = request.headers.get('Last-Event-ID') or request.args.get('after')
+    if value in (None, ''):
+        return None
+    after = int(value)
+    if after < 0:
+        raise ValueError('after must not be negative')
+    return after
+
+
+def _event_data(seq, payload):
+    data = json.loads(payload)
+    data['seq'] = seq
+    return data
+
+
+def stream_response():
+    """text/event-stream of change events, resuming after Last-Event-ID"""
+    from flask import Response, jsonify
+
+    feed = get_feed()
+    if feed is None:
+        return jsonify({'success': False, 'message': 'Change feed is disabled'}), 404
+    try:
+        tables = _requested_tables()
+        after = _requested_after()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Invalid change feed request: {str(e)}'}), 400
+
+    keepalive = current_app.config.get('CHANGE_FEED_KEEPALIVE', 15)
+    duration = current_app.config.get('CHANGE_FEED_STREAM_SECONDS', 300)
+    retry_ms = current_app.config.get('CHANGE_FEED_RETRY_MS', 3000)
+
+    def generate(after):
+        closes = time.monotonic() + duration
+        yield f'retry: {retry_ms}\n\n'
+        if after is None:
+            # New subscriber: start from now
+            after = feed.latest()
+            yield f'id: {after}\nevent: ready\ndata: {json.dumps({"seq": after})}\n\n'
+        while time.monotonic() < closes:
+            events, reset, after = feed.wait(after, tables, timeout=min(keepalive, closes - time.monotonic()))
+            if reset:
+                after = feed.latest()
+                yield f'id: {after}\nevent: reset\ndata: {json.dumps({"seq": after})}\n\n'
+                continue
+            if not events:
+                yield ': keepalive\n\n'
+                continue
+            for seq, payload in events:
+                yield f'id: {seq}\nevent: change\ndata: {json.dumps(_event_data(seq, payload))}\n\n'
+
+    response = Response(generate(after), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def poll_response():
+    """Long-poll fallback: wait up to `timeout` seconds for events after `after`"""
+    from flask import jsonify, request
+
+    feed = get_feed()
+    if feed is None:
+        return jsonify({'success': False, 'message': 'Change feed is disabled'}), 404
+    try:
+        tables = _requested_tables()
+        after = _requested_after()
+        limit = current_app.config.get('CHANGE_FEED_LONG_POLL_SECONDS', 25)
+        timeout = min(max(request.args.get('timeout', limit, type=float), 0), limit)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Invalid change feed request: {str(e)}'}), 400
+
+    if after is None:
+        return jsonify({'success': True, 'last_event_id': feed.latest(), 'events': [], 'reset': False})
+
+    events, reset, position = feed.wait(after, tables, timeout=timeout)
+    if reset:
+        return jsonify({'success': True, 'last_event_id': feed.latest(), 'events': [], 'reset': True})
+    return jsonify({
+        'success': True,
+        'last_event_id': position,
+        'events': [_event_data(seq, payload) for seq, payload in events],
+        'reset': False
+    })
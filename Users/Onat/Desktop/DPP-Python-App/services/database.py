@@ -0,0 +1,305 @@
+"""SQLite engine tuning: pragmas, pool sizing and an optional write queue
+
+``engine_options(config)`` turns the DB_* / SQLITE_* settings from config.py
+into SQLALCHEMY_ENGINE_OPTIONS and ``configure_engine(engine, config)``
+installs the per-connection pragmas. Both are no-ops for other databases.
+
+With ``SQLITE_WRITE_QUEUE`` enabled, ``run_write()`` hands write functions to
+a single writer thread. It runs whatever is queued within a short window in
+one ``BEGIN IMMEDIATE`` transaction (one SAVEPOINT per write, so a failing
+write doesn't undo its neighbours) and commits once for the whole group.
+
+Session hooks that act once the data is committed (change feed, render cache,
+stats cache, dimension ids) keep their state with ``commit_state()``: every
+SAVEPOINT also fires after_commit and after_soft_rollback, so the state is
+kept per savepoint and ``pop_commit_state()`` only hands it over when the
+outermost transaction commits.
+"""
+import atexit
+import contextvars
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, scoped_session
+
+# Set while the current context is about to write, see begin_immediate()
+_begin_immediate = contextvars.ContextVar('sqlite_begin_immediate', default=False)
+
+
+def is_file_sqlite(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def engine_options(config, uri=None):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured (or given) database"""
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}) if uri is None else {}
+    uri = uri or config['SQLALCHEMY_DATABASE_URI']
+    if not is_file_sqlite(uri):
+        return options
+
+    # One pooled connection per request thread in this worker, plus headroom
+    options.setdefault('pool_size', config.get('DB_POOL_SIZE', 5))
+    options.setdefault('max_overflow', config.get('DB_POOL_OVERFLOW', 5))
+    options.setdefault('pool_timeout', config.get('DB_POOL_TIMEOUT', 10))
+    connect_args = options.setdefault('connect_args', {})
+    connect_args.setdefault('check_same_thread', False)
+    connect_args.setdefault('timeout', config.get('SQLITE_PRAGMAS', {}).get('busy_timeout', 5000) / 1000)
+    return options
+
+
+def bind_options(config):
+    """SQLALCHEMY_BINDS with the same pool/connect options per bind
+
+    Flask-SQLAlchemy does not apply SQLALCHEMY_ENGINE_OPTIONS to binds.
+    """
+    binds = {}
+    for key, value in (config.get('SQLALCHEMY_BINDS') or {}).items():
+        if isinstance(value, dict):
+            binds[key] = value
+        else:
+            binds[key] = {'url': value, **engine_options(config, value)}
+    return binds
+
+
+def ensure_sqlite_directory(engine):
+    """Create the parent directory of a file-backed SQLite database"""
+    if is_file_sqlite(engine.url):
+        directory = os.path.dirname(os.path.abspath(engine.url.database))
+        os.makedirs(directory, exist_ok=True)
+
+
+def configure_engine(engine, config):
+    """Apply pragmas on every new connection and take over transaction control"""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    pragmas = config.get('SQLITE_PRAGMAS') or {}
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        # Let SQLAlchemy emit BEGIN itself (see _on_begin) so SAVEPOINTs work
+        # and writers can ask for BEGIN IMMEDIATE
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def _on_begin(connection):
+        mode = connection.info.get('sqlite_begin') or ('IMMEDIATE' if _begin_immediate.get() else '')
+        connection.exec_driver_sql(f'BEGIN {mode}'.strip())
+
+
+def commit_state(session, key, factory):
+    """The current transaction's `key` state in session.info, made with factory()
+
+    The state is kept in parts, in the order they were collected, each owned
+    by the transaction (or SAVEPOINT) that was current: rolling a savepoint
+    back discards just its parts (see discard_commit_state()).
+    """
+    if isinstance(session, scoped_session):
+        session = session()
+    parts = session.info.setdefault(key, [])
+    transaction = session.get_nested_transaction()
+    if not parts or parts[-1][0] is not transaction:
+        parts.append((transaction, factory()))
+    return parts[-1][1]
+
+
+def commit_state_parts(session, key):
+    """Every live part of `key` collected in this transaction, oldest first"""
+    return [state for transaction, state in session.info.get(key, ())]
+
+
+def pop_commit_state(session, key):
+    """All parts of `key` once the outermost transaction commits, else []
+
+    after_commit hooks call this: a released SAVEPOINT fires after_commit
+    too, but nothing is committed until the outermost transaction is.
+    """
+    if session.in_nested_transaction():
+        return []
+    return [state for transaction, state in session.info.pop(key, ())]
+
+
+def discard_commit_state(session, key, previous_transaction):
+    """Drop the `key` state of a rolled back transaction and its savepoints"""
+    if not previous_transaction.nested:
+        session.info.pop(key, None)
+        return
+
+    def rolled_back(transaction):
+        while transaction is not None and transaction is not previous_transaction:
+            transaction = transaction.parent
+        return transaction is not None
+
+    if key in session.info:
+        session.info[key] = [part for part in session.info[key] if not rolled_back(part[0])]
+
+
+class WriteQueue:
+    """Single writer thread that group-commits queued write functions"""
+
+    def __init__(self, app, max_batch=100, max_wait=0.002):
+        self.app = app
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='dpp-sqlite-writer', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
+    def submit(self, func):
+        """Queue func(session) and return a Future for its result"""
+        future = Future()
+        self.start()
+        self._queue.put((func, future))
+        return future
+
+    def run(self, func):
+        """Queue func(session) and wait until its group has committed"""
+        return self.submit(func).result()
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get(timeout=self.max_wait)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        from app import db
+
+        with self.app.app_context():
+            connection = db.engine.connect()
+        connection.info['sqlite_begin'] = 'IMMEDIATE'
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    break
+                # A fresh app context per batch, so per-context state such as
+                # the recorded queries doesn't accumulate in this thread
+                with self.app.app_context():
+                    self._commit_batch(connection, batch)
+        finally:
+            # The pooled connection goes back to request threads afterwards
+            connection.info.pop('sqlite_begin', None)
+            connection.close()
+
+    def _commit_batch(self, connection, batch):
+        session = Session(bind=connection, expire_on_commit=False)
+        results = []
+        try:
+            for func, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    with session.begin_nested():
+                        result = func(session)
+                    results.append((future, result, None))
+                except Exception as e:
+                    results.append((future, None, e))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            results = [(future, None, error or e) for future, result, error in results]
+        finally:
+            session.close()
+
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+def init_write_queue(app):
+    """Create the writer thread for this app if SQLITE_WRITE_QUEUE is on"""
+    if not app.config.get('SQLITE_WRITE_QUEUE') or not is_file_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+        return None
+    write_queue = WriteQueue(
+        app,
+        max_batch=app.config.get('SQLITE_WRITE_QUEUE_BATCH', 100),
+        max_wait=app.config.get('SQLITE_WRITE_QUEUE_WAIT_MS', 2) / 1000
+    )
+    app.extensions['dpp_write_queue'] = write_queue
+    atexit.register(write_queue.stop)
+    return write_queue
+
+
+@contextmanager
+def begin_immediate():
+    """Make the request session's next transaction a BEGIN IMMEDIATE one
+
+    A deferred SQLite transaction that has already read cannot be upgraded to
+    a write while another connection is writing: it fails with "database is
+    locked" straight away instead of waiting for busy_timeout. Writers
+    therefore roll back any open read transaction first and take the write
+    lock up front. Pending ORM changes are an error rather than being
+    committed or dropped on the caller's behalf.
+    """
+    from app import db
+
+    session = db.session()
+    if session.new or session.dirty or session.deleted:
+        raise RuntimeError('begin_immediate() with pending session changes: commit or roll them back first')
+    if session.in_transaction():
+        session.rollback()
+    token = _begin_immediate.set(True)
+    try:
+        yield db.session
+    finally:
+        _begin_immediate.reset(token)
+
+
+def run_write(func):
+    """Run func(session) as one write, returning its result
+
+    Goes through the writer thread when the write queue is enabled, otherwise
+    runs on the request's own session and commits it.
+    """
+    write_queue = current_app.extensions.get('dpp_write_queue')
+    if write_queue is not None:
+        from app import db
+
+        if db.session().in_transaction():
+            # Later reads in this request must see the queued write
+            db.session.commit()
+        return write_queue.run(func)
+
+    with begin_immediate() as session:
+        try:
+            result = func(session)
+            session.commit()
+            return result
+        except Exception:
+            session.rollback()
+            raise
@@ -0,0 +1,527 @@
+"""Interned dimension tables for countries, facilities and fabrics
+
+Orders and garments store their country, facility and fabric as integer
+keys into ``countries``, ``facilities`` and ``fabrics`` (one row per
+distinct fabric type/name/construction combination) instead of repeating the
+strings in every row. Rows get narrower, indexes and group-bys compare small
+integers, and every public API still reads and writes the plain values:
+
+* the models expose each value as a ``DimensionField`` attribute, so
+  ``to_dict()``, templates and ``garment.country = 'Turkey'`` are unchanged;
+* listings, exports and search pages select the values through LEFT JOINs
+  on the dimension tables (``select_fields()``), which are tiny and always
+  cached by SQLite;
+* Core writers (batch, import, bulk generate) turn values into keys with
+  ``encode_rows()`` / ``encode_columns()`` in one lookup per dimension.
+
+An ``Interner`` per app keeps the value <-> id maps in memory. It is filled
+from the dimension tables on first use (create_app() runs no queries) and
+grows as writers intern new values: a missing value is inserted with ``ON
+CONFLICT DO NOTHING`` and its id read back, so concurrent writers agree on
+one id. Ids interned inside a transaction are kept on the session and only
+reach the shared maps after the commit; a rolled back insert may hand its id
+to a different value later.
+"""
+import threading
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, attributes
+
+from app import db
+from models.dimensions import Country, DimensionField, Fabric, Facility
+from models.garment import Garment
+from models.orders import Order
+from services.database import commit_state, commit_state_parts, discard_commit_state, pop_commit_state
+
+# Values per IN (...) list, well below SQLite's bound parameter limit
+IN_CHUNK_SIZE = 300
+
+
+class Dimension:
+    """One dimension table: the key column pointing at it and its value parts"""
+
+    def __init__(self, name, model, parts):
+        self.name = name
+        self.model = model
+        self.parts = parts
+        self.key_column = f'{name}_id'
+
+    @property
+    def table(self):
+        return self.model.__table__
+
+
+DIMENSIONS = {
+    'country': Dimension('country', Country, ('name',)),
+    'facility': Dimension('facility', Facility, ('name',)),
+    'fabric': Dimension('fabric', Fabric, ('fabric_type', 'fabric_name', 'fabric_construction'))
+}
+MODELS = (Garment, Order)
+
+
+def _chunks(items, size=IN_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+# Field metadata
+
+_fields = {}
+
+
+def fields(model):
+    """{public name: DimensionField} of `model`, in declaration order"""
+    if model not in _fields:
+        _fields[model] = {
+            name: value for name, value in vars(model).items() if isinstance(value, DimensionField)
+        }
+    return _fields[model]
+
+
+_dimension_fields = {}
+_required = {}
+
+
+def dimension_fields(model):
+    """{dimension name: (DimensionField, ...) in part order} of `model`"""
+    if model not in _dimension_fields:
+        grouped = {}
+        for field in fields(model).values():
+            grouped.setdefault(field.dimension, []).append(field)
+        _dimension_fields[model] = {
+            name: tuple(sorted(items, key=lambda field: DIMENSIONS[name].parts.index(field.part)))
+            for name, items in grouped.items()
+        }
+    return _dimension_fields[model]
+
+
+def required_positions(model, dimension):
+    """Part positions of `dimension` that `model` can't leave unset (non-nullable fields)"""
+    if (model, dimension) not in _required:
+        _required[model, dimension] = tuple(
+            DIMENSIONS[dimension].parts.index(field.part)
+            for field in dimension_fields(model)[dimension] if not field.nullable
+        )
+    return _required[model, dimension]
+
+
+def key_columns(model):
+    """Names of `model`'s key columns into the dimension tables"""
+    return {DIMENSIONS[name].key_column for name in dimension_fields(model)}
+
+
+def public_fields(model):
+    """Field names of `model` as the API shows them (to_dict() order)"""
+    by_key = {DIMENSIONS[name].key_column: items for name, items in dimension_fields(model).items()}
+    names = []
+    for column in model.__table__.columns:
+        if column.name in by_key:
+            names.extend(field.name for field in by_key[column.name])
+        else:
+            names.append(column.name)
+    return names
+
+
+def stored_columns(model, names):
+    """Table columns written for public `names` (dimension fields -> key column)"""
+    model_fields = fields(model)
+    columns = []
+    for name in names:
+        field = model_fields.get(name)
+        column = DIMENSIONS[field.dimension].key_column if field is not None else name
+        if column not in columns:
+            columns.append(column)
+    return columns
+
+
+def make_key(dimension, values):
+    """Interned key for the part values of `dimension` (None when all are unset)"""
+    key = tuple('' if value is None else value for value in values)
+    return key if any(key) else None
+
+
+def _complete(model, dimension, key, required=None):
+    """`key`, or None when it leaves a part of a non-nullable field unset
+
+    Writers encoding many rows pass required_positions() once as `required`.
+    """
+    if key is None:
+        return None
+    if required is None:
+        required = required_positions(model, dimension)
+    for position in required:
+        if key[position] == '':
+            return None
+    return key
+
+
+def _part(field, key):
+    if key is None:
+        return None
+    return key[DIMENSIONS[field.dimension].parts.index(field.part)] or None
+
+
+# Lookup cache
+
+class Interner:
+    """Two-way value key <-> id maps for every dimension of one database"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = {name: {} for name in DIMENSIONS}
+        self.keys = {name: {} for name in DIMENSIONS}
+        self.loaded = False
+
+    def remember(self, dimension, pairs):
+        """Add {key: id} pairs that are committed"""
+        with self.lock:
+            self.ids[dimension].update(pairs)
+            keys = self.keys[dimension]
+            for key, row_id in pairs.items():
+                keys[row_id] = key
+
+    def load(self, connection):
+        """Read every dimension table into the maps"""
+        for name, dimension in DIMENSIONS.items():
+            table = dimension.table
+            rows = connection.execute(select(table.c.id, *(table.c[part] for part in dimension.parts))).all()
+            self.remember(name, {tuple(row[1:]): row[0] for row in rows})
+        self.loaded = True
+
+    def ensure_loaded(self, connection):
+        if not self.loaded:
+            self.load(connection)
+
+    def clear(self):
+        with self.lock:
+            for name in DIMENSIONS:
+                self.ids[name].clear()
+                self.keys[name].clear()
+            self.loaded = False
+
+    def stats(self):
+        return {name: len(ids) for name, ids in self.ids.items()}
+
+
+_default_interner = Interner()
+
+
+def interner():
+    """The current app's Interner (a process-wide one outside app contexts)"""
+    if has_app_context():
+        return current_app.extensions.get('dpp_dimensions', _default_interner)
+    return _default_interner
+
+
+def init_dimensions(app):
+    """Give the app its own lookup cache; it is filled on first use"""
+    app.extensions['dpp_dimensions'] = Interner()
+
+
+def _pending(session, dimension):
+    return commit_state(session, 'dimension_ids', dict).setdefault(dimension, {})
+
+
+def _interned(session, dimension):
+    """{key: id} interned earlier in this (uncommitted) transaction"""
+    found = {}
+    for part in commit_state_parts(session, 'dimension_ids'):
+        found.update(part.get(dimension, {}))
+    return found
+
+
+@event.listens_for(Session, 'after_commit')
+def _remember_on_commit(session):
+    cache = None
+    for part in pop_commit_state(session, 'dimension_ids'):
+        cache = cache or interner()
+        for dimension, pairs in part.items():
+            cache.remember(dimension, pairs)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_on_rollback(session, previous_transaction):
+    discard_commit_state(session, 'dimension_ids', previous_transaction)
+
+
+def _insert_missing(connection, dimension, keys):
+    dialect = {'sqlite': sqlite, 'postgresql': postgresql}.get(connection.dialect.name)
+    if dialect is None:
+        raise RuntimeError(f'Dimension lookups are not supported on {connection.dialect.name}')
+    spec = DIMENSIONS[dimension]
+    connection.execute(
+        dialect.insert(spec.table).on_conflict_do_nothing(),
+        [dict(zip(spec.parts, key)) for key in keys]
+    )
+
+
+def _select_ids(connection, dimension, keys):
+    spec = DIMENSIONS[dimension]
+    table = spec.table
+    parts = [table.c[part] for part in spec.parts]
+    found = {}
+    for chunk in _chunks(list(keys)):
+        if len(parts) == 1:
+            condition = parts[0].in_([key[0] for key in chunk])
+        else:
+            condition = tuple_(*parts).in_(chunk)
+        for row in connection.execute(select(table.c.id, *parts).where(condition)):
+            found[tuple(row[1:])] = row[0]
+    return found
+
+
+def ids_for(connection, dimension, keys, session=None, create=True):
+    """{key: id} for `keys` of `dimension`, interning the missing ones
+
+    With create=False unknown keys are left out instead.
+    """
+    session = session if session is not None else db.session
+    cache = interner()
+    cache.ensure_loaded(connection)
+    known = cache.ids[dimension]
+    interned = _interned(session, dimension)
+
+    result = {}
+    missing = []
+    for key in set(keys):
+        if key is None:
+            continue
+        row_id = known.get(key) or interned.get(key)
+        if row_id is None:
+            missing.append(key)
+        else:
+            result[key] = row_id
+    if not missing:
+        return result
+
+    if create:
+        _insert_missing(connection, dimension, missing)
+    found = _select_ids(connection, dimension, missing)
+    _pending(session, dimension).update(found)
+    result.update(found)
+    return result
+
+
+def keys_for(dimension, ids, connection=None, session=None):
+    """{id: key} for ids of `dimension`, reading the ones the cache doesn't know"""
+    session = session if session is not None else db.session
+    cache = interner()
+    if not cache.loaded:
+        cache.ensure_loaded(connection if connection is not None else session.connection())
+    known = cache.keys[dimension]
+    result = {}
+    missing = []
+    for row_id in set(ids):
+        if row_id is None:
+            continue
+        key = known.get(row_id)
+        if key is None:
+            missing.append(row_id)
+        else:
+            result[row_id] = key
+    if not missing:
+        return result
+
+    # Interned earlier in this (uncommitted) transaction
+    pending = {row_id: key for key, row_id in _interned(session, dimension).items()}
+    unknown = [row_id for row_id in missing if row_id not in pending]
+    result.update({row_id: pending[row_id] for row_id in missing if row_id in pending})
+    if unknown:
+        # Committed by another process since the cache was filled
+        connection = connection if connection is not None else session.connection()
+        spec = DIMENSIONS[dimension]
+        table = spec.table
+        found = {}
+        for chunk in _chunks(unknown):
+            for row in connection.execute(
+                select(table.c.id, *(table.c[part] for part in spec.parts)).where(table.c.id.in_(chunk))
+            ):
+                found[tuple(row[1:])] = row[0]
+        cache.remember(dimension, found)
+        result.update({row_id: key for key, row_id in found.items()})
+    return result
+
+
+# ORM attributes (see models.dimensions.DimensionField)
+
+def _stored_key(obj, dimension):
+    values = obj.__dict__.get('_dimension_values')
+    if values and dimension in values:
+        return values[dimension]
+    row_id = getattr(obj, DIMENSIONS[dimension].key_column)
+    if row_id is None:
+        return None
+    session = Session.object_session(obj)
+    return keys_for(dimension, [row_id], session=session).get(row_id)
+
+
+def get_value(obj, field):
+    return _part(field, _stored_key(obj, field.dimension))
+
+
+def set_value(obj, field, value):
+    """Store the key when the value is known, otherwise keep it for the flush"""
+    dimension = DIMENSIONS[field.dimension]
+    key = _stored_key(obj, field.dimension)
+    parts = list(key or ('',) * len(dimension.parts))
+    parts[dimension.parts.index(field.part)] = value
+    key = make_key(field.dimension, parts)
+
+    values = obj.__dict__.setdefault('_dimension_values', {})
+    row_id = interner().ids[field.dimension].get(key) if _complete(type(obj), field.dimension, key) else None
+    if key is None or row_id is not None:
+        values.pop(field.dimension, None)
+        setattr(obj, dimension.key_column, row_id)
+        return
+    values[field.dimension] = key
+    # Marks the row changed even when the key column already was NULL
+    setattr(obj, dimension.key_column, None)
+    attributes.flag_modified(obj, dimension.key_column)
+
+
+def _intern_pending(mapper, connection, target):
+    values = target.__dict__.pop('_dimension_values', None)
+    if not values:
+        return
+    session = Session.object_session(target)
+    for dimension, key in values.items():
+        key = _complete(type(target), dimension, key)
+        ids = ids_for(connection, dimension, [key], session) if key is not None else {}
+        # A NULL key on a NOT NULL column fails the write like the text column did
+        setattr(target, DIMENSIONS[dimension].key_column, ids.get(key))
+
+
+def public_changes(obj, values):
+    """Replace changed key columns in {column: value} by the public fields"""
+    for dimension, items in dimension_fields(type(obj)).items():
+        key_column = DIMENSIONS[dimension].key_column
+        if key_column in values:
+            del values[key_column]
+            for field in items:
+                values[field.name] = get_value(obj, field)
+    return values
+
+
+for _model in MODELS:
+    event.listen(_model, 'before_insert', _intern_pending)
+    event.listen(_model, 'before_update', _intern_pending)
+
+
+# Core writers
+
+def encode_rows(connection, model, rows, current=None, session=None):
+    """Replace dimension values in `rows` (dicts of public fields) by keys, in place
+
+    Rows that supply some but not all parts of a dimension (only
+    ``fabric_type``, say) take the other parts from ``current[i]``, a dict
+    holding the row's stored key columns, when it is given.
+    """
+    for dimension, items in dimension_fields(model).items():
+        spec = DIMENSIONS[dimension]
+        names = [field.name for field in items]
+        required = required_positions(model, dimension)
+        row_keys = []
+        for index, row in enumerate(rows):
+            if not any(name in row for name in names):
+                row_keys.append(None)
+                continue
+            stored = None
+            if current is not None and current[index] is not None and not all(name in row for name in names):
+                row_id = current[index].get(spec.key_column)
+                if row_id is not None:
+                    stored = keys_for(dimension, [row_id], connection, session).get(row_id)
+            parts = list(stored or ('',) * len(spec.parts))
+            for field in items:
+                if field.name in row:
+                    parts[spec.parts.index(field.part)] = row.pop(field.name)
+            row_keys.append((_complete(model, dimension, make_key(dimension, parts), required),))
+
+        ids = ids_for(connection, dimension, [item[0] for item in row_keys if item], session)
+        for row, item in zip(rows, row_keys):
+            if item is not None:
+                row[spec.key_column] = ids.get(item[0])
+    return rows
+
+
+def encode_columns(connection, model, columns, session=None):
+    """Replace dimension value lists in `columns` by key column lists, in place"""
+    for dimension, items in dimension_fields(model).items():
+        spec = DIMENSIONS[dimension]
+        if not any(field.name in columns for field in items):
+            continue
+        count = len(next(iter(columns.values())))
+        values = [columns.pop(field.name, [None] * count) for field in items]
+        positions = [spec.parts.index(field.part) for field in items]
+        required = required_positions(model, dimension)
+        # Generated and imported columns repeat a few combinations: build each key once
+        built = {}
+        keys = []
+        for row in zip(*values):
+            if row not in built:
+                parts = [''] * len(spec.parts)
+                for position, value in zip(positions, row):
+                    parts[position] = value
+                built[row] = _complete(model, dimension, make_key(dimension, parts), required)
+            keys.append(built[row])
+        ids = ids_for(connection, dimension, keys, session)
+        columns[spec.key_column] = [ids.get(key) for key in keys]
+    return columns
+
+
+def decode_column(model, name, ids, connection=None):
+    """Public values of field `name` for a list of key column values"""
+    field = fields(model)[name]
+    keys = keys_for(field.dimension, ids, connection)
+    position = DIMENSIONS[field.dimension].parts.index(field.part)
+    values = {row_id: key[position] or None for row_id, key in keys.items()}
+    return [values.get(row_id) for row_id in ids]
+
+
+# SQL expressions
+
+def value_expression(model, name, key=None):
+    """SQL expression for public field `name`: the column, or a lookup of its key
+
+    `key` overrides the key expression (default: the model's key column).
+    """
+    field = fields(model).get(name)
+    if field is None:
+        return model.__table__.c[name]
+    spec = DIMENSIONS[field.dimension]
+    table = spec.table
+    key = key if key is not None else model.__table__.c[spec.key_column]
+    return select(func.nullif(table.c[field.part], '')).where(table.c.id == key).scalar_subquery()
+
+
+def match_clause(model, name, values):
+    """WHERE clause: public field `name` is one of `values`"""
+    field = fields(model).get(name)
+    if field is None:
+        return model.__table__.c[name].in_(values)
+    spec = DIMENSIONS[field.dimension]
+    table = spec.table
+    return model.__table__.c[spec.key_column].in_(
+        select(table.c.id).where(table.c[field.part].in_(values))
+    )
+
+
+def select_fields(model, names):
+    """SELECT of the public `names` of `model`, joining only the dimension tables they need"""
+    source = model.__table__
+    model_fields = fields(model)
+    joined = {}
+    columns = []
+    for name in names:
+        field = model_fields.get(name)
+        if field is None:
+            columns.append(model.__table__.c[name])
+            continue
+        spec = DIMENSIONS[field.dimension]
+        if field.dimension not in joined:
+            joined[field.dimension] = spec.table
+            source = source.outerjoin(spec.table, spec.table.c.id == model.__table__.c[spec.key_column])
+        column = spec.table.c[field.part]
+        columns.append((func.nullif(column, '') if len(spec.parts) > 1 else column).label(name))
+    return select(*columns).select_from(source)
@@ -0,0 +1,275 @@
+"""Per-request timing, SQL instrumentation and a Prometheus /metrics endpoint
+
+For every request (except /metrics itself) this records:
+
+* wall time,
+* SQL statement count and total DB time, read from Flask-SQLAlchemy's
+  recorded queries (needs SQLALCHEMY_RECORD_QUERIES),
+* ORM rows hydrated (instances loaded from result rows),
+* serialization time (JSON encoding plus template rendering).
+
+The values go into per-endpoint histograms that ``/metrics`` exposes in the
+Prometheus text format. The metrics are per process; scrape every worker.
+Statements slower than SLOW_QUERY_MS and SELECTs repeated at least
+N_PLUS_ONE_THRESHOLD times in one request are logged as warnings.
+
+With PROFILE_REQUESTS enabled, a request carrying ``?_profile=1`` (or an
+``X-Profile: 1`` header) runs under cProfile and its stats are written to
+PROFILE_DIR.
+"""
+import cProfile
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from flask import Response, current_app, g, has_request_context, request, before_render_template, template_rendered
+from flask.json.provider import JSONProvider
+from flask_sqlalchemy.record_queries import get_recorded_queries
+from sqlalchemy import event
+from sqlalchemy.orm import Mapper
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label tuple"""
+
+    def __init__(self, name, documentation, buckets, labels=('endpoint',)):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, label_values, value):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted(self._series.items())
+            items = [(labels, (list(counts), total, count)) for labels, (counts, total, count) in items]
+        for label_values, (counts, total, count) in items:
+            labels = _format_labels(self.labels, label_values)
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+
+class CounterMetric:
+    """Monotonic counter with one series per label tuple"""
+
+    def __init__(self, name, documentation, labels=('endpoint',)):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._series = Counter()
+
+    def inc(self, label_values, amount=1):
+        with self._lock:
+            self._series[label_values] += amount
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._series.items())
+        for label_values, value in items:
+            lines.append(f'{self.name}{{{_format_labels(self.labels, label_values)}}} {value}')
+        return lines
+
+
+def _format_labels(names, values):
+    def escape(value):
+        return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+    return ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+
+REQUESTS = CounterMetric('dpp_http_requests_total', 'Requests handled', ('endpoint', 'method', 'status'))
+REQUEST_SECONDS = Histogram('dpp_http_request_duration_seconds', 'Wall time until the response is returned', TIME_BUCKETS)
+SQL_STATEMENTS = Histogram('dpp_http_request_sql_statements', 'SQL statements executed per request', COUNT_BUCKETS)
+DB_SECONDS = Histogram('dpp_http_request_db_seconds', 'Total SQL execution time per request', TIME_BUCKETS)
+ROWS_HYDRATED = Histogram('dpp_http_request_rows_hydrated', 'ORM instances loaded per request', ROW_BUCKETS)
+SERIALIZATION_SECONDS = Histogram('dpp_http_request_serialization_seconds', 'JSON encoding and template rendering time per request', TIME_BUCKETS)
+SLOW_QUERIES = CounterMetric('dpp_slow_queries_total', 'Statements slower than SLOW_QUERY_MS')
+N_PLUS_ONE = CounterMetric('dpp_n_plus_one_total', 'Requests that repeated one SELECT N_PLUS_ONE_THRESHOLD+ times')
+
+METRICS = (REQUESTS, REQUEST_SECONDS, SQL_STATEMENTS, DB_SECONDS, ROWS_HYDRATED,
+           SERIALIZATION_SECONDS, SLOW_QUERIES, N_PLUS_ONE)
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.expose())
+    return '\n'.join(lines) + '\n'
+
+
+# Per-request collection (state lives on flask.g)
+
+def _add(name, amount):
+    if has_request_context() and 'dpp_metrics' in g:
+        g.dpp_metrics[name] += amount
+
+
+def _on_load(target, context):
+    _add('rows', 1)
+
+
+def _on_before_render(sender, template, context, **extra):
+    if has_request_context() and 'dpp_metrics' in g:
+        g.dpp_render_started = time.perf_counter()
+
+
+def _on_rendered(sender, template, context, **extra):
+    started = g.pop('dpp_render_started', None) if has_request_context() else None
+    if started is not None:
+        _add('serialization', time.perf_counter() - started)
+
+
+class TimedJSONProvider(JSONProvider):
+    """Wraps the app's JSON provider and adds its encoding time to the request metrics"""
+
+    def __init__(self, app, provider):
+        super().__init__(app)
+        self.provider = provider
+
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self.provider.dumps(obj, **kwargs)
+        finally:
+            _add('serialization', time.perf_counter() - started)
+
+    def loads(self, s, **kwargs):
+        return self.provider.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self.provider.response(*args, **kwargs)
+        finally:
+            _add('serialization', time.perf_counter() - started)
+
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _check_queries(endpoint, queries):
+    config = current_app.config
+    slow = config.get('SLOW_QUERY_MS', 100) / 1000
+    threshold = config.get('N_PLUS_ONE_THRESHOLD', 10)
+
+    selects = Counter()
+    for query in queries:
+        statement = _WHITESPACE.sub(' ', query.statement or '').strip()
+        if query.duration >= slow:
+            SLOW_QUERIES.inc((endpoint,))
+            current_app.logger.warning(
+                'Slow query (%.1f ms) in %s at %s: %s',
+                query.duration * 1000, endpoint, query.location, statement[:500]
+            )
+        if statement.upper().startswith('SELECT'):
+            selects[statement] += 1
+
+    repeated = [(statement, count) for statement, count in selects.items() if count >= threshold]
+    if repeated:
+        N_PLUS_ONE.inc((endpoint,))
+        for statement, count in repeated:
+            current_app.logger.warning(
+                'Possible N+1 in %s: same SELECT executed %d times: %s',
+                endpoint, count, statement[:500]
+            )
+
+
+def _wants_profile():
+    if not current_app.config.get('PROFILE_REQUESTS'):
+        return False
+    return request.args.get('_profile') == '1' or request.headers.get('X-Profile') == '1'
+
+
+def _before_request():
+    if request.path == current_app.config.get('METRICS_PATH', '/metrics'):
+        return
+    g.dpp_metrics = Counter()
+    g.dpp_started = time.perf_counter()
+    g.dpp_query_offset = len(get_recorded_queries())
+    if _wants_profile():
+        g.dpp_profiler = cProfile.Profile()
+        g.dpp_profiler.enable()
+
+
+def _dump_profile(profiler, endpoint):
+    profiler.disable()
+    directory = os.path.join(current_app.instance_path, current_app.config.get('PROFILE_DIR', 'profiles'))
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{endpoint.replace('.', '-')}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof")
+    profiler.dump_stats(path)
+    current_app.logger.info('Request profile written to %s', path)
+    return path
+
+
+def _after_request(response):
+    if 'dpp_metrics' not in g:
+        return response
+
+    elapsed = time.perf_counter() - g.dpp_started
+    endpoint = request.endpoint or 'unmatched'
+    queries = get_recorded_queries()[g.dpp_query_offset:]
+    metrics = g.dpp_metrics
+
+    labels = (endpoint,)
+    REQUESTS.inc((endpoint, request.method, response.status_code))
+    REQUEST_SECONDS.observe(labels, elapsed)
+    SQL_STATEMENTS.observe(labels, len(queries))
+    DB_SECONDS.observe(labels, sum(query.duration for query in queries))
+    ROWS_HYDRATED.observe(labels, metrics['rows'])
+    SERIALIZATION_SECONDS.observe(labels, metrics['serialization'])
+    _check_queries(endpoint, queries)
+
+    profiler = g.pop('dpp_profiler', None)
+    if profiler is not None:
+        response.headers['X-Profile-Path'] = _dump_profile(profiler, endpoint)
+    return response
+
+
+def metrics_view():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+_hooks_installed = False
+
+
+def init_instrumentation(app):
+    """Install the request hooks and the /metrics endpoint"""
+    global _hooks_installed
+    if not app.config.get('INSTRUMENTATION_ENABLED', True):
+        return
+
+    if not _hooks_installed:
+        event.listen(Mapper, 'load', _on_load)
+        before_render_template.connect(_on_before_render)
+        template_rendered.connect(_on_rendered)
+        _hooks_installed = True
+
+    app.json = TimedJSONProvider(app, app.json)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule(app.config.get('METRICS_PATH', '/metrics'), 'metrics', metrics_view)
@@ -0,0 +1,103 @@
+"""Built-in background job kinds
+
+Each handler is called as ``handler(job, **params)`` inside an app context
+and returns a JSON-serializable result (see services/jobs.py).
+"""
+import os
+import shutil
+
+from app import db
+from services.jobs import JobCancelled, job_file_path, job_handler
+
+
+@job_handler('orders.bulk_delete')
+def bulk_delete_orders(job, **params):
+    from services.purge import delete_orders
+    return delete_orders(job=job, **params)
+
+
+@job_handler('orders.generate')
+def generate_orders(job, count, **params):
+    from services.bulk import generate_orders
+    return generate_orders(count, job=job, **params)
+
+
+@job_handler('stats.rebuild')
+def rebuild_stats(job):
+    from services.summary import rebuild
+    counters = rebuild()
+    db.session.commit()
+    return counters
+
+
+@job_handler('rollups.rebuild')
+def rebuild_rollups(job):
+    from services.rollups import rebuild
+    counts = rebuild()
+    db.session.commit()
+    return counts
+
+
+@job_handler('search.catch_up')
+def catch_up_search(job):
+    from services.database import begin_immediate
+    from services.search import catch_up
+    with begin_immediate():
+        counts = catch_up()
+    db.session.commit()
+    return counts
+
+
+@job_handler('orders.compact_status_history')
+def compact_status_history(job, **params):
+    from services.status_history import compact
+    return compact(job=job, **params)
+
+
+@job_handler('garments.rescore')
+def rescore_garments(job, **params):
+    from services.carbon import rescore_all
+    return rescore_all(job=job, **params)
+
+
+@job_handler('garments.render_passports')
+def render_passports(job, **params):
+    from services.passports import render_passports
+    return render_passports(job=job, **params)
+
+
+@job_handler('import')
+def import_data(job, kind, fmt, batch_size=1000):
+    """Import the upload saved at job_file_path(job id, fmt); removed once done"""
+    from services.transfer import import_rows
+    path = job_file_path(job.id, fmt)
+    try:
+        with open(path, 'rb') as stream:
+            report = import_rows(kind, stream, fmt, batch_size=batch_size, job=job)
+    except Exception:
+        # Keep the upload while retries remain
+        if job.attempt >= job.max_attempts:
+            os.remove(path)
+        raise
+    os.remove(path)
+    return report
+
+
+@job_handler('export')
+def export_data(job, kind, fmt, fields=None):
+    """Write the export to job_file_path(job id, fmt) for /api/jobs/<id>/download"""
+    from services.transfer import export_chunks, export_xlsx
+    path = job_file_path(job.id, fmt)
+    try:
+        if fmt == 'xlsx':
+            with export_xlsx(kind, fields) as source, open(path, 'wb') as target:
+                shutil.copyfileobj(source, target)
+        else:
+            with open(path, 'w', encoding='utf-8', newline='') as target:
+                for chunk in export_chunks(kind, fmt, fields):
+                    target.write(chunk)
+                    job.check_cancelled()
+    except JobCancelled:
+        os.remove(path)
+        raise
+    return {'kind': kind, 'format': fmt, 'bytes': os.path.getsize(path)}
@@ -0,0 +1,568 @@
+"""Background job runner backed by a SQLite job table
+
+Jobs are rows in the ``jobs`` table of their own database, the 'jobs' bind
+(database/jobs.db next to dpp.db), so frequent progress and heartbeat writes
+never compete with the main database's write lock. No external broker needed.
+
+* ``submit_job(kind, params)`` inserts a queued row and wakes the runner.
+* Each app has a ``JobRunner`` whose dispatcher thread claims queued jobs
+  (one BEGIN IMMEDIATE transaction per claim, so several web workers can
+  share the table) and runs them on a thread pool or a process pool
+  (JOB_EXECUTOR; 'inline' runs jobs in the submitting thread instead, for
+  tests). JOB_WORKERS caps jobs per runner and JOB_CONCURRENCY caps
+  running jobs per kind across all runners.
+* Handlers are registered with ``@job_handler(kind)`` in
+  services/job_handlers.py and called as ``handler(job, **params)``. They
+  report progress with ``job.update(...)`` and should stop early when
+  ``job.cancel_requested`` is set (or raise JobCancelled).
+* JOB_SCHEDULE kinds are queued periodically by the runners' housekeeping.
+* A job that raises is retried with exponential backoff until it has run
+  ``max_attempts`` times. Running jobs heartbeat; a job whose heartbeat is
+  older than JOB_STALE_SECONDS (its worker died) is queued again.
+
+The runner starts on the first request or submission in a web process, or in
+the foreground with ``flask run-jobs``.
+"""
+import glob
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app, has_app_context
+from flask.cli import with_appcontext
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from models.jobs import Job
+
+HANDLERS = {}
+
+# Files owned by a job (saved uploads, finished exports), under instance/
+JOB_FILES_DIR = 'jobs'
+
+# Seconds between progress writes / cancellation checks from inside a job
+PROGRESS_INTERVAL = 0.5
+
+
+class JobCancelled(Exception):
+    """Raised by a handler to stop a job that was asked to cancel"""
+
+
+def job_handler(kind):
+    """Register func(job, **params) as the handler for `kind`"""
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def _load_handlers():
+    # Registers the built-in handlers (also needed in process pool workers)
+    from services import job_handlers  # noqa: F401
+
+
+def job_kinds():
+    _load_handlers()
+    return sorted(HANDLERS)
+
+
+def job_file_path(job_id, suffix):
+    """instance/jobs/<job id>.<suffix>"""
+    directory = os.path.join(current_app.instance_path, JOB_FILES_DIR)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f'{job_id}.{suffix}')
+
+
+def jobs_table():
+    return Job.__table__
+
+
+def jobs_engine():
+    return db.engines['jobs']
+
+
+def _dumps(value):
+    return json.dumps(value, default=str) if value is not None else None
+
+
+class JobContext:
+    """What a handler sees of its job: params, progress and cancellation"""
+
+    def __init__(self, engine, row):
+        self.engine = engine
+        self.id = row.id
+        self.kind = row.kind
+        self.attempt = row.attempts
+        self.max_attempts = row.max_attempts
+        self.params = json.loads(row.params or '{}')
+        self.progress = json.loads(row.progress) if row.progress else {}
+        self._cancel = bool(row.cancel_requested)
+        self._last_write = 0.0
+        self._last_check = time.monotonic()
+
+    def update(self, force=False, **progress):
+        """Merge progress and store it (at most every PROGRESS_INTERVAL)"""
+        self.progress.update(progress)
+        now = time.monotonic()
+        if force or now - self._last_write >= PROGRESS_INTERVAL:
+            self._last_write = now
+            with self.engine.begin() as connection:
+                connection.execute(
+                    update(jobs_table()).where(jobs_table().c.id == self.id)
+                    .values(progress=_dumps(self.progress), heartbeat=datetime.utcnow())
+                )
+
+    @property
+    def cancel_requested(self):
+        now = time.monotonic()
+        if not self._cancel and now - self._last_check >= PROGRESS_INTERVAL:
+            self._last_check = now
+            with self.engine.connect() as connection:
+                self._cancel = bool(connection.execute(
+                    select(jobs_table().c.cancel_requested).where(jobs_table().c.id == self.id)
+                ).scalar())
+        return self._cancel
+
+    def check_cancelled(self):
+        if self.cancel_requested:
+            raise JobCancelled()
+
+
+# Job table operations
+
+def submit_job(kind, params=None, priority=0, max_attempts=None, delay=0, job_id=None):
+    """Queue a job and return its id (pass job_id when files were saved for it)"""
+    _load_handlers()
+    if kind not in HANDLERS:
+        raise ValueError(f"unknown job kind {kind!r}; known kinds: {', '.join(sorted(HANDLERS))}")
+    params = params or {}
+    if not isinstance(params, dict):
+        raise ValueError('params must be an object')
+
+    config = current_app.config
+    job_id = job_id or uuid.uuid4().hex
+    now = datetime.utcnow()
+    with jobs_engine().begin() as connection:
+        connection.execute(insert(jobs_table()).values(
+            id=job_id,
+            kind=kind,
+            params=_dumps(params),
+            status='queued',
+            priority=int(priority),
+            attempts=0,
+            max_attempts=max(1, int(max_attempts or config.get('JOB_MAX_ATTEMPTS', 3))),
+            cancel_requested=False,
+            run_after=now + timedelta(seconds=delay),
+            created_date=now
+        ))
+
+    if config.get('JOB_EXECUTOR') == 'inline':
+        run_inline(job_id)
+        return job_id
+    runner = get_runner()
+    if runner is not None:
+        runner.start()
+        runner.wake()
+    return job_id
+
+
+def job_accepted(job_id, message):
+    """202 response pointing at the status URL of a submitted job"""
+    from flask import jsonify, url_for
+    return jsonify({
+        'success': True,
+        'message': message,
+        'job_id': job_id,
+        'status_url': url_for('jobs.api_job_status', job_id=job_id)
+    }), 202
+
+
+def get_job(job_id):
+    """The job as a dict, or None"""
+    with jobs_engine().connect() as connection:
+        row = connection.execute(select(jobs_table()).where(jobs_table().c.id == job_id)).first()
+    return Job.row_to_dict(row) if row else None
+
+
+def list_jobs(status=None, kind=None, limit=50):
+    table = jobs_table()
+    query = select(table).order_by(table.c.created_date.desc()).limit(limit)
+    if status:
+        query = query.where(table.c.status == status)
+    if kind:
+        query = query.where(table.c.kind == kind)
+    with jobs_engine().connect() as connection:
+        return [Job.row_to_dict(row) for row in connection.execute(query)]
+
+
+def cancel_job(job_id):
+    """Cancel a queued job now, or ask a running one to stop; returns the job"""
+    table = jobs_table()
+    now = datetime.utcnow()
+    with jobs_engine().begin() as connection:
+        connection.execute(
+            update(table).where(table.c.id == job_id, table.c.status == 'queued')
+            .values(status='cancelled', cancel_requested=True, finished_date=now)
+        )
+        connection.execute(
+            update(table).where(table.c.id == job_id, table.c.status == 'running')
+            .values(cancel_requested=True)
+        )
+    return get_job(job_id)
+
+
+def _begin_immediate(connection):
+    if connection.dialect.name == 'sqlite':
+        connection.info['sqlite_begin'] = 'IMMEDIATE'
+    return connection.begin()
+
+
+def claim_next(engine, worker, limits):
+    """Atomically mark the next runnable queued job as running; returns its id"""
+    table = jobs_table()
+    now = datetime.utcnow()
+    with engine.connect() as connection:
+        try:
+            with _begin_immediate(connection):
+                running = connection.execute(
+                    select(table.c.kind, func.count()).where(table.c.status == 'running').group_by(table.c.kind)
+                ).all()
+                busy = {kind for kind, count in running if count >= limits.get(kind, count + 1)}
+
+                query = (
+                    select(table.c.id)
+                    .where(table.c.status == 'queued', table.c.run_after <= now)
+                    .order_by(table.c.priority.desc(), table.c.created_date)
+                    .limit(1)
+                )
+                if busy:
+                    query = query.where(table.c.kind.not_in(busy))
+                job_id = connection.execute(query).scalar()
+                if job_id is None:
+                    return None
+                connection.execute(_claim(job_id, worker, now))
+                return job_id
+        finally:
+            connection.info.pop('sqlite_begin', None)
+
+
+def _claim(job_id, worker, now):
+    table = jobs_table()
+    return (
+        update(table).where(table.c.id == job_id, table.c.status == 'queued').values(
+            status='running', worker=worker, attempts=table.c.attempts + 1,
+            started_date=now, heartbeat=now, error=None
+        )
+    )
+
+
+def run_inline(job_id):
+    """Run a job (and its retries, without backoff) in the calling thread
+
+    JOB_EXECUTOR = 'inline' is meant for tests and scripts with an in-memory
+    database, which background threads can't share safely.
+    """
+    engine = jobs_engine()
+    while True:
+        with engine.begin() as connection:
+            if not connection.execute(_claim(job_id, 'inline', datetime.utcnow())).rowcount:
+                return
+        execute_job(job_id)
+
+
+def _finish(engine, job_id, **values):
+    table = jobs_table()
+    with engine.begin() as connection:
+        connection.execute(update(table).where(table.c.id == job_id).values(**values))
+
+
+def execute_job(job_id):
+    """Run one claimed job to completion (needs an app context)"""
+    _load_handlers()
+    engine = jobs_engine()
+    table = jobs_table()
+    with engine.connect() as connection:
+        row = connection.execute(select(table).where(table.c.id == job_id)).first()
+    if row is None:
+        return
+
+    job = JobContext(engine, row)
+    now = datetime.utcnow
+    try:
+        result = HANDLERS[row.kind](job, **job.params)
+        status = 'cancelled' if job.cancel_requested else 'completed'
+        _finish(engine, job_id, status=status, result=_dumps(result),
+                progress=_dumps(job.progress), finished_date=now())
+    except JobCancelled:
+        db.session.rollback()
+        _finish(engine, job_id, status='cancelled', progress=_dumps(job.progress), finished_date=now())
+    except Exception as e:
+        db.session.rollback()
+        error = f'{type(e).__name__}: {e}'
+        current_app.logger.error('Job %s (%s) attempt %d failed:\n%s',
+                                 job_id, row.kind, row.attempts, traceback.format_exc())
+        if row.attempts < row.max_attempts and not job.cancel_requested:
+            backoff = current_app.config.get('JOB_RETRY_BACKOFF', 5) * 2 ** (row.attempts - 1)
+            _finish(engine, job_id, status='queued', error=error, worker=None,
+                    progress=_dumps(job.progress), run_after=now() + timedelta(seconds=backoff))
+        else:
+            _finish(engine, job_id, status='failed', error=error,
+                    progress=_dumps(job.progress), finished_date=now())
+    finally:
+        db.session.remove()
+
+
+def requeue_stale(engine, stale_seconds):
+    """Queue again (or fail) running jobs whose worker stopped heartbeating"""
+    table = jobs_table()
+    cutoff = datetime.utcnow() - timedelta(seconds=stale_seconds)
+    stale = [table.c.status == 'running', table.c.heartbeat < cutoff]
+    with engine.begin() as connection:
+        connection.execute(
+            update(table).where(*stale, table.c.attempts < table.c.max_attempts)
+            .values(status='queued', worker=None, error='worker stopped responding', run_after=datetime.utcnow())
+        )
+        connection.execute(
+            update(table).where(*stale)
+            .values(status='failed', error='worker stopped responding', finished_date=datetime.utcnow())
+        )
+
+
+def enqueue_scheduled(engine, schedule, now=None):
+    """Queue the JOB_SCHEDULE kinds due in the current period
+
+    The job id is derived from the kind and period, so however many runners
+    get here, each period queues one job.
+    """
+    table = jobs_table()
+    now = now or datetime.utcnow()
+    queued = []
+    for kind, seconds in schedule.items():
+        period = int(now.timestamp() // seconds)
+        job_id = uuid.uuid5(uuid.NAMESPACE_URL, f'{kind}@{period}').hex
+        try:
+            with engine.begin() as connection:
+                connection.execute(insert(table).values(
+                    id=job_id, kind=kind, params=_dumps({}), status='queued', priority=0, attempts=0,
+                    max_attempts=1, cancel_requested=False, run_after=now, created_date=now
+                ))
+        except IntegrityError:
+            continue
+        queued.append(job_id)
+    return queued
+
+
+def purge_finished(engine, retention_days, files_dir=None):
+    """Delete finished jobs older than `retention_days` and their files"""
+    table = jobs_table()
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    expired = [table.c.status.in_(Job.FINISHED_STATUSES), table.c.finished_date < cutoff]
+    # Reads then writes: take the write lock up front like claim_next()
+    with engine.connect() as connection:
+        try:
+            with _begin_immediate(connection):
+                ids = set(connection.execute(select(table.c.id).where(*expired)).scalars())
+                connection.execute(delete(table).where(*expired))
+        finally:
+            connection.info.pop('sqlite_begin', None)
+    if files_dir and ids:
+        for path in glob.glob(os.path.join(files_dir, '*.*')):
+            if os.path.basename(path).split('.')[0] in ids:
+                os.remove(path)
+
+
+# Pool workers
+
+def _run_in_app(app, job_id):
+    with app.app_context():
+        execute_job(job_id)
+
+
+_process_app = None
+
+
+def _init_process_worker(config_name):
+    global _process_app
+    from app import create_app
+    _process_app = create_app(config_name)
+
+
+def _run_in_process(job_id):
+    with _process_app.app_context():
+        execute_job(job_id)
+
+
+class JobRunner:
+    """Dispatcher thread plus a thread or process pool for one app"""
+
+    def __init__(self, app, workers=2, executor='thread', poll_interval=1.0,
+                 concurrency=None, stale_seconds=60, heartbeat_seconds=10, retention_days=7, schedule=None):
+        self.app = app
+        self.workers = max(1, int(workers))
+        self.executor = executor
+        self.poll_interval = poll_interval
+        self.concurrency = concurrency or {}
+        self.stale_seconds = stale_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.retention_days = retention_days
+        self.schedule = schedule or {}
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pool = None
+        self._running = {}
+
+    def _make_pool(self):
+        if self.executor == 'process':
+            import multiprocessing
+            return ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_process_worker,
+                initargs=(self.app.config.get('CONFIG_NAME', 'default'),)
+            )
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='dpp-job')
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._pool = self._make_pool()
+                self._thread = threading.Thread(target=self._loop, name='dpp-job-dispatcher', daemon=True)
+                self._thread.start()
+
+    def stop(self, wait=True):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+
+    def wake(self):
+        self._wake.set()
+
+    def _submit(self, job_id):
+        if self.executor == 'process':
+            return self._pool.submit(_run_in_process, job_id)
+        return self._pool.submit(_run_in_app, self.app, job_id)
+
+    def _dispatch(self, engine):
+        self._running = {job_id: future for job_id, future in self._running.items() if not future.done()}
+        while len(self._running) < self.workers:
+            job_id = claim_next(engine, self.worker_id, self.concurrency)
+            if job_id is None:
+                return
+            try:
+                future = self._submit(job_id)
+            except Exception:
+                # Give the claim back so another runner (or a later try) can take it
+                table = jobs_table()
+                with engine.begin() as connection:
+                    connection.execute(
+                        update(table).where(table.c.id == job_id)
+                        .values(status='queued', worker=None, attempts=table.c.attempts - 1)
+                    )
+                raise
+            future.add_done_callback(lambda _: self._wake.set())
+            self._running[job_id] = future
+
+    def _heartbeat(self, engine):
+        if not self._running:
+            return
+        table = jobs_table()
+        with engine.begin() as connection:
+            connection.execute(
+                update(table).where(table.c.id.in_(list(self._running)), table.c.status == 'running')
+                .values(heartbeat=datetime.utcnow())
+            )
+
+    def _loop(self):
+        with self.app.app_context():
+            engine = jobs_engine()
+        last_heartbeat = last_housekeeping = 0.0
+        while not self._stop.is_set():
+            try:
+                now = time.monotonic()
+                if now - last_heartbeat >= self.heartbeat_seconds:
+                    self._heartbeat(engine)
+                    last_heartbeat = now
+                if now - last_housekeeping >= self.stale_seconds:
+                    requeue_stale(engine, self.stale_seconds)
+                    purge_finished(engine, self.retention_days,
+                                   os.path.join(self.app.instance_path, JOB_FILES_DIR))
+                    enqueue_scheduled(engine, self.schedule)
+                    last_housekeeping = now
+                self._dispatch(engine)
+            except Exception:
+                self.app.logger.error('Job dispatcher error:\n%s', traceback.format_exc())
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+
+def init_job_runner(app):
+    """Create the app's JobRunner; it starts on the first request or submission"""
+    if not app.config.get('JOBS_ENABLED', True) or app.config.get('JOB_EXECUTOR') == 'inline':
+        return None
+    runner = JobRunner(
+        app,
+        workers=app.config.get('JOB_WORKERS', 2),
+        executor=app.config.get('JOB_EXECUTOR', 'thread'),
+        poll_interval=app.config.get('JOB_POLL_INTERVAL', 1.0),
+        concurrency=app.config.get('JOB_CONCURRENCY', {}),
+        stale_seconds=app.config.get('JOB_STALE_SECONDS', 60),
+        heartbeat_seconds=app.config.get('JOB_HEARTBEAT_SECONDS', 10),
+        retention_days=app.config.get('JOB_RETENTION_DAYS', 7),
+        schedule=app.config.get('JOB_SCHEDULE', {})
+    )
+    app.extensions['dpp_job_runner'] = runner
+
+    if app.config.get('JOBS_RUN_IN_WEB', True):
+        @app.before_request
+        def _start_job_runner():
+            if runner._thread is None:
+                runner.start()
+    return runner
+
+
+def get_runner():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('dpp_job_runner')
+
+
+@click.command('run-jobs')
+@click.option('--workers', type=int, default=None, help='Defaults to JOB_WORKERS')
+@click.option('--executor', type=click.Choice(['thread', 'process']), default=None, help='Defaults to JOB_EXECUTOR')
+@with_appcontext
+def run_jobs_command(workers, executor):
+    """Run the background job runner in the foreground until interrupted"""
+    app = current_app._get_current_object()
+    app.config['JOBS_RUN_IN_WEB'] = False
+    if workers:
+        app.config['JOB_WORKERS'] = workers
+    if executor:
+        app.config['JOB_EXECUTOR'] = executor
+    runner = init_job_runner(app)
+    if runner is None:
+        raise click.ClickException('Jobs are disabled or JOB_EXECUTOR is inline')
+    runner.start()
+    print(f"✅ Job runner {runner.worker_id} started ({runner.workers} {runner.executor} workers), Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        runner.stop()
+
+
+COMMANDS = (run_jobs_command,)
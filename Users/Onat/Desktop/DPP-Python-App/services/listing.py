@@ -0,0 +1,184 @@
+"""Keyset pagination, field projection and streaming for the listing APIs"""
+import base64
+from datetime import datetime
+
+from flask import Response, request, stream_with_context, jsonify
+from sqlalchemy import and_, or_
+
+from app import db
+from services import dimensions, serialization
+from services.serialization import FORMATS
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 1000
+
+
+def encode_cursor(created_date, row_id):
+    """Encode the (created_date, id) keyset position as an opaque token"""
+    raw = f"{created_date.isoformat() if created_date else ''}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor token back into (created_date, id)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created, row_id = raw.rsplit('|', 1)
+        return (datetime.fromisoformat(created) if created else None), int(row_id)
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
+
+
+def resolve_fields(model, fields_param):
+    """Map a comma separated fields= value onto the model's public fields"""
+    public = dimensions.public_fields(model)
+    if not fields_param:
+        return public
+
+    names = [name.strip() for name in fields_param.split(',') if name.strip()]
+    unknown = [name for name in names if name not in public]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    return names
+
+
+def selected_columns(fields):
+    """Column names a listing query selects, in order"""
+    # created_date and id are always selected so the next cursor can be built
+    return tuple(dict.fromkeys(list(fields) + ['created_date', 'id']))
+
+
+def build_query(model, fields, cursor=None, filters=None):
+    """Select only the requested columns, newest first, after the cursor
+
+    Country, facility and fabric values are joined in from the dimension
+    tables (see services/dimensions.py).
+    """
+    stmt = dimensions.select_fields(model, selected_columns(fields))
+
+    for name, value in (filters or {}).items():
+        stmt = stmt.where(dimensions.match_clause(model, name, [value]))
+
+    # Rows without a created_date come last, newest id first
+    if cursor:
+        created_date, row_id = decode_cursor(cursor)
+        if created_date is None:
+            stmt = stmt.where(model.created_date.is_(None), model.id < row_id)
+        else:
+            stmt = stmt.where(or_(
+                model.created_date < created_date,
+                and_(model.created_date == created_date, model.id < row_id),
+                model.created_date.is_(None)
+            ))
+
+    return stmt.order_by(model.created_date.desc().nulls_last(), model.id.desc())
+
+
+def encoder_for(model, fields):
+    return serialization.row_encoder(model, tuple(fields), selected_columns(fields))
+
+
+def serialize_row(fields, row):
+    """Turn a result row into a JSON-ready dict of the requested fields"""
+    mapping = row._mapping
+    item = {}
+    for name in fields:
+        value = mapping[name]
+        item[name] = value.isoformat() if isinstance(value, datetime) else value
+    return item
+
+
+def page_query(model, fields, cursor=None, limit=DEFAULT_PAGE_SIZE, filters=None):
+    """The query for one page: one row more than `limit` tells if there are more"""
+    return build_query(model, fields, cursor, filters).limit(limit + 1)
+
+
+def split_page(rows, limit):
+    """Trim the rows of page_query() to the page and build its metadata"""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]._mapping
+        next_cursor = encode_cursor(last['created_date'], last['id'])
+    return rows, {'next_cursor': next_cursor, 'has_more': has_more}
+
+
+def fetch_page(model, fields, cursor=None, limit=DEFAULT_PAGE_SIZE, filters=None):
+    """One keyset page of rows plus the cursor for the following page"""
+    rows = db.session.execute(page_query(model, fields, cursor, limit, filters)).all()
+    return split_page(rows, limit)
+
+
+def iter_row_chunks(model, fields, cursor=None, filters=None, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield lists of result rows from a server-side cursor"""
+    stmt = build_query(model, fields, cursor, filters)
+    result = db.session.execute(stmt.execution_options(yield_per=chunk_size))
+    try:
+        for partition in result.partitions():
+            yield partition
+    finally:
+        result.close()
+
+
+def iter_rows(model, fields, cursor=None, filters=None, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield serialized rows in chunks from a server-side cursor"""
+    encoder = encoder_for(model, fields)
+    for partition in iter_row_chunks(model, fields, cursor, filters, chunk_size):
+        yield encoder.json_ready(partition)
+
+
+def stream_rows(model, fields, fmt, cursor=None, filters=None):
+    """Stream every row in `fmt` (see services/serialization.py)"""
+    chunks = iter_row_chunks(model, fields, cursor, filters)
+    body = serialization.stream_chunks(fmt, encoder_for(model, fields), chunks)
+    return Response(stream_with_context(body), mimetype=FORMATS[fmt])
+
+
+def page_response(model, fields, fmt, cursor=None, limit=DEFAULT_PAGE_SIZE, filters=None):
+    """One keyset page in `fmt`"""
+    rows, meta = fetch_page(model, fields, cursor, limit, filters)
+    body = serialization.page_body(fmt, encoder_for(model, fields), rows, **meta)
+    return Response(body, mimetype=FORMATS[fmt])
+
+
+def parse_listing_request(model):
+    """(fields, fmt, cursor, limit) from the request arguments; limit None streams
+
+    - ``format=ndjson`` (or ``Accept: application/x-ndjson``) streams every row
+    - ``format=columnar`` / ``format=msgpack`` (or their Accept types) switch
+      the body format of pages and full listings
+    - ``limit=`` / ``cursor=`` return a single keyset page with ``next_cursor``
+    - no arguments stream the full JSON array, as the API always returned
+
+    Raises ValueError for invalid arguments.
+    """
+    fields = resolve_fields(model, request.args.get('fields'))
+    cursor = request.args.get('cursor')
+    if cursor:
+        decode_cursor(cursor)
+    fmt = serialization.negotiate(request)
+
+    if fmt != 'ndjson' and (cursor or 'limit' in request.args):
+        limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+        return fields, fmt, cursor, max(1, min(limit, MAX_PAGE_SIZE))
+    return fields, fmt, cursor, None
+
+
+def listing_response(model, filters=None):
+    """Build the listing response for a model from the request arguments
+
+    See parse_listing_request() for the arguments.
+    """
+    try:
+        fields, fmt, cursor, limit = parse_listing_request(model)
+        if limit is None:
+            return stream_rows(model, fields, fmt, cursor, filters)
+        return page_response(model, fields, fmt, cursor, limit, filters)
+
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
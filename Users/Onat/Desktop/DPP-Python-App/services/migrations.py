@@ -0,0 +1,186 @@
+"""Lightweight schema migrations for existing SQLite databases
+
+``db.create_all()`` only creates missing tables. Migrations bring databases
+created by older versions up to date; each one runs once, in order, and is
+recorded in the ``schema_migrations`` table.
+"""
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+
+from app import db
+
+MIGRATIONS = []
+
+
+def migration(name):
+    """Register a migration function under a unique, sortable name"""
+    def decorator(func):
+        MIGRATIONS.append((name, func))
+        return func
+    return decorator
+
+
+def add_missing_columns(connection, model):
+    """ALTER TABLE ADD COLUMN for model columns the database doesn't have yet"""
+    table = model.__table__
+    existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    added = []
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        ddl = CreateColumn(column).compile(dialect=connection.dialect)
+        connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {ddl}'))
+        added.append(column.name)
+    return added
+
+
+@migration('0001_dashboard_summary_counters')
+def _dashboard_summary_counters(connection):
+    from models.dashboard import DashboardStats
+    from services.summary import rebuild
+
+    add_missing_columns(connection, DashboardStats)
+    rebuild(connection)
+
+
+@migration('0002_query_indexes')
+def _query_indexes(connection):
+    from models.garment import Garment
+    from models.orders import Order
+
+    for model in (Garment, Order):
+        for index in model.__table__.indexes:
+            index.create(connection, checkfirst=True)
+    connection.execute(text('ANALYZE'))
+
+
+# The text columns 0002a moves into dimension tables, frozen as they were when
+# it was written so later model changes can't widen what it drops:
+# table -> (dimension table, key column, {dimension column: text column})
+DIMENSION_COLUMNS_0002A = {
+    'garments': (
+        ('countries', 'country_id', {'name': 'country'}),
+        ('facilities', 'facility_id', {'name': 'production_facility'}),
+        ('fabrics', 'fabric_id', {'fabric_type': 'fabric_type', 'fabric_name': 'fabric_name',
+                                  'fabric_construction': 'fabric_construction'})
+    ),
+    'orders': (
+        ('countries', 'country_id', {'name': 'country'}),
+        ('facilities', 'facility_id', {'name': 'facility'}),
+        ('fabrics', 'fabric_id', {'fabric_type': 'fabric_type', 'fabric_name': 'fabric_name',
+                                  'fabric_construction': 'fabric_construction'})
+    )
+}
+
+
+# Named to sort between 0002 and 0003: databases that haven't built their
+# rollups and search index yet build them from the converted tables
+@migration('0002a_dimension_tables')
+def _dimension_tables(connection):
+    """Move the country/facility/fabric strings into the dimension tables"""
+    from services import search
+
+    # The index triggers read the old text columns, which can't be dropped under them
+    reinstall_search = search.uninstall(connection)
+    for table, dimensions in DIMENSION_COLUMNS_0002A.items():
+        existing = {column['name'] for column in inspect(connection).get_columns(table)}
+        for dimension_table, key_column, columns in dimensions:
+            if not set(columns.values()) <= existing:
+                continue
+            if key_column not in existing:
+                connection.execute(text(
+                    f'ALTER TABLE {table} ADD COLUMN {key_column} INTEGER REFERENCES {dimension_table}(id)'
+                ))
+            values = [f"coalesce({table}.{name}, '')" for name in columns.values()]
+            set_values = ' OR '.join(f"{value} != ''" for value in values)
+            connection.execute(text(
+                f"INSERT OR IGNORE INTO {dimension_table} ({', '.join(columns)}) "
+                f"SELECT DISTINCT {', '.join(values)} FROM {table} WHERE {set_values}"
+            ))
+            matches = ' AND '.join(f'{dimension_table}.{part} = {value}' for part, value in zip(columns, values))
+            connection.execute(text(
+                f'UPDATE {table} SET {key_column} = '
+                f'(SELECT {dimension_table}.id FROM {dimension_table} WHERE {matches})'
+            ))
+            for name in columns.values():
+                connection.execute(text(f'ALTER TABLE {table} DROP COLUMN {name}'))
+    if reinstall_search:
+        search.install(connection)
+
+
+@migration('0003_rollups')
+def _rollups(connection):
+    from services.rollups import rebuild
+
+    rebuild(connection)
+
+
+@migration('0004_search_index')
+def _search_index(connection):
+    from services.search import install
+
+    install(connection)
+
+
+@migration('0005_order_status_history')
+def _order_status_history(connection):
+    """Start the status history of the existing orders"""
+    from models.status_history import OrderStatusChange, OrderStatusDuration
+    from services.status_history import record_created
+
+    for model in (OrderStatusChange, OrderStatusDuration):
+        model.__table__.create(connection, checkfirst=True)
+    record_created(connection)
+
+
+@migration('0006_search_backlog')
+def _search_backlog(connection):
+    """Add the bulk-load backlog and the triggers that skip its rows"""
+    from services.search import SPECS, create_triggers, drop_triggers
+    from models.search import SearchBacklog
+
+    if connection.dialect.name != 'sqlite':
+        return
+    SearchBacklog.__table__.create(connection, checkfirst=True)
+    for spec in SPECS.values():
+        drop_triggers(connection, spec)
+        create_triggers(connection, spec)
+
+
+@migration('0007_garment_stats_score')
+def _garment_stats_score(connection):
+    """Add sustainability_score to the covering index read by Garment.get_stats()"""
+    from models.garment import Garment
+
+    index = next(index for index in Garment.__table__.indexes if index.name == 'ix_garments_stats')
+    index.drop(connection, checkfirst=True)
+    index.create(connection)
+
+
+def applied_migrations(connection):
+    connection.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migrations '
+        '(name VARCHAR(100) PRIMARY KEY, applied_at DATETIME NOT NULL)'
+    ))
+    return {row[0] for row in connection.execute(text('SELECT name FROM schema_migrations'))}
+
+
+def upgrade():
+    """Apply all pending migrations, each in its own transaction"""
+    with db.engine.begin() as connection:
+        done = applied_migrations(connection)
+
+    applied = []
+    for name, func in sorted(MIGRATIONS, key=lambda item: item[0]):
+        if name in done:
+            continue
+        with db.engine.begin() as connection:
+            func(connection)
+            connection.execute(
+                text('INSERT INTO schema_migrations (name, applied_at) VALUES (:name, :applied_at)'),
+                {'name': name, 'applied_at': datetime.utcnow()}
+            )
+        applied.append(name)
+    return applied
@@ -0,0 +1,423 @@
+"""Declarative registry of the dashboard's DPP modules, with background metrics
+
+The fifteen modules are declared once in ``MODULES``: name, category,
+description, icon, url_path and up to three metrics. A metric names a
+provider registered with ``@metric_provider(name)``; providers are called as
+``provider(sources)`` inside an app context and return the display string.
+``Sources`` memoizes the queries shared by several providers (the summary
+row, the garment aggregates, ...) so each one runs once per refresh.
+
+Each app holds a ``ModuleRegistry`` whose snapshot is a tuple of immutable
+``Module`` rows shaped like ``DPPModule`` (``metric1_value`` and so on). The
+dashboard only reads the snapshot. A daemon thread, started on the first
+request like the job runner, recomputes the metrics every
+MODULE_REFRESH_SECONDS and swaps in a new tuple; when a value changed it
+bumps the ``dpp_modules`` render cache version so cached pages are redrawn.
+Until the first refresh the metrics read PLACEHOLDER. With
+MODULE_REFRESH_SECONDS = 0 there is no thread and the first read refreshes
+inline instead.
+
+The ``dpp_modules`` table is seeded from the registry (``seed_modules()``)
+for databases that still expect the rows.
+"""
+import threading
+import time
+import traceback
+from collections import namedtuple
+
+from flask import current_app, has_app_context
+from sqlalchemy import func, select
+
+from app import db
+
+DEFAULT_REFRESH_SECONDS = 60
+PLACEHOLDER = '-'
+METRIC_SLOTS = 3
+
+
+class Metric:
+    """A module metric: its label and the provider computing its value"""
+
+    def __init__(self, label, provider):
+        self.label = label
+        self.provider = provider
+
+
+class ModuleSpec:
+    """One module as declared in the registry"""
+
+    def __init__(self, name, category, description, icon, url_path, metrics=(), status='active'):
+        if len(metrics) > METRIC_SLOTS:
+            raise ValueError(f'{name}: at most {METRIC_SLOTS} metrics')
+        self.name = name
+        self.category = category
+        self.description = description
+        self.icon = icon
+        self.url_path = url_path
+        self.metrics = tuple(metrics)
+        self.status = status
+
+    def row(self):
+        """Column values of the module's dpp_modules row"""
+        row = {
+            'name': self.name, 'category': self.category, 'description': self.description,
+            'icon': self.icon, 'url_path': self.url_path, 'status': self.status
+        }
+        for slot, metric in enumerate(self.metrics, 1):
+            row[f'metric{slot}_label'] = metric.label
+        return row
+
+
+MODULES = (
+    ModuleSpec('Fibre DPP', 'manufacturing', 'Fiber traceability and sustainability', 'fas fa-seedling', '/fibre',
+               [Metric('Fibre types', 'fabrics.types'), Metric('Origins', 'dimensions.countries')]),
+    ModuleSpec('Yarn DPP', 'manufacturing', 'Yarn production and quality tracking', 'fas fa-thread', '/yarn',
+               [Metric('Fabrics', 'dimensions.fabrics'), Metric('Avg weight', 'garments.avg_weight')]),
+    ModuleSpec('Fabric DPP', 'manufacturing', 'Fabric manufacturing and properties', 'fas fa-cut', '/fabric',
+               [Metric('Fabrics', 'dimensions.fabrics'), Metric('Constructions', 'fabrics.constructions'),
+                Metric('Avg weight', 'garments.avg_weight')]),
+    ModuleSpec('Garment DPP', 'manufacturing', 'Complete garment lifecycle tracking', 'fas fa-tshirt', '/garment',
+               [Metric('Garments', 'garments.total'), Metric('Units', 'garments.quantity'),
+                Metric('Styles', 'garments.styles')]),
+    ModuleSpec('Chemical & Dyes', 'manufacturing', 'Chemical usage and safety tracking', 'fas fa-flask', '/chemicals',
+               [Metric('Emission factors', 'carbon.factors')]),
+    ModuleSpec('Energy & Utilities', 'manufacturing', 'Energy consumption monitoring', 'fas fa-bolt', '/energy',
+               [Metric('CO2e', 'garments.carbon'), Metric('Avg score', 'garments.avg_score')]),
+    ModuleSpec('Finishing', 'manufacturing', 'Finishing processes and quality', 'fas fa-magic', '/finishing',
+               [Metric('Facilities', 'dimensions.facilities'), Metric('Avg score', 'garments.avg_score')]),
+    ModuleSpec('IT DPP', 'corporate', 'IT infrastructure and digital tracking', 'fas fa-laptop', '/it'),
+    ModuleSpec('Logistics', 'supply-chain', 'Supply chain and logistics management', 'fas fa-truck', '/logistics',
+               [Metric('Orders', 'orders.total'), Metric('In progress', 'orders.processing'),
+                Metric('Countries', 'dimensions.countries')]),
+    ModuleSpec('Office DPP', 'corporate', 'Office operations and administration', 'fas fa-building', '/office'),
+    ModuleSpec('Office Supplies', 'corporate', 'Office supplies and waste management', 'fas fa-paperclip', '/supplies'),
+    ModuleSpec('Order Delivery', 'supply-chain', 'Order processing and delivery tracking', 'fas fa-shipping-fast',
+               '/orders',
+               [Metric('Pending', 'orders.pending'), Metric('Completed', 'orders.completed'),
+                Metric('Avg processing', 'orders.processing_time')]),
+    ModuleSpec('Packaging', 'supply-chain', 'Packaging materials and sustainability', 'fas fa-box', '/packaging',
+               [Metric('Units ordered', 'orders.quantity')]),
+    ModuleSpec('Retail Distribution', 'supply-chain', 'Retail and distribution management', 'fas fa-store', '/retail',
+               [Metric('Units ordered', 'orders.quantity'), Metric('Completion', 'orders.completion_rate')]),
+    ModuleSpec('Transport DPP', 'supply-chain', 'Transportation and carbon footprint', 'fas fa-car', '/transport',
+               [Metric('CO2e', 'garments.carbon'), Metric('Origins', 'dimensions.countries')])
+)
+
+
+class Module(namedtuple('Module', [
+    'id', 'name', 'category', 'description', 'icon', 'url_path', 'status',
+    'metric1_label', 'metric1_value', 'metric2_label', 'metric2_value', 'metric3_label', 'metric3_value'
+])):
+    """A module with its current metric values, read by the dashboard"""
+    __slots__ = ()
+
+    def to_dict(self):
+        return self._asdict()
+
+
+def build(specs, values):
+    """Module rows for `specs`, taking metric values from {provider name: value}"""
+    modules = []
+    for index, spec in enumerate(specs, 1):
+        slots = {}
+        for slot in range(1, METRIC_SLOTS + 1):
+            metric = spec.metrics[slot - 1] if slot <= len(spec.metrics) else None
+            slots[f'metric{slot}_label'] = metric.label if metric else None
+            slots[f'metric{slot}_value'] = values.get(metric.provider, PLACEHOLDER) if metric else None
+        modules.append(Module(index, spec.name, spec.category, spec.description, spec.icon,
+                              spec.url_path, spec.status, **slots))
+    return tuple(modules)
+
+
+# Metric providers
+
+PROVIDERS = {}
+
+
+def metric_provider(name):
+    """Register `func(sources)` as the provider of metric `name`"""
+    def decorator(func):
+        PROVIDERS[name] = func
+        return func
+    return decorator
+
+
+class Sources:
+    """Per-refresh memo of the queries shared by providers"""
+
+    def __init__(self):
+        self._values = {}
+
+    def get(self, name, compute):
+        if name not in self._values:
+            self._values[name] = compute()
+        return self._values[name]
+
+    @property
+    def summary(self):
+        from models.dashboard import DashboardStats
+        return self.get('summary', lambda: DashboardStats.current().to_dict())
+
+    @property
+    def garments(self):
+        from services.stats import garment_stats
+        return self.get('garments', garment_stats)
+
+    def count(self, model, column=None):
+        """Rows of model (distinct values of column)"""
+        counted = func.count(func.distinct(column)) if column is not None else func.count()
+        return self.get(('count', model.__tablename__, getattr(column, 'key', None)),
+                        lambda: db.session.execute(select(counted).select_from(model)).scalar() or 0)
+
+
+def _number(value):
+    return f'{value:,}'
+
+
+def _mass(kilograms):
+    if kilograms >= 1000:
+        return f'{kilograms / 1000:,.1f} t'
+    return f'{kilograms:,.1f} kg'
+
+
+@metric_provider('garments.total')
+def _garments_total(sources):
+    return _number(sources.summary['total_garments'])
+
+
+@metric_provider('garments.quantity')
+def _garments_quantity(sources):
+    return _number(sources.summary['garment_quantity'])
+
+
+@metric_provider('garments.carbon')
+def _garments_carbon(sources):
+    return _mass(sources.summary['total_carbon'] or 0)
+
+
+@metric_provider('garments.styles')
+def _garments_styles(sources):
+    return _number(sources.garments['unique_styles'])
+
+
+@metric_provider('garments.avg_weight')
+def _garments_avg_weight(sources):
+    weight = sources.garments['avg_weight']
+    return f'{weight:,.0f} g' if weight else PLACEHOLDER
+
+
+@metric_provider('garments.avg_score')
+def _garments_avg_score(sources):
+    garments = sources.garments
+    return f"{garments['avg_score']:.0f}/100" if garments['total_count'] else PLACEHOLDER
+
+
+@metric_provider('orders.total')
+def _orders_total(sources):
+    return _number(sources.summary['total_orders'])
+
+
+@metric_provider('orders.quantity')
+def _orders_quantity(sources):
+    return _number(sources.summary['order_quantity'])
+
+
+@metric_provider('orders.pending')
+def _orders_pending(sources):
+    return _number(sources.summary['pending_orders'])
+
+
+@metric_provider('orders.processing')
+def _orders_processing(sources):
+    return _number(sources.summary['processing_orders'])
+
+
+@metric_provider('orders.completed')
+def _orders_completed(sources):
+    return _number(sources.summary['completed_orders'])
+
+
+@metric_provider('orders.completion_rate')
+def _orders_completion_rate(sources):
+    summary = sources.summary
+    if not summary['total_orders']:
+        return PLACEHOLDER
+    return f"{100 * summary['completed_orders'] / summary['total_orders']:.0f}%"
+
+
+@metric_provider('orders.processing_time')
+def _orders_processing_time(sources):
+    """Mean time orders stayed in 'processing', from the status duration aggregates"""
+    from models.status_history import OrderStatusDuration
+    seconds, exited = db.session.execute(
+        select(func.sum(OrderStatusDuration.total_seconds), func.sum(OrderStatusDuration.exited))
+        .where(OrderStatusDuration.status == 'processing')
+    ).one()
+    if not exited:
+        return PLACEHOLDER
+    hours = seconds / exited / 3600
+    return f'{hours / 24:.1f} d' if hours >= 48 else f'{hours:.1f} h'
+
+
+@metric_provider('dimensions.countries')
+def _countries(sources):
+    from models.dimensions import Country
+    return _number(sources.count(Country))
+
+
+@metric_provider('dimensions.facilities')
+def _facilities(sources):
+    from models.dimensions import Facility
+    return _number(sources.count(Facility))
+
+
+@metric_provider('dimensions.fabrics')
+def _fabrics(sources):
+    from models.dimensions import Fabric
+    return _number(sources.count(Fabric))
+
+
+@metric_provider('fabrics.types')
+def _fabric_types(sources):
+    from models.dimensions import Fabric
+    return _number(sources.count(Fabric, Fabric.fabric_type))
+
+
+@metric_provider('fabrics.constructions')
+def _fabric_constructions(sources):
+    from models.dimensions import Fabric
+    return _number(sources.count(Fabric, Fabric.fabric_construction))
+
+
+@metric_provider('carbon.factors')
+def _emission_factors(sources):
+    from models.carbon import EmissionFactor
+    return _number(sources.count(EmissionFactor))
+
+
+def compute_values(specs, previous=None, logger=None):
+    """{provider name: value} for every metric in `specs` (app context required)
+
+    A failing provider keeps its previous value and is logged; the others
+    are unaffected.
+    """
+    previous = previous or {}
+    sources = Sources()
+    values = {}
+    try:
+        for spec in specs:
+            for metric in spec.metrics:
+                if metric.provider in values:
+                    continue
+                try:
+                    values[metric.provider] = PROVIDERS[metric.provider](sources)
+                except Exception:
+                    db.session.rollback()
+                    values[metric.provider] = previous.get(metric.provider, PLACEHOLDER)
+                    if logger is not None:
+                        logger.error('Module metric %s failed:\n%s', metric.provider, traceback.format_exc())
+    finally:
+        db.session.rollback()
+    return values
+
+
+# Registry
+
+class ModuleRegistry:
+    """The current module snapshot, refreshed by a background thread"""
+
+    def __init__(self, app, specs=MODULES, interval=DEFAULT_REFRESH_SECONDS):
+        unknown = {metric.provider for spec in specs for metric in spec.metrics} - set(PROVIDERS)
+        if unknown:
+            raise ValueError(f"Unknown module metric providers: {', '.join(sorted(unknown))}")
+        self.app = app
+        self.specs = tuple(specs)
+        self.interval = interval
+        self.values = {}
+        self.modules = build(self.specs, self.values)
+        self.refreshed_at = None
+        self.refresh_seconds = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh(self):
+        """Recompute every metric and swap in the new snapshot (app context required)"""
+        with self._lock:
+            started = time.perf_counter()
+            values = compute_values(self.specs, self.values, self.app.logger)
+            changed = values != self.values
+            self.values = values
+            # Readers pick up the new tuple with a single reference swap
+            self.modules = build(self.specs, values)
+            self.refreshed_at = time.time()
+            self.refresh_seconds = round(time.perf_counter() - started, 4)
+        if changed:
+            from services.render_cache import bump_versions
+            bump_versions(['dpp_modules'])
+        return self.modules
+
+    def current(self):
+        """The module snapshot; refreshed inline on first use when there is no refresh thread"""
+        if self.refreshed_at is None and not self.interval:
+            self.refresh()
+        return self.modules
+
+    def start(self):
+        with self._lock:
+            if self.interval and (self._thread is None or not self._thread.is_alive()):
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._loop, name='dpp-module-refresh', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    self.refresh()
+            except Exception:
+                self.app.logger.error('Module refresh error:\n%s', traceback.format_exc())
+            self._stop.wait(self.interval)
+
+    def status(self):
+        return {
+            'refreshed_at': self.refreshed_at,
+            'refresh_seconds': self.refresh_seconds,
+            'interval': self.interval
+        }
+
+
+def init_modules(app):
+    """Create the app's ModuleRegistry; its refresh thread starts on the first request"""
+    registry = ModuleRegistry(app, interval=app.config.get('MODULE_REFRESH_SECONDS', DEFAULT_REFRESH_SECONDS))
+    app.extensions['dpp_modules'] = registry
+
+    if registry.interval:
+        @app.before_request
+        def _start_module_refresh():
+            if registry._thread is None:
+                registry.start()
+    return registry
+
+
+def get_registry():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('dpp_modules')
+
+
+def current_modules():
+    """The dashboard's modules, from memory"""
+    return get_registry().current()
+
+
+def seed_modules():
+    """Insert the registry's modules into the dpp_modules table"""
+    from models.dashboard import DPPModule
+    db.session.add_all(DPPModule(**spec.row()) for spec in MODULES)
+    db.session.commit()
@@ -0,0 +1,367 @@
+"""Digital Product Passports rendered per garment and cached on disk
+
+A passport is three documents built from one garment:
+
+* ``passport.jsonld``: a schema.org Product in JSON-LD (origin, materials,
+  footprint and score as PropertyValues),
+* ``passport.html``: the public page (templates/passport.html), with the
+  JSON-LD embedded,
+* ``qr.txt``: the QR payload, the public URL of the passport under
+  PASSPORT_BASE_URL; plus ``qr.svg`` when the optional ``segno`` package is
+  installed.
+
+They are stored under instance/passports/<shard>/<garment id>/<digest>/,
+where the digest covers everything a passport is rendered from that can
+change: updated_date, the carbon columns (rescoring writes them without
+touching updated_date), the base URL and RENDERER_VERSION. A lookup reads
+those columns by primary key, and if that directory exists, serves its
+file as is. Otherwise the passport is rendered once and the directory is
+moved into place whole, replacing the garment's older versions; a request
+whose version was removed under it looks the garment up again.
+
+``render_passports()`` (``flask render-passports``, the
+``garments.render_passports`` job) pre-renders missing passports on a
+process pool: the parent walks the garment ids in chunks and each worker
+(its own create_app(), like the job runner's process executor) loads and
+renders one chunk.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import click
+from flask import current_app, render_template
+from flask.cli import with_appcontext
+from sqlalchemy import select
+
+from app import db
+from models.garment import Garment
+
+try:
+    import segno
+except ImportError:  # optional: QR code SVGs
+    segno = None
+
+# Bump when the documents change shape, so every cached passport is rebuilt
+RENDERER_VERSION = '1'
+DEFAULT_CACHE_DIR = 'passports'
+DEFAULT_BASE_URL = 'http://localhost:5000'
+DEFAULT_CHUNK_SIZE = 500
+# Passport files and their mimetypes (Flask adds "; charset=utf-8" to text/* ones)
+DOCUMENTS = {
+    'html': ('passport.html', 'text/html'),
+    'jsonld': ('passport.jsonld', 'application/ld+json'),
+    'qr': ('qr.txt', 'text/plain'),
+    'qr.svg': ('qr.svg', 'image/svg+xml')
+}
+KEY_COLUMNS = (Garment.id, Garment.updated_date, Garment.carbon_footprint, Garment.sustainability_score)
+SHARDS = 256
+# Lookups per request when the resolved version is replaced before it is opened
+RESOLVE_ATTEMPTS = 3
+# Ids per IN (...) list, well below SQLite's bound parameter limit
+IN_CHUNK_SIZE = 500
+
+
+def cache_root():
+    directory = current_app.config.get('PASSPORT_CACHE_DIR', DEFAULT_CACHE_DIR)
+    return os.path.join(current_app.instance_path, directory)
+
+
+def base_url():
+    return (current_app.config.get('PASSPORT_BASE_URL') or DEFAULT_BASE_URL).rstrip('/')
+
+
+def passport_url(garment_id):
+    """Public URL of a garment's passport, encoded in its QR code"""
+    return f'{base_url()}/garment/{garment_id}/passport'
+
+
+def passport_key(garment_id, updated_date, carbon_footprint, sustainability_score):
+    """Cache key of a garment's current passport: '<id>-<digest>'"""
+    source = '|'.join([
+        RENDERER_VERSION, base_url(), str(garment_id),
+        updated_date.isoformat() if updated_date else '', repr(carbon_footprint), repr(sustainability_score)
+    ])
+    return f'{garment_id}-{hashlib.sha256(source.encode()).hexdigest()[:24]}'
+
+
+def _shard(garment_id):
+    return f'{garment_id % SHARDS:02x}'
+
+
+def passport_dir(key):
+    garment_id, digest = key.split('-', 1)
+    return os.path.join(cache_root(), _shard(int(garment_id)), garment_id, digest)
+
+
+# Rendering
+
+def _property(name, value, unit=None):
+    item = {'@type': 'PropertyValue', 'name': name, 'value': value}
+    if unit:
+        item['unitText'] = unit
+    return item
+
+
+def passport_jsonld(garment):
+    """The passport as a schema.org Product"""
+    material = [part for part in (garment.fabric_type, garment.fabric_name, garment.fabric_construction) if part]
+    document = {
+        '@context': 'https://schema.org',
+        '@type': 'Product',
+        '@id': passport_url(garment.id),
+        'url': passport_url(garment.id),
+        'identifier': garment.po_number,
+        'sku': garment.po_number,
+        'name': garment.style_name,
+        'category': garment.product_type,
+        'countryOfOrigin': {'@type': 'Country', 'name': garment.country},
+        'manufacturer': {'@type': 'Organization', 'name': garment.production_facility},
+        'material': ', '.join(material) or None,
+        'additionalProperty': [
+            _property('carbonFootprint', garment.carbon_footprint, 'kg CO2e'),
+            _property('sustainabilityScore', garment.sustainability_score, 'of 100'),
+            _property('quantity', garment.quantity)
+        ],
+        'dateCreated': garment.created_date.isoformat() if garment.created_date else None,
+        'dateModified': garment.updated_date.isoformat() if garment.updated_date else None
+    }
+    if garment.fabric_weight:
+        document['weight'] = {'@type': 'QuantitativeValue', 'value': garment.fabric_weight, 'unitCode': 'GRM'}
+    return document
+
+
+def render(garment):
+    """{file name: content} of a garment's passport"""
+    payload = passport_url(garment.id)
+    qr_svg = None
+    if segno is not None:
+        qr_svg = segno.make(payload, error='m').svg_inline(scale=4)
+    jsonld = passport_jsonld(garment)
+    documents = {
+        'passport.jsonld': json.dumps(jsonld, ensure_ascii=False, indent=2),
+        'passport.html': render_template('passport.html', garment=garment, jsonld=jsonld, url=payload,
+                                         qr_payload=payload, qr_svg=qr_svg),
+        'qr.txt': payload
+    }
+    if qr_svg is not None:
+        documents['qr.svg'] = qr_svg
+    return documents
+
+
+def store(key, documents):
+    """Write a rendered passport and drop the garment's older versions"""
+    target = passport_dir(key)
+    parent = os.path.dirname(target)
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.tmp-', dir=parent)
+    try:
+        for name, content in documents.items():
+            with open(os.path.join(staging, name), 'w', encoding='utf-8') as stream:
+                stream.write(content)
+        try:
+            os.rename(staging, target)
+        except OSError:
+            # Rendered concurrently by another worker; keep theirs
+            if not os.path.isdir(target):
+                raise
+    finally:
+        if os.path.isdir(staging):
+            shutil.rmtree(staging, ignore_errors=True)
+
+    current = os.path.basename(target)
+    for name in os.listdir(parent):
+        if name != current and not name.startswith('.tmp-'):
+            shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+    return target
+
+
+def ensure_passport(garment_id):
+    """Directory of the garment's current passport, rendering it on a miss; None if no such garment"""
+    row = db.session.execute(select(*KEY_COLUMNS).where(Garment.id == garment_id)).first()
+    if row is None:
+        return None
+    key = passport_key(*row)
+    directory = passport_dir(key)
+    if not os.path.isdir(directory):
+        garment = db.session.get(Garment, garment_id)
+        directory = store(key, render(garment))
+    return directory
+
+
+def passport_response(garment_id, document):
+    """Serve one passport file with an ETag from its key"""
+    from flask import abort, send_file
+
+    name, mimetype = DOCUMENTS[document]
+    for _ in range(RESOLVE_ATTEMPTS):
+        directory = ensure_passport(garment_id)
+        if directory is None:
+            abort(404)
+        # Opened before it is served: an open file stays readable when a newer
+        # version replaces its directory
+        try:
+            stream = open(os.path.join(directory, name), 'rb')
+        except FileNotFoundError:
+            if os.path.isdir(directory):
+                # Not part of this passport (qr.svg without segno)
+                abort(404)
+            # Replaced since it was resolved: resolve the newer version
+            continue
+        return send_file(
+            stream, mimetype=mimetype, etag=f'{garment_id}-{os.path.basename(directory)}-{document}',
+            max_age=current_app.config.get('PASSPORT_MAX_AGE', 300), conditional=True
+        )
+    abort(503)
+
+
+# Batch rendering
+
+_worker_app = None
+
+
+def _init_worker(config_name):
+    global _worker_app
+    from app import create_app
+    _worker_app = create_app(config_name)
+
+
+def render_chunk(ids, force=False):
+    """Render the passports of `ids` that aren't cached yet (app context required)"""
+    rendered = 0
+    for garment in Garment.query.filter(Garment.id.in_(ids)).order_by(Garment.id):
+        key = passport_key(garment.id, garment.updated_date, garment.carbon_footprint,
+                           garment.sustainability_score)
+        if force or not os.path.isdir(passport_dir(key)):
+            if force:
+                shutil.rmtree(passport_dir(key), ignore_errors=True)
+            store(key, render(garment))
+            rendered += 1
+    db.session.rollback()
+    return rendered
+
+
+def _render_in_worker(ids, force):
+    with _worker_app.app_context():
+        return render_chunk(ids, force)
+
+
+def _pending_chunks(chunk_size, force):
+    """Id chunks with at least one passport missing from the cache"""
+    after_id = 0
+    while True:
+        rows = db.session.execute(
+            select(*KEY_COLUMNS).where(Garment.id > after_id).order_by(Garment.id).limit(chunk_size)
+        ).all()
+        db.session.rollback()
+        if not rows:
+            return
+        after_id = rows[-1][0]
+        missing = [row[0] for row in rows if force or not os.path.isdir(passport_dir(passport_key(*row)))]
+        yield len(rows), missing
+
+
+def render_passports(workers=None, chunk_size=DEFAULT_CHUNK_SIZE, force=False, job=None):
+    """Pre-render every garment's passport that isn't cached, on `workers` processes
+
+    workers=1 renders in this process. Runs standalone or as a background
+    job, reporting progress per chunk and stopping when cancellation is asked.
+    """
+    import multiprocessing
+
+    workers = int(workers or current_app.config.get('PASSPORT_WORKERS') or os.cpu_count() or 1)
+    chunk_size = max(1, int(chunk_size))
+    started = time.perf_counter()
+    progress = {'checked': 0, 'rendered': 0, 'chunks': 0}
+
+    def cancelled():
+        return job is not None and job.cancel_requested
+
+    def report():
+        if job is not None:
+            job.update(**progress)
+
+    if workers <= 1:
+        for checked, missing in _pending_chunks(chunk_size, force):
+            if cancelled():
+                break
+            progress['checked'] += checked
+            if missing:
+                progress['rendered'] += render_chunk(missing, force)
+                progress['chunks'] += 1
+            report()
+    else:
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(current_app.config.get('CONFIG_NAME', 'default'),)
+        )
+        running = set()
+        try:
+            for checked, missing in _pending_chunks(chunk_size, force):
+                if cancelled():
+                    break
+                progress['checked'] += checked
+                if not missing:
+                    continue
+                # Keep every worker busy without queueing the whole table
+                if len(running) >= 2 * workers:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        progress['rendered'] += future.result()
+                        progress['chunks'] += 1
+                    report()
+                running.add(pool.submit(_render_in_worker, missing, force))
+            for future in running:
+                progress['rendered'] += future.result()
+                progress['chunks'] += 1
+            report()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    return dict(progress, workers=workers, seconds=round(time.perf_counter() - started, 3))
+
+
+def prune():
+    """Remove cached passports of garments that no longer exist"""
+    root = cache_root()
+    if not os.path.isdir(root):
+        return 0
+    removed = 0
+    for shard in os.listdir(root):
+        directory = os.path.join(root, shard)
+        ids = [int(name) for name in os.listdir(directory) if name.isdigit()]
+        existing = set()
+        for start in range(0, len(ids), IN_CHUNK_SIZE):
+            existing.update(db.session.execute(
+                select(Garment.id).where(Garment.id.in_(ids[start:start + IN_CHUNK_SIZE]))
+            ).scalars())
+        for garment_id in ids:
+            if garment_id not in existing:
+                shutil.rmtree(os.path.join(directory, str(garment_id)), ignore_errors=True)
+                removed += 1
+    db.session.rollback()
+    return removed
+
+
+@click.command('render-passports')
+@click.option('--workers', type=int, help='Rendering processes (default PASSPORT_WORKERS or one per CPU)')
+@click.option('--chunk-size', default=500, show_default=True, help='Garments per worker task')
+@click.option('--force', is_flag=True, help='Render cached passports again')
+@click.option('--prune', 'prune_deleted', is_flag=True, help='Also remove the passports of deleted garments')
+@with_appcontext
+def render_passports_command(workers, chunk_size, force, prune_deleted):
+    """Pre-render the garment passports that aren't cached yet"""
+    result = render_passports(workers=workers, chunk_size=chunk_size, force=force)
+    print(f"✅ {result['rendered']} of {result['checked']} passports rendered in {result['seconds']}s "
+          f"on {result['workers']} workers")
+    if prune_deleted:
+        print(f"✅ {prune()} passports of deleted garments removed")
+
+
+COMMANDS = (render_passports_command,)
@@ -0,0 +1,178 @@
+"""Chunked bulk delete of orders
+
+Matching rows are deleted in id order, ``chunk_size`` at a time. Each chunk is
+its own short BEGIN IMMEDIATE transaction: it reads the chunk's per-status
+counts, deletes the rows and adjusts the DashboardStats counters. Other
+writers and the dashboard only ever wait for one chunk, never for the whole
+delete. Optionally the freed pages are returned to the filesystem afterwards
+with VACUUM, or with ``PRAGMA incremental_vacuum`` on databases created with
+``auto_vacuum=INCREMENTAL``.
+"""
+import time
+from datetime import datetime
+
+from sqlalchemy import delete, func, select
+
+from app import db
+from models.dashboard import DashboardStats, SUMMARY_ID
+from models.orders import Order
+from services import change_feed, dimensions, rollups, stats as stats_engine, status_history
+from services.database import begin_immediate, is_file_sqlite
+from services.summary import apply_delta, order_status_column
+
+DEFAULT_CHUNK_SIZE = 1000
+RECLAIM_MODES = ('vacuum', 'incremental')
+# Pages freed per PRAGMA incremental_vacuum step
+INCREMENTAL_STEP_PAGES = 1000
+
+
+def parse_filters(data):
+    """Validate the status/facility/created_before/created_after filters"""
+    filters = {}
+    status = data.get('status')
+    if status:
+        if status not in Order.STATUSES:
+            raise ValueError(f"status must be one of {', '.join(Order.STATUSES)}")
+        filters['status'] = status
+    if data.get('facility'):
+        filters['facility'] = str(data['facility'])
+    for name in ('created_before', 'created_after'):
+        if data.get(name):
+            try:
+                filters[name] = datetime.fromisoformat(str(data[name])).isoformat()
+            except ValueError:
+                raise ValueError(f'{name} must be an ISO date or datetime')
+    return filters
+
+
+def filter_clauses(filters):
+    table = Order.__table__
+    clauses = []
+    if 'status' in filters:
+        clauses.append(table.c.status == filters['status'])
+    if 'facility' in filters:
+        clauses.append(dimensions.match_clause(Order, 'facility', [filters['facility']]))
+    if 'created_before' in filters:
+        clauses.append(table.c.created_date < datetime.fromisoformat(filters['created_before']))
+    if 'created_after' in filters:
+        clauses.append(table.c.created_date >= datetime.fromisoformat(filters['created_after']))
+    return clauses
+
+
+def count_matching(connection, filters):
+    """Rows a delete will remove; O(1) from the summary row when unfiltered"""
+    table = Order.__table__
+    if not filters:
+        total = connection.execute(
+            select(DashboardStats.total_orders).where(DashboardStats.id == SUMMARY_ID)
+        ).scalar()
+        if total is not None:
+            return total
+    return connection.execute(select(func.count()).select_from(table).where(*filter_clauses(filters))).scalar()
+
+
+def _delete_chunk(after_id, chunk_size, clauses):
+    """Delete the next chunk in one transaction; returns (last id, rows deleted)"""
+    table = Order.__table__
+    try:
+        with begin_immediate():
+            connection = db.session.connection()
+        ids = connection.execute(
+            select(table.c.id).where(table.c.id > after_id, *clauses).order_by(table.c.id).limit(chunk_size)
+        ).scalars().all()
+        if not ids:
+            db.session.commit()
+            return None, 0
+
+        window = [table.c.id > after_id, table.c.id <= ids[-1], *clauses]
+        deltas = {'total_orders': 0, 'order_quantity': 0}
+        for status, count, quantity in connection.execute(
+            select(table.c.status, func.count(), func.coalesce(func.sum(table.c.quantity), 0))
+            .where(*window).group_by(table.c.status)
+        ):
+            deltas['total_orders'] -= count
+            deltas['order_quantity'] -= quantity
+            column = order_status_column(status)
+            if column:
+                deltas[column] = -count
+
+        rollups.apply(connection, Order, window, sign=-1)
+        status_history.record_deleted(connection, window)
+        deleted = connection.execute(delete(table).where(*window)).rowcount
+        apply_delta(connection, deltas)
+        stats_engine.mark_dirty(db.session, Order)
+        change_feed.record(db.session, 'orders', deleted=ids)
+        db.session.commit()
+        return ids[-1], deleted
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def reclaim_space(mode):
+    """Return free pages to the filesystem; returns page counts before/after"""
+    if not is_file_sqlite(db.engine.url):
+        return {'mode': mode, 'skipped': 'not a file-backed SQLite database'}
+
+    # Raw DB-API connection in autocommit mode: VACUUM can't run in a transaction
+    raw = db.engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        before = cursor.execute('PRAGMA freelist_count').fetchone()[0]
+        result = {'mode': mode, 'free_pages_before': before}
+        if mode == 'vacuum':
+            cursor.execute('VACUUM')
+        elif cursor.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+            remaining = before
+            while remaining:
+                cursor.execute(f'PRAGMA incremental_vacuum({INCREMENTAL_STEP_PAGES})').fetchall()
+                now = cursor.execute('PRAGMA freelist_count').fetchone()[0]
+                if now >= remaining:
+                    break
+                remaining = now
+        else:
+            result['skipped'] = 'auto_vacuum is not INCREMENTAL; use reclaim=vacuum'
+        result['free_pages_after'] = cursor.execute('PRAGMA freelist_count').fetchone()[0]
+        cursor.close()
+        return result
+    finally:
+        raw.close()
+
+
+def delete_orders(job=None, chunk_size=DEFAULT_CHUNK_SIZE, reclaim=None, pause_ms=0, **filters):
+    """Delete the orders matching `filters` chunk by chunk
+
+    Runs standalone or as a background job (services/jobs.py); with a job it
+    reports progress after every chunk and stops when cancellation is asked.
+    """
+    clauses = filter_clauses(filters)
+    started = time.perf_counter()
+    total = count_matching(db.session.connection(), filters)
+    db.session.commit()
+
+    progress = {'total': total, 'deleted': 0, 'chunks': 0, 'phase': 'deleting'}
+    if job is not None:
+        job.update(**progress)
+
+    last_id = 0
+    while not (job is not None and job.cancel_requested):
+        last_id, deleted = _delete_chunk(last_id, chunk_size, clauses)
+        if last_id is None:
+            break
+        progress['deleted'] += deleted
+        progress['chunks'] += 1
+        if job is not None:
+            job.update(**progress)
+        if pause_ms:
+            # Leave a gap for other writers between chunks
+            time.sleep(pause_ms / 1000)
+
+    result = dict(progress, phase='done', filters=filters)
+    if reclaim and not (job is not None and job.cancel_requested):
+        if job is not None:
+            job.update(phase='reclaiming')
+        result['reclaim'] = reclaim_space(reclaim)
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    if job is not None:
+        job.update(phase='done')
+    return result
@@ -0,0 +1,157 @@
+"""EXPLAIN QUERY PLAN regression checks for the blueprint queries
+
+Every endpoint in ``CHECKED_ENDPOINTS`` is requested through the Flask test
+client while the SQL it runs is captured. Each captured SELECT against a
+checked table is then re-run as ``EXPLAIN QUERY PLAN`` with the same
+parameters. Plans that scan a table without an index, or sort through a
+temporary B-tree, are reported as problems, and so are endpoints that don't
+answer 200 (their queries may not all have run).
+"""
+import re
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import event
+
+from app import db
+
+CHECKED_TABLES = ('garments', 'orders')
+
+# Endpoints whose queries must be index backed; {cursor} is filled in from
+# the first page of the matching listing
+CHECKED_ENDPOINTS = [
+    '/',
+    '/api/stats',
+    '/garment/',
+    '/garment/api/stats',
+    '/garment/api/garments',
+    '/garment/api/garments?limit=20',
+    '/garment/api/garments?limit=20&cursor={garments_cursor}',
+    '/garment/api/garments?format=ndjson&fields=id,po_number',
+    '/garment/api/garments/1',
+    '/garment/api/garments/search?q=cotton',
+    '/garment/api/garments/search?q=cot tur&country=Turkey',
+    '/orders/',
+    '/orders/api/orders',
+    '/orders/api/orders?limit=20',
+    '/orders/api/orders?limit=20&cursor={orders_cursor}',
+    '/orders/api/orders?status=pending&limit=20',
+    '/orders/api/orders?status=pending&limit=20&cursor={orders_cursor}',
+    '/orders/api/orders/1',
+    '/orders/api/orders/search?q=cotton',
+    '/orders/api/orders/search?q=style&status=pending&page=2',
+]
+
+_FULL_SCAN = re.compile(r'^SCAN (\w+)(?! USING (?:COVERING )?INDEX)(?! USING INTEGER PRIMARY KEY)')
+_TEMP_SORT = re.compile(r'USE TEMP B-TREE FOR (?:ORDER BY|RIGHT PART OF ORDER BY)')
+
+
+def explain(connection, statement, parameters=()):
+    """Return the EXPLAIN QUERY PLAN detail lines for a SQL statement"""
+    cursor = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)
+    return [row[-1] for row in cursor]
+
+
+def plan_problems(plan):
+    """Full table scans and temporary sorts of the checked tables in a plan"""
+    problems = []
+    for line in plan:
+        scan = _FULL_SCAN.match(line)
+        if scan and scan.group(1) in CHECKED_TABLES:
+            problems.append(line)
+        elif _TEMP_SORT.search(line):
+            problems.append(line)
+    return problems
+
+
+def capture_queries(app, urls, statuses=None):
+    """Request each URL and collect the (url, sql, parameters) it executed
+
+    The response status of each URL is stored in `statuses` if given.
+    """
+    captured = []
+    current = {'url': None}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith('SELECT'):
+            captured.append((current['url'], statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+    # Cached renders would hide the queries behind them
+    render_cache = app.extensions.pop('dpp_render_cache', None)
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        client = app.test_client()
+        for url in urls:
+            current['url'] = url
+            response = client.get(url)
+            # Drain streamed responses so their queries run too
+            response.get_data()
+            if statuses is not None:
+                statuses[url] = response.status_code
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+        if render_cache is not None:
+            app.extensions['dpp_render_cache'] = render_cache
+    return captured
+
+
+def _first_cursor(client, url):
+    response = client.get(url)
+    data = response.get_json(silent=True) or {}
+    return data.get('next_cursor') or ''
+
+
+def check_query_plans(app):
+    """Explain every checked endpoint query; returns a list of failures"""
+    client = app.test_client()
+    cursors = {
+        'garments_cursor': _first_cursor(client, '/garment/api/garments?limit=1'),
+        'orders_cursor': _first_cursor(client, '/orders/api/orders?limit=1')
+    }
+    urls = [url.format(**cursors) for url in CHECKED_ENDPOINTS]
+
+    failures = []
+    seen = set()
+    statuses = {}
+    with app.app_context():
+        with db.engine.connect() as connection:
+            for url, statement, parameters in capture_queries(app, urls, statuses):
+                if not any(re.search(rf'\b{table}\b', statement) for table in CHECKED_TABLES):
+                    continue
+                if statement in seen:
+                    continue
+                seen.add(statement)
+
+                plan = explain(connection, statement, parameters)
+                problems = plan_problems(plan)
+                if problems:
+                    failures.append({
+                        'url': url,
+                        'sql': ' '.join(statement.split()),
+                        'plan': plan,
+                        'problems': problems
+                    })
+    for url, status in statuses.items():
+        if status != 200:
+            failures.append({'url': url, 'sql': '', 'plan': [], 'problems': [f'HTTP {status}']})
+    return failures
+
+
+@click.command('check-query-plans')
+@with_appcontext
+def check_query_plans_command():
+    """Fail if any blueprint query scans garments/orders without an index"""
+    failures = check_query_plans(current_app._get_current_object())
+    for failure in failures:
+        print(f"❌ {failure['url']}: {failure['sql'][:120] or ', '.join(failure['problems'])}")
+        for line in failure['plan']:
+            print(f"     {line}")
+    if failures:
+        raise SystemExit(1)
+    print("✅ All blueprint queries are index backed")
+
+
+COMMANDS = (check_query_plans_command,)
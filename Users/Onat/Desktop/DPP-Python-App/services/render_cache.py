@@ -0,0 +1,267 @@
+"""Rendered page cache with ETag/Last-Modified validation
+
+Each table has a data version in the cache backend. A commit that wrote to
+the table replaces the version with a new token (commit time plus a random
+suffix). A page decorated with ``cached_page(*tables)`` derives its ETag from
+the versions of the tables it reads, and its Last-Modified from the newest of
+them (a version is dated when it is made, so Last-Modified only moves
+forward; it is left out while the newest version is from the current
+second), so:
+
+* a client sending a matching If-None-Match / If-Modified-Since gets a 304
+  without the view running or the database being queried;
+* other clients get the stored render for that ETag if there is one;
+* otherwise the view runs and its response is stored.
+
+Backends: ``lru`` keeps everything in this process (with several worker
+processes each one only sees its own writes until RENDER_CACHE_TTL expires),
+``redis`` shares versions and renders between workers (needs the ``redis``
+package), and ``package.module:Class`` plugs in any class with the
+``LRUBackend`` methods. ``none`` disables caching.
+"""
+import hashlib
+import importlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import Response, current_app, has_app_context, request, session as flask_session
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from services.database import commit_state, discard_commit_state, pop_commit_state
+
+DEFAULT_SIZE = 256
+DEFAULT_TTL = 300  # seconds
+
+
+class LRUBackend:
+    """Thread safe in-process LRU with per-entry expiry"""
+
+    def __init__(self, size=DEFAULT_SIZE, ttl=DEFAULT_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def add(self, key, value):
+        """Set key only if it has no live value; returns the value now stored"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+        self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisBackend:
+    """Shared backend on a Redis server; values are pickled"""
+
+    def __init__(self, url, ttl=DEFAULT_TTL, prefix='dpp:render:'):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError('RENDER_CACHE_BACKEND=redis needs the redis package (pip install redis)') from e
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return pickle.loads(value) if value is not None else None
+
+    def get_many(self, keys):
+        values = self.client.mget([self.prefix + key for key in keys])
+        return [pickle.loads(value) if value is not None else None for value in values]
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=self.ttl)
+
+    def add(self, key, value):
+        if self.client.set(self.prefix + key, pickle.dumps(value), ex=self.ttl, nx=True):
+            return value
+        return self.get(key) or value
+
+    def clear(self):
+        for key in self.client.scan_iter(f'{self.prefix}*'):
+            self.client.delete(key)
+
+
+def create_backend(config):
+    """Build the backend named by RENDER_CACHE_BACKEND"""
+    name = config.get('RENDER_CACHE_BACKEND', 'lru')
+    ttl = config.get('RENDER_CACHE_TTL', DEFAULT_TTL)
+    if not name or name == 'none':
+        return None
+    if name == 'lru':
+        return LRUBackend(size=config.get('RENDER_CACHE_SIZE', DEFAULT_SIZE), ttl=ttl)
+    if name == 'redis':
+        return RedisBackend(config['RENDER_CACHE_URL'], ttl=ttl)
+    module_name, _, class_name = name.partition(':')
+    backend_class = getattr(importlib.import_module(module_name), class_name)
+    return backend_class(config)
+
+
+def init_render_cache(app):
+    """Attach the configured render cache backend to the app"""
+    backend = create_backend(app.config)
+    if backend is not None:
+        app.extensions['dpp_render_cache'] = backend
+    return backend
+
+
+def get_backend():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('dpp_render_cache')
+
+
+# Data versions
+
+def _new_version():
+    return f'{time.time():.6f}-{os.urandom(4).hex()}'
+
+
+def _version_time(version):
+    return float(version.split('-', 1)[0])
+
+
+def data_versions(tables, backend=None):
+    """Current version token of each table, starting missing ones now
+
+    A missing version (first use, restart, eviction) is dated now rather
+    than from the table's rows: Last-Modified must never go backwards, and
+    max(updated_date) does after the newest rows are deleted.
+    """
+    backend = backend or get_backend()
+    keys = [f'version:{table}' for table in tables]
+    versions = backend.get_many(keys)
+    for index, version in enumerate(versions):
+        if version is None:
+            versions[index] = backend.add(keys[index], _new_version())
+    return versions
+
+
+def bump_versions(tables, backend=None):
+    backend = backend or get_backend()
+    if backend is None:
+        return
+    version = _new_version()
+    for table in tables:
+        backend.set(f'version:{table}', version)
+
+
+def mark_changed(session, *tables):
+    """Bump the tables' data versions when the session commits"""
+    if tables:
+        commit_state(session, 'render_dirty', set).update(tables)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_flushed(session, flush_context):
+    tables = {
+        obj.__table__.name
+        for obj in (*session.new, *session.dirty, *session.deleted)
+        if hasattr(obj, '__table__')
+    }
+    mark_changed(session, *tables)
+
+
+def _collect_bulk(context):
+    if context.mapper is not None:
+        mark_changed(context.session, context.mapper.local_table.name)
+
+
+event.listen(Session, 'after_bulk_update', _collect_bulk)
+event.listen(Session, 'after_bulk_delete', _collect_bulk)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_on_commit(session):
+    dirty = set().union(*pop_commit_state(session, 'render_dirty'))
+    if dirty:
+        bump_versions(sorted(dirty))
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_on_rollback(session, previous_transaction):
+    discard_commit_state(session, 'render_dirty', previous_transaction)
+
+
+# Page decorator
+
+def _page_validators(tables, backend):
+    versions = data_versions(tables, backend)
+    args = sorted(request.args.items(multi=True))
+    digest = hashlib.sha1(repr((request.endpoint, args, versions)).encode()).hexdigest()
+    newest = int(max(map(_version_time, versions)))
+    # HTTP dates are whole seconds: a version made in the current second may
+    # be followed by another in the same second, so it gets no Last-Modified
+    modified = datetime.fromtimestamp(newest, timezone.utc) if newest < int(time.time()) else None
+    return digest, modified
+
+
+def cached_page(*tables):
+    """Cache a GET view's rendered response until one of `tables` changes"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            backend = get_backend()
+            # Pending flash messages are per user and consumed by the render
+            if backend is None or request.method != 'GET' or '_flashes' in flask_session:
+                return view(*args, **kwargs)
+
+            etag, modified = _page_validators(tables, backend)
+
+            def conditional(response):
+                response.set_etag(etag)
+                if modified is not None:
+                    response.last_modified = modified
+                response.cache_control.no_cache = True
+                return response.make_conditional(request)
+
+            probe = conditional(Response(status=200))
+            if probe.status_code == 304:
+                return probe
+
+            cached = backend.get(f'page:{etag}')
+            if cached is not None:
+                body, mimetype = cached
+                return conditional(Response(body, mimetype=mimetype))
+
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                backend.set(f'page:{etag}', (response.get_data(), response.mimetype))
+                return conditional(response)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,435 @@
+"""Time-bucketed rollups of orders and garments
+
+``order_rollups`` and ``garment_rollups`` hold counts and sums per
+created-date bucket (hour, day and month) and per combination of the
+dimension columns, so trend and breakdown queries read a few hundred
+pre-aggregated rows instead of grouping the raw tables.
+
+Rollups are adjusted in the writer's transaction by ``apply()``: it groups
+the rows matching a clause by hour and dimensions in one pass, derives the
+day buckets from the hours and the months from the days and upserts all with
+``count = count + excluded.count``. A write is counted out with sign=-1
+before it changes rows and back in with sign=+1 afterwards:
+
+* ORM writes, by the mapper hooks below (per row),
+* batch and import writes, around their whole write,
+* bulk generate (``RollupDeltas``, from the inserted columns), purge (each
+  deleted chunk) and carbon rescoring (each changed chunk).
+
+Query.update()/Query.delete() don't expose their rows and rebuild the
+rollups of their model instead. ``rebuild()`` (``flask rebuild-rollups``)
+backfills everything from the raw tables. Buckets whose rows all moved
+elsewhere keep zero counts until the next rebuild; queries skip them.
+"""
+import time
+from collections import Counter
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import delete, event, func, literal, select, true, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app import db
+from models.garment import Garment
+from models.orders import Order
+from models.rollups import GRAINS, GarmentRollup, OrderRollup
+from services import dimensions
+
+# SQLite buckets use the text format SQLAlchemy stores DateTime values in, so
+# they compare equal to bound datetime parameters
+SQLITE_BUCKET_FORMATS = {
+    'hour': '%Y-%m-%d %H:00:00.000000',
+    'day': '%Y-%m-%d 00:00:00.000000',
+    'month': '%Y-%m-01 00:00:00.000000'
+}
+DEFAULT_LIMIT = 5000
+MAX_LIMIT = 50000
+
+
+class RollupSpec:
+    """Which rollup a model feeds and how its columns map onto it"""
+
+    def __init__(self, kind, model, rollup, dimensions, metrics):
+        self.kind = kind
+        self.model = model
+        self.rollup = rollup
+        # rollup column -> source field name
+        self.dimensions = dimensions
+        # rollup column -> source column summed, or None for the row count
+        self.metrics = metrics
+
+    @property
+    def source(self):
+        return self.model.__table__
+
+    @property
+    def table(self):
+        return self.rollup.__table__
+
+
+SPECS = {
+    'orders': RollupSpec(
+        'orders', Order, OrderRollup,
+        dimensions={'country': 'country', 'facility': 'facility', 'product_type': 'product_type',
+                    'status': 'status'},
+        metrics={'orders': None, 'quantity': 'quantity'}
+    ),
+    'garments': RollupSpec(
+        'garments', Garment, GarmentRollup,
+        dimensions={'country': 'country', 'facility': 'production_facility', 'product_type': 'product_type'},
+        metrics={'garments': None, 'quantity': 'quantity', 'carbon': 'carbon_footprint'}
+    )
+}
+SPECS_BY_MODEL = {spec.model: spec for spec in SPECS.values()}
+
+
+def bucket_expression(dialect_name, grain, column):
+    """SQL expression truncating `column` to the start of its `grain` bucket"""
+    if dialect_name == 'sqlite':
+        return func.strftime(SQLITE_BUCKET_FORMATS[grain], column)
+    if dialect_name == 'postgresql':
+        return func.date_trunc(grain, column)
+    raise RuntimeError(f'Rollups are not supported on {dialect_name}')
+
+
+def _aggregate(source, column):
+    if column is None:
+        return func.count()
+    return func.coalesce(func.sum(source.c[column]), 0)
+
+
+def _upsert(connection, spec, source_select=None):
+    """Upsert adding to the stored metrics, from `source_select` or from executemany parameters"""
+    dialect = {'sqlite': sqlite, 'postgresql': postgresql}[connection.dialect.name]
+    table = spec.table
+    keys = ['grain', 'bucket', *spec.dimensions]
+    statement = dialect.insert(table)
+    if source_select is not None:
+        statement = statement.from_select(keys + list(spec.metrics), source_select)
+    return statement.on_conflict_do_update(
+        index_elements=keys,
+        set_={name: table.c[name] + statement.excluded[name] for name in spec.metrics}
+    )
+
+
+def _grouping_column(spec, name, field):
+    """What the CTEs group by: the key column for interned fields, else the text"""
+    keyed = dimensions.fields(spec.model).get(field)
+    if keyed is not None:
+        return spec.source.c[dimensions.DIMENSIONS[keyed.dimension].key_column].label(name)
+    return func.coalesce(spec.source.c[field], '').label(name)
+
+
+def _named(spec, buckets):
+    """SELECT of the grouped buckets with interned keys joined to their names"""
+    source = buckets
+    columns = [buckets.c.grain, buckets.c.bucket]
+    model_fields = dimensions.fields(spec.model)
+    for name, field in spec.dimensions.items():
+        if field not in model_fields:
+            columns.append(buckets.c[name])
+            continue
+        table = dimensions.DIMENSIONS[model_fields[field].dimension].table
+        source = source.outerjoin(table, table.c.id == buckets.c[name])
+        columns.append(func.coalesce(table.c[model_fields[field].part], ''))
+    columns += [buckets.c[name] for name in spec.metrics]
+    # WHERE true: SQLite would read "FROM t ON CONFLICT" as a join constraint
+    return select(*columns).select_from(source).where(true())
+
+
+def apply(connection, model, clauses=(), sign=1):
+    """Add (sign=1) or subtract (sign=-1) the rows of `model` matching `clauses`
+
+    Countries and facilities are grouped by their integer keys and turned into
+    names once per output row.
+    """
+    spec = SPECS_BY_MODEL[model]
+    source = spec.source
+    dialect_name = connection.dialect.name
+
+    hour = bucket_expression(dialect_name, 'hour', source.c.created_date)
+    keys = [_grouping_column(spec, name, field) for name, field in spec.dimensions.items()]
+    level = (
+        select(
+            hour.label('bucket'),
+            *keys,
+            *((_aggregate(source, column) * sign).label(name) for name, column in spec.metrics.items())
+        )
+        .where(source.c.created_date.isnot(None), *clauses)
+        .group_by(hour, *keys)
+        .cte('hour_buckets')
+        # Each grain is grouped from the materialized one before it, so the
+        # source rows are only read and sorted once
+        .prefix_with('MATERIALIZED')
+    )
+
+    parts = [select(literal(GRAINS[0]).label('grain'), *level.c)]
+    for grain in GRAINS[1:]:
+        bucket = bucket_expression(dialect_name, grain, level.c.bucket)
+        grouped = [level.c[name] for name in spec.dimensions]
+        level = (
+            select(bucket.label('bucket'), *grouped, *(func.sum(level.c[name]).label(name) for name in spec.metrics))
+            .group_by(bucket, *grouped)
+            .cte(f'{grain}_buckets')
+            .prefix_with('MATERIALIZED')
+        )
+        parts.append(select(literal(grain), *level.c))
+    buckets = union_all(*parts).cte('buckets')
+    connection.execute(_upsert(connection, spec, _named(spec, buckets)))
+
+
+class RollupDeltas:
+    """Rollup rows accumulated from inserted column lists (bulk generate)
+
+    Same result as apply() over the inserted rows without reading them back:
+    rows are grouped by their exact created_date and dimension keys in a hash
+    table, then the groups are truncated to hours, days and months. Bulk
+    columns share a handful of timestamps, so this is far cheaper than
+    sorting the new rows in SQL.
+    """
+
+    def __init__(self, model):
+        self.spec = SPECS_BY_MODEL[model]
+        model_fields = dimensions.fields(model)
+        # Column holding each dimension in the inserted columns: the key column for interned fields
+        self.sources = {
+            name: (dimensions.DIMENSIONS[model_fields[field].dimension].key_column if field in model_fields else field)
+            for name, field in self.spec.dimensions.items()
+        }
+        # (created_date, *dimension values) -> [metric, ...]
+        self.groups = {}
+
+    def add(self, columns):
+        """Count in one chunk of inserted columns (after dimensions.encode_columns())"""
+        count = len(columns['created_date'])
+        groups = list(zip(columns['created_date'], *(columns.get(source, [None] * count)
+                                                    for source in self.sources.values())))
+        counts = Counter(groups)
+        totals = [counts if column is None else self._sums(groups, columns.get(column, ()))
+                  for column in self.spec.metrics.values()]
+        for group in counts:
+            row = self.groups.get(group)
+            if row is None:
+                row = self.groups[group] = [0] * len(totals)
+            for index, metric in enumerate(totals):
+                row[index] += metric.get(group, 0)
+
+    @staticmethod
+    def _sums(groups, values):
+        sums = Counter()
+        for group, value in zip(groups, values):
+            if value:
+                sums[group] += value
+        return sums
+
+    def _names(self, connection):
+        """{dimension: {key: name}} for the interned dimensions of the collected groups"""
+        model_fields = dimensions.fields(self.spec.model)
+        names = {}
+        for position, (name, field) in enumerate(self.spec.dimensions.items(), 1):
+            if field not in model_fields:
+                continue
+            dimension = model_fields[field].dimension
+            part = dimensions.DIMENSIONS[dimension].parts.index(model_fields[field].part)
+            ids = list({group[position] for group in self.groups if group[position] is not None})
+            keys = dimensions.keys_for(dimension, ids, connection)
+            names[name] = {row_id: key[part] for row_id, key in keys.items()}
+        return names
+
+    def apply(self, connection):
+        """Upsert the collected rows into the rollup table"""
+        if not self.groups:
+            return
+        names = self._names(connection)
+        rows = {}
+        for group, metrics in self.groups.items():
+            created, values = group[0], group[1:]
+            if created is None:
+                continue
+            labels = tuple(
+                names[name].get(value, '') if name in names else ('' if value is None else value)
+                for name, value in zip(self.spec.dimensions, values)
+            )
+            hour = created.replace(minute=0, second=0, microsecond=0)
+            day = hour.replace(hour=0)
+            for bucket in (('hour', hour), ('day', day), ('month', day.replace(day=1))):
+                row = rows.get(bucket + labels)
+                if row is None:
+                    row = rows[bucket + labels] = [0] * len(metrics)
+                for index, value in enumerate(metrics):
+                    row[index] += value
+        keys = ['grain', 'bucket', *self.spec.dimensions]
+        connection.execute(_upsert(connection, self.spec), [
+            dict(zip(keys, group), **dict(zip(self.spec.metrics, metrics))) for group, metrics in rows.items()
+        ])
+        self.groups = {}
+
+
+def rebuild(connection=None, models=None):
+    """Recompute the rollups of `models` (default: all) from the raw tables"""
+    connection = connection or db.session.connection()
+    counts = {}
+    for spec in SPECS.values():
+        if models is not None and spec.model not in models:
+            continue
+        connection.execute(delete(spec.table))
+        apply(connection, spec.model)
+        counts[spec.kind] = connection.execute(select(func.count()).select_from(spec.table)).scalar()
+    return counts
+
+
+# Queries
+
+def _parse_datetime(name, value):
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        raise ValueError(f'{name} must be an ISO date or datetime')
+
+
+def parse_query(kind, args):
+    """Validate the grain/start/end/by/series/limit and dimension filter arguments"""
+    if kind not in SPECS:
+        raise ValueError(f"kind must be one of {', '.join(SPECS)}")
+    spec = SPECS[kind]
+
+    grain = args.get('grain', 'day')
+    if grain not in GRAINS:
+        raise ValueError(f"grain must be one of {', '.join(GRAINS)}")
+
+    by = [name for name in (args.get('by') or '').split(',') if name]
+    unknown = [name for name in by if name not in spec.dimensions]
+    if unknown:
+        raise ValueError(f"by must be among {', '.join(spec.dimensions)}")
+
+    filters = {}
+    for name in spec.dimensions:
+        if args.get(name):
+            filters[name] = [value for value in str(args[name]).split(',') if value]
+
+    limit = args.get('limit', DEFAULT_LIMIT)
+    try:
+        limit = min(max(int(limit), 1), MAX_LIMIT)
+    except (TypeError, ValueError):
+        raise ValueError('limit must be an integer')
+
+    return {
+        'kind': kind,
+        'grain': grain,
+        'start': _parse_datetime('start', args['start']) if args.get('start') else None,
+        'end': _parse_datetime('end', args['end']) if args.get('end') else None,
+        'by': by,
+        'filters': filters,
+        'series': str(args.get('series', '1')).lower() not in ('0', 'false', 'no'),
+        'limit': limit
+    }
+
+
+def query(kind, grain='day', start=None, end=None, by=(), filters=None, series=True, limit=DEFAULT_LIMIT):
+    """Metrics per bucket (series=True) and per `by` dimension, from the rollups
+
+    Buckets are selected by their start time: start <= bucket < end.
+    """
+    spec = SPECS[kind]
+    table = spec.table
+    started = time.perf_counter()
+
+    keys = ([table.c.bucket] if series else []) + [table.c[name] for name in by]
+    first_metric = next(iter(spec.metrics))
+    statement = (
+        select(*keys, *(func.sum(table.c[name]).label(name) for name in spec.metrics))
+        .where(table.c.grain == grain)
+        .group_by(*keys)
+        .having(func.sum(table.c[first_metric]) != 0)
+        .order_by(*keys)
+        .limit(limit)
+    )
+    if start is not None:
+        statement = statement.where(table.c.bucket >= start)
+    if end is not None:
+        statement = statement.where(table.c.bucket < end)
+    for name, values in (filters or {}).items():
+        statement = statement.where(table.c[name].in_(values))
+
+    rows = []
+    totals = dict.fromkeys(spec.metrics, 0)
+    for row in db.session.execute(statement):
+        item = dict(row._mapping)
+        if series:
+            item['bucket'] = item['bucket'].isoformat()
+        if 'carbon' in item:
+            item['carbon'] = round(item['carbon'], 3)
+        for name in spec.metrics:
+            totals[name] += item[name]
+        rows.append(item)
+    if 'carbon' in totals:
+        totals['carbon'] = round(totals['carbon'], 3)
+
+    return {
+        'kind': kind,
+        'grain': grain,
+        'metrics': list(spec.metrics),
+        'rows': rows,
+        'totals': totals,
+        'truncated': len(rows) == limit,
+        'seconds': round(time.perf_counter() - started, 4)
+    }
+
+
+def query_response(kind):
+    """Handle GET /api/analytics/<kind>"""
+    from flask import request, jsonify
+
+    try:
+        params = parse_query(kind, request.args)
+        params.pop('kind')
+        result = query(kind, **params)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid analytics request: {str(e)}'
+        }), 400
+    return jsonify({'success': True, **result})
+
+
+# ORM hooks: count the row out before it changes and back in afterwards
+
+def _row_added(mapper, connection, target):
+    apply(connection, mapper.class_, [mapper.local_table.c.id == target.id])
+
+
+def _row_removed(mapper, connection, target):
+    apply(connection, mapper.class_, [mapper.local_table.c.id == target.id], sign=-1)
+
+
+def _bulk_write(context):
+    """Query.update()/Query.delete() don't expose their rows; rebuild instead"""
+    model = context.mapper.class_ if context.mapper else None
+    if model in SPECS_BY_MODEL:
+        rebuild(context.session.connection(), [model])
+
+
+for _model in SPECS_BY_MODEL:
+    event.listen(_model, 'after_insert', _row_added)
+    event.listen(_model, 'before_update', _row_removed)
+    event.listen(_model, 'after_update', _row_added)
+    event.listen(_model, 'before_delete', _row_removed)
+
+event.listen(Session, 'after_bulk_update', _bulk_write)
+event.listen(Session, 'after_bulk_delete', _bulk_write)
+
+
+@click.command('rebuild-rollups')
+@with_appcontext
+def rebuild_rollups_command():
+    """Backfill the order/garment rollup tables from the raw tables"""
+    started = time.perf_counter()
+    counts = rebuild()
+    db.session.commit()
+    print(f"✅ Rollups rebuilt in {round(time.perf_counter() - started, 2)}s: "
+          f"{counts['orders']} order rows, {counts['garments']} garment rows")
+
+
+COMMANDS = (rebuild_rollups_command,)
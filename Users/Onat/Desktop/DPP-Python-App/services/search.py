@@ -0,0 +1,504 @@
+"""Full-text and faceted search over garments and orders
+
+On SQLite every searchable table has an FTS5 index (``garments_fts``,
+``orders_fts``) over its text columns. The indexes are external-content
+tables: they store only the inverted index and read column values by rowid
+from a view of the base table (``garments_search``, ``orders_search``) that
+looks the facility and fabric values up in the dimension tables. Triggers on
+the base table keep them in sync for every writer (ORM, batch, import and
+purge alike); the update trigger only fires for updates that set an indexed
+column, so status changes and carbon rescoring never touch the index.
+``install()`` (migration 0004_search_index) creates the index and triggers
+and fills the index from the existing rows; ``flask rebuild-search-index``
+refills it.
+
+Bulk generate doesn't index its rows: it records the loaded id range in the
+``search_backlog`` table and queues a ``search.catch_up`` job, which indexes
+each range with one INSERT ... SELECT (tokenizing is most of a load's cost).
+The triggers skip rows inside a queued range, so updates and deletes of rows
+the index has not seen yet don't touch it, and catch_up() indexes whatever
+the range holds when it runs. Until then the loaded rows are not found by
+search.
+
+A query is split into words. Every word must appear in some indexed column,
+the last one as a prefix (``premium cot`` finds Premium Cotton orders while
+typing); facet filters (country, product type and, for orders, status)
+narrow the matches further.
+
+One query reads the ids and facet columns of the newest SEARCH_WINDOW
+matches, walking the index newest first so it stops there. The match count
+(``window_total``) and the facet counts are computed from that window, the
+hits are ranked and the requested page is loaded by primary key. A query
+matching more rows than the window ("cotton" matches most of the catalogue)
+is answered from its newest matches and flagged ``exhaustive: false``;
+counting, faceting or scoring every match would cost seconds at millions of
+rows. Pages past the window are empty.
+
+Ranking is by tier, newest first within a tier: rows where every word is in
+an identifier column (PO number, style name) come before rows matched
+through the descriptive columns. The tier comes from a second index lookup
+restricted to the identifier columns and to the window's id range. FTS5's
+bm25 is not used: it reads the full doclist of every word to weigh it
+("po" is in every row), which alone costs tens of milliseconds per query.
+
+Prefix matching the last word also merges the doclists of every indexed word
+it prefixes, unless the prefix is 2 or 3 characters long (those have prefix
+indexes). When the word is complete, the exact-word query already fills the
+window and the prefix query is skipped.
+
+Other databases fall back to case-insensitive substring matching, newest
+first.
+"""
+import re
+import time
+from collections import Counter
+from datetime import datetime
+
+import click
+from flask import current_app, has_app_context
+from flask.cli import with_appcontext
+from sqlalchemy import and_, column, delete, func, insert, or_, select, table, text
+
+from app import db
+from models.garment import Garment
+from models.orders import Order
+from models.search import SearchBacklog
+from services import dimensions
+from services.listing import encoder_for, resolve_fields, selected_columns
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# Matches ranked, counted and faceted per query (newest first)
+DEFAULT_WINDOW = 1000
+MAX_TERMS = 10
+TOKENIZER = 'unicode61 remove_diacritics 2'
+# Prefix indexes for 2 and 3 character prefixes keep short prefix queries fast
+PREFIXES = '2 3'
+# Bytes of new index entries FTS5 buffers before writing a segment: the
+# default, and the size used while catch_up() indexes bulk-loaded rows (fewer,
+# larger segments to merge)
+DEFAULT_HASHSIZE = 1024 * 1024
+LOAD_HASHSIZE = 64 * 1024 * 1024
+
+
+class SearchSpec:
+    """What is indexed for a model and which columns are facets"""
+
+    def __init__(self, kind, model, columns, identifiers, facets):
+        self.kind = kind
+        self.model = model
+        # Indexed text columns, in index column order
+        self.columns = columns
+        # Columns whose matches rank first
+        self.identifiers = identifiers
+        self.facets = facets
+
+    @property
+    def source(self):
+        return self.model.__table__
+
+    @property
+    def index_name(self):
+        return f'{self.source.name}_fts'
+
+    @property
+    def content_name(self):
+        """View the index reads its column values from"""
+        return f'{self.source.name}_search'
+
+    @property
+    def index(self):
+        """The FTS5 table as a selectable (rowid and its hidden MATCH column)"""
+        return table(self.index_name, column('rowid'), column(self.index_name))
+
+
+SPECS = {
+    'garments': SearchSpec(
+        'garments', Garment,
+        columns=['style_name', 'po_number', 'production_facility', 'fabric_name', 'fabric_type', 'product_type'],
+        identifiers=['style_name', 'po_number'],
+        facets=['country', 'product_type']
+    ),
+    'orders': SearchSpec(
+        'orders', Order,
+        columns=['style_name', 'po_number', 'facility', 'fabric_name', 'fabric_type', 'product_type'],
+        identifiers=['style_name', 'po_number'],
+        facets=['country', 'status', 'product_type']
+    )
+}
+
+
+# Index maintenance (SQLite)
+
+def _value_sql(spec, name, row):
+    """SQL for indexed column `name` of trigger row `row` ('new'/'old') or table"""
+    field = dimensions.fields(spec.model).get(name)
+    if field is None:
+        return f'{row}.{name}'
+    dimension = dimensions.DIMENSIONS[field.dimension]
+    return (f"(SELECT nullif({field.part}, '') FROM {dimension.table.name} "
+            f"WHERE id = {row}.{dimension.key_column})")
+
+
+def _content_ddl(spec):
+    values = ', '.join(f'{_value_sql(spec, name, spec.source.name)} AS {name}' for name in spec.columns)
+    return f'CREATE VIEW IF NOT EXISTS {spec.content_name} AS SELECT id, {values} FROM {spec.source.name}'
+
+
+def _trigger_ddl(spec):
+    name = spec.index_name
+    base = spec.source.name
+    columns = ', '.join(spec.columns)
+    new_values = ', '.join(_value_sql(spec, column, 'new') for column in spec.columns)
+    old_values = ', '.join(_value_sql(spec, column, 'old') for column in spec.columns)
+    insert_new = f'INSERT INTO {name} (rowid, {columns}) VALUES (new.id, {new_values});'
+    delete_old = f"INSERT INTO {name} ({name}, rowid, {columns}) VALUES ('delete', old.id, {old_values});"
+    updated = ', '.join(dimensions.stored_columns(spec.model, spec.columns))
+    # Rows of a queued bulk load are indexed by catch_up(), with their values at that time
+    indexed = {
+        row: f"WHEN NOT EXISTS (SELECT 1 FROM {SearchBacklog.__tablename__} "
+             f"WHERE kind = '{spec.kind}' AND {row}.id BETWEEN first_id AND last_id)"
+        for row in ('new', 'old')
+    }
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {name}_insert AFTER INSERT ON {base} {indexed['new']} "
+        f'BEGIN {insert_new} END',
+        f"CREATE TRIGGER IF NOT EXISTS {name}_delete AFTER DELETE ON {base} {indexed['old']} "
+        f'BEGIN {delete_old} END',
+        f"CREATE TRIGGER IF NOT EXISTS {name}_update AFTER UPDATE OF {updated} ON {base} {indexed['old']} "
+        f'BEGIN {delete_old} {insert_new} END'
+    ]
+
+
+def create_triggers(connection, spec):
+    for ddl in _trigger_ddl(spec):
+        connection.execute(text(ddl))
+
+
+def drop_triggers(connection, spec):
+    for suffix in ('insert', 'delete', 'update'):
+        connection.execute(text(f'DROP TRIGGER IF EXISTS {spec.index_name}_{suffix}'))
+
+
+def rebuild(connection=None, kinds=None):
+    """Refill the FTS indexes of `kinds` (default: all) from the base tables"""
+    connection = connection or db.session.connection()
+    if connection.dialect.name != 'sqlite':
+        return {}
+    counts = {}
+    for spec in SPECS.values():
+        if kinds is not None and spec.kind not in kinds:
+            continue
+        connection.execute(text(f"INSERT INTO {spec.index_name} ({spec.index_name}) VALUES ('rebuild')"))
+        connection.execute(delete(SearchBacklog.__table__).where(SearchBacklog.kind == spec.kind))
+        counts[spec.kind] = connection.execute(select(func.count()).select_from(spec.source)).scalar()
+    return counts
+
+
+def install(connection):
+    """Create the FTS indexes and their triggers, then index the existing rows"""
+    if connection.dialect.name != 'sqlite':
+        return
+    SearchBacklog.__table__.create(connection, checkfirst=True)
+    for spec in SPECS.values():
+        connection.execute(text(_content_ddl(spec)))
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {spec.index_name} USING fts5("
+            f"{', '.join(spec.columns)}, content='{spec.content_name}', content_rowid='id', "
+            f"tokenize='{TOKENIZER}', prefix='{PREFIXES}')"
+        ))
+        create_triggers(connection, spec)
+    rebuild(connection)
+
+
+def uninstall(connection):
+    """Drop the FTS indexes, their triggers and content views; True if there were any"""
+    if connection.dialect.name != 'sqlite':
+        return False
+    existing = {row[0] for row in connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+    installed = False
+    for spec in SPECS.values():
+        drop_triggers(connection, spec)
+        if spec.index_name in existing:
+            connection.execute(text(f'DROP TABLE {spec.index_name}'))
+            installed = True
+        connection.execute(text(f'DROP VIEW IF EXISTS {spec.content_name}'))
+    return installed
+
+
+def _set_option(connection, spec, name, value):
+    connection.execute(text(f"INSERT INTO {spec.index_name} ({spec.index_name}, rank) VALUES (:name, :value)"),
+                       {'name': name, 'value': value})
+
+
+def deferred_index(connection, model):
+    """Drop the sync triggers of `model`'s index for a bulk load; returns the spec to restore
+
+    Used by services/bulk.py for every generated load, so the loaded rows
+    don't run a trigger each. The load's write transaction covers both
+    calls: no other writer sees the table without its triggers.
+    """
+    if connection.dialect.name != 'sqlite':
+        return None
+    spec = next((spec for spec in SPECS.values() if spec.model is model), None)
+    if spec is not None:
+        drop_triggers(connection, spec)
+    return spec
+
+
+def restore_index(connection, spec, first_id=None):
+    """Recreate the triggers dropped by deferred_index(); returns the rows left to catch_up()
+
+    Rows with ids from `first_id` on are queued in the search backlog;
+    without it the whole table is reindexed.
+    """
+    if spec is None:
+        return 0
+    create_triggers(connection, spec)
+    if first_id is None:
+        rebuild(connection, [spec.kind])
+        return 0
+    last_id = connection.execute(select(func.max(spec.source.c.id))).scalar()
+    if last_id is None or last_id < first_id:
+        return 0
+    connection.execute(insert(SearchBacklog.__table__).values(
+        kind=spec.kind, first_id=first_id, last_id=last_id, created_date=datetime.utcnow()
+    ))
+    return last_id - first_id + 1
+
+
+def catch_up(connection=None, kinds=None):
+    """Index the queued bulk-loaded rows of `kinds` (default: all); returns rows indexed per kind
+
+    Each range is indexed and dequeued in the caller's transaction, which
+    must hold the write lock (services/database.py begin_immediate()) so no
+    writer changes a queued row in between.
+    """
+    connection = connection or db.session.connection()
+    if connection.dialect.name != 'sqlite':
+        return {}
+    backlog = SearchBacklog.__table__
+    counts = {}
+    for entry in connection.execute(select(backlog).order_by(backlog.c.id)).all():
+        if kinds is not None and entry.kind not in kinds:
+            continue
+        spec = SPECS[entry.kind]
+        columns = ', '.join(spec.columns)
+        _set_option(connection, spec, 'hashsize', LOAD_HASHSIZE)
+        indexed = connection.execute(text(
+            f'INSERT INTO {spec.index_name} (rowid, {columns}) '
+            f'SELECT id, {columns} FROM {spec.content_name} WHERE id BETWEEN :first_id AND :last_id'
+        ), {'first_id': entry.first_id, 'last_id': entry.last_id}).rowcount
+        _set_option(connection, spec, 'hashsize', DEFAULT_HASHSIZE)
+        connection.execute(delete(backlog).where(backlog.c.id == entry.id))
+        counts[entry.kind] = counts.get(entry.kind, 0) + max(indexed, 0)
+    return counts
+
+
+def pending(connection=None):
+    """Rows per kind waiting in the search backlog"""
+    connection = connection or db.session.connection()
+    if connection.dialect.name != 'sqlite':
+        return {}
+    return dict(connection.execute(
+        select(SearchBacklog.kind, func.sum(SearchBacklog.last_id - SearchBacklog.first_id + 1))
+        .group_by(SearchBacklog.kind)
+    ).all())
+
+
+# Queries
+
+def query_terms(q):
+    """Words of a search query, lower-cased (at most MAX_TERMS)"""
+    return re.findall(r'\w+', (q or '').lower())[:MAX_TERMS]
+
+
+def match_expression(terms, prefix=True, columns=None):
+    """FTS5 query requiring every term, the last one as a prefix when `prefix`
+
+    Terms are quoted, so no FTS5 operator syntax leaks in from user input.
+    `columns` restricts the match to those index columns.
+    """
+    words = [f'"{term}"' for term in terms]
+    if prefix:
+        words[-1] += '*'
+    expression = ' '.join(words)
+    if columns:
+        expression = f"{{{' '.join(columns)}}} : ({expression})"
+    return expression
+
+
+def _window_query(spec, condition, filters, window, index=None):
+    """Ids and facet columns of the newest `window` + 1 rows matching `condition`
+
+    Interned facets (country) are read as their keys and decoded by search().
+    """
+    source = spec.source
+    statement = (
+        select(source.c.id, *(source.c[name] for name in dimensions.stored_columns(spec.model, spec.facets)))
+        .where(condition, *(dimensions.match_clause(spec.model, name, values) for name, values in filters.items()))
+        .limit(window + 1)
+    )
+    if index is None:
+        return statement.order_by(source.c.id.desc())
+    # Read newest first straight from the index's doclists, so the scan stops
+    # after the window instead of visiting every match
+    return statement.select_from(index.join(source, source.c.id == index.c.rowid)).order_by(index.c.rowid.desc())
+
+
+def _fts_match(index, spec, expression):
+    return index.c[spec.index_name].op('MATCH')(expression)
+
+
+def _sqlite_hits(connection, spec, terms, filters, window):
+    """Window of matching rows plus the ids ranked into the identifier tier"""
+    index = spec.index
+    hits = []
+    for prefix in (False, True):
+        condition = _fts_match(index, spec, match_expression(terms, prefix))
+        hits = connection.execute(_window_query(spec, condition, filters, window, index)).all()
+        # Complete words fill the window on their own
+        if len(hits) > window:
+            break
+
+    top_ids = set()
+    if hits:
+        oldest = hits[min(len(hits), window) - 1][0]
+        top_ids = set(connection.execute(
+            select(index.c.rowid)
+            .where(_fts_match(index, spec, match_expression(terms, prefix, spec.identifiers)), index.c.rowid >= oldest)
+        ).scalars())
+    return hits, top_ids
+
+
+def _fallback_hits(connection, spec, terms, filters, window):
+    source = spec.source
+    condition = and_(*(
+        or_(*(dimensions.value_expression(spec.model, name).icontains(term, autoescape=True)
+              for name in spec.columns))
+        for term in terms
+    ))
+    return connection.execute(_window_query(spec, condition, filters, window)).all(), set()
+
+
+def search(kind, q, filters=None, fields=None, page=1, limit=DEFAULT_PAGE_SIZE, facets=True, window=None):
+    """Ranked page of `kind` rows matching `q`, plus the match and facet counts
+
+    Everything is computed over the newest `window` matches: when a query
+    matches more rows than that, `exhaustive` is false, window_total is the
+    window size and the facets describe the window.
+    """
+    spec = SPECS[kind]
+    terms = query_terms(q)
+    if not terms:
+        raise ValueError('q must contain at least one word')
+    filters = filters or {}
+    fields = fields or dimensions.public_fields(spec.model)
+    window = window or _config('SEARCH_WINDOW', DEFAULT_WINDOW)
+    started = time.perf_counter()
+
+    connection = db.session.connection()
+    find = _sqlite_hits if connection.dialect.name == 'sqlite' else _fallback_hits
+    hits, top_ids = find(connection, spec, terms, filters, window)
+    exhaustive = len(hits) <= window
+    hits = hits[:window]
+
+    # Identifier matches first; the window is newest first already and sort() is stable
+    hits.sort(key=lambda hit: hit[0] not in top_ids)
+    offset = (page - 1) * limit
+    page_ids = [hit[0] for hit in hits[offset:offset + limit]]
+
+    source = spec.source
+    rows = []
+    if page_ids:
+        selected = selected_columns(fields)
+        by_id = {
+            row.id: row for row in connection.execute(
+                dimensions.select_fields(spec.model, selected).where(source.c.id.in_(page_ids))
+            )
+        }
+        rows = [by_id[row_id] for row_id in page_ids if row_id in by_id]
+
+    result = {
+        'kind': kind,
+        'query': ' '.join(terms),
+        'page': page,
+        'limit': limit,
+        'has_more': offset + limit < len(hits),
+        'window_total': len(hits),
+        'exhaustive': exhaustive,
+        'items': encoder_for(spec.model, fields).json_ready(rows)
+    }
+    if facets:
+        result['facets'] = {}
+        for position, name in enumerate(spec.facets, start=1):
+            counts = Counter(hit[position] for hit in hits)
+            if name in dimensions.fields(spec.model):
+                decoded = Counter()
+                values = dimensions.decode_column(spec.model, name, list(counts), connection)
+                for value, count in zip(values, counts.values()):
+                    decoded[value] += count
+                counts = decoded
+            result['facets'][name] = [
+                {'value': value, 'count': count}
+                for value, count in sorted(counts.items(), key=lambda item: (-item[1], str(item[0])))
+            ]
+    result['seconds'] = round(time.perf_counter() - started, 4)
+    return result
+
+
+def _config(name, default):
+    return current_app.config.get(name, default) if has_app_context() else default
+
+
+def parse_request(kind, args):
+    """Validate q/page/limit/fields/facets and the facet filters of a search request"""
+    spec = SPECS[kind]
+    filters = {}
+    for name in spec.facets:
+        if args.get(name):
+            filters[name] = [value for value in str(args[name]).split(',') if value]
+
+    try:
+        page = max(int(args.get('page', 1)), 1)
+        limit = min(max(int(args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        raise ValueError('page and limit must be integers')
+
+    return {
+        'q': args.get('q', ''),
+        'filters': filters,
+        'fields': resolve_fields(spec.model, args.get('fields')),
+        'page': page,
+        'limit': limit,
+        'facets': str(args.get('facets', '1')).lower() not in ('0', 'false', 'no')
+    }
+
+
+def search_response(kind):
+    """Handle GET /<blueprint>/api/<kind>/search"""
+    from flask import request, jsonify
+
+    try:
+        result = search(kind, **parse_request(kind, request.args))
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'Invalid search request: {str(e)}'
+        }), 400
+    return jsonify({'success': True, **result})
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """Refill the garment/order full-text search indexes from the raw tables"""
+    started = time.perf_counter()
+    counts = rebuild()
+    db.session.commit()
+    print(f"✅ Search index rebuilt in {round(time.perf_counter() - started, 2)}s: "
+          f"{counts.get('garments', 0)} garments, {counts.get('orders', 0)} orders")
+
+
+COMMANDS = (rebuild_search_index_command,)
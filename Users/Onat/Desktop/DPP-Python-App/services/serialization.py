@@ -0,0 +1,359 @@
+"""Row encoders and response formats for the listing APIs
+
+Listings select plain column tuples (see services/listing.py). A
+``RowEncoder`` is compiled once per (model, fields, selected columns): it
+picks the requested positions out of each row with one ``itemgetter`` and
+zips them with the field names, with no per-value type checks. Datetimes are
+left to the encoder: orjson writes naive datetimes exactly like
+``isoformat()``, and the stdlib fallback converts them in its ``default``
+hook. Without orjson installed everything still works through :mod:`json`.
+
+Formats, chosen with ``format=`` or the Accept header:
+
+* ``json`` (application/json): a page object or a streamed array of rows,
+* ``ndjson`` (application/x-ndjson): one row object per line,
+* ``columnar`` (application/vnd.dpp.columnar+json): field names plus one
+  value list per field, streamed as ``{"fields": [...], "chunks": [columns,
+  ...]}`` for full listings,
+* ``msgpack`` (application/msgpack, needs the msgpack package): the JSON
+  shapes in MessagePack; full listings are a stream of row maps.
+
+``FastJSONProvider`` also puts orjson behind ``jsonify`` for the rest of the
+app, keeping Flask's output types (sorted keys, RFC 822 datetimes).
+"""
+import json
+import operator
+import time
+from datetime import date, datetime
+from functools import lru_cache
+
+import click
+from flask.cli import with_appcontext
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import DateTime, select
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib json module is used instead
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional: format=msgpack is rejected without it
+    msgpack = None
+
+JSON_MIMETYPE = 'application/json'
+NDJSON_MIMETYPE = 'application/x-ndjson'
+COLUMNAR_MIMETYPE = 'application/vnd.dpp.columnar+json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+FORMATS = {
+    'json': JSON_MIMETYPE,
+    'ndjson': NDJSON_MIMETYPE,
+    'columnar': COLUMNAR_MIMETYPE,
+    'msgpack': MSGPACK_MIMETYPE
+}
+# Also accepted in Accept headers
+MIMETYPE_ALIASES = {'application/x-msgpack': 'msgpack'}
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def dumps(obj):
+    """Compact JSON as UTF-8 bytes, datetimes in ISO 8601"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, default=_default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def packb(obj):
+    """MessagePack bytes, datetimes as ISO 8601 strings"""
+    if msgpack is None:
+        raise ValueError('MessagePack responses require the msgpack package')
+    return msgpack.packb(obj, default=_default, use_bin_type=True)
+
+
+def encoder_name():
+    return 'orjson' if orjson is not None else 'json'
+
+
+def available_formats():
+    return [name for name in FORMATS if name != 'msgpack' or msgpack is not None]
+
+
+# Row encoders
+
+class RowEncoder:
+    """Turns rows of `selected` columns into the requested `fields`"""
+
+    def __init__(self, fields, selected, datetime_fields=()):
+        self.fields = tuple(fields)
+        positions = [selected.index(name) for name in self.fields]
+        if len(positions) == 1:
+            position = positions[0]
+            self.pick = lambda row: (row[position],)
+        else:
+            self.pick = operator.itemgetter(*positions)
+        # Field positions holding datetimes, for the isoformat() conversion
+        self.datetime_positions = [
+            index for index, name in enumerate(self.fields) if name in datetime_fields
+        ]
+
+    def dicts(self, rows):
+        """Row dicts with the values as selected (datetimes included)"""
+        fields = self.fields
+        pick = self.pick
+        return [dict(zip(fields, pick(row))) for row in rows]
+
+    def json_ready(self, rows):
+        """Row dicts with datetimes as ISO strings (CSV/XLSX writers, stdlib json)"""
+        if not self.datetime_positions:
+            return self.dicts(rows)
+        fields = self.fields
+        pick = self.pick
+        positions = self.datetime_positions
+        items = []
+        for row in rows:
+            values = list(pick(row))
+            for index in positions:
+                value = values[index]
+                if value is not None:
+                    values[index] = value.isoformat()
+            items.append(dict(zip(fields, values)))
+        return items
+
+    def columns(self, rows):
+        """One value list per field"""
+        if not rows:
+            return [[] for _ in self.fields]
+        return [list(column) for column in zip(*map(self.pick, rows))]
+
+
+@lru_cache(maxsize=256)
+def row_encoder(model, fields, selected):
+    """Cached RowEncoder for `model` rows (fields and selected are tuples)"""
+    columns = model.__table__.columns
+    datetime_fields = {
+        name for name in fields if name in columns and isinstance(columns[name].type, DateTime)
+    }
+    return RowEncoder(fields, selected, datetime_fields)
+
+
+# Content negotiation and bodies
+
+def negotiate(request):
+    """Response format from format= or the Accept header (json by default)"""
+    requested = request.args.get('format')
+    if requested:
+        if requested not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        if requested == 'msgpack' and msgpack is None:
+            raise ValueError('format=msgpack requires the msgpack package')
+        return requested
+
+    offered = [FORMATS[name] for name in available_formats()]
+    if msgpack is not None:
+        offered.extend(MIMETYPE_ALIASES)
+    best = request.accept_mimetypes.best_match(offered, default=JSON_MIMETYPE)
+    if request.accept_mimetypes[best] <= 0:
+        return 'json'
+    return MIMETYPE_ALIASES.get(best) or next(name for name, mimetype in FORMATS.items() if mimetype == best)
+
+
+# Spellings accepted for boolean options in JSON bodies and query strings
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+FALSE_VALUES = ('0', 'false', 'no', 'off')
+
+
+def json_flag(data, name, default=None):
+    """Boolean option `name` of a request body; ValueError for anything but a boolean spelling
+
+    Accepts JSON booleans, 0/1 and the TRUE_VALUES/FALSE_VALUES strings, so
+    "false" is false instead of a truthy string. Missing or null gives `default`.
+    """
+    value = data.get(name)
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in TRUE_VALUES + FALSE_VALUES:
+        return value.strip().lower() in TRUE_VALUES
+    raise ValueError(f'{name} must be true or false')
+
+
+def page_body(fmt, encoder, rows, **meta):
+    """One page (rows plus next_cursor/has_more style metadata) as bytes"""
+    if fmt == 'columnar':
+        return dumps({'fields': list(encoder.fields), 'columns': encoder.columns(rows), **meta})
+    if fmt == 'msgpack':
+        return packb({'items': encoder.dicts(rows), **meta})
+    if fmt == 'ndjson':
+        return b''.join(dumps(item) + b'\n' for item in encoder.dicts(rows))
+    return dumps({'items': encoder.dicts(rows), **meta})
+
+
+class StreamWriter:
+    """A streamed body in pieces: head(), one chunk(rows) per row chunk, tail()
+
+    Lets sync generators (stream_chunks) and async handlers (services/asgi.py)
+    write the same bytes.
+    """
+
+    def __init__(self, fmt, encoder):
+        self.fmt = fmt
+        self.encoder = encoder
+        self._separator = b''
+
+    def head(self):
+        if self.fmt == 'columnar':
+            return b'{"fields":' + dumps(list(self.encoder.fields)) + b',"chunks":['
+        if self.fmt == 'json':
+            return b'['
+        return b''
+
+    def chunk(self, rows):
+        if not rows:
+            return b''
+        if self.fmt == 'ndjson':
+            return b''.join(dumps(item) + b'\n' for item in self.encoder.dicts(rows))
+        if self.fmt == 'msgpack':
+            return b''.join(packb(item) for item in self.encoder.dicts(rows))
+        if self.fmt == 'columnar':
+            piece = self._separator + dumps(self.encoder.columns(rows))
+        else:
+            # Strip the chunk's own brackets to splice it into one array
+            piece = self._separator + dumps(self.encoder.dicts(rows))[1:-1]
+        self._separator = b','
+        return piece
+
+    def tail(self):
+        if self.fmt == 'columnar':
+            return b']}'
+        if self.fmt == 'json':
+            return b']'
+        return b''
+
+
+def stream_chunks(fmt, encoder, chunks):
+    """Encode an iterable of row chunks as one streamed body"""
+    writer = StreamWriter(fmt, encoder)
+    head = writer.head()
+    if head:
+        yield head
+    for rows in chunks:
+        piece = writer.chunk(rows)
+        if piece:
+            yield piece
+    tail = writer.tail()
+    if tail:
+        yield tail
+
+
+# jsonify
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, encoding with orjson when it is installed
+
+    Output types match DefaultJSONProvider: keys are sorted, datetimes go
+    through Flask's default (RFC 822) and anything orjson can't handle falls
+    back to the stdlib path.
+    """
+
+    if orjson is not None:
+        OPTIONS = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                   | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_SUBCLASS)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or set(kwargs) - {'separators'}:
+            return super().dumps(obj, **kwargs)
+        try:
+            return orjson.dumps(obj, default=self.default, option=self.OPTIONS).decode('utf-8')
+        except TypeError:
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+
+def init_serialization(app):
+    """Install FastJSONProvider unless FAST_JSON is disabled"""
+    if app.config.get('FAST_JSON', True):
+        app.json = FastJSONProvider(app)
+
+
+# Benchmark
+
+def benchmark(model, count=10000, repeat=3):
+    """Time the listing serializers on the newest `count` rows of `model`
+
+    Compares the old paths (ORM objects + to_dict() + jsonify, and Row
+    ``_mapping`` lookups + json.dumps) with the compiled row encoder in each
+    format. Returns the best of `repeat` runs per path, in seconds and rows/s,
+    plus the body size.
+    """
+    from flask import jsonify
+
+    from app import db
+    from services.dimensions import public_fields
+    from services.listing import build_query, serialize_row
+
+    fields = public_fields(model)
+    query = build_query(model, fields).limit(count)
+    selected = tuple(dict.fromkeys(fields + ['created_date', 'id']))
+    rows = db.session.execute(query).all()
+    objects = db.session.execute(
+        select(model).order_by(model.created_date.desc(), model.id.desc()).limit(count)
+    ).scalars().all()
+    encoder = row_encoder(model, tuple(fields), selected)
+
+    paths = {
+        'to_dict_jsonify': lambda: jsonify([item.to_dict() for item in objects]).get_data(),
+        'mapping_json': lambda: json.dumps([serialize_row(fields, row) for row in rows]).encode('utf-8'),
+        'encoder_json': lambda: page_body('json', encoder, rows),
+        'encoder_ndjson': lambda: page_body('ndjson', encoder, rows),
+        'encoder_columnar': lambda: page_body('columnar', encoder, rows)
+    }
+    if msgpack is not None:
+        paths['encoder_msgpack'] = lambda: page_body('msgpack', encoder, rows)
+
+    results = {}
+    for name, func in paths.items():
+        best = None
+        for _ in range(max(1, repeat)):
+            started = time.perf_counter()
+            body = func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = {
+            'seconds': round(best, 4),
+            'rows_per_second': round(len(rows) / best) if best else len(rows),
+            'bytes': len(body)
+        }
+    db.session.rollback()
+    return {'rows': len(rows), 'encoder': encoder_name(), 'paths': results}
+
+
+@click.command('benchmark-serialization')
+@click.argument('kind', type=click.Choice(['garments', 'orders']), default='orders')
+@click.option('--count', default=10000, show_default=True, help='Newest rows to serialize')
+@click.option('--repeat', default=3, show_default=True, help='Runs per path (best is reported)')
+@with_appcontext
+def benchmark_serialization_command(kind, count, repeat):
+    """Compare to_dict() + jsonify with the compiled row encoders"""
+    from models.garment import Garment
+    from models.orders import Order
+    result = benchmark({'garments': Garment, 'orders': Order}[kind], count, repeat)
+    print(f"   {result['rows']} {kind}, {result['encoder']} encoder")
+    for name, path in result['paths'].items():
+        print(f"   {name}: {path['seconds']}s ({path['rows_per_second']} rows/s, {path['bytes']} bytes)")
+
+
+COMMANDS = (benchmark_serialization_command,)
@@ -0,0 +1,74 @@
+"""Cold start measurements for new worker processes
+
+Each run starts a fresh interpreter. It times three steps: importing ``app``,
+``create_app()``, and serving the first request through the test client.
+Interpreter start-up itself is not counted.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+import click
+
+STEPS = ('import', 'create_app', 'first_response', 'total')
+
+_PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app(sys.argv[1])
+created = time.perf_counter()
+response = app.test_client().get(sys.argv[2])
+response.get_data()
+served = time.perf_counter()
+print(json.dumps({
+    'import': imported - started,
+    'create_app': created - imported,
+    'first_response': served - created,
+    'total': served - started,
+    'status': response.status_code
+}))
+'''
+
+
+def probe(config_name, path, cwd):
+    """Run one cold start in a subprocess and return its timings in seconds"""
+    result = subprocess.run(
+        [sys.executable, '-c', _PROBE, config_name, path],
+        cwd=cwd, capture_output=True, text=True, check=True
+    )
+    # Seeding and SQL echo may print first; the timings are the last line
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure_cold_start(config_name, path='/api/stats', runs=5, cwd=None):
+    """Median and per-run cold start timings over `runs` fresh processes"""
+    cwd = cwd or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    samples = [probe(config_name, path, cwd) for _ in range(max(1, runs))]
+    return {
+        'path': path,
+        'runs': samples,
+        'statuses': sorted({sample['status'] for sample in samples}),
+        'median_ms': {
+            step: round(statistics.median(sample[step] for sample in samples) * 1000, 1)
+            for step in STEPS
+        }
+    }
+
+
+@click.command('measure-startup')
+@click.option('--runs', default=5, show_default=True, help='Fresh interpreter runs to average over')
+@click.option('--path', default='/api/stats', show_default=True, help='URL requested as the first response')
+def measure_startup_command(runs, path):
+    """Measure import time, create_app() time and time to first response"""
+    config_name = os.environ.get('FLASK_CONFIG', 'default')
+    result = measure_cold_start(config_name, path=path, runs=runs)
+    for name, value in result['median_ms'].items():
+        print(f"   {name}: {value} ms")
+    print(f"✅ Ready to serve {path} in {result['median_ms']['total']} ms (median of {runs} runs)")
+
+
+COMMANDS = (measure_startup_command,)
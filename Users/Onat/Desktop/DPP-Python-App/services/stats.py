@@ -0,0 +1,143 @@
+"""Cached aggregate statistics for garments and orders
+
+Each model's aggregates are computed with a single SQL statement
+(``Garment.get_stats`` / ``Order.get_stats``) and kept in memory until either
+the TTL expires or a committed write touches the model.
+"""
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models.dashboard import DashboardStats
+from models.garment import Garment
+from models.orders import Order
+from services import render_cache
+from services.database import commit_state, discard_commit_state, pop_commit_state
+# Registers the incremental DashboardStats maintenance hooks
+from services import summary  # noqa: F401
+
+DEFAULT_TTL = 30  # seconds
+
+
+class StatsCache:
+    """Thread safe TTL cache with per-key invalidation"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, key, compute, ttl):
+        value = self.peek(key)
+        if value is None:
+            value = compute()
+            self.put(key, value, ttl)
+        return value
+
+    def peek(self, key):
+        """The live value for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                return entry[1]
+        return None
+
+    def put(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            if not keys:
+                self._entries.clear()
+            for key in keys:
+                self._entries.pop(key, None)
+
+
+cache = StatsCache()
+
+# Tables whose writes invalidate the cached aggregates, keyed by cache key
+TRACKED_MODELS = {
+    Garment: 'garments',
+    Order: 'orders'
+}
+
+
+def cache_ttl():
+    if has_app_context():
+        return current_app.config.get('STATS_CACHE_TTL', DEFAULT_TTL)
+    return DEFAULT_TTL
+
+
+def garment_stats():
+    """Cached result of Garment.get_stats()"""
+    return cache.get('garments', Garment.get_stats, cache_ttl())
+
+
+def order_stats():
+    """Cached result of Order.get_stats()"""
+    return cache.get('orders', Order.get_stats, cache_ttl())
+
+
+def totals(stats=None):
+    """Headline counters used by the /api/stats endpoints, read from the summary row"""
+    stats = stats or DashboardStats.current()
+    return {
+        'total_garments': stats.total_garments,
+        'total_orders': stats.total_orders
+    }
+
+
+# Invalidation hooks: writes mark the key dirty on the session and the cache
+# entry is dropped once the transaction commits, so readers never cache a
+# value that is missing uncommitted rows.
+
+def mark_dirty(session, *models):
+    """Invalidate the models' cached stats when the session commits
+
+    Core inserts/updates bypass the mapper events below, so bulk writers call
+    this themselves. It also bumps the tables' render cache data versions.
+    """
+    render_cache.mark_changed(session, *(model.__tablename__ for model in models))
+    keys = [TRACKED_MODELS[model] for model in models if model in TRACKED_MODELS]
+    if not keys:
+        return
+    commit_state(session, 'stats_dirty', set).update(keys)
+    # Drop the entries right away as well so no reader keeps them past the TTL
+    cache.invalidate(*keys)
+
+
+def _mark_dirty(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        mark_dirty(session, mapper.class_)
+    else:
+        cache.invalidate(TRACKED_MODELS[mapper.class_])
+
+
+def _mark_bulk_dirty(context):
+    model = context.mapper.class_ if context.mapper else None
+    if model in TRACKED_MODELS:
+        mark_dirty(context.session, model)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    dirty = set().union(*pop_commit_state(session, 'stats_dirty'))
+    if dirty:
+        cache.invalidate(*dirty)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_on_rollback(session, previous_transaction):
+    discard_commit_state(session, 'stats_dirty', previous_transaction)
+
+
+for _model in TRACKED_MODELS:
+    for _event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event_name, _mark_dirty)
+
+event.listen(Session, 'after_bulk_update', _mark_bulk_dirty)
+event.listen(Session, 'after_bulk_delete', _mark_bulk_dirty)
@@ -0,0 +1,522 @@
+"""Append-only order status history and time-in-state aggregates
+
+Every change of ``Order.status`` appends a row to ``order_status_changes``
+in the writer's transaction: the order, its facility, the old and the new
+status and when it changed. The first row of an order has no from_status
+and a deleted order gets a last row without to_status.
+
+The same writes keep ``order_status_durations`` up to date. For each day,
+facility and status it holds how many orders entered the status, how many
+stays in it ended (by moving on, not by deletion) and their total and
+longest length. Time-in-state and throughput queries
+(``GET /api/analytics/order-status``) read those few rows instead of the
+log.
+
+Transitions are recorded by:
+
+* ORM inserts, updates and deletes: the hooks below, once per flush,
+* ``record_created()`` after Core inserts (bulk generate, which counts the
+  duration aggregates from its columns with ``enter_columns()``),
+* ``record()`` after Core updates and upserts (batch, import); it compares
+  each order with the latest row of its history,
+* ``record_deleted()`` before Core deletes (batch, purge).
+
+Query.update()/Query.delete() don't expose their rows and reconcile the
+whole table with ``sync()`` instead.
+
+``compact()`` (the periodic ``orders.compact_status_history`` job, see
+JOB_SCHEDULE, and ``flask compact-status-history``) drops rows older than
+STATUS_HISTORY_RETENTION_DAYS that a later row of the same order
+supersedes. What is left is a snapshot of each order's current status and
+since when, plus the recent transitions. The aggregates are unaffected.
+"""
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import delete, event, exists, func, insert, inspect, literal, null, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app import db
+from models.dimensions import Facility
+from models.orders import Order
+from models.status_history import OrderStatusChange, OrderStatusDuration
+from services.database import begin_immediate
+from services.rollups import bucket_expression
+
+orders = Order.__table__
+history = OrderStatusChange.__table__
+durations = OrderStatusDuration.__table__
+
+HISTORY_COLUMNS = ['order_id', 'facility_id', 'from_status', 'to_status', 'changed_at']
+DURATION_METRICS = ('entered', 'exited', 'total_seconds', 'max_seconds')
+DEFAULT_RETENTION_DAYS = 90
+# History rows examined per compaction transaction
+COMPACT_CHUNK_SIZE = 5000
+# Orders per reconciliation pass of sync()
+SYNC_CHUNK_SIZE = 5000
+# Ids per IN (...) list, well below SQLite's bound parameter limit
+IN_CHUNK_SIZE = 500
+QUERY_DIMENSIONS = ('facility', 'status')
+DEFAULT_LIMIT = 5000
+MAX_LIMIT = 50000
+
+
+def _chunks(items, size=IN_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _day(value):
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _as_datetime(value):
+    # SQLite returns bucket expressions as text
+    return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+
+
+class DurationDeltas:
+    """Changes to order_status_durations collected for one write"""
+
+    def __init__(self):
+        self.rows = {}
+
+    def _row(self, when, facility_id, status):
+        key = (_day(when), facility_id or 0, status)
+        return self.rows.setdefault(key, dict.fromkeys(DURATION_METRICS, 0))
+
+    def enter(self, when, facility_id, status, count=1):
+        if status is not None:
+            self._row(when, facility_id, status)['entered'] += count
+
+    def exit(self, when, facility_id, status, since):
+        if status is None or since is None:
+            return
+        seconds = max((when - since).total_seconds(), 0.0)
+        row = self._row(when, facility_id, status)
+        row['exited'] += 1
+        row['total_seconds'] += seconds
+        row['max_seconds'] = max(row['max_seconds'], seconds)
+
+    def apply(self, connection):
+        """Add the collected deltas with one executemany upsert"""
+        if not self.rows:
+            return
+        name = connection.dialect.name
+        if name not in ('sqlite', 'postgresql'):
+            raise RuntimeError(f'Order status history is not supported on {name}')
+        statement = {'sqlite': sqlite, 'postgresql': postgresql}[name].insert(durations)
+        greatest = func.max if name == 'sqlite' else func.greatest
+        statement = statement.on_conflict_do_update(
+            index_elements=['day', 'facility_id', 'status'],
+            set_={
+                'entered': durations.c.entered + statement.excluded.entered,
+                'exited': durations.c.exited + statement.excluded.exited,
+                'total_seconds': durations.c.total_seconds + statement.excluded.total_seconds,
+                'max_seconds': greatest(durations.c.max_seconds, statement.excluded.max_seconds)
+            }
+        )
+        connection.execute(statement, [
+            {'day': day, 'facility_id': facility_id, 'status': status, **metrics}
+            for (day, facility_id, status), metrics in self.rows.items()
+        ])
+        self.rows = {}
+
+
+def latest_changes(connection, order_ids):
+    """{order id: latest history row} for the orders that have one"""
+    latest = {}
+    for chunk in _chunks(list(order_ids)):
+        newest = select(func.max(history.c.id)).where(history.c.order_id.in_(chunk)).group_by(history.c.order_id)
+        for row in connection.execute(select(history).where(history.c.id.in_(newest))):
+            latest[row.order_id] = row
+    return latest
+
+
+# Recording
+
+def record(connection, clauses=(), now=None):
+    """Append a transition for each order matching `clauses` whose status differs from its history
+
+    An order without history (or whose id belonged to a deleted order)
+    starts it with the status it has had since its last write.
+    """
+    now = now or datetime.utcnow()
+    rows = connection.execute(
+        select(orders.c.id, orders.c.facility_id, orders.c.status, orders.c.created_date, orders.c.updated_date)
+        .where(*clauses)
+    ).all()
+    latest = latest_changes(connection, [row.id for row in rows])
+
+    changes = []
+    deltas = DurationDeltas()
+    for row in rows:
+        previous = latest.get(row.id)
+        if previous is None or previous.to_status is None:
+            since = row.updated_date or row.created_date or now
+            changes.append({'order_id': row.id, 'facility_id': row.facility_id, 'from_status': None,
+                            'to_status': row.status, 'changed_at': since})
+            deltas.enter(since, row.facility_id, row.status)
+        elif previous.to_status != row.status:
+            changes.append({'order_id': row.id, 'facility_id': row.facility_id, 'from_status': previous.to_status,
+                            'to_status': row.status, 'changed_at': now})
+            # The stay ended where it happened, even if the facility changed with it
+            deltas.exit(now, previous.facility_id, previous.to_status, previous.changed_at)
+            deltas.enter(now, row.facility_id, row.status)
+
+    if changes:
+        connection.execute(insert(history), changes)
+    deltas.apply(connection)
+    return len(changes)
+
+
+def record_created(connection, clauses=(), now=None, deltas=None):
+    """Start the history of newly inserted orders matching `clauses`, set-based
+
+    Bulk writers pass the duration `deltas` they counted from the inserted
+    columns (enter_columns()); otherwise the new rows are grouped in SQL.
+    """
+    now = now or datetime.utcnow()
+    since = func.coalesce(orders.c.updated_date, orders.c.created_date, literal(now, db.DateTime))
+    connection.execute(insert(history).from_select(
+        HISTORY_COLUMNS,
+        select(orders.c.id, orders.c.facility_id, null(), orders.c.status, since).where(*clauses)
+    ))
+
+    if deltas is None:
+        deltas = DurationDeltas()
+        day = bucket_expression(connection.dialect.name, 'day', since)
+        for bucket, facility_id, status, count in connection.execute(
+            select(day, orders.c.facility_id, orders.c.status, func.count())
+            .where(orders.c.status.isnot(None), *clauses)
+            .group_by(day, orders.c.facility_id, orders.c.status)
+        ):
+            deltas.enter(_as_datetime(bucket), facility_id, status, count)
+    deltas.apply(connection)
+
+
+def enter_columns(deltas, columns, now=None):
+    """Count one chunk of inserted order columns into `deltas` (see record_created())"""
+    count = len(columns['status'])
+    updated, created = columns.get('updated_date'), columns.get('created_date')
+    if updated is None or created is None:
+        dates = updated or created or [None] * count
+    elif all(updated):
+        dates = updated
+    else:
+        dates = [first or second for first, second in zip(updated, created)]
+    groups = Counter(zip(dates, columns.get('facility_id', [None] * count), columns['status']))
+    now = now or datetime.utcnow()
+    for (when, facility_id, status), entered in groups.items():
+        deltas.enter(when or now, facility_id, status, entered)
+
+
+def record_deleted(connection, clauses=(), now=None):
+    """Close the history of the orders matching `clauses`; call before deleting them"""
+    connection.execute(insert(history).from_select(
+        HISTORY_COLUMNS,
+        select(orders.c.id, orders.c.facility_id, orders.c.status, null(),
+               literal(now or datetime.utcnow(), db.DateTime)).where(*clauses)
+    ))
+
+
+def sync(connection=None, now=None):
+    """Reconcile the history with the whole orders table
+
+    Records the transitions of every order whose status differs from its
+    latest history row and closes the history of orders that no longer exist.
+    """
+    connection = connection or db.session.connection()
+    now = now or datetime.utcnow()
+    recorded = 0
+    after_id = 0
+    while True:
+        ids = connection.execute(
+            select(orders.c.id).where(orders.c.id > after_id).order_by(orders.c.id).limit(SYNC_CHUNK_SIZE)
+        ).scalars().all()
+        if not ids:
+            break
+        recorded += record(connection, [orders.c.id >= ids[0], orders.c.id <= ids[-1]], now)
+        after_id = ids[-1]
+
+    newest = select(func.max(history.c.id)).group_by(history.c.order_id)
+    closed = connection.execute(insert(history).from_select(
+        HISTORY_COLUMNS,
+        select(history.c.order_id, history.c.facility_id, history.c.to_status, null(), literal(now, db.DateTime))
+        .where(history.c.id.in_(newest), history.c.to_status.isnot(None),
+               ~exists().where(orders.c.id == history.c.order_id))
+    )).rowcount
+    return {'recorded': recorded, 'closed': closed}
+
+
+def rebuild(connection=None):
+    """Recompute order_status_durations from the history that is left
+
+    Compacted rows are gone, so this is only exact before the first compaction.
+    """
+    connection = connection or db.session.connection()
+    connection.execute(delete(durations))
+    deltas = DurationDeltas()
+    previous = {}
+    for row in connection.execute(select(history).order_by(history.c.order_id, history.c.id)):
+        before = previous.get(row.order_id)
+        # Only moves between two statuses end a stay; starts and deletions don't
+        if before is not None and row.from_status is not None and row.to_status is not None:
+            deltas.exit(row.changed_at, before.facility_id, row.from_status, before.changed_at)
+        deltas.enter(row.changed_at, row.facility_id, row.to_status)
+        previous[row.order_id] = row
+    deltas.apply(connection)
+    return connection.execute(select(func.count()).select_from(durations)).scalar()
+
+
+# Compaction
+
+def compact(before=None, chunk_size=COMPACT_CHUNK_SIZE, job=None):
+    """Drop history rows older than `before` that a later row of their order supersedes
+
+    Works through the old rows in id order, one short write transaction per
+    chunk. Deletion rows go too: nothing is left to snapshot for those orders.
+    """
+    from flask import current_app
+
+    if before is None:
+        retention = current_app.config.get('STATUS_HISTORY_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+        before = datetime.utcnow() - timedelta(days=retention)
+    elif isinstance(before, str):
+        # Job params arrive as JSON
+        before = datetime.fromisoformat(before)
+    started = time.perf_counter()
+    later = history.alias('later')
+    superseded = or_(
+        history.c.to_status.is_(None),
+        exists().where(later.c.order_id == history.c.order_id, later.c.id > history.c.id)
+    )
+
+    progress = {'examined': 0, 'removed': 0, 'chunks': 0}
+    after_id = 0
+    while not (job is not None and job.cancel_requested):
+        try:
+            with begin_immediate():
+                connection = db.session.connection()
+            ids = connection.execute(
+                select(history.c.id).where(history.c.id > after_id, history.c.changed_at < before)
+                .order_by(history.c.id).limit(chunk_size)
+            ).scalars().all()
+            if not ids:
+                db.session.commit()
+                break
+            window = [history.c.id > after_id, history.c.id <= ids[-1], history.c.changed_at < before]
+            progress['removed'] += connection.execute(delete(history).where(*window, superseded)).rowcount
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        after_id = ids[-1]
+        progress['examined'] += len(ids)
+        progress['chunks'] += 1
+        if job is not None:
+            job.update(**progress)
+
+    return dict(progress, before=before.isoformat(), seconds=round(time.perf_counter() - started, 3))
+
+
+# Queries
+
+def order_history(order_id):
+    """An order's remaining transitions, oldest first"""
+    statement = (
+        select(history.c.from_status, history.c.to_status, history.c.changed_at, Facility.__table__.c.name)
+        .select_from(history.outerjoin(Facility.__table__, Facility.__table__.c.id == history.c.facility_id))
+        .where(history.c.order_id == order_id)
+        .order_by(history.c.id)
+    )
+    return [
+        {'from_status': from_status, 'to_status': to_status, 'changed_at': changed_at.isoformat(),
+         'facility': facility}
+        for from_status, to_status, changed_at, facility in db.session.execute(statement)
+    ]
+
+
+def _parse_datetime(name, value):
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        raise ValueError(f'{name} must be an ISO date or datetime')
+
+
+def parse_query(args):
+    """Validate the start/end/by/series/limit and facility/status filter arguments"""
+    by = [name for name in (args.get('by') or 'facility,status').split(',') if name]
+    unknown = [name for name in by if name not in QUERY_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"by must be among {', '.join(QUERY_DIMENSIONS)}")
+
+    filters = {}
+    for name in QUERY_DIMENSIONS:
+        if args.get(name):
+            filters[name] = [value for value in str(args[name]).split(',') if value]
+
+    limit = args.get('limit', DEFAULT_LIMIT)
+    try:
+        limit = min(max(int(limit), 1), MAX_LIMIT)
+    except (TypeError, ValueError):
+        raise ValueError('limit must be an integer')
+
+    return {
+        'start': _parse_datetime('start', args['start']) if args.get('start') else None,
+        'end': _parse_datetime('end', args['end']) if args.get('end') else None,
+        'by': by,
+        'filters': filters,
+        'series': str(args.get('series', '0')).lower() in ('1', 'true', 'yes'),
+        'limit': limit
+    }
+
+
+def query(start=None, end=None, by=QUERY_DIMENSIONS, filters=None, series=False, limit=DEFAULT_LIMIT):
+    """Entries, completed stays and their average/longest length per `by` (and day)
+
+    Days are selected by their start: start <= day < end.
+    """
+    started = time.perf_counter()
+    facilities = Facility.__table__
+    columns = {
+        'facility': func.coalesce(facilities.c.name, '').label('facility'),
+        'status': durations.c.status
+    }
+    keys = ([durations.c.day] if series else []) + [columns[name] for name in by]
+    statement = (
+        select(
+            *keys,
+            func.sum(durations.c.entered).label('entered'),
+            func.sum(durations.c.exited).label('exited'),
+            func.sum(durations.c.total_seconds).label('total_seconds'),
+            func.max(durations.c.max_seconds).label('max_seconds')
+        )
+        .select_from(durations.outerjoin(facilities, facilities.c.id == durations.c.facility_id))
+        .group_by(*keys)
+        .order_by(*keys)
+        .limit(limit)
+    )
+    if start is not None:
+        statement = statement.where(durations.c.day >= start)
+    if end is not None:
+        statement = statement.where(durations.c.day < end)
+    if (filters or {}).get('facility'):
+        statement = statement.where(facilities.c.name.in_(filters['facility']))
+    if (filters or {}).get('status'):
+        statement = statement.where(durations.c.status.in_(filters['status']))
+
+    rows = []
+    for row in db.session.execute(statement):
+        item = dict(row._mapping)
+        if series:
+            item['day'] = item['day'].isoformat()
+        total = item.pop('total_seconds') or 0.0
+        item['avg_seconds'] = round(total / item['exited'], 1) if item['exited'] else None
+        item['max_seconds'] = round(item['max_seconds'] or 0.0, 1)
+        rows.append(item)
+
+    return {
+        'rows': rows,
+        'truncated': len(rows) == limit,
+        'seconds': round(time.perf_counter() - started, 4)
+    }
+
+
+def query_response():
+    """Handle GET /api/analytics/order-status"""
+    from flask import request, jsonify
+
+    try:
+        result = query(**parse_query(request.args))
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid order status analytics request: {str(e)}'
+        }), 400
+    return jsonify({'success': True, **result})
+
+
+# ORM hooks: collect the flush's orders and record them once it is done
+
+def _pending(session):
+    return session.info.setdefault('status_history', {'written': set(), 'deleted': []})
+
+
+def _reset_pending(session, flush_context, instances):
+    # Whatever a failed flush collected was rolled back with it
+    session.info.pop('status_history', None)
+
+
+def _order_inserted(mapper, connection, target):
+    _pending(Session.object_session(target))['written'].add(target.id)
+
+
+def _order_updated(mapper, connection, target):
+    if inspect(target).attrs.status.history.has_changes():
+        _pending(Session.object_session(target))['written'].add(target.id)
+
+
+def _order_deleted(mapper, connection, target):
+    _pending(Session.object_session(target))['deleted'].append({
+        'order_id': target.id, 'facility_id': target.facility_id, 'from_status': target.status,
+        'to_status': None, 'changed_at': datetime.utcnow()
+    })
+
+
+def _record_flushed(session, flush_context):
+    pending = session.info.pop('status_history', None)
+    if not pending:
+        return
+    connection = session.connection()
+    if pending['deleted']:
+        connection.execute(insert(history), pending['deleted'])
+    written = sorted(pending['written'])
+    for chunk in _chunks(written):
+        record(connection, [orders.c.id.in_(chunk)])
+
+
+def _bulk_write(context):
+    """Query.update()/Query.delete() don't expose their rows; reconcile instead"""
+    if context.mapper is not None and context.mapper.class_ is Order:
+        sync(context.session.connection())
+
+
+event.listen(Order, 'after_insert', _order_inserted)
+event.listen(Order, 'after_update', _order_updated)
+event.listen(Order, 'after_delete', _order_deleted)
+event.listen(Session, 'before_flush', _reset_pending)
+event.listen(Session, 'after_flush', _record_flushed)
+event.listen(Session, 'after_bulk_update', _bulk_write)
+event.listen(Session, 'after_bulk_delete', _bulk_write)
+
+
+@click.command('rebuild-status-history')
+@with_appcontext
+def rebuild_status_history_command():
+    """Record missing order status transitions and recompute the time-in-state aggregates"""
+    started = time.perf_counter()
+    counts = sync()
+    rows = rebuild()
+    db.session.commit()
+    print(f"✅ Status history rebuilt in {round(time.perf_counter() - started, 2)}s: "
+          f"{counts['recorded']} transitions recorded, {counts['closed']} deleted orders closed, "
+          f"{rows} aggregate rows")
+
+
+@click.command('compact-status-history')
+@click.option('--retention-days', type=int, help='Keep this many days of transitions (default STATUS_HISTORY_RETENTION_DAYS)')
+@with_appcontext
+def compact_status_history_command(retention_days):
+    """Drop superseded order status transitions older than the retention period"""
+    before = datetime.utcnow() - timedelta(days=retention_days) if retention_days is not None else None
+    result = compact(before=before)
+    print(f"✅ Status history compacted in {result['seconds']}s: "
+          f"{result['removed']} of {result['examined']} transitions before {result['before']} removed")
+
+
+COMMANDS = (rebuild_status_history_command, compact_status_history_command)
@@ -0,0 +1,226 @@
+"""Incrementally maintained DashboardStats summary
+
+Every Garment/Order insert, update and delete adjusts the counters on the
+single DashboardStats row inside the same transaction, so dashboard reads are
+a primary key lookup. ``rebuild()`` recomputes everything from the raw tables
+and is also used after bulk ORM updates/deletes whose rows are not known.
+Readers that find no row don't create it: they compute the counters without
+saving them and ``schedule_rebuild()`` queues a ``stats.rebuild`` job.
+"""
+import time
+import uuid
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import event, inspect, func, select, update, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import db
+from models.dashboard import DashboardStats, SUMMARY_ID
+from models.garment import Garment
+from models.orders import Order
+
+summary = DashboardStats.__table__
+
+# Non-derived dashboard figures used when the summary row is first created
+SEED_VALUES = {
+    'active_dpps': 15,
+    'manufacturing_processes': 7,
+    'total_co2_monthly': 156.8,
+    'monthly_operations': 1200000
+}
+
+# Sentinel for an attribute whose previous value was not loaded
+_UNKNOWN = object()
+
+
+def compute_counters(connection):
+    """Compute every materialized counter from the garments and orders tables"""
+    garment_row = connection.execute(select(
+        func.count(Garment.id),
+        func.coalesce(func.sum(Garment.quantity), 0),
+        func.coalesce(func.sum(Garment.carbon_footprint), 0.0)
+    )).one()
+    order_rows = connection.execute(
+        select(Order.status, func.count(Order.id), func.coalesce(func.sum(Order.quantity), 0))
+        .group_by(Order.status)
+    ).all()
+
+    counters = {
+        'total_garments': garment_row[0],
+        'garment_quantity': garment_row[1],
+        'total_carbon': garment_row[2],
+        'total_orders': sum(row[1] for row in order_rows),
+        'order_quantity': sum(row[2] for row in order_rows)
+    }
+    by_status = {row[0]: row[1] for row in order_rows}
+    for status in Order.STATUSES:
+        counters[f'{status}_orders'] = by_status.get(status, 0)
+    return counters
+
+
+def rebuild(connection=None):
+    """Recompute the summary row from scratch inside the current transaction"""
+    connection = connection or db.session.connection()
+    counters = compute_counters(connection)
+
+    result = connection.execute(
+        update(summary).where(summary.c.id == SUMMARY_ID).values(**counters)
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(summary).values(id=SUMMARY_ID, **SEED_VALUES, **counters))
+    return counters
+
+
+def schedule_rebuild():
+    """Queue a stats.rebuild job, at most one per minute however many readers ask"""
+    from services.jobs import submit_job
+
+    job_id = uuid.uuid5(uuid.NAMESPACE_URL, f'stats.rebuild@{int(time.time() // 60)}').hex
+    try:
+        submit_job('stats.rebuild', job_id=job_id)
+    except IntegrityError:
+        pass
+
+
+def apply_delta(connection, deltas, target=None):
+    """Add the given per-column deltas to the summary row"""
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    values = {name: summary.c[name] + delta for name, delta in deltas.items()}
+    result = connection.execute(
+        update(summary).where(summary.c.id == SUMMARY_ID).values(**values)
+    )
+    if result.rowcount == 0:
+        # No summary yet; build it once every row of the write is in the table
+        if target is not None:
+            _request_rebuild(target)
+        else:
+            rebuild(connection)
+
+
+def _request_rebuild(target):
+    """Rebuild after the current flush instead of mid-way through it"""
+    session = Session.object_session(target)
+    if session is not None:
+        session.info['summary_rebuild'] = True
+
+
+def order_status_column(status):
+    """Summary column counting orders in the given status, if tracked"""
+    return f'{status}_orders' if status in Order.STATUSES else None
+
+
+def _previous(target, attr):
+    """Value of an attribute before this flush (current value if unchanged)"""
+    history = inspect(target).attrs[attr].history
+    if not history.has_changes():
+        return getattr(target, attr)
+    if history.deleted:
+        return history.deleted[0]
+    return _UNKNOWN
+
+
+# Garment hooks
+
+def _garment_inserted(mapper, connection, target):
+    apply_delta(connection, {
+        'total_garments': 1,
+        'garment_quantity': target.quantity or 0,
+        'total_carbon': target.carbon_footprint or 0.0
+    }, target)
+
+
+def _garment_updated(mapper, connection, target):
+    old_quantity = _previous(target, 'quantity')
+    old_carbon = _previous(target, 'carbon_footprint')
+    if _UNKNOWN in (old_quantity, old_carbon):
+        _request_rebuild(target)
+        return
+
+    apply_delta(connection, {
+        'garment_quantity': (target.quantity or 0) - (old_quantity or 0),
+        'total_carbon': (target.carbon_footprint or 0.0) - (old_carbon or 0.0)
+    }, target)
+
+
+def _garment_deleted(mapper, connection, target):
+    apply_delta(connection, {
+        'total_garments': -1,
+        'garment_quantity': -(target.quantity or 0),
+        'total_carbon': -(target.carbon_footprint or 0.0)
+    }, target)
+
+
+# Order hooks
+
+def _order_inserted(mapper, connection, target):
+    deltas = {'total_orders': 1, 'order_quantity': target.quantity or 0}
+    column = order_status_column(target.status)
+    if column:
+        deltas[column] = 1
+    apply_delta(connection, deltas, target)
+
+
+def _order_updated(mapper, connection, target):
+    old_quantity = _previous(target, 'quantity')
+    old_status = _previous(target, 'status')
+    if _UNKNOWN in (old_quantity, old_status):
+        _request_rebuild(target)
+        return
+
+    deltas = {'order_quantity': (target.quantity or 0) - (old_quantity or 0)}
+    if old_status != target.status:
+        old_column = order_status_column(old_status)
+        new_column = order_status_column(target.status)
+        if old_column:
+            deltas[old_column] = -1
+        if new_column:
+            deltas[new_column] = deltas.get(new_column, 0) + 1
+    apply_delta(connection, deltas, target)
+
+
+def _order_deleted(mapper, connection, target):
+    deltas = {'total_orders': -1, 'order_quantity': -(target.quantity or 0)}
+    column = order_status_column(target.status)
+    if column:
+        deltas[column] = -1
+    apply_delta(connection, deltas, target)
+
+
+def _rebuild_after_flush(session, flush_context):
+    if session.info.pop('summary_rebuild', False):
+        rebuild(session.connection())
+
+
+def _bulk_write(context):
+    """Query.update()/Query.delete() don't expose their rows; rebuild instead"""
+    model = context.mapper.class_ if context.mapper else None
+    if model in (Garment, Order):
+        rebuild(context.session.connection())
+
+
+event.listen(Garment, 'after_insert', _garment_inserted)
+event.listen(Garment, 'after_update', _garment_updated)
+event.listen(Garment, 'after_delete', _garment_deleted)
+event.listen(Order, 'after_insert', _order_inserted)
+event.listen(Order, 'after_update', _order_updated)
+event.listen(Order, 'after_delete', _order_deleted)
+event.listen(Session, 'after_flush', _rebuild_after_flush)
+event.listen(Session, 'after_bulk_update', _bulk_write)
+event.listen(Session, 'after_bulk_delete', _bulk_write)
+
+
+@click.command('rebuild-stats')
+@with_appcontext
+def rebuild_stats_command():
+    """Recompute the dashboard summary counters from the raw tables"""
+    counters = rebuild()
+    db.session.commit()
+    print(f"✅ Dashboard summary rebuilt: {counters['total_garments']} garments, {counters['total_orders']} orders")
+
+
+COMMANDS = (rebuild_stats_command,)
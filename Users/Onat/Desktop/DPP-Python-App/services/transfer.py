@@ -0,0 +1,570 @@
+"""Bulk import and export of garments and orders (CSV, NDJSON, XLSX)
+
+Imports stream-parse the source row by row, coerce values with converters
+compiled once per import, and upsert each batch in its own transaction:
+garments on their unique ``po_number``, orders on their unique ``order_id``.
+Rows that fail validation are skipped and reported with their row number.
+
+Exports read from a server-side cursor in chunks (see services/listing.py)
+and write each chunk out immediately.
+"""
+import csv
+import io
+import json
+import shutil
+import tempfile
+import uuid
+from collections import Counter
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import Integer, Float, DateTime, select
+from sqlalchemy.dialects import sqlite, postgresql
+
+from app import db
+from models.garment import Garment
+from models.orders import Order
+from services import carbon, change_feed, dimensions, rollups, stats as stats_engine, status_history
+from services.database import begin_immediate
+from services import serialization
+from services.listing import encoder_for, iter_row_chunks, iter_rows
+from services.summary import apply_delta, order_status_column
+
+FORMATS = ('csv', 'ndjson', 'xlsx')
+DEFAULT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+
+
+class ImportSpec:
+    """How one model's rows are keyed, named and counted in the summary"""
+
+    def __init__(self, model, key, aliases, summary_columns, contribution):
+        self.model = model
+        self.table = model.__table__
+        self.key = key
+        self.aliases = aliases
+        self.summary_columns = summary_columns
+        self.contribution = contribution
+        # Columns set by the database/importer rather than the source file
+        self.managed = {'id', 'created_date', 'updated_date'}
+
+    @property
+    def importable(self):
+        return [name for name in dimensions.public_fields(self.model) if name not in self.managed]
+
+    @property
+    def required(self):
+        fields = dimensions.fields(self.model)
+        required = []
+        for name in self.importable:
+            if name in fields:
+                if not fields[name].nullable:
+                    required.append(name)
+            elif not self.table.c[name].nullable and self.table.c[name].default is None:
+                required.append(name)
+        return required
+
+
+def _garment_contribution(values):
+    return {
+        'total_garments': 1,
+        'garment_quantity': values.get('quantity') or 0,
+        'total_carbon': values.get('carbon_footprint') or 0.0
+    }
+
+
+def _order_contribution(values):
+    contribution = {'total_orders': 1, 'order_quantity': values.get('quantity') or 0}
+    column = order_status_column(values.get('status'))
+    if column:
+        contribution[column] = 1
+    return contribution
+
+
+SPECS = {
+    'garments': ImportSpec(
+        Garment, 'po_number',
+        aliases={'facility': 'production_facility', 'po': 'po_number', 'style': 'style_name'},
+        summary_columns=('quantity', 'carbon_footprint'),
+        contribution=_garment_contribution
+    ),
+    'orders': ImportSpec(
+        Order, 'order_id',
+        aliases={'production_facility': 'facility', 'po': 'po_number', 'style': 'style_name'},
+        summary_columns=('quantity', 'status'),
+        contribution=_order_contribution
+    )
+}
+
+
+def detect_format(filename=None, explicit=None):
+    """Pick the file format from an explicit value or the file extension"""
+    fmt = (explicit or (filename or '').rsplit('.', 1)[-1]).lower()
+    if fmt == 'jsonl':
+        fmt = 'ndjson'
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format '{fmt}', expected one of: {', '.join(FORMATS)}")
+    return fmt
+
+
+def normalize_header(name, spec):
+    """'Production Facility' -> 'production_facility', then apply aliases"""
+    key = str(name or '').strip().lower().replace(' ', '_').replace('-', '_')
+    return spec.aliases.get(key, key)
+
+
+# Parsing: each reader yields (row_number, {header: raw value})
+
+def _read_csv(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    for number, record in enumerate(csv.DictReader(text), start=2):
+        yield number, record
+
+
+def _read_ndjson(stream):
+    for number, line in enumerate(io.TextIOWrapper(stream, encoding='utf-8'), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield number, ValueError(f'Invalid JSON: {e}')
+            continue
+        yield number, record if isinstance(record, dict) else ValueError('Expected a JSON object')
+
+
+def _read_xlsx(stream):
+    try:
+        from openpyxl import load_workbook
+    except ImportError as e:
+        raise RuntimeError('XLSX support requires the openpyxl package') from e
+
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        for number, values in enumerate(rows, start=2):
+            if any(value not in (None, '') for value in values):
+                yield number, dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+READERS = {'csv': _read_csv, 'ndjson': _read_ndjson, 'xlsx': _read_xlsx}
+
+
+# Validation and coercion
+
+def _to_int(value):
+    return int(float(value)) if isinstance(value, str) else int(value)
+
+
+def _to_datetime(value):
+    return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+
+def _to_str(value):
+    return str(value).strip()
+
+
+def build_converters(spec):
+    """One converter per importable column, resolved once per import"""
+    converters = {}
+    for name in spec.importable:
+        if name not in spec.table.c:
+            # Dimension fields (country, facility, fabric) are text
+            converters[name] = _to_str
+            continue
+        column_type = spec.table.c[name].type
+        if isinstance(column_type, Integer):
+            converters[name] = _to_int
+        elif isinstance(column_type, Float):
+            converters[name] = float
+        elif isinstance(column_type, DateTime):
+            converters[name] = _to_datetime
+        else:
+            converters[name] = _to_str
+    return converters
+
+
+def _column_default(column):
+    default = column.default
+    if default is not None and default.is_scalar:
+        return default.arg
+    return None
+
+
+def column_defaults(spec):
+    """Scalar column defaults for the importable columns"""
+    defaults = {}
+    for name in spec.importable:
+        if name not in spec.table.c:
+            continue
+        default = _column_default(spec.table.c[name])
+        if default is not None:
+            defaults[name] = default
+    return defaults
+
+
+def known_fields(spec, converters, record, errors):
+    """(column name, raw value) of each importable field of a record
+
+    Managed columns (id and the timestamps) and blank headers are skipped so
+    exported files import again; any other field is added to `errors` as
+    unknown. Imports and the batch endpoint validate fields the same way.
+    """
+    for header, raw in record.items():
+        name = normalize_header(header, spec)
+        if name in converters:
+            yield name, raw
+        elif name and name not in spec.managed:
+            errors.append(f'{header}: unknown field')
+
+
+def coerce_row(spec, converters, defaults, record):
+    """Convert one parsed record into column values, collecting every error
+
+    Returns the values (with column defaults filled in), the names the record
+    actually supplied and the list of errors.
+    """
+    values = {}
+    errors = []
+    for name, raw in known_fields(spec, converters, record, errors):
+        if raw is None or (isinstance(raw, str) and not raw.strip()):
+            continue
+        try:
+            values[name] = converters[name](raw)
+        except (TypeError, ValueError):
+            values[name] = None
+            errors.append(f"{name}: invalid value {raw!r}")
+
+    supplied = set(values)
+    if spec.model is Order:
+        # Orders without an id are new; the id is generated like Order.__init__ does
+        values.setdefault('order_id', f"ORD-{str(uuid.uuid4())[:8].upper()}")
+        if values.get('status', 'pending') not in Order.STATUSES:
+            errors.append(f"status: must be one of {', '.join(Order.STATUSES)}")
+
+    for name in spec.required:
+        if name not in values:
+            errors.append(f'{name}: required')
+
+    for name, default in defaults.items():
+        values.setdefault(name, default)
+    return values, supplied, errors
+
+
+# Upserting
+
+def _upsert_statement(connection, spec, update_columns):
+    dialect = {'sqlite': sqlite, 'postgresql': postgresql}.get(connection.dialect.name)
+    if dialect is None:
+        raise RuntimeError(f'Upserts are not supported on {connection.dialect.name}')
+    statement = dialect.insert(spec.table)
+    return statement.on_conflict_do_update(
+        index_elements=[spec.key],
+        set_={name: statement.excluded[name] for name in update_columns}
+    )
+
+
+def _existing_rows(spec, connection, rows):
+    """{key: {summary and dimension key column: value}} of the batch's existing rows"""
+    key = spec.table.c[spec.key]
+    names = list(spec.summary_columns) + sorted(dimensions.key_columns(spec.model))
+    keys = list({row[spec.key] for row in rows})
+    return {
+        row[0]: dict(zip(names, row[1:]))
+        for row in connection.execute(select(key, *(spec.table.c[name] for name in names)).where(key.in_(keys)))
+    }
+
+
+def _encode_dimensions(spec, connection, rows, existing):
+    """Turn the batch's dimension values into key columns, in place
+
+    Existing rows keep the dimension parts (and keys) the source didn't supply.
+    """
+    current = [existing.get(row[spec.key]) for row in rows]
+    dimensions.encode_rows(connection, spec.model, rows, current)
+    for name in dimensions.key_columns(spec.model):
+        for row, stored in zip(rows, current):
+            if name not in row:
+                row[name] = stored[name] if stored is not None else None
+
+
+def _summary_deltas(spec, rows, update_columns, existing):
+    """Exact DashboardStats deltas for a batch, from its existing rows"""
+    state = {
+        key: {name: values[name] for name in spec.summary_columns}
+        for key, values in existing.items()
+    }
+
+    deltas = Counter()
+    for row in rows:
+        old = state.get(row[spec.key])
+        if old is None:
+            new = {name: row.get(name) for name in spec.summary_columns}
+            deltas.update(spec.contribution(new))
+        else:
+            new = {
+                name: row.get(name) if name in update_columns else old[name]
+                for name in spec.summary_columns
+            }
+            deltas.update(spec.contribution(new))
+            deltas.subtract(spec.contribution(old))
+        state[row[spec.key]] = new
+    return dict(deltas)
+
+
+def _write_batch(spec, rows, update_columns):
+    """Upsert one batch in its own transaction"""
+    try:
+        with begin_immediate():
+            connection = db.session.connection()
+        existing = _existing_rows(spec, connection, rows)
+        deltas = _summary_deltas(spec, rows, update_columns, existing)
+        update_columns = dimensions.stored_columns(spec.model, update_columns)
+        _encode_dimensions(spec, connection, rows, existing)
+        written = spec.table.c[spec.key].in_(list({row[spec.key] for row in rows}))
+        rollups.apply(connection, spec.model, [written], sign=-1)
+        connection.execute(_upsert_statement(connection, spec, update_columns), rows)
+        apply_delta(connection, deltas)
+        if spec.model is Garment:
+            carbon.rescore_written(db.session, written)
+        rollups.apply(connection, spec.model, [written])
+        if spec.model is Order:
+            status_history.record(connection, [written])
+        stats_engine.mark_dirty(db.session, spec.model)
+        # Upserted ids aren't known without reading them back
+        change_feed.record(db.session, spec.table.name, reset=True)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def import_rows(kind, stream, fmt, batch_size=DEFAULT_BATCH_SIZE, job=None):
+    """Stream-parse `stream` and upsert its rows into the `kind` table
+
+    As a background job (services/jobs.py) it reports progress after every
+    batch and stops between batches when cancellation is asked.
+    """
+    spec = SPECS[kind]
+    converters = build_converters(spec)
+    defaults = column_defaults(spec)
+
+    report = {'processed': 0, 'imported': 0, 'failed': 0, 'errors': []}
+    batch = []
+    batch_columns = set()
+
+    def flush():
+        if not batch:
+            return
+        now = datetime.utcnow()
+        columns = (set(spec.importable) - set(dimensions.fields(spec.model))) | set(defaults)
+        for row in batch:
+            for name in columns:
+                row.setdefault(name, None)
+            row['created_date'] = row['updated_date'] = now
+        # Only overwrite columns the source actually supplied (plus the timestamp)
+        update_columns = sorted((batch_columns - {spec.key}) | {'updated_date'})
+        _write_batch(spec, batch, update_columns)
+        report['imported'] += len(batch)
+        batch.clear()
+        batch_columns.clear()
+        if job is not None:
+            job.update(processed=report['processed'], imported=report['imported'], failed=report['failed'])
+            job.check_cancelled()
+
+    for number, record in READERS[fmt](stream):
+        report['processed'] += 1
+        if isinstance(record, Exception):
+            values, supplied, errors = None, set(), [str(record)]
+        else:
+            values, supplied, errors = coerce_row(spec, converters, defaults, record)
+
+        if errors:
+            report['failed'] += 1
+            if len(report['errors']) < MAX_REPORTED_ERRORS:
+                report['errors'].append({'row': number, 'errors': errors})
+            continue
+
+        batch_columns.update(supplied)
+        batch.append(values)
+        if len(batch) >= batch_size:
+            flush()
+
+    flush()
+    return report
+
+
+# Exporting
+
+def export_chunks(kind, fmt, fields=None):
+    """Yield the `kind` table as CSV or NDJSON text, one cursor chunk at a time"""
+    spec = SPECS[kind]
+    fields = fields or dimensions.public_fields(spec.model)
+
+    if fmt == 'ndjson':
+        chunks = iter_row_chunks(spec.model, fields)
+        for body in serialization.stream_chunks('ndjson', encoder_for(spec.model, fields), chunks):
+            yield body.decode('utf-8')
+        return
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields)
+    writer.writeheader()
+    for chunk in iter_rows(spec.model, fields):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_xlsx(kind, fields=None):
+    """Write the `kind` table to a temporary XLSX file and return the file"""
+    try:
+        from openpyxl import Workbook
+    except ImportError as e:
+        raise RuntimeError('XLSX support requires the openpyxl package') from e
+
+    spec = SPECS[kind]
+    fields = fields or dimensions.public_fields(spec.model)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(kind)
+    sheet.append(fields)
+    for chunk in iter_rows(spec.model, fields):
+        for item in chunk:
+            sheet.append([item[name] for name in fields])
+
+    output = tempfile.TemporaryFile(suffix='.xlsx')
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+# HTTP helpers used by the garment and orders blueprints
+
+def _wants_background():
+    from flask import request
+    return request.args.get('background', '').lower() in ('1', 'true', 'yes')
+
+
+def import_response(kind):
+    """Handle an import upload (multipart 'file' field or raw request body)
+
+    With ?background=1 the upload is saved and imported by a background job.
+    """
+    from flask import request, jsonify
+    from services.jobs import submit_job, job_accepted, job_file_path
+
+    upload = request.files.get('file')
+    try:
+        fmt = detect_format(upload.filename if upload else None, request.args.get('format'))
+        batch_size = max(1, request.args.get('batch_size', DEFAULT_BATCH_SIZE, type=int))
+        if _wants_background():
+            job_id = uuid.uuid4().hex
+            if upload:
+                upload.save(job_file_path(job_id, fmt))
+            else:
+                with open(job_file_path(job_id, fmt), 'wb') as target:
+                    shutil.copyfileobj(request.stream, target)
+            submit_job('import', {'kind': kind, 'fmt': fmt, 'batch_size': batch_size}, job_id=job_id)
+            return job_accepted(job_id, f'Import of {kind} queued')
+
+        stream = upload.stream if upload else request.stream
+        if fmt == 'xlsx' and not upload:
+            # openpyxl needs a seekable file
+            spooled = tempfile.SpooledTemporaryFile()
+            spooled.write(request.get_data())
+            spooled.seek(0)
+            stream = spooled
+        report = import_rows(kind, stream, fmt, batch_size=batch_size)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error importing {kind}: {str(e)}'
+        }), 400
+
+    return jsonify({
+        'success': report['failed'] == 0,
+        'message': f"{report['imported']} {kind} imported, {report['failed']} rows rejected",
+        **report
+    })
+
+
+def export_response(kind):
+    """Stream the table as CSV/NDJSON or send it as an XLSX download
+
+    With ?background=1 a job writes the file for /api/jobs/<id>/download.
+    """
+    from flask import Response, request, jsonify, send_file, stream_with_context
+    from services.jobs import submit_job, job_accepted
+    from services.listing import resolve_fields
+
+    try:
+        fmt = detect_format(explicit=request.args.get('format', 'csv'))
+        fields = resolve_fields(SPECS[kind].model, request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+
+    if _wants_background():
+        job_id = submit_job('export', {'kind': kind, 'fmt': fmt, 'fields': fields})
+        return job_accepted(job_id, f'Export of {kind} queued')
+
+    filename = f'{kind}.{fmt}'
+    if fmt == 'xlsx':
+        return send_file(export_xlsx(kind, fields), mimetype=MIMETYPES[fmt],
+                         as_attachment=True, download_name=filename)
+
+    response = Response(stream_with_context(export_chunks(kind, fmt, fields)), mimetype=MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+
+@click.command('import-data')
+@click.argument('kind', type=click.Choice(['garments', 'orders']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson', 'xlsx']), help='Defaults to the file extension')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows per upsert transaction')
+@with_appcontext
+def import_data_command(kind, path, fmt, batch_size):
+    """Bulk upsert garments or orders from a CSV, NDJSON or XLSX file"""
+    with open(path, 'rb') as stream:
+        report = import_rows(kind, stream, detect_format(path, fmt), batch_size=batch_size)
+    print(f"✅ {report['imported']} {kind} imported, {report['failed']} rows rejected")
+    for error in report['errors']:
+        print(f"   row {error['row']}: {'; '.join(error['errors'])}")
+
+
+@click.command('export-data')
+@click.argument('kind', type=click.Choice(['garments', 'orders']))
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson', 'xlsx']), help='Defaults to the file extension')
+@with_appcontext
+def export_data_command(kind, path, fmt):
+    """Export all garments or orders to a CSV, NDJSON or XLSX file"""
+    import shutil
+    fmt = detect_format(path, fmt)
+    if fmt == 'xlsx':
+        with export_xlsx(kind) as source, open(path, 'wb') as target:
+            shutil.copyfileobj(source, target)
+    else:
+        with open(path, 'w', encoding='utf-8', newline='') as target:
+            for chunk in export_chunks(kind, fmt):
+                target.write(chunk)
+    print(f"✅ {kind} exported to {path}")
+
+
+COMMANDS = (import_data_command, export_data_command)
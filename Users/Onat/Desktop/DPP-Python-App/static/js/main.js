@@ -194,6 +194,52 @@ function validateForm(formId) {
     return isValid;
 }
 
+// Change feed: call onChange(event) for every garment/order change.
+// Uses server-sent events, falling back to long-polling; both resume from
+// the last seen sequence number. onReset() means the feed can't tell what
+// changed (too many rows, or missed events) and the data should be refetched.
+function subscribeChanges(tables, onChange, onReset) {
+    const query = tables && tables.length ? `tables=${tables.join(',')}` : '';
+    onReset = onReset || (() => location.reload());
+    
+    if (window.EventSource) {
+        const source = new EventSource(`/api/changes${query ? '?' + query : ''}`);
+        source.addEventListener('change', e => onChange(JSON.parse(e.data)));
+        source.addEventListener('reset', () => onReset());
+        return () => source.close();
+    }
+    
+    let stopped = false;
+    let after = '';
+    function poll() {
+        if (stopped) return;
+        fetch(`/api/changes/poll?${query}&after=${after}`)
+            .then(response => response.json())
+            .then(data => {
+                if (after !== '' && data.reset) {
+                    onReset();
+                }
+                (data.events || []).forEach(onChange);
+                after = data.last_event_id;
+                poll();
+            })
+            .catch(() => setTimeout(poll, 3000));
+    }
+    poll();
+    return () => { stopped = true; };
+}
+
+// Update elements marked data-stat="<counter>" from a change event
+function applyStats(event) {
+    if (!event.stats) return;
+    document.querySelectorAll('[data-stat]').forEach(element => {
+        const value = event.stats[element.dataset.stat];
+        if (value !== undefined) {
+            element.textContent = value;
+        }
+    });
+}
+
 // Export functions for global use
 window.DPPApp = {
     showAlert,
@@ -203,5 +249,7 @@ window.DPPApp = {
     apiRequest,
     showLoading,
     hideLoading,
-    validateForm
+    validateForm,
+    subscribeChanges,
+    applyStats
 };
\ No newline at end of file
@@ -0,0 +1,86 @@
+import pytest
+from sqlalchemy import text
+
+from app import create_app, db
+from config import TestingConfig
+
+
+def make_app(instance):
+    """Testing app whose database and generated files live under `instance`
+
+    The database is a file: an in-memory one is a single shared connection,
+    so check_query_plans() couldn't explain queries next to a request.
+    """
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{instance / 'dpp.db'}")
+        patch.setattr(TestingConfig, 'ASSET_BUILD_DIR', str(instance / 'assets'), raising=False)
+        patch.setattr(TestingConfig, 'PASSPORT_CACHE_DIR', str(instance / 'passports'))
+        return create_app('testing')
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """Shared testing app seeded with bulk-generated rows; tests must not write to it"""
+    from services.bulk import generate_garments, generate_orders
+
+    app = make_app(tmp_path_factory.mktemp('instance'))
+    with app.app_context():
+        generate_orders(2000, seed=1, spread_days=30)
+        generate_garments(2000, seed=1, spread_days=30)
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
+    return app
+
+
+@pytest.fixture
+def empty_app(tmp_path):
+    """Testing app on a fresh, empty database"""
+    return make_app(tmp_path)
+
+
+@pytest.fixture
+def client(empty_app):
+    return empty_app.test_client()
+
+
+ORDER = {
+    'country': 'Turkey',
+    'facility': 'Mango Apparel Facilities',
+    'po_number': 'PO-1',
+    'style_name': 'Style-1',
+    'product_type': 'T-Shirt',
+    'fabric_type': 'Cotton',
+    'fabric_name': 'Organic Cotton',
+    'fabric_construction': 'Jersey',
+    'fabric_weight': 180.0,
+    'quantity': 100,
+    'status': 'pending'
+}
+
+
+def create_order(client, **values):
+    """POST an order and return its id"""
+    response = client.post('/orders/api/orders', json={**ORDER, **values})
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['order']['id']
+
+
+GARMENT = {
+    'country': 'Turkey',
+    'production_facility': 'Mango Apparel Facilities',
+    'po_number': 'PO-G1',
+    'style_name': 'Style-G1',
+    'product_type': 'T-Shirt',
+    'fabric_type': 'Cotton',
+    'fabric_name': 'Organic Cotton',
+    'fabric_construction': 'Jersey',
+    'fabric_weight': 180.0,
+    'quantity': 100
+}
+
+
+def create_garment(client, **values):
+    """POST a garment and return its id"""
+    response = client.post('/garment/api/garments', json={**GARMENT, **values})
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['garment']['id']
@@ -0,0 +1,45 @@
+import os
+
+from services.batch import benchmark
+from tests.conftest import ORDER, create_order
+
+
+def batch(client, *operations):
+    return client.post('/orders/api/orders/batch', json={'operations': list(operations), 'atomic': False}).get_json()
+
+
+def import_csv(client, text):
+    return client.post('/orders/api/orders/import?format=csv', data=text.encode()).get_json()
+
+
+def test_batch_and_import_reject_the_same_unknown_fields(client):
+    order_id = create_order(client)
+    report = batch(
+        client,
+        {'op': 'create', 'data': {**ORDER, 'po_number': 'PO-2', 'colour': 'red'}},
+        {'op': 'update', 'id': order_id, 'data': {'colour': 'red'}}
+    )
+    assert [result.get('errors') for result in report['results']] == [['colour: unknown field']] * 2
+
+    header = ','.join([*ORDER, 'colour'])
+    row = ','.join([*(str(value) for value in {**ORDER, 'po_number': 'PO-3'}.values()), 'red'])
+    report = import_csv(client, f'{header}\n{row}\n')
+    assert report['failed'] == 1
+    assert report['errors'] == [{'row': 2, 'errors': ['colour: unknown field']}]
+
+
+def test_exported_files_import_again(client):
+    create_order(client)
+    exported = client.get('/orders/api/orders/export?format=csv').get_data(as_text=True)
+    assert exported.startswith('id,')
+    report = import_csv(client, exported)
+    assert report['failed'] == 0 and report['imported'] == 1
+
+
+def test_benchmark_runs_on_a_temporary_database():
+    database_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database')
+    before = sorted(os.listdir(database_dir)) if os.path.isdir(database_dir) else None
+    result = benchmark('orders', 5, 'production')
+    assert set(result) == {'count', 'single_update', 'batch_update', 'single_delete', 'batch_delete'}
+    after = sorted(os.listdir(database_dir)) if os.path.isdir(database_dir) else None
+    assert after == before
@@ -0,0 +1,28 @@
+import itertools
+
+from services.benchmarks import RunContext, Scenario, compare, measure_in_process
+
+
+def results(**scenario):
+    stats = {'count': 100, 'errors': 0, 'p50_ms': 10.0, 'p99_ms': 20.0, 'rps': 100.0, **scenario}
+    return {'sizes': {'1000': {'modes': {'in_process': {'stats': stats}}}}}
+
+
+def test_compare_counts_more_errors_as_a_regression():
+    regressions = compare(results(errors=0), results(errors=3))
+    assert [(item['metric'], item['baseline'], item['current']) for item in regressions] == [('errors', 0, 3)]
+    assert compare(results(errors=3), results(errors=3)) == []
+    assert compare(results(errors=3), results(errors=1)) == []
+
+
+def test_compare_latency_and_throughput_thresholds():
+    regressions = compare(results(), results(p50_ms=20.0, p99_ms=25.0, rps=50.0))
+    assert [item['metric'] for item in regressions] == ['p50_ms', 'rps']
+
+
+def test_failed_requests_are_left_out_of_the_latencies(empty_app):
+    paths = itertools.cycle(['/api/stats', '/api/missing'])
+    scenario = Scenario('mixed', lambda context: next(paths))
+    result = measure_in_process(empty_app, [scenario], RunContext(1, {}), requests=10, warmup=0)['mixed']
+    assert result['count'] == 5
+    assert result['errors'] == 5
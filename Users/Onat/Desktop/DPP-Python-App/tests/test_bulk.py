@@ -0,0 +1,66 @@
+import pytest
+
+from app import db
+from services import search
+from services.bulk import generate_orders
+from services.database import begin_immediate
+
+
+@pytest.mark.parametrize('flag, deferred', [(False, False), ('false', False), ('0', False), (True, True), ('true', True)])
+def test_defer_indexes_flag_is_parsed_strictly(client, flag, deferred):
+    response = client.post('/orders/api/orders/bulk-generate', json={'count': 10, 'defer_indexes': flag})
+    assert response.status_code == 201, response.get_json()
+    assert response.get_json()['deferred_indexes'] is deferred
+
+
+@pytest.mark.parametrize('flag', ['maybe', 2, [True]])
+def test_invalid_defer_indexes_flag_is_rejected(client, flag):
+    response = client.post('/orders/api/orders/bulk-generate', json={'count': 10, 'defer_indexes': flag})
+    assert response.status_code == 400
+    assert 'defer_indexes must be true or false' in response.get_json()['message']
+
+
+def _found(q):
+    result = search.search('orders', q, facets=False)
+    db.session.rollback()
+    return result['window_total']
+
+
+def test_generated_rows_are_searchable_once_caught_up(empty_app):
+    with empty_app.app_context():
+        result = generate_orders(50, seed=1, queue_search=False)
+        assert result['search_pending'] == 50
+        assert search.pending() == {'orders': 50}
+        db.session.rollback()
+        assert _found('style') == 0
+
+        with begin_immediate():
+            assert search.catch_up() == {'orders': 50}
+        db.session.commit()
+        assert search.pending() == {}
+        db.session.rollback()
+        assert _found('style') == 50
+
+
+def test_rows_edited_before_the_catch_up_are_indexed_as_they_are_then(empty_app, client):
+    with empty_app.app_context():
+        generate_orders(5, seed=1, queue_search=False)
+    assert client.put('/orders/api/orders/1', json={'style_name': 'Zebrastripe'}).status_code == 200
+    assert client.delete('/orders/api/orders/2').status_code == 200
+    with empty_app.app_context():
+        assert _found('zebrastripe') == 0
+        with begin_immediate():
+            search.catch_up()
+        db.session.commit()
+        assert _found('zebrastripe') == 1
+        assert _found('style') == 3
+
+
+def test_api_generate_queues_the_catch_up(empty_app, client):
+    # The testing config runs jobs inline, so the catch-up is done on return
+    response = client.post('/orders/api/orders/bulk-generate', json={'count': 20, 'seed': 3})
+    assert response.get_json()['search_pending'] == 20
+    with empty_app.app_context():
+        assert search.pending() == {}
+        db.session.rollback()
+        assert _found('style') == 20
@@ -0,0 +1,48 @@
+import pytest
+
+from services import carbon
+from services.database import begin_immediate
+from tests.conftest import create_garment
+
+
+def footprint(client, garment_id):
+    return client.get(f'/garment/api/garments/{garment_id}').get_json()['carbon_footprint']
+
+
+def test_factors_changed_by_another_process_are_used_on_the_next_write(empty_app, client):
+    po_numbers = (f'PO-W{index}' for index in range(3))
+    wool = {'fabric_type': 'Wool', 'fabric_weight': 1000.0, 'quantity': 1}
+    assert footprint(client, create_garment(client, po_number=next(po_numbers), **wool)) == pytest.approx(14.9)
+
+    # Another worker process: this one's factor cache is not invalidated
+    with empty_app.app_context():
+        with begin_immediate() as session:
+            carbon.set_factors(session, [{'kind': 'fabric', 'key': 'wool', 'factor': 1.0}])
+            session.commit()
+    assert footprint(client, create_garment(client, po_number=next(po_numbers), **wool)) == pytest.approx(2.0)
+
+    with empty_app.app_context():
+        with begin_immediate() as session:
+            carbon.set_factors(session, [{'kind': 'fabric', 'key': 'wool', 'factor': None}])
+            session.commit()
+    # The '*' fallback of 7.0
+    assert footprint(client, create_garment(client, po_number=next(po_numbers), **wool)) == pytest.approx(8.0)
+
+
+@pytest.mark.parametrize('rescore, queued', [(False, False), ('false', False), ('0', False), (True, True), (None, True)])
+def test_rescore_flag_is_parsed_strictly(client, rescore, queued):
+    body = {'factors': [{'kind': 'fabric', 'key': 'wool', 'factor': 10.0}]}
+    if rescore is not None:
+        body['rescore'] = rescore
+    response = client.put('/garment/api/emission-factors', json=body)
+    assert response.status_code in (200, 202), response.get_json()
+    assert ('job_id' in response.get_json()) is queued
+
+
+def test_invalid_rescore_flag_changes_nothing(client):
+    response = client.put('/garment/api/emission-factors', json={
+        'factors': [{'kind': 'fabric', 'key': 'wool', 'factor': 10.0}], 'rescore': 'maybe'
+    })
+    assert response.status_code == 400
+    factors = client.get('/garment/api/emission-factors').get_json()['factors']
+    assert {factor['key']: factor['factor'] for factor in factors if factor['kind'] == 'fabric'}['wool'] == 13.9
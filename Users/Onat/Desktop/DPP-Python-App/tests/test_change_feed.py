@@ -0,0 +1,106 @@
+from app import db
+from models.orders import Order
+from services.bulk import generate_orders
+from tests.conftest import ORDER, create_garment, create_order
+
+
+def _latest(client):
+    return client.get('/api/changes/poll').get_json()['last_event_id']
+
+
+def _events(client, after, **args):
+    query = '&'.join(f'{name}={value}' for name, value in {'after': after, 'timeout': 0, **args}.items())
+    response = client.get(f'/api/changes/poll?{query}')
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['events']
+
+
+def test_api_writes_are_published_with_the_counters(client):
+    after = _latest(client)
+    order_id = create_order(client)
+    assert client.put(f'/orders/api/orders/{order_id}', json={'status': 'completed'}).status_code == 200
+    assert client.delete(f'/orders/api/orders/{order_id}').status_code == 200
+
+    events = _events(client, after)
+
+    created, updated, deleted = [event['changes'] for event in events]
+    assert created == {'orders': {'created': [order_id]}}
+    assert updated['orders']['updated'][str(order_id)]['status'] == 'completed'
+    assert deleted == {'orders': {'deleted': [order_id]}}
+    assert [event['stats']['total_orders'] for event in events] == [1, 1, 0]
+    assert events[1]['stats']['completed_orders'] == 1
+    assert [event['seq'] for event in events] == sorted(event['seq'] for event in events)
+
+
+def test_rows_updated_and_deleted_in_one_commit_are_only_reported_deleted(empty_app, client):
+    kept, removed = create_order(client, po_number='PO-1'), create_order(client, po_number='PO-2')
+    after = _latest(client)
+
+    with empty_app.app_context():
+        for order in db.session.scalars(db.select(Order)):
+            order.status = 'processing'
+        db.session.flush()
+        db.session.delete(db.session.get(Order, removed))
+        db.session.commit()
+
+    [event] = _events(client, after)
+    assert event['changes'] == {'orders': {
+        'updated': {str(kept): {'status': 'processing'}},
+        'deleted': [removed]
+    }}
+
+
+def test_rows_created_and_updated_in_one_commit_are_only_reported_created(empty_app, client):
+    after = _latest(client)
+
+    with empty_app.app_context():
+        order = Order(**ORDER)
+        db.session.add(order)
+        db.session.flush()
+        order.status = 'completed'
+        db.session.commit()
+        order_id = order.id
+
+    [event] = _events(client, after)
+    assert event['changes'] == {'orders': {'created': [order_id]}}
+
+
+def test_rolled_back_writes_are_not_published(empty_app, client):
+    order_id = create_order(client)
+    after = _latest(client)
+
+    with empty_app.app_context():
+        db.session.get(Order, order_id).status = 'cancelled'
+        db.session.flush()
+        db.session.rollback()
+
+    assert _events(client, after) == []
+
+
+def test_readers_can_filter_tables_and_resume(client):
+    after = _latest(client)
+    create_order(client)
+    garment_id = create_garment(client)
+    create_order(client, po_number='PO-2')
+
+    garment_events = _events(client, after, tables='garments')
+    assert [event['changes'] for event in garment_events] == [{'garments': {'created': [garment_id]}}]
+
+    resumed = _events(client, garment_events[0]['seq'])
+    assert [list(event['changes']) for event in resumed] == [['orders']]
+
+
+def test_large_writes_are_sent_as_a_reset(empty_app, client):
+    empty_app.config['CHANGE_FEED_MAX_IDS'] = 2
+    after = _latest(client)
+
+    with empty_app.app_context():
+        generate_orders(5, seed=1)
+
+    [event] = _events(client, after)
+    assert event['changes'] == {'orders': {'reset': True}}
+
+
+def test_invalid_requests_are_rejected(client):
+    assert client.get('/api/changes/poll?tables=users').status_code == 400
+    assert client.get('/api/changes/poll?after=soon').status_code == 400
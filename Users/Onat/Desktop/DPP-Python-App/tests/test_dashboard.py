@@ -0,0 +1,24 @@
+from markupsafe import escape
+
+from services.modules import current_modules
+from tests.conftest import create_garment, create_order
+
+
+def test_dashboard_renders_on_an_empty_database(client):
+    response = client.get('/')
+    assert response.status_code == 200
+    assert b'Recent Orders' in response.data
+
+
+def test_dashboard_lists_modules_and_recent_rows(empty_app, client):
+    create_garment(client, style_name='Dashboard Tee')
+    create_order(client, style_name='Dashboard Order')
+    response = client.get('/')
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert 'Dashboard Tee' in page
+    assert 'Dashboard Order' in page
+    with empty_app.app_context():
+        modules = current_modules()
+    assert modules
+    assert all(escape(module.name) in page for module in modules)
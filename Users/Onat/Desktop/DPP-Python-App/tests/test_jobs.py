@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, insert, select
+
+from services.jobs import jobs_engine, jobs_table, purge_finished
+
+
+def test_purge_finished_removes_old_finished_jobs_and_files(empty_app, tmp_path):
+    now = datetime.utcnow()
+    old = now - timedelta(days=10)
+    jobs = {
+        'oldcompleted': ('completed', old),
+        'oldfailed': ('failed', old),
+        'recentdone': ('completed', now - timedelta(days=1)),
+        'oldrunning': ('running', None)
+    }
+    files = tmp_path / 'jobs'
+    files.mkdir()
+    for job_id in jobs:
+        (files / f'{job_id}.csv').write_text('')
+
+    with empty_app.app_context():
+        engine = jobs_engine()
+        table = jobs_table()
+        with engine.begin() as connection:
+            connection.execute(insert(table), [
+                {'id': job_id, 'kind': 'stats.rebuild', 'status': status, 'created_date': old,
+                 'run_after': old, 'finished_date': finished}
+                for job_id, (status, finished) in jobs.items()
+            ])
+
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            purge_finished(engine, 7, str(files))
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+
+        with engine.connect() as connection:
+            left = set(connection.execute(select(table.c.id)).scalars())
+
+    assert left == {'recentdone', 'oldrunning'}
+    assert sorted(path.name for path in files.iterdir()) == ['oldrunning.csv', 'recentdone.csv']
+    # It reads before it deletes, so it takes the write lock up front
+    assert statements[0] == 'BEGIN IMMEDIATE'
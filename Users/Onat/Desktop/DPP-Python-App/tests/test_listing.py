@@ -0,0 +1,40 @@
+from sqlalchemy import text
+
+from app import db
+from services.listing import decode_cursor
+from tests.conftest import create_order
+
+
+def _page_through(client, url):
+    ids, cursor = [], None
+    while True:
+        page = client.get(f'{url}&cursor={cursor}' if cursor else url).get_json()
+        ids += [item['id'] for item in page['items']]
+        cursor = page['next_cursor']
+        if not cursor:
+            return ids
+
+
+def test_keyset_pages_reach_rows_without_created_date(empty_app, client):
+    ids = [create_order(client, po_number=f'PO-{n}') for n in range(7)]
+    undated = ids[1:6:2]
+    with empty_app.app_context():
+        db.session.execute(text('UPDATE orders SET created_date = NULL WHERE id IN (:a, :b, :c)'),
+                           dict(zip('abc', undated)))
+        db.session.commit()
+
+    dated = [row_id for row_id in ids if row_id not in undated]
+    expected = sorted(dated, reverse=True) + sorted(undated, reverse=True)
+    for limit in (1, 2, 3):
+        assert _page_through(client, f'/orders/api/orders?limit={limit}&fields=id') == expected
+
+
+def test_cursor_of_undated_row_continues_the_undated_tail(empty_app, client):
+    ids = [create_order(client, po_number=f'PO-{n}') for n in range(3)]
+    with empty_app.app_context():
+        db.session.execute(text('UPDATE orders SET created_date = NULL'))
+        db.session.commit()
+
+    page = client.get('/orders/api/orders?limit=1&fields=id').get_json()
+    assert decode_cursor(page['next_cursor']) == (None, ids[2])
+    assert _page_through(client, '/orders/api/orders?limit=1&fields=id') == ids[::-1]
@@ -0,0 +1,67 @@
+import sqlite3
+
+from sqlalchemy import inspect, text
+
+from app import db
+from models.garment import Garment
+from models.orders import Order
+from tests.conftest import make_app
+
+# orders and garments as they were before the dimension tables
+LEGACY_SCHEMA = """
+CREATE TABLE garments (
+    id INTEGER PRIMARY KEY, country VARCHAR(100) NOT NULL, production_facility VARCHAR(200) NOT NULL,
+    po_number VARCHAR(50) NOT NULL UNIQUE, style_name VARCHAR(100) NOT NULL, product_type VARCHAR(100) NOT NULL,
+    fabric_type VARCHAR(100) NOT NULL, fabric_name VARCHAR(100), fabric_construction VARCHAR(100),
+    fabric_weight FLOAT, quantity INTEGER NOT NULL, carbon_footprint FLOAT, sustainability_score INTEGER,
+    created_date DATETIME, updated_date DATETIME
+);
+CREATE TABLE orders (
+    id INTEGER PRIMARY KEY, order_id VARCHAR(50) NOT NULL UNIQUE, country VARCHAR(100) NOT NULL,
+    facility VARCHAR(200) NOT NULL, po_number VARCHAR(50) NOT NULL, style_name VARCHAR(100) NOT NULL,
+    product_type VARCHAR(100) NOT NULL, fabric_type VARCHAR(100), fabric_name VARCHAR(100),
+    fabric_construction VARCHAR(100), fabric_weight FLOAT, quantity INTEGER NOT NULL, status VARCHAR(20),
+    created_date DATETIME, updated_date DATETIME
+);
+INSERT INTO garments VALUES
+    (1, 'Turkey', 'Mango Apparel Facilities', 'PO-G1', 'Style-G1', 'T-Shirt', 'Cotton', 'Organic Cotton',
+     'Jersey', 180.0, 100, 12.5, 60, '2026-01-05 10:00:00.000000', '2026-01-05 10:00:00.000000'),
+    (2, 'Portugal', 'Mango Apparel Facilities', 'PO-G2', 'Style-G2', 'Dress', 'Linen', NULL,
+     NULL, 150.0, 40, 3.0, 70, '2026-01-06 10:00:00.000000', '2026-01-06 10:00:00.000000');
+INSERT INTO orders VALUES
+    (1, 'ORD-1', 'Turkey', 'Mango Apparel Facilities', 'PO-1', 'Style-1', 'T-Shirt', 'Cotton', 'Organic Cotton',
+     'Jersey', 180.0, 100, 'pending', '2026-01-05 10:00:00.000000', '2026-01-05 10:00:00.000000'),
+    (2, 'ORD-2', 'Turkey', 'Other Facility', 'PO-2', 'Style-2', 'Dress', NULL, NULL,
+     NULL, 150.0, 50, 'completed', '2026-01-06 10:00:00.000000', '2026-01-06 10:00:00.000000');
+"""
+
+
+def test_legacy_text_columns_move_into_the_dimension_tables(tmp_path):
+    connection = sqlite3.connect(tmp_path / 'dpp.db')
+    connection.executescript(LEGACY_SCHEMA)
+    # Not one of the columns the migration was written for: it must survive
+    connection.execute("ALTER TABLE orders ADD COLUMN season VARCHAR(20) DEFAULT 'SS26'")
+    connection.commit()
+    connection.close()
+
+    app = make_app(tmp_path)
+
+    with app.app_context():
+        inspector = inspect(db.engine)
+        for model, extra in ((Garment, set()), (Order, {'season'})):
+            columns = {column['name'] for column in inspector.get_columns(model.__tablename__)}
+            assert columns == {column.name for column in model.__table__.columns} | extra, model
+
+        garments = {garment.po_number: garment.to_dict() for garment in Garment.query}
+        assert garments['PO-G1']['production_facility'] == 'Mango Apparel Facilities'
+        assert (garments['PO-G1']['fabric_name'], garments['PO-G2']['fabric_name']) == ('Organic Cotton', None)
+        assert garments['PO-G2']['country'] == 'Portugal'
+
+        orders = {order.order_id: order.to_dict() for order in Order.query}
+        assert [orders[key]['facility'] for key in ('ORD-1', 'ORD-2')] == ['Mango Apparel Facilities', 'Other Facility']
+        assert orders['ORD-2']['fabric_type'] is None
+        assert db.session.execute(text('SELECT fabric_id FROM orders WHERE id = 2')).scalar() is None
+
+    response = app.test_client().get('/orders/api/orders/search?q=Other')
+    assert [order['order_id'] for order in response.get_json()['items']] == ['ORD-2']
+
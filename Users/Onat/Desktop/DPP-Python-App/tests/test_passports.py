@@ -0,0 +1,70 @@
+import os
+import shutil
+
+import pytest
+
+from services import passports
+from tests.conftest import create_garment
+
+
+@pytest.mark.parametrize('url, content_type', [
+    ('/garment/1/passport', 'text/html; charset=utf-8'),
+    ('/garment/api/garments/1/passport?format=qr', 'text/plain; charset=utf-8'),
+    ('/garment/api/garments/1/passport', 'application/ld+json'),
+])
+def test_passport_content_type(app, url, content_type):
+    response = app.test_client().get(url)
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == content_type
+
+
+def passport_dirs(app, garment_id):
+    """Cached passport versions of a garment"""
+    with app.app_context():
+        directory = os.path.dirname(passports.passport_dir(f'{garment_id}-x'))
+    return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+
+def test_a_changed_garment_gets_a_new_version_and_the_old_one_is_dropped(empty_app, client):
+    garment_id = create_garment(client)
+    first = client.get(f'/garment/api/garments/{garment_id}/passport')
+    assert first.status_code == 200
+    assert len(passport_dirs(empty_app, garment_id)) == 1
+    assert client.get(f'/garment/api/garments/{garment_id}/passport',
+                      headers={'If-None-Match': first.get_etag()[0]}).status_code == 304
+
+    assert client.put(f'/garment/api/garments/{garment_id}', json={'quantity': 7}).status_code == 200
+    second = client.get(f'/garment/api/garments/{garment_id}/passport')
+    assert second.status_code == 200
+    assert second.get_etag() != first.get_etag()
+    assert len(passport_dirs(empty_app, garment_id)) == 1
+
+
+def test_a_version_replaced_before_it_is_opened_is_resolved_again(empty_app, client, monkeypatch):
+    garment_id = create_garment(client)
+    resolved = []
+    ensure_passport = passports.ensure_passport
+
+    def racing(garment_id):
+        directory = ensure_passport(garment_id)
+        if not resolved:
+            # Another request stores a newer version and drops this one
+            shutil.rmtree(directory)
+        resolved.append(directory)
+        return directory
+
+    monkeypatch.setattr(passports, 'ensure_passport', racing)
+    response = client.get(f'/garment/{garment_id}/passport')
+    assert response.status_code == 200
+    assert len(resolved) == 2
+
+
+def test_prune_removes_passports_of_deleted_garments(empty_app, client):
+    kept, deleted = create_garment(client), create_garment(client, po_number='PO-G2')
+    for garment_id in (kept, deleted):
+        assert client.get(f'/garment/{garment_id}/passport').status_code == 200
+    assert client.delete(f'/garment/api/garments/{deleted}').status_code == 200
+    with empty_app.app_context():
+        assert passports.prune() == 1
+    assert passport_dirs(empty_app, deleted) == []
+    assert len(passport_dirs(empty_app, kept)) == 1
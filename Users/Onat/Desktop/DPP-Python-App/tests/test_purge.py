@@ -0,0 +1,62 @@
+import pytest
+
+from app import db
+from models.dashboard import DashboardStats, SUMMARY_ID
+from models.orders import Order
+from services.summary import compute_counters
+from tests.conftest import create_order
+
+
+def _bulk_delete(client, **data):
+    response = client.post('/orders/api/orders/bulk-delete', json=data)
+    assert response.status_code == 202, response.get_json()
+    job = client.get(response.get_json()['status_url']).get_json()['job']
+    assert job['status'] == 'completed', job
+    return job['result']
+
+
+def test_bulk_delete_removes_matching_orders_in_chunks(empty_app, client):
+    after = client.get('/api/changes/poll').get_json()['last_event_id']
+    pending = [create_order(client, po_number=f'PO-P{n}') for n in range(5)]
+    completed = [create_order(client, po_number=f'PO-C{n}', status='completed') for n in range(2)]
+    elsewhere = create_order(client, po_number='PO-E', facility='Other Facility')
+
+    result = _bulk_delete(client, status='pending', facility='Mango Apparel Facilities', chunk_size=2)
+
+    assert (result['total'], result['deleted'], result['chunks']) == (5, 5, 3)
+    with empty_app.app_context():
+        left = {order.id for order in Order.query.all()}
+        assert left == {*completed, elsewhere}
+        assert not left & set(pending)
+
+        # The summary row is adjusted chunk by chunk, not recounted afterwards
+        stats = db.session.get(DashboardStats, SUMMARY_ID)
+        for name, value in compute_counters(db.session.connection()).items():
+            assert getattr(stats, name) == pytest.approx(value), name
+        assert (stats.total_orders, stats.pending_orders) == (3, 1)
+
+    events = client.get(f'/api/changes/poll?after={after}&timeout=0').get_json()['events']
+    deleted = {row_id for event in events for row_id in event['changes'].get('orders', {}).get('deleted', [])}
+    assert deleted == set(pending)
+
+
+def test_bulk_delete_without_matches_deletes_nothing(empty_app, client):
+    order_id = create_order(client)
+
+    result = _bulk_delete(client, status='cancelled')
+
+    assert (result['total'], result['deleted']) == (0, 0)
+    with empty_app.app_context():
+        assert db.session.get(Order, order_id) is not None
+
+
+@pytest.mark.parametrize('data', [
+    {'status': 'lost'},
+    {'created_before': 'yesterday'},
+    {'chunk_size': 0},
+    {'reclaim': 'shred'}
+])
+def test_bulk_delete_rejects_bad_parameters(client, data):
+    response = client.post('/orders/api/orders/bulk-delete', json=data)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
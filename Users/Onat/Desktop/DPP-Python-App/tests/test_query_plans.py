@@ -0,0 +1,8 @@
+from services.query_plans import check_query_plans
+
+
+def test_blueprint_queries_use_indexes(app):
+    # Every checked page must answer 200 as well: a failing page would leave
+    # some of its queries unchecked
+    failures = check_query_plans(app)
+    assert failures == [], [(failure['url'], failure['sql'], failure['problems']) for failure in failures]
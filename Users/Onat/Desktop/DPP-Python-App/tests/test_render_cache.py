@@ -0,0 +1,56 @@
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from werkzeug.http import http_date
+
+from services import render_cache
+from tests.conftest import create_order
+
+START = 1_700_000_000
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controls the wall clock render_cache dates versions and pages with"""
+    clock = SimpleNamespace(now=START + 0.5, monotonic=time.monotonic)
+    clock.time = lambda: clock.now
+    monkeypatch.setattr(render_cache, 'time', clock)
+    return clock
+
+
+def test_no_last_modified_while_the_version_is_from_this_second(client, clock):
+    create_order(client)
+    clock.now += 0.2
+    response = client.get('/orders/')
+    assert response.status_code == 200
+    assert response.last_modified is None
+    assert response.get_etag()[0]
+
+    clock.now += 1
+    response = client.get('/orders/')
+    assert response.last_modified == datetime.fromtimestamp(START, timezone.utc)
+
+
+def test_last_modified_does_not_go_back_after_deletes(empty_app, client, clock):
+    create_order(client)
+    clock.now += 10
+    newest = create_order(client)
+    clock.now += 10
+    before = client.get('/orders/')
+    assert before.last_modified == datetime.fromtimestamp(START + 10, timezone.utc)
+
+    assert client.delete(f'/orders/api/orders/{newest}').status_code == 200
+    # Versions are lost on restart or eviction and started again
+    empty_app.extensions['dpp_render_cache'].clear()
+    clock.now += 10
+    response = client.get('/orders/', headers={'If-Modified-Since': http_date(before.last_modified)})
+    assert response.status_code == 200
+    assert response.last_modified is None
+
+    clock.now += 10
+    response = client.get('/orders/', headers={'If-Modified-Since': http_date(before.last_modified)})
+    assert response.status_code == 200
+    assert response.last_modified > before.last_modified
+    assert client.get('/orders/', headers={'If-Modified-Since': http_date(response.last_modified)}).status_code == 304
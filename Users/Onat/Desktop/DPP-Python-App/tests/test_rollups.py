@@ -0,0 +1,92 @@
+import pytest
+from sqlalchemy import text
+
+from app import db
+from models.orders import Order
+from services import rollups
+from services.bulk import generate_garments, generate_orders
+from tests.conftest import ORDER, create_garment, create_order
+
+# The same metrics grouped straight from the raw tables
+RAW_ORDERS = """
+    SELECT strftime(:format, o.created_date) AS bucket, c.name AS country, f.name AS facility,
+           o.product_type, o.status, count(*) AS orders, sum(o.quantity) AS quantity
+    FROM orders o JOIN countries c ON c.id = o.country_id JOIN facilities f ON f.id = o.facility_id
+    GROUP BY 1, 2, 3, 4, 5
+"""
+RAW_GARMENTS = """
+    SELECT strftime(:format, g.created_date) AS bucket, c.name AS country, f.name AS facility,
+           g.product_type, count(*) AS garments, sum(g.quantity) AS quantity,
+           round(sum(coalesce(g.carbon_footprint, 0)), 3) AS carbon
+    FROM garments g JOIN countries c ON c.id = g.country_id JOIN facilities f ON f.id = g.facility_id
+    GROUP BY 1, 2, 3, 4
+"""
+RAW_FORMATS = {'hour': '%Y-%m-%dT%H:00:00', 'day': '%Y-%m-%dT00:00:00', 'month': '%Y-%m-01T00:00:00'}
+
+
+def _assert_rollups_match(app, kind, raw):
+    spec = rollups.SPECS[kind]
+    with app.app_context():
+        for grain, format in RAW_FORMATS.items():
+            expected = {
+                tuple(row[:len(spec.dimensions) + 1]): tuple(row[len(spec.dimensions) + 1:])
+                for row in db.session.execute(text(raw), {'format': format})
+            }
+            result = rollups.query(kind, grain=grain, by=list(spec.dimensions))
+            actual = {
+                (row['bucket'], *(row[name] for name in spec.dimensions)): tuple(row[name] for name in spec.metrics)
+                for row in result['rows']
+            }
+            assert actual.keys() == expected.keys(), grain
+            for key, metrics in expected.items():
+                assert actual[key] == pytest.approx(metrics, abs=1e-3), (grain, key)
+        db.session.rollback()
+
+
+def test_order_rollups_match_a_group_by_after_every_kind_of_write(empty_app, client):
+    with empty_app.app_context():
+        generate_orders(300, seed=1, spread_days=60)
+    _assert_rollups_match(empty_app, 'orders', RAW_ORDERS)
+
+    order_id = create_order(client, po_number='PO-api')
+    assert client.put(f'/orders/api/orders/{order_id}', json={'status': 'completed', 'facility': 'Other'}).status_code == 200
+    report = client.post('/orders/api/orders/batch', json={'operations': [
+        {'op': 'create', 'data': {**ORDER, 'po_number': 'PO-batch'}},
+        {'op': 'update', 'id': 1, 'data': {'quantity': 9, 'status': 'cancelled'}},
+        {'op': 'delete', 'id': 2}
+    ]}).get_json()
+    assert report['success'], report
+    assert client.delete(f'/orders/api/orders/{order_id}').status_code == 200
+    _assert_rollups_match(empty_app, 'orders', RAW_ORDERS)
+
+    response = client.post('/orders/api/orders/bulk-delete', json={'status': 'pending', 'chunk_size': 25})
+    assert response.status_code == 202
+    with empty_app.app_context():
+        Order.query.filter(Order.id <= 20).update({'status': 'processing'})
+        db.session.commit()
+    _assert_rollups_match(empty_app, 'orders', RAW_ORDERS)
+
+
+def test_garment_rollups_match_a_group_by(empty_app, client):
+    with empty_app.app_context():
+        generate_garments(200, seed=1, spread_days=60)
+    garment_id = create_garment(client, po_number='PO-api')
+    assert client.put(f'/garment/api/garments/{garment_id}', json={'quantity': 40}).status_code == 200
+    assert client.delete('/garment/api/garments/1').status_code == 200
+
+    _assert_rollups_match(empty_app, 'garments', RAW_GARMENTS)
+
+
+def test_rebuild_matches_the_incremental_rollups(empty_app):
+    with empty_app.app_context():
+        generate_orders(200, seed=2, spread_days=10)
+        before = rollups.query('orders', grain='day', by=list(rollups.SPECS['orders'].dimensions))['rows']
+        rollups.rebuild()
+        after = rollups.query('orders', grain='day', by=list(rollups.SPECS['orders'].dimensions))['rows']
+    assert after == before
+
+
+@pytest.mark.parametrize('query', ['grain=week', 'by=colour', 'start=yesterday', 'limit=many'])
+def test_invalid_queries_are_rejected(client, query):
+    response = client.get(f'/api/analytics/orders?{query}')
+    assert response.status_code == 400
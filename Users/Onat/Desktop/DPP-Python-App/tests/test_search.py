@@ -0,0 +1,26 @@
+from app import db
+from services import search
+
+
+def test_counts_cover_the_window(app):
+    with app.app_context():
+        full = search.search('orders', 'style', facets=False, window=10000)
+        windowed = search.search('orders', 'style', window=50)
+        db.session.rollback()
+    assert full['exhaustive'] and full['window_total'] == 2000
+    assert not windowed['exhaustive'] and windowed['window_total'] == 50
+    for counts in windowed['facets'].values():
+        assert sum(item['count'] for item in counts) == 50
+
+
+def test_pages_past_the_window_are_empty(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'SEARCH_WINDOW', 50)
+    client = app.test_client()
+    last = client.get('/orders/api/orders/search?q=style&limit=20&page=3').get_json()
+    assert len(last['items']) == 10 and not last['has_more']
+
+    response = client.get('/orders/api/orders/search?q=style&limit=20&page=4')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['items'] == [] and not data['has_more']
+    assert data['window_total'] == 50 and not data['exhaustive']
@@ -0,0 +1,60 @@
+import pytest
+
+from tests.conftest import create_order
+
+FIRST, SECOND = 'Mango Apparel Facilities', 'Other Facility'
+
+
+def _history(client, order_id):
+    response = client.get(f'/orders/api/orders/{order_id}/history')
+    assert response.status_code == 200
+    return [(change['facility'], change['from_status'], change['to_status']) for change in response.get_json()['changes']]
+
+
+def _durations(client):
+    rows = client.get('/api/analytics/order-status').get_json()['rows']
+    return {(row['facility'], row['status']): (row['entered'], row['exited']) for row in rows}
+
+
+def _batch_update(client, order_id, data):
+    report = client.post('/orders/api/orders/batch', json={
+        'operations': [{'op': 'update', 'id': order_id, 'data': data}]
+    }).get_json()
+    assert report['success'], report
+
+
+def _api_update(client, order_id, data):
+    assert client.put(f'/orders/api/orders/{order_id}', json=data).status_code == 200
+
+
+@pytest.mark.parametrize('update', [_api_update, _batch_update])
+def test_a_stay_ends_at_the_facility_where_it_began(client, update):
+    order_id = create_order(client, facility=FIRST)
+
+    update(client, order_id, {'status': 'processing', 'facility': SECOND})
+
+    assert _history(client, order_id) == [(FIRST, None, 'pending'), (SECOND, 'pending', 'processing')]
+    assert _durations(client) == {(FIRST, 'pending'): (1, 1), (SECOND, 'processing'): (1, 0)}
+
+
+@pytest.mark.parametrize('update', [_api_update, _batch_update])
+def test_moving_facility_without_a_status_change_records_nothing(client, update):
+    order_id = create_order(client, facility=FIRST)
+
+    update(client, order_id, {'facility': SECOND})
+    assert _history(client, order_id) == [(FIRST, None, 'pending')]
+
+    update(client, order_id, {'status': 'completed'})
+    assert _history(client, order_id) == [(FIRST, None, 'pending'), (SECOND, 'pending', 'completed')]
+    assert _durations(client) == {(FIRST, 'pending'): (1, 1), (SECOND, 'completed'): (1, 0)}
+
+
+def test_deleting_a_moved_order_closes_its_history_at_the_new_facility(client):
+    order_id = create_order(client, facility=FIRST)
+    _api_update(client, order_id, {'status': 'processing', 'facility': SECOND})
+
+    assert client.delete(f'/orders/api/orders/{order_id}').status_code == 200
+
+    assert _history(client, order_id)[-1] == (SECOND, 'processing', None)
+    # Deletion doesn't count as a completed stay
+    assert _durations(client)[(SECOND, 'processing')] == (1, 0)
@@ -0,0 +1,72 @@
+import pytest
+from sqlalchemy import delete
+
+from app import db
+from models.dashboard import DashboardStats, SUMMARY_ID
+from models.orders import Order
+from services.summary import compute_counters
+from tests.conftest import create_garment, create_order
+
+
+def _assert_counters_match(app):
+    with app.app_context():
+        stats = db.session.get(DashboardStats, SUMMARY_ID)
+        expected = compute_counters(db.session.connection())
+        assert stats is not None
+        for name, value in expected.items():
+            assert getattr(stats, name) == pytest.approx(value), name
+        db.session.rollback()
+
+
+def test_counters_follow_inserts_updates_and_deletes(empty_app, client):
+    orders = [create_order(client, po_number=f'PO-{n}', quantity=10 * (n + 1)) for n in range(4)]
+    garments = [create_garment(client, po_number=f'PO-G{n}', quantity=5 + n) for n in range(3)]
+    _assert_counters_match(empty_app)
+
+    assert client.put(f'/orders/api/orders/{orders[0]}', json={'status': 'completed', 'quantity': 7}).status_code == 200
+    assert client.put(f'/orders/api/orders/{orders[1]}', json={'status': 'cancelled'}).status_code == 200
+    assert client.put(f'/garment/api/garments/{garments[0]}', json={'quantity': 50}).status_code == 200
+    _assert_counters_match(empty_app)
+
+    assert client.delete(f'/orders/api/orders/{orders[0]}').status_code == 200
+    assert client.delete(f'/garment/api/garments/{garments[1]}').status_code == 200
+    _assert_counters_match(empty_app)
+
+    stats = client.get('/api/stats').get_json()
+    assert stats['stats']['total_orders'] == 3
+    assert stats['stats']['total_garments'] == 2
+
+
+def test_counters_follow_batch_writes_and_bulk_generate(empty_app, client):
+    from services.bulk import generate_garments, generate_orders
+
+    with empty_app.app_context():
+        generate_orders(300, seed=1)
+        generate_garments(200, seed=1)
+    _assert_counters_match(empty_app)
+
+    with empty_app.app_context():
+        Order.query.filter(Order.id <= 50).update({'status': 'completed'})
+        Order.query.filter(Order.id > 250).delete()
+        db.session.commit()
+    _assert_counters_match(empty_app)
+
+
+def test_missing_summary_row_is_served_without_a_write_and_rebuilt_by_a_job(empty_app, client, monkeypatch):
+    create_order(client)
+    with empty_app.app_context():
+        db.session.execute(delete(DashboardStats))
+        db.session.commit()
+
+    queued = []
+    monkeypatch.setattr('services.jobs.submit_job', lambda kind, **kwargs: queued.append(kind))
+    response = client.get('/api/stats')
+    assert response.status_code == 200
+    assert response.get_json()['stats']['total_orders'] == 1
+    assert queued == ['stats.rebuild']
+    with empty_app.app_context():
+        assert db.session.get(DashboardStats, SUMMARY_ID) is None
+
+    monkeypatch.undo()
+    client.get('/api/stats')
+    _assert_counters_match(empty_app)
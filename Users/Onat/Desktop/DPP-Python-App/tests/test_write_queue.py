@@ -0,0 +1,78 @@
+from concurrent.futures import Future
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+from models.orders import Order
+from services import change_feed, render_cache
+from services.database import WriteQueue
+from services.dimensions import interner
+from tests.conftest import ORDER
+
+
+@pytest.fixture
+def published(monkeypatch):
+    """Changes passed to change_feed.publish() and tables whose render version was bumped"""
+    calls = {'changes': [], 'bumped': []}
+    monkeypatch.setattr(change_feed, 'publish', lambda changes, stats=None: calls['changes'].append(changes))
+    monkeypatch.setattr(render_cache, 'bump_versions', lambda tables, backend=None: calls['bumped'].extend(tables))
+    return calls
+
+
+def run_batch(app, *writes):
+    """Run writes as one WriteQueue group and return their futures"""
+    batch = [(write, Future()) for write in writes]
+    with app.app_context():
+        with db.engine.connect() as connection:
+            connection.info['sqlite_begin'] = 'IMMEDIATE'
+            try:
+                WriteQueue(app)._commit_batch(connection, batch)
+            finally:
+                connection.info.pop('sqlite_begin', None)
+    return [future for _, future in batch]
+
+
+def add_order(**values):
+    return lambda session: session.add(Order(**{**ORDER, **values}))
+
+
+def fail_write(session):
+    session.add(Order(**{**ORDER, 'facility': 'Rolled Back Facility'}))
+    session.flush()
+    raise ValueError('rejected')
+
+
+def _facilities():
+    return {key for keys in interner().ids['facility'] for key in (keys if isinstance(keys, tuple) else (keys,))}
+
+
+def test_failed_write_only_drops_its_own_changes(empty_app, published):
+    futures = run_batch(empty_app, add_order(po_number='PO-A'), fail_write, add_order(po_number='PO-C'))
+    assert [future.exception() is None for future in futures] == [True, False, True]
+
+    with empty_app.app_context():
+        ids = sorted(order.id for order in Order.query.all())
+        assert len(ids) == 2
+        assert published['changes'] == [{'orders': {'created': ids}}]
+        assert 'orders' in published['bumped']
+        assert 'Rolled Back Facility' not in _facilities()
+
+
+def test_failed_batch_commit_publishes_nothing(empty_app, published):
+    def fail_commit(session):
+        if not session.in_nested_transaction():
+            raise RuntimeError('commit failed')
+
+    event.listen(Session, 'before_commit', fail_commit)
+    try:
+        futures = run_batch(empty_app, add_order(facility='Uncommitted Facility'), add_order())
+    finally:
+        event.remove(Session, 'before_commit', fail_commit)
+
+    assert all(isinstance(future.exception(), RuntimeError) for future in futures)
+    assert published == {'changes': [], 'bumped': []}
+    with empty_app.app_context():
+        assert Order.query.count() == 0
+        assert 'Uncommitted Facility' not in _facilities()
@@ -0,0 +1,6 @@
+"""WSGI entry point, e.g. `gunicorn wsgi:app` (run `flask db-upgrade` first)"""
+import os
+
+from app import create_app
+
+app = create_app(os.environ.get('FLASK_CONFIG', 'production'))